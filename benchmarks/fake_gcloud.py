@@ -0,0 +1,467 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local emulator of the `gcloud` commands used to build a custom image.
+
+It is installed as `gcloud` on the PATH of a benchmark run, see
+run_benchmark.py. Images, disks, instances and GCS objects are kept as files
+in the FAKE_GCLOUD_STATE directory, so the calls of one build see each
+other's effects. The FAKE_GCLOUD_CONFIG JSON file sets:
+
+  * latency_ms: the latency injected in each call, by command (for example
+    "compute instances create") with a "default".
+  * failure_rate: the probability that a call of a command fails.
+  * fail_first: how many of the first calls of a command fail.
+  * customization_sec: how long after its creation the VM reports that the
+    customization script succeeded on its serial port and guest attributes.
+  * stockout_zones: zones which do not have the resources for any VM.
+  * preempt_after_sec: how long after it starts a spot VM is preempted,
+    the first `preemptions` times it starts (1 by default).
+  * quotas, project_quotas: the [limit, usage] of regional and project
+    quota metrics, replacing the defaults of _QUOTAS and _PROJECT_QUOTAS.
+
+Every call is appended to the FAKE_GCLOUD_LOG JSON lines file.
+"""
+
+import datetime
+import fcntl
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+
+PROJECT = "fake-project"
+
+# Flags passed to gcloud with their value as the next argument.
+_VALUE_FLAGS = {
+    "--filter", "--format", "--metadata-from-file", "--port", "--project",
+    "--region", "--source", "--source-disk", "--source-disk-zone",
+    "--source-image", "--source-image-project", "--start", "--zone"
+}
+
+# [limit, usage] of the quotas of every region, then of the project.
+_QUOTAS = {
+    "CPUS": [600, 0],
+    "INSTANCES": [1000, 0],
+    "SSD_TOTAL_GB": [10000, 0],
+    "NVIDIA_T4_GPUS": [8, 0],
+}
+_PROJECT_QUOTAS = {
+    "CPUS_ALL_REGIONS": [1200, 0],
+    "GPUS_ALL_REGIONS": [16, 0],
+    "IMAGES": [5000, 0],
+}
+
+
+class FakeGcloudError(Exception):
+  """Makes the emulator exit with an error, like gcloud does."""
+
+
+def _load_config():
+  path = os.environ.get("FAKE_GCLOUD_CONFIG")
+  if not path:
+    return {}
+  with open(path) as f:
+    return json.load(f)
+
+
+def _parse(argv):
+  """Splits arguments in positional arguments and flag values."""
+  positionals = []
+  flags = {}
+  i = 0
+  while i < len(argv):
+    arg = argv[i]
+    if arg.startswith("--"):
+      if "=" in arg:
+        name, value = arg.split("=", 1)
+      elif arg in _VALUE_FLAGS and i + 1 < len(argv):
+        name, value = arg, argv[i + 1]
+        i += 1
+      else:
+        name, value = arg, True
+      flags[name] = value
+    elif not arg.startswith("-"):
+      positionals.append(arg)
+    i += 1
+  return positionals, flags
+
+
+def command_key(positionals):
+  """Returns the command of a call, e.g. 'compute images describe'."""
+  if not positionals:
+    return ""
+  depth = {"compute": 3, "dataproc": 3, "config": 2, "auth": 2}.get(
+      positionals[0], 2)
+  if positionals[:2] == ["storage", "objects"]:
+    depth = 3
+  return " ".join(positionals[:depth])
+
+
+class State:
+  """Resources of the emulated project, kept as files."""
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def _path(self, kind, name):
+    return os.path.join(self.directory, kind, name + ".json")
+
+  def get(self, kind, name):
+    try:
+      with open(self._path(kind, name)) as f:
+        return json.load(f)
+    except FileNotFoundError:
+      raise FakeGcloudError(
+          "ERROR: (gcloud) The resource '{}/{}' was not found".format(
+              kind, name))
+
+  def put(self, kind, name, resource):
+    os.makedirs(os.path.dirname(self._path(kind, name)), exist_ok=True)
+    with open(self._path(kind, name), "w") as f:
+      json.dump(resource, f)
+
+  def list(self, kind):
+    directory = os.path.join(self.directory, kind)
+    if not os.path.isdir(directory):
+      return []
+    return [self.get(kind, name[:-len(".json")])
+            for name in sorted(os.listdir(directory))]
+
+  def delete(self, kind, name):
+    try:
+      os.remove(self._path(kind, name))
+    except FileNotFoundError:
+      raise FakeGcloudError(
+          "ERROR: (gcloud) The resource '{}/{}' was not found".format(
+              kind, name))
+
+  def count_call(self, key):
+    """Returns how many calls of a command were made, including this one."""
+    os.makedirs(self.directory, exist_ok=True)
+    path = os.path.join(self.directory, "calls.json")
+    with open(path, "a+") as f:
+      fcntl.flock(f, fcntl.LOCK_EX)
+      f.seek(0)
+      counts = json.loads(f.read() or "{}")
+      counts[key] = counts.get(key, 0) + 1
+      f.seek(0)
+      f.truncate()
+      f.write(json.dumps(counts))
+    return counts[key]
+
+  def object_path(self, gcs_uri):
+    return os.path.join(self.directory, "storage", gcs_uri[len("gs://"):])
+
+
+def _timestamp(epoch):
+  return datetime.datetime.fromtimestamp(epoch).strftime(
+      "%Y-%m-%dT%H:%M:%S.%f")[:-3] + "-07:00"
+
+
+def _base_image(name, version_label):
+  return {
+      "name": name,
+      "status": "READY",
+      "creationTimestamp": _timestamp(0),
+      "labels": {"goog-dataproc-version": version_label},
+      "selfLink": "projects/cloud-dataproc/global/images/" + name,
+  }
+
+
+def _base_image_from_filter(filter_arg):
+  match = re.search(r"goog-dataproc-version (?:=|~) \^?([^$ ]+)\$?",
+                    filter_arg)
+  version_label = match.group(1).replace(r"\d+", "0") if match else "2-2-0"
+  return _base_image("dataproc-{}-20260101-000000-rc01".format(version_label),
+                     version_label)
+
+
+def _parse_labels(labels_flag):
+  return dict(label.split("=", 1) for label in labels_flag.split(",")
+              if "=" in label)
+
+
+def _zonal(name, flags):
+  """Disks and instances of the same name in different zones are distinct."""
+  return "{}@{}".format(name, flags["--zone"]) if "--zone" in flags else name
+
+
+def _quotas(defaults, overrides):
+  quotas = dict(defaults, **overrides)
+  return {"quotas": [{"metric": metric, "limit": limit, "usage": usage}
+                     for metric, (limit, usage) in sorted(quotas.items())]}
+
+
+def _preempted(instance, config):
+  """Whether a spot VM is preempted before its customization completes."""
+  return (instance.get("scheduling", {}).get("provisioningModel") == "SPOT"
+          and "preempt_after_sec" in config and
+          instance.get("boots", 1) <= config.get("preemptions", 1) and
+          config["preempt_after_sec"] < config.get("customization_sec", 5))
+
+
+def _get_instance(state, name, flags, config):
+  """Returns an instance, stopped if it was preempted meanwhile."""
+  instance = state.get("instances", _zonal(name, flags))
+  if (instance["status"] == "RUNNING" and _preempted(instance, config) and
+      time.time() >= instance["createdAt"] + config["preempt_after_sec"]):
+    instance["status"] = "TERMINATED"
+    state.put("instances", _zonal(name, flags), instance)
+  return instance
+
+
+def _busy_sec(instance, config):
+  """How long the emulated customization keeps a started VM busy."""
+  if _preempted(instance, config):
+    return config["preempt_after_sec"]
+  return config.get("customization_sec", 5)
+
+
+def _serial_port_output(state, name, start, config, flags):
+  instance = _get_instance(state, name, flags, config)
+  if (instance["status"] != "RUNNING" and _preempted(instance, config) or
+      time.time() < instance["createdAt"] + config.get("customization_sec",
+                                                       5)):
+    return ""
+  lines = "".join(
+      "Oct 17 00:00:00 {} google_metadata_script_runner[1]: startup-script: "
+      "{}\n".format(name, line) for line in [
+          "Running customization script.",
+          "INFO: maximum-disk-used-bytes: 12884901888 "
+          "disk-size-bytes: 32212254720",
+          "BuildSucceeded: Dataproc Initialization Actions Succeeded.",
+      ])
+  return lines[start:]
+
+
+def _copy(state, source, destination, recursive=False):
+  def local(path):
+    return state.object_path(path) if path.startswith("gs://") else path
+
+  source, destination = local(source), local(destination)
+  if not os.path.exists(source):
+    raise FakeGcloudError(
+        "ERROR: (gcloud.storage.cp) The following URLs matched no objects or "
+        "files: {}".format(source))
+  if recursive and os.path.isdir(source):
+    shutil.copytree(source, destination, dirs_exist_ok=True)
+    return
+  if destination.endswith("/") or os.path.isdir(destination):
+    destination = os.path.join(destination, os.path.basename(source))
+  os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+  shutil.copyfile(source, destination)
+
+
+def run_command(state, key, positionals, flags, config):
+  """Emulates a gcloud command and returns its stdout."""
+  name = positionals[len(key.split())] if len(positionals) > len(
+      key.split()) else None
+  if key in ("--help", "") or "--help" in flags:
+    return "Usage: gcloud"
+  if key == "config get-value":
+    return PROJECT
+  if key == "auth print-access-token":
+    return "fake-token"
+
+  if key == "compute images describe":
+    if name.startswith("dataproc-"):
+      return json.dumps(_base_image(name, "2-2-0"))
+    return json.dumps(state.get("images", name))
+  if key == "compute images describe-from-family":
+    return json.dumps(_base_image(name + "-20260101-000000-rc01", "2-2-0"))
+  if key == "compute images list":
+    filter_arg = flags.get("--filter", "")
+    if "goog-dataproc-version" in filter_arg:
+      return json.dumps([_base_image_from_filter(filter_arg)])
+    labels = dict(re.findall(r"labels\.([\w-]+) = ([\w-]+)", filter_arg))
+    return json.dumps([
+        image for image in state.list("images")
+        if all(image["labels"].get(k) == v for k, v in labels.items())
+    ])
+  if key == "compute images create":
+    image = {
+        "name": name,
+        "status": "READY",
+        "family": flags.get("--family"),
+        "sourceImage": flags.get("--source-image"),
+        "creationTimestamp": _timestamp(time.time()),
+        "labels": _parse_labels(flags.get("--labels", "")),
+    }
+    state.put("images", name, image)
+    if flags.get("--format") == "json":
+      return json.dumps([image])
+    if flags.get("--format") == "value(creationTimestamp)":
+      return image["creationTimestamp"]
+    return ""
+  if key == "compute images add-labels":
+    image = state.get("images", name)
+    image["labels"].update(_parse_labels(flags.get("--labels", "")))
+    state.put("images", name, image)
+    return ""
+  if key == "compute images delete":
+    state.delete("images", name)
+    return ""
+
+  if key == "compute regions describe":
+    return json.dumps(_quotas(_QUOTAS, config.get("quotas", {})))
+  if key == "compute project-info describe":
+    return json.dumps(_quotas(_PROJECT_QUOTAS,
+                              config.get("project_quotas", {})))
+  if key == "compute machine-types describe":
+    return json.dumps({"name": name, "guestCpus": 4})
+
+  if key == "compute disks create":
+    state.put("disks", _zonal(name, flags), {"name": name,
+                                             "status": "READY"})
+    return ""
+  if key == "compute disks delete":
+    state.delete("disks", _zonal(name, flags))
+    return ""
+  if key == "compute snapshots describe":
+    return json.dumps(state.get("snapshots", name))
+  if key == "compute snapshots create":
+    state.put("snapshots", name, {"name": name, "status": "READY",
+                                  "labels": {}})
+    return ""
+
+  if key == "compute instances create":
+    zone = flags.get("--zone")
+    if zone in config.get("stockout_zones", []):
+      raise FakeGcloudError(
+          "ERROR: (gcloud.compute.instances.create) Could not fetch "
+          "resource:\n - The zone 'projects/{}/zones/{}' does not have "
+          "enough resources available to fulfill the request.  Try a "
+          "different zone, or try again later.".format(PROJECT, zone))
+    instance = {
+        "name": name,
+        "status": "RUNNING",
+        "createdAt": time.time(),
+    }
+    if flags.get("--provisioning-model"):
+      instance["scheduling"] = {
+          "provisioningModel": flags["--provisioning-model"]}
+    state.put("instances", _zonal(name, flags), instance)
+    return ""
+  if key == "compute instances describe":
+    return json.dumps(_get_instance(state, name, flags, config))
+  if key == "compute instances start":
+    instance = _get_instance(state, name, flags, config)
+    instance.update(status="RUNNING", createdAt=time.time(),
+                    boots=instance.get("boots", 1) + 1)
+    state.put("instances", _zonal(name, flags), instance)
+    return ""
+  if key == "compute instances stop":
+    instance = _get_instance(state, name, flags, config)
+    instance["status"] = "TERMINATED"
+    state.put("instances", _zonal(name, flags), instance)
+    return ""
+  if key == "compute instances delete":
+    state.delete("instances", _zonal(name, flags))
+    return ""
+  if key == "compute instances get-serial-port-output":
+    start = int(flags.get("--start", 0))
+    contents = _serial_port_output(state, name, start, config, flags)
+    return json.dumps({"contents": contents, "start": start,
+                       "next": start + len(contents)})
+  if key == "compute instances get-guest-attributes":
+    instance = _get_instance(state, name, flags, config)
+    if (instance["status"] != "RUNNING" and _preempted(instance, config) or
+        time.time() < instance["createdAt"] + config.get("customization_sec",
+                                                         5)):
+      raise FakeGcloudError("ERROR: (gcloud) The guest attributes of {} "
+                            "were not found: 404".format(name))
+    return json.dumps([
+        {"namespace": "custom-image", "key": "status", "value": "succeeded"},
+        {"namespace": "custom-image", "key": "log-flushed",
+         "value": str(int(instance["createdAt"]))},
+    ])
+  if key == "compute instances tail-serial-port-output":
+    while True:
+      contents = _serial_port_output(state, name, 0, config, flags)
+      if contents:
+        return contents
+      time.sleep(0.5)
+
+  if key == "storage cp":
+    _copy(state, positionals[2], positionals[3],
+          recursive="--recursive" in flags)
+    return ""
+  if key == "storage rsync":
+    _copy(state, positionals[2], positionals[3], recursive=True)
+    return ""
+  if key == "storage objects describe":
+    if not os.path.exists(state.object_path(name)):
+      raise FakeGcloudError("ERROR: (gcloud.storage.objects.describe) "
+                            "{} not found: 404.".format(name))
+    return json.dumps({"name": name})
+
+  if key.startswith(("dataproc workflow-templates", "dataproc clusters",
+                     "dataproc jobs")):
+    return ""
+  raise FakeGcloudError("ERROR: (gcloud) unsupported command: " + key)
+
+
+def _log(entry):
+  path = os.environ.get("FAKE_GCLOUD_LOG")
+  if path:
+    # A single append per call keeps concurrent calls from interleaving.
+    with open(path, "a") as f:
+      f.write(json.dumps(entry) + "\n")
+
+
+def main(argv):
+  start = time.time()
+  config = _load_config()
+  state = State(os.environ.get("FAKE_GCLOUD_STATE", "/tmp/fake-gcloud"))
+  positionals, flags = _parse(argv)
+  key = command_key(positionals)
+
+  latencies = config.get("latency_ms", {})
+  latency_sec = latencies.get(key, latencies.get("default", 0)) / 1000.0
+  latency_start = time.time()
+  time.sleep(latency_sec)
+  latency_end = time.time()
+
+  entry = {"command": key, "argv": argv, "start": start,
+           "latency_start": latency_start, "latency_end": latency_end}
+  call = state.count_call(key)
+  try:
+    if (call <= config.get("fail_first", {}).get(key, 0) or
+        random.random() < config.get("failure_rate", {}).get(key, 0)):
+      raise FakeGcloudError(
+          "ERROR: (gcloud) Injected failure of {}".format(key))
+    output = run_command(state, key, positionals, flags, config)
+    returncode = 0
+  except FakeGcloudError as e:
+    print(e, file=sys.stderr)
+    output = ""
+    returncode = 1
+  if (key in ("compute instances create", "compute instances start") and
+      returncode == 0):
+    # The emulated customization keeps the VM busy for this long.
+    instance = state.get("instances", _zonal(positionals[3], flags))
+    entry["busy_until"] = time.time() + _busy_sec(instance, config)
+  if output:
+    print(output)
+  entry.update(end=time.time(), returncode=returncode)
+  _log(entry)
+  return returncode
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,239 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Offline benchmark of the custom image build orchestration.
+
+Runs the real generate_custom_image.py end to end against fake_gcloud.py,
+installed as `gcloud` on the PATH, and reports for each run:
+
+  * the wall time of the build,
+  * the number of gcloud subprocesses, by command,
+  * for each phase of the build trace, its duration, the time spent in
+    emulated cloud latency or customization, and the rest: the overhead of
+    the tool itself.
+
+Usage:
+
+  python -m benchmarks.run_benchmark --runs 3 --workflow-engine python \\
+      --config benchmarks/configs/default.json --json-output results.json
+
+Arguments after `--` are passed to generate_custom_image.py.
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from custom_image_utils import tracing
+
+_BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+_REPO_DIR = os.path.dirname(_BENCHMARKS_DIR)
+_DEFAULT_CONFIG = os.path.join(_BENCHMARKS_DIR, "configs", "default.json")
+
+
+def _parse_args(args):
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--runs", type=int, default=1,
+                      help="Number of builds to run.")
+  parser.add_argument("--config", default=_DEFAULT_CONFIG,
+                      help="fake_gcloud.py latency and failure config.")
+  parser.add_argument("--workflow-engine", default="bash",
+                      choices=["bash", "python"])
+  parser.add_argument("--dataproc-version", default="2.2.0-debian12")
+  parser.add_argument("--json-output",
+                      help="File to write the results to, as JSON.")
+  parser.add_argument("--keep-temp", action="store_true",
+                      help="Keep the fake gcloud state and build logs.")
+  parser.add_argument("build_args", nargs=argparse.REMAINDER,
+                      help="Arguments passed to generate_custom_image.py.")
+  return parser.parse_args(args)
+
+
+def _install_fake_gcloud(bin_dir):
+  os.makedirs(bin_dir)
+  path = os.path.join(bin_dir, "gcloud")
+  with open(path, "w") as f:
+    f.write("#!/bin/sh\nexec '{}' '{}' \"$@\"\n".format(
+        sys.executable, os.path.join(_BENCHMARKS_DIR, "fake_gcloud.py")))
+  os.chmod(path, 0o755)
+
+
+def _read_jsonl(path):
+  if not os.path.exists(path):
+    return []
+  with open(path) as f:
+    return [json.loads(line) for line in f if line.strip()]
+
+
+def merge_intervals(intervals):
+  """Merges overlapping (start, end) intervals."""
+  merged = []
+  for start, end in sorted(intervals):
+    if merged and start <= merged[-1][1]:
+      merged[-1][1] = max(merged[-1][1], end)
+    else:
+      merged.append([start, end])
+  return merged
+
+
+def covered(merged, start, end):
+  """Returns how much of [start, end] merged intervals cover."""
+  return sum(max(0.0, min(end, e) - max(start, s)) for s, e in merged)
+
+
+def cloud_intervals(calls):
+  """Time spent in injected latency and in the emulated customization."""
+  intervals = [(c["latency_start"], c["latency_end"]) for c in calls]
+  intervals += [(c["end"], c["busy_until"]) for c in calls
+                if "busy_until" in c]
+  return merge_intervals(intervals)
+
+
+def phase_overheads(spans, calls):
+  """Splits the duration of each span in cloud time and tool overhead."""
+  merged = cloud_intervals(calls)
+  phases = []
+  for span in spans:
+    cloud_sec = covered(merged, span["start"], span["end"])
+    phases.append({
+        "name": span["name"],
+        "category": span["category"],
+        "duration_sec": span["duration"],
+        "cloud_sec": cloud_sec,
+        "overhead_sec": span["duration"] - cloud_sec,
+    })
+  return phases
+
+
+def _run_build(args, run_index, temp_dir):
+  run_dir = os.path.join(temp_dir, "run-{}".format(run_index))
+  _install_fake_gcloud(os.path.join(run_dir, "bin"))
+  calls_log = os.path.join(run_dir, "gcloud-calls.jsonl")
+  image_name = "bench-{}-{}".format(run_index, uuid.uuid4().hex[:8])
+  env = dict(os.environ,
+             PATH=os.path.join(run_dir, "bin") + os.pathsep +
+             os.environ.get("PATH", ""),
+             FAKE_GCLOUD_CONFIG=os.path.abspath(args.config),
+             FAKE_GCLOUD_STATE=os.path.join(run_dir, "state"),
+             FAKE_GCLOUD_LOG=calls_log,
+             DATAPROC_CUSTOM_IMAGES_CACHE_DIR=os.path.join(run_dir, "cache"))
+  build_args = [a for a in args.build_args if a != "--"]
+  command = [
+      sys.executable, os.path.join(_REPO_DIR, "generate_custom_image.py"),
+      "--image-name", image_name,
+      "--dataproc-version", args.dataproc_version,
+      "--customization-script",
+      os.path.join(_REPO_DIR, "examples", "customization_script.sh"),
+      "--zone", "us-central1-a",
+      "--gcs-bucket", "gs://fake-benchmark-bucket",
+      "--workflow-engine", args.workflow_engine,
+  ] + build_args
+
+  start = time.time()
+  with open(os.path.join(run_dir, "build.log"), "w") as build_log:
+    returncode = subprocess.call(command, cwd=_REPO_DIR, env=env,
+                                 stdout=build_log, stderr=subprocess.STDOUT)
+  wall_sec = time.time() - start
+
+  calls = _read_jsonl(calls_log)
+  by_command = {}
+  for call in calls:
+    stats = by_command.setdefault(call["command"], {"calls": 0, "sec": 0.0})
+    stats["calls"] += 1
+    stats["sec"] += call["end"] - call["start"]
+  build_dirs = glob.glob("/tmp/custom-image-{}-*".format(image_name))
+  spans = []
+  for build_dir in build_dirs:
+    spans += _read_jsonl(
+        os.path.join(build_dir, "logs", tracing.JSONL_FILE))
+  merged = cloud_intervals(calls)
+  result = {
+      "run": run_index,
+      "image_name": image_name,
+      "returncode": returncode,
+      "wall_sec": wall_sec,
+      "gcloud_calls": len(calls),
+      "failed_gcloud_calls": sum(1 for c in calls if c["returncode"]),
+      "cloud_sec": covered(merged, start, start + wall_sec),
+      "commands": by_command,
+      "phases": phase_overheads(spans, calls),
+      "build_log": os.path.join(run_dir, "build.log"),
+  }
+  result["overhead_sec"] = wall_sec - result["cloud_sec"]
+  if not args.keep_temp:
+    for build_dir in build_dirs:
+      shutil.rmtree(build_dir, ignore_errors=True)
+  return result
+
+
+def format_result(result):
+  lines = [
+      "Run {run}: returncode {returncode}, wall {wall_sec:.3f}s, cloud "
+      "{cloud_sec:.3f}s, overhead {overhead_sec:.3f}s, {gcloud_calls} gcloud "
+      "subprocesses ({failed_gcloud_calls} failed)".format(**result)
+  ]
+  for command, stats in sorted(result["commands"].items()):
+    lines.append("  {:<44} calls {:4d}  total {:8.3f}s".format(
+        command, stats["calls"], stats["sec"]))
+  for phase in result["phases"]:
+    lines.append(
+        "  {:<24} {:<12} duration {:8.3f}s  cloud {:8.3f}s  overhead "
+        "{:8.3f}s".format(phase["name"], phase["category"],
+                          phase["duration_sec"], phase["cloud_sec"],
+                          phase["overhead_sec"]))
+  return "\n".join(lines)
+
+
+def main(args):
+  args = _parse_args(args)
+  temp_dir = tempfile.mkdtemp(prefix="custom-images-benchmark-")
+  try:
+    results = []
+    for run_index in range(args.runs):
+      result = _run_build(args, run_index, temp_dir)
+      results.append(result)
+      print(format_result(result), flush=True)
+    summary = {
+        "workflow_engine": args.workflow_engine,
+        "runs": results,
+        "median_wall_sec": statistics.median(r["wall_sec"] for r in results),
+        "median_overhead_sec": statistics.median(
+            r["overhead_sec"] for r in results),
+        "median_gcloud_calls": statistics.median(
+            r["gcloud_calls"] for r in results),
+    }
+    print("Median wall {median_wall_sec:.3f}s, overhead "
+          "{median_overhead_sec:.3f}s, {median_gcloud_calls} gcloud "
+          "subprocesses over {} runs".format(len(results), **summary))
+    if args.json_output:
+      with open(args.json_output, "w") as f:
+        json.dump(summary, f, indent=2)
+  finally:
+    if args.keep_temp:
+      print("Benchmark state kept in {}".format(temp_dir))
+    else:
+      shutil.rmtree(temp_dir, ignore_errors=True)
+  return 0 if all(r["returncode"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -18,8 +18,9 @@ Infer arguments for Dataproc custom image build.
 import logging
 import os
 import re
-import subprocess
-import tempfile
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import image_cache
 
 _IMAGE_PATH = "projects/{}/global/images/{}"
 _IMAGE_URI = re.compile(
@@ -34,19 +35,16 @@ _LOG = logging.getLogger(__name__)
 _LOG.setLevel(logging.WARN)
 
 
-def _get_project_id():
+def _get_project_id(backend):
   """Get project id from gcloud config."""
-  gcloud_command = ["gcloud", "config", "get-value", "project"]
-  with tempfile.NamedTemporaryFile() as temp_file:
-    pipe = subprocess.Popen(gcloud_command, stdout=temp_file)
-    pipe.wait()
-    if pipe.returncode != 0:
-      raise RuntimeError("Cannot find gcloud project ID. "
-                         "Please setup the project ID in gcloud SDK")
-    # get project id
-    temp_file.seek(0)
-    stdout = temp_file.read()
-    return stdout.decode('utf-8').strip()
+  try:
+    project_id = backend.get_project_id()
+  except cloud_backend.CloudApiError:
+    project_id = None
+  if not project_id:
+    raise RuntimeError("Cannot find gcloud project ID. "
+                       "Please setup the project ID in gcloud SDK")
+  return project_id
 
 
 def _extract_image_name_and_project(image_uri):
@@ -61,59 +59,43 @@ def _extract_image_name_and_project_from_family_uri(image_uri):
   return m.group(3), m.group(4)  # project, image_name
 
 
-def _get_dataproc_image_version(image_uri):
+def _get_dataproc_image_version(image_uri, cache, backend):
   """Get Dataproc image version from image URI."""
   project, image_name = _extract_image_name_and_project(image_uri)
-  command = [
-      "gcloud", "compute", "images", "describe", image_name, "--project",
-      project, "--format=value(labels.goog-dataproc-version)"
-  ]
-
-  # get stdout from compute images list --filters
-  with tempfile.NamedTemporaryFile() as temp_file:
-    pipe = subprocess.Popen(command, stdout=temp_file)
-    pipe.wait()
-    if pipe.returncode != 0:
-      raise RuntimeError(
-          "Cannot find dataproc base image, please check and verify "
-          "the base image URI.")
-
-    temp_file.seek(0)  # go to start of the stdout
-    stdout = temp_file.read()
-    # parse the first ready image with the dataproc version attached in labels
-    if stdout:
-      parsed_line = stdout.decode('utf-8').strip()  # should be just one value
-      return parsed_line
-
-  raise RuntimeError("Cannot find dataproc base image: %s", image_uri)
-
-
-def _get_dataproc_version_from_image_family(image_family_uri):
+  return cache.get_or_compute(
+      (project, "describe", image_name),
+      lambda: _describe_dataproc_image_version(project, image_name, backend))
+
+
+def _describe_dataproc_image_version(project, image_name, backend):
+  """Get Dataproc image version label of an image."""
+  try:
+    image = backend.describe_image(project, image_name)
+  except cloud_backend.CloudApiError:
+    raise RuntimeError(
+        "Cannot find dataproc base image, please check and verify "
+        "the base image URI.")
+  return image.get("labels", {}).get("goog-dataproc-version", "")
+
+
+def _get_dataproc_version_from_image_family(image_family_uri, cache, backend):
   """Get Dataproc image family version from family name."""
   project, image_family_name = _extract_image_name_and_project_from_family_uri(image_family_uri)
-  command = [
-      "gcloud", "compute", "images", "describe-from-family", image_family_name, "--project",
-      project, "--format=value(labels.goog-dataproc-version)"
-  ]
-
-  # get stdout from compute images list --filters
-  with tempfile.NamedTemporaryFile() as temp_file:
-    pipe = subprocess.Popen(command, stdout=temp_file)
-    pipe.wait()
-    if pipe.returncode != 0:
-      raise RuntimeError(
-          "Cannot find dataproc base family image, please check and verify "
-          "the family URI.")
-
-    temp_file.seek(0)  # go to start of the stdout
-    stdout = temp_file.read()
-    # parse the first ready image with the dataproc version attached in labels
-    if stdout:
-      dataproc_version = stdout.decode('utf-8').strip()  # should be just one value
-      return dataproc_version
-
-  raise RuntimeError("Cannot find dataproc base image family: %s" %
-                     image_family_uri)
+  return cache.get_or_compute(
+      (project, "describe-from-family", image_family_name),
+      lambda: _describe_dataproc_family_version(project, image_family_name,
+                                                backend))
+
+
+def _describe_dataproc_family_version(project, image_family_name, backend):
+  """Get Dataproc image family version label from the latest family image."""
+  try:
+    image = backend.describe_image_from_family(project, image_family_name)
+  except cloud_backend.CloudApiError:
+    raise RuntimeError(
+        "Cannot find dataproc base family image, please check and verify "
+        "the family URI.")
+  return image.get("labels", {}).get("goog-dataproc-version", "")
 
 def _extract_image_path(image_uri):
   """Get the partial image URI from the full image URI."""
@@ -125,7 +107,7 @@ def _extract_image_family_path(image_family_uri):
   project, image_name = _extract_image_name_and_project_from_family_uri(image_family_uri)
   return _IMAGE_FAMILY_PATH.format(project, image_name)
 
-def _get_dataproc_image_path_by_version(version):
+def _get_dataproc_image_path_by_version(version, cache, backend):
   """Get Dataproc base image name from version."""
   # version regex already checked in arg parser
   parsed_version = version.split(".")
@@ -135,102 +117,111 @@ def _get_dataproc_image_path_by_version(version):
     # expand it to 1-5-\d+-debian10 so we can do a regexp on the minor version
     minor_version = parsed_version[1].split("-")[0]
     parsed_version[1] = parsed_version[1].replace("-", r"-\d+-", 1)
-    filter_arg = ("labels.goog-dataproc-version ~ ^{}-{}$ AND NOT name ~ -eap$"
-                  " AND status = READY").format(parsed_version[0],
-                                                parsed_version[1])
+    version_label = "{}-{}".format(parsed_version[0], parsed_version[1])
+    exact = False
   else:
     major_version = parsed_version[0]
     minor_version = parsed_version[1]
-    # Moreover, push the filter of READY status and name not containing 'eap' to
-    # gcloud command so we don't have to iterate the list
-    filter_arg = ("labels.goog-dataproc-version = {}-{}-{} AND NOT name ~ -eap$"
-                  " AND status = READY").format(parsed_version[0],
-                                                parsed_version[1],
-                                                parsed_version[2])
-  command = [
-    "gcloud", "compute", "images", "list", "--project", "cloud-dataproc",
-    "--filter", filter_arg, "--format",
-    "csv[no-heading=true](name,labels.goog-dataproc-version)",
-    "--sort-by=~creationTimestamp"
-  ]
-
-  _LOG.info("Executing command: {}".format(command))
-  # get stdout from compute images list --filters
-  with tempfile.NamedTemporaryFile() as temp_file:
-    pipe = subprocess.Popen(command, stdout=temp_file)
-    pipe.wait()
-    if pipe.returncode != 0:
-      raise RuntimeError(
-        "Cannot find dataproc base image, please check and verify "
-        "[--dataproc-version]")
-
-    temp_file.seek(0)  # go to start of the stdout
-    stdout = temp_file.read()
-    # parse the first ready image with the dataproc version attached in labels
-    if stdout:
-      # in case there are multiple images
-      parsed_lines = stdout.decode('utf-8').strip().split('\n')
-      expected_prefix = "dataproc-{}-{}".format(major_version, minor_version)
-      _LOG.info("Filtering images : %s", expected_prefix)
-      image_versions=[]
-      all_images_for_version = {}
-      for line in parsed_lines:
-        parsed_image = line.split(",")
-        if len(parsed_image) == 2:
-          parsed_image_name = parsed_image[0]
-          if not parsed_image_name.startswith(expected_prefix):
-            _LOG.info("Skipping non-release image %s", parsed_image_name)
-            # Not a regular dataproc release image. Maybe a custom image with same label.
-            continue
-          parsed_image_version = parsed_image[1]
-          if parsed_image_version not in all_images_for_version:
-            all_images_for_version[parsed_image_version] = [_IMAGE_PATH.format("cloud-dataproc", parsed_image_name)]
-            image_versions.append(parsed_image_version)
-          else:
-            all_images_for_version[parsed_image_version].append(_IMAGE_PATH.format("cloud-dataproc", parsed_image_name))
-
-      _LOG.info("All Images : %s", all_images_for_version)
-      _LOG.info("All Image-Versions : %s", image_versions)
-
-      latest_available_version = image_versions[0]
-      if (len(all_images_for_version[latest_available_version]) > 1):
-        raise RuntimeError(
-          "Found more than one images for latest dataproc-version={}. Images: {}".format(
-            latest_available_version,
-            str(all_images_for_version[latest_available_version])))
-
-      _LOG.info("Choosing image %s with version %s", all_images_for_version[image_versions[0]][0], image_versions[0])
-      return all_images_for_version[image_versions[0]][0], image_versions[0]
-
-  raise RuntimeError(
-    "Cannot find dataproc base image with dataproc-version=%s." % version)
-
-
-def _infer_project_id(args):
+    version_label = "{}-{}-{}".format(parsed_version[0], parsed_version[1],
+                                      parsed_version[2])
+    exact = True
+  image_path, image_version = cache.get_or_compute(
+      ("cloud-dataproc", version_label, exact, version),
+      lambda: _list_dataproc_images_by_version(version, version_label, exact,
+                                               major_version, minor_version,
+                                               backend))
+  return image_path, image_version
+
+
+def _list_dataproc_images_by_version(version, version_label, exact,
+                                     major_version, minor_version, backend):
+  """Get the latest Dataproc base image matching the version label."""
+  _LOG.info("Listing images with dataproc-version label: %s", version_label)
+  try:
+    images = backend.list_dataproc_images("cloud-dataproc", version_label,
+                                          exact)
+  except cloud_backend.CloudApiError:
+    raise RuntimeError(
+      "Cannot find dataproc base image, please check and verify "
+      "[--dataproc-version]")
+
+  expected_prefix = "dataproc-{}-{}".format(major_version, minor_version)
+  _LOG.info("Filtering images : %s", expected_prefix)
+  image_versions=[]
+  all_images_for_version = {}
+  for image in images:
+    parsed_image_name = image["name"]
+    parsed_image_version = image.get("labels", {}).get("goog-dataproc-version")
+    if not parsed_image_version:
+      continue
+    if not parsed_image_name.startswith(expected_prefix):
+      _LOG.info("Skipping non-release image %s", parsed_image_name)
+      # Not a regular dataproc release image. Maybe a custom image with same label.
+      continue
+    if parsed_image_version not in all_images_for_version:
+      all_images_for_version[parsed_image_version] = [_IMAGE_PATH.format("cloud-dataproc", parsed_image_name)]
+      image_versions.append(parsed_image_version)
+    else:
+      all_images_for_version[parsed_image_version].append(_IMAGE_PATH.format("cloud-dataproc", parsed_image_name))
+
+  _LOG.info("All Images : %s", all_images_for_version)
+  _LOG.info("All Image-Versions : %s", image_versions)
+
+  if not image_versions:
+    raise RuntimeError(
+      "Cannot find dataproc base image with dataproc-version=%s." % version)
+
+  latest_available_version = image_versions[0]
+  if (len(all_images_for_version[latest_available_version]) > 1):
+    raise RuntimeError(
+      "Found more than one images for latest dataproc-version={}. Images: {}".format(
+        latest_available_version,
+        str(all_images_for_version[latest_available_version])))
+
+  _LOG.info("Choosing image %s with version %s", all_images_for_version[image_versions[0]][0], image_versions[0])
+  return [all_images_for_version[image_versions[0]][0], image_versions[0]]
+
+
+def infer_project_id(args):
   if not args.project_id:
-    args.project_id = _get_project_id()
+    args.project_id = _get_project_id(cloud_backend.get_backend(args))
 
 
-def _infer_base_image(args):
+def infer_base_image(args, output=None):
+  """Infers the base image and Dataproc version of the build.
+
+  The image cache report is printed to `output` if set, otherwise to stdout.
+  """
+  # Batch builds resolve base images shared by several images up front.
+  if getattr(args, "dataproc_base_image", None):
+    return
   # get dataproc base image from dataproc version
   _LOG.info("Getting Dataproc base image name...")
+  cache = image_cache.ImageCache(ttl_sec=args.image_cache_ttl_sec,
+                                 refresh=args.refresh_image_cache)
+  backend = cloud_backend.get_backend(args)
   if args.base_image_uri:
     args.dataproc_base_image = _extract_image_path(args.base_image_uri)
-    args.dataproc_version = _get_dataproc_image_version(args.base_image_uri)
+    args.dataproc_version = _get_dataproc_image_version(args.base_image_uri,
+                                                        cache, backend)
   elif args.dataproc_version:
     args.dataproc_base_image, args.dataproc_version = _get_dataproc_image_path_by_version(
-        args.dataproc_version)
+        args.dataproc_version, cache, backend)
   elif args.base_image_family:
     args.dataproc_base_image = _extract_image_family_path(args.base_image_family)
-    args.dataproc_version = _get_dataproc_version_from_image_family(args.base_image_family)
+    args.dataproc_version = _get_dataproc_version_from_image_family(
+        args.base_image_family, cache, backend)
   else:
     raise RuntimeError(
         "Neither --dataproc-version nor --base-image-uri nor --source-image-family-uri is specified.")
+  cache_report = cache.format_report()
+  if cache_report:
+    print(cache_report, file=output)
   _LOG.info("Returned Dataproc base image: %s", args.dataproc_base_image)
   _LOG.info("Returned Dataproc version   : %s", args.dataproc_version)
 
 
-def _infer_oauth(args):
+def infer_oauth(args):
   if args.oauth:
     args.oauth = "\n    \"OAuthPath\": \"{}\",".format(
         os.path.abspath(args.oauth))
@@ -238,7 +229,7 @@ def _infer_oauth(args):
     args.oauth = ""
 
 
-def _infer_network(args):
+def infer_network(args):
   # When the user wants to create a VM in a shared VPC,
   # only the subnetwork argument has to be provided whereas
   # the network one has to be left empty.
@@ -251,9 +242,13 @@ def _infer_network(args):
     args.network = 'projects/{}/{}'.format(args.project_id, args.network)
 
 
-def infer_args(args):
-  _infer_project_id(args)
-  _infer_base_image(args)
-  _infer_oauth(args)
-  _infer_network(args)
+def infer_shutdown_timer(args):
   args.shutdown_timer_in_sec = args.shutdown_instance_timer_sec
+
+
+def infer_args(args):
+  infer_project_id(args)
+  infer_base_image(args)
+  infer_oauth(args)
+  infer_network(args)
+  infer_shutdown_timer(args)
@@ -21,7 +21,16 @@ import argparse
 import json
 import re
 
+from custom_image_utils import build_fingerprint
+from custom_image_utils import cloud_backend
 from custom_image_utils import constants
+from custom_image_utils import image_cache
+from custom_image_utils import python_image_creator
+from custom_image_utils import quota_checker
+from custom_image_utils import rate_limiter
+from custom_image_utils import smoke_test_runner
+from custom_image_utils import spot_vm
+from custom_image_utils import zone_placement
 
 
 # Old style images: 1.2.3
@@ -29,7 +38,9 @@ from custom_image_utils import constants
 _VERSION_REGEX = re.compile(r"^\d+\.\d+\.\d+(-RC\d+)?(-[a-z\-]+\d+)?$")
 _FULL_IMAGE_URI = re.compile(r"^(https://www\.googleapis\.com/compute/([^/]+)/)?projects/([^/]+)/global/images/([^/]+)$")
 _FULL_IMAGE_FAMILY_URI = re.compile(r"^(https://www\.googleapis\.com/compute/([^/]+)/)?projects/([^/]+)/global/images/family/([^/]+)$")
-_LATEST_FROM_MINOR_VERSION = re.compile(r"^(\d+)\.(\d+)-((?:debian|ubuntu|rocky)\d+)$")
+# Latest subminor version: 2.2-debian12, 2.3-ml-ubuntu22
+_LATEST_FROM_MINOR_VERSION = re.compile(r"^(\d+)\.(\d+)-((?:ml-)?(?:debian|ubuntu|rocky)\d+)$")
+_ZONE_REGEX = re.compile(r"^[a-z]+-[a-z]+\d+-[a-z]$")
 _ARM_ARCH_REGEX = re.compile(r"""
   (?:^|[-_./])  # Non-alphanumeric separator or start of string
   (?:           # Match one of the ARM architecture terms:
@@ -40,6 +51,9 @@ _ARM_ARCH_REGEX = re.compile(r"""
   (?:$|[-_./])  # Non-alphanumeric separator or end of string
 """, re.IGNORECASE | re.VERBOSE)
 _VALID_OPTIONAL_COMPONENTS = ["HIVE_WEBHCAT", "ZEPPELIN", "TRINO", "RANGER", "SOLR", "FLINK", "DOCKER", "HUDI", "ICEBERG", "PIG"]
+# Steps of the pre-capture slimming stage of startup_script/run.sh.
+_SLIMMING_STEPS = ["caches", "logs", "trim", "zero"]
+_DEFAULT_SLIMMING_STEPS = "caches,logs,trim"
 _ARM_MACHINE_TYPE = "c4a-standard-2"
 _X86_MACHINE_TYPE = "n1-standard-1"
 
@@ -68,6 +82,35 @@ def _validate_components(optional_components):
             raise argparse.ArgumentTypeError("Invalid optional component selected.")
     return optional_components
 
+def _validate_slimming_steps(slimming_steps):
+    for step in slimming_steps.split(','):
+        if step not in _SLIMMING_STEPS:
+            raise argparse.ArgumentTypeError(
+                "Invalid slimming step: {}.".format(step))
+    return slimming_steps
+
+def _validate_smoke_test_checks(smoke_test_checks):
+    for check in smoke_test_checks.split(','):
+        if check not in smoke_test_runner.CHECKS:
+            raise argparse.ArgumentTypeError(
+                "Invalid smoke test check: {}.".format(check))
+    return smoke_test_checks
+
+def _validate_api_rate_limits(api_rate_limits):
+    try:
+        rate_limiter.parse_rates(api_rate_limits)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            "Invalid API rate limits: {}.".format(e))
+    return api_rate_limits
+
+def _zones_type(zones):
+    zones = [zone.strip() for zone in zones.split(',') if zone.strip()]
+    for zone in zones:
+        if not _ZONE_REGEX.match(zone):
+            raise argparse.ArgumentTypeError("Invalid zone: {}.".format(zone))
+    return zones
+
 def parse_args(args):
   """Parses command-line arguments."""
   parser = argparse.ArgumentParser()
@@ -117,6 +160,27 @@ def parse_args(args):
       type=str,
       required=True,
       help="""GCE zone used to build the custom image.""")
+  parser.add_argument(
+      "--zones",
+      type=_zones_type,
+      required=False,
+      default=None,
+      metavar="ZONE,...",
+      help="""(Optional) Other zones of the --zone region in which the build
+      VM may be created, when a zone does not have the resources for it, as
+      often happens with scarce --accelerator types. The zones are ranked by
+      the outcome of earlier builds of the same machine and accelerator
+      type. The disk, VM and image steps use the zone the VM was created
+      in.""")
+  parser.add_argument(
+      "--zone-strategy",
+      choices=zone_placement.STRATEGIES,
+      default=zone_placement.RANKED,
+      help="""(Optional) How the --zones are tried. `ranked` (the default)
+      tries them one after the other, moving to the next zone as soon as a
+      zone does not have the resources. `parallel` creates the VM in up to 3
+      zones at once and deletes all but the first VM created. Requires
+      --workflow-engine=python.""")
   required_args.add_argument(
       "--gcs-bucket",
       type=str,
@@ -154,6 +218,24 @@ def parse_args(args):
       action="store_true",
       help="""(Optional) Disables smoke test to verify if the custom image
       can create a functional Dataproc cluster.""")
+  parser.add_argument(
+      "--smoke-test-mode",
+      choices=smoke_test_runner.MODES,
+      default=smoke_test_runner.WORKFLOW,
+      help="""(Optional) How the smoke test runs. `workflow` (the default)
+      runs SparkPi with a workflow template on a managed cluster. `cluster`
+      creates one single-node cluster on the image and runs the checks of
+      --smoke-test-checks on it concurrently, with a timing report per
+      check.""")
+  parser.add_argument(
+      "--smoke-test-checks",
+      type=_validate_smoke_test_checks,
+      required=False,
+      default=None,
+      help="""(Optional) Comma-separated checks of the `cluster` smoke test
+      mode: spark-pi, pyspark, components (health of the Dataproc services)
+      and gpu (GPUs visible to the driver and executors). Default is
+      spark-pi,pyspark,components, and gpu with --accelerator.""")
   parser.add_argument(
       "--network",
       type=str,
@@ -219,6 +301,22 @@ def parse_args(args):
       """(Optional) The accelerators (e.g. GPUs) attached to the VM instance
       that builds the custom image. If not specified, no accelerators are
       attached.""")
+  parser.add_argument(
+      "--provisioning-model",
+      choices=spot_vm.PROVISIONING_MODELS,
+      default=spot_vm.STANDARD,
+      help="""(Optional) Provisioning model of the VM instance that builds
+      the custom image. `standard` (the default) creates an on-demand VM.
+      `spot` creates a cheaper Spot VM which is started again on the same
+      boot disk when it is preempted, up to 3 times, resuming the
+      customization.""")
+  parser.add_argument(
+      "--profile-customization",
+      action="store_true",
+      help="""(Optional) Traces every command of the customization script
+      with its time, and reports the slowest commands and programs once the
+      VM is done. The trace, the report and flame graph stacks in the folded
+      format of flamegraph.pl are written to the log directory.""")
   parser.add_argument(
       "--storage-location",
       type=str,
@@ -264,8 +362,147 @@ def parse_args(args):
       default="googleapis.com",
       help="""(Optional) The universe domain to configure for gcloud. Defaults to 'googleapis.com'."""
   )
+  parser.add_argument(
+      "--api-backend",
+      type=str,
+      required=False,
+      choices=cloud_backend.BACKENDS,
+      default=cloud_backend.GCLOUD,
+      help="""(Optional) How Compute Engine and Dataproc APIs are called
+      outside of the image build workflow script. 'gcloud' runs one gcloud
+      command per call. 'rest' calls the REST APIs directly over pooled
+      connections and falls back to gcloud if they cannot be reached.
+      Default is 'gcloud'.""")
+  parser.add_argument(
+      "--api-rate-limits",
+      type=_validate_api_rate_limits,
+      required=False,
+      default=None,
+      metavar="FAMILY=RATE,...",
+      help="""(Optional) Overrides the requests per second allowed in an API
+      family: compute-read, compute-mutate, serial-port, storage or
+      dataproc, e.g. `compute-mutate=1,serial-port=0.5`. Calls are queued to
+      stay within the rates, and retried with backoff when throttled.""")
+  parser.add_argument(
+      "--shared-rate-limits",
+      action="store_true",
+      help="""(Optional) Shares the API rate limits with the workflow script
+      and the other builds running on this machine, through files locked in
+      the cache directory, so that concurrent builds stay within the API
+      quotas together.""")
+  parser.add_argument(
+      "--refresh-image-cache",
+      action="store_true",
+      help="""(Optional) Ignores cached base image lookups and resolves the
+      base image again. The fresh result replaces the cached one.""")
+  parser.add_argument(
+      "--image-cache-ttl-sec",
+      type=int,
+      required=False,
+      default=image_cache.DEFAULT_TTL_SEC,
+      help="""(Optional) How long in seconds base image lookups are cached
+      on disk. Set to 0 to disable the cache. Default is 3600 seconds.""")
+  parser.add_argument(
+      "--workflow-engine",
+      type=str,
+      required=False,
+      choices=python_image_creator.ENGINES,
+      default=python_image_creator.BASH,
+      help="""(Optional) How the image build workflow is run. 'bash' runs a
+      generated Shell script. 'python' runs each step from Python with
+      per-step timeouts, retries and a step timing report. Builds with a
+      --trusted-cert always use 'bash'. Default is 'bash'.""")
+  parser.add_argument(
+      "--resume",
+      type=str,
+      required=False,
+      default=None,
+      metavar="RUN_ID",
+      help="""(Optional) Resumes the build with the given run id, skipping
+      the steps it completed and reusing its disk or VM. The run id is
+      printed when a build fails. Requires --workflow-engine=python and no
+      --trusted-cert: the bash engine deletes the disk and VM of a failed
+      build.""")
+  parser.add_argument(
+      "--reuse-base-disk-snapshot",
+      action="store_true",
+      help="""(Optional) Creates the build disk from a snapshot of the base
+      image disk, taken by the first build on that base image and kept for
+      later builds. Requires --workflow-engine=python.""")
+  parser.add_argument(
+      "--on-matching-image",
+      choices=build_fingerprint.POLICIES,
+      default=build_fingerprint.BUILD,
+      help="""(Optional) What to do when an image of the project was built
+      from the same base image, sources, metadata, optional components,
+      accelerator and disk size, as recorded by its custom-image-fingerprint
+      label. `build` (the default) builds anyway, `reuse` skips the build and
+      uses the existing image, `alias` creates the image from the existing
+      one, in --family if set, without running the customization.""")
+  parser.add_argument(
+      "--customization-layer",
+      dest="customization_layers",
+      action="append",
+      help="""(Optional) A script run before --customization-script and
+      captured as an intermediate image. Repeat the flag to stack layers in
+      order, each one is built on top of the image of the previous one. A
+      layer image is reused by later builds until its script or a layer
+      below it changes.""")
+  parser.add_argument(
+      "--slim-image",
+      type=_validate_slimming_steps,
+      nargs="?",
+      const=_DEFAULT_SLIMMING_STEPS,
+      default=None,
+      metavar="STEPS",
+      help="""(Optional) Shrinks the image before it is captured, once the
+      customization succeeded. STEPS is a comma-separated list of: `caches`
+      (apt, dnf, conda and pip caches), `logs` (journal and /var/log), `trim`
+      (discards free blocks with fstrim) and `zero` (fills free space with
+      zeros, slower, for disks that do not support discard). Without STEPS,
+      runs caches,logs,trim. Disabled by default.""")
+  parser.add_argument(
+      "--on-insufficient-quota",
+      choices=quota_checker.POLICIES,
+      default=quota_checker.FAIL,
+      help="""(Optional) What to do when the regional or project quotas do
+      not have the headroom for the vCPUs of --machine-type, the GPUs of
+      --accelerator and the SSD of --disk-size, checked before any resource
+      is created. `fail` (the default) stops the build, `wait` checks the
+      quotas again every minute for up to an hour, `ignore` skips the
+      check. In --manifest mode, builds are also only started while the
+      quotas have headroom for them.""")
+  parser.add_argument(
+      "--auto-disk-size",
+      action="store_true",
+      help="""(Optional) Sets the disk size from the peak disk usage
+      measured by earlier builds of the same Dataproc version and
+      customization script, with 15%% headroom and at least 30 GB. Builds
+      without recorded usage use --disk-size.""")
+  # Parsed by parse_batch_args, only listed in the help of a single build.
+  _add_batch_arguments(parser.add_argument_group("batch mode arguments"),
+                       default=argparse.SUPPRESS)
 
   parsed_args = parser.parse_args(args)
+  if (parsed_args.resume and
+      parsed_args.workflow_engine != python_image_creator.PYTHON):
+    parser.error("--resume requires --workflow-engine=python")
+  if parsed_args.zones:
+    parsed_args.zones = [parsed_args.zone] + [
+        zone for zone in parsed_args.zones if zone != parsed_args.zone]
+    region = zone_placement.region_of(parsed_args.zone)
+    if any(zone_placement.region_of(zone) != region
+           for zone in parsed_args.zones):
+      parser.error("--zones must be in the region of --zone, {}".format(
+          region))
+  if (parsed_args.zone_strategy == zone_placement.PARALLEL and
+      parsed_args.workflow_engine != python_image_creator.PYTHON):
+    parser.error("--zone-strategy=parallel requires "
+                 "--workflow-engine=python")
+  if (parsed_args.reuse_base_disk_snapshot and
+      parsed_args.workflow_engine != python_image_creator.PYTHON):
+    parser.error("--reuse-base-disk-snapshot requires "
+                 "--workflow-engine=python")
 
   if parsed_args.machine_type is None:
     is_arm = ((parsed_args.base_image_uri and _ARM_ARCH_REGEX.search(parsed_args.base_image_uri)) or
@@ -278,3 +515,51 @@ def parse_args(args):
   return parsed_args
 
 
+def _add_batch_arguments(parser, default=None):
+  """Adds the batch mode arguments to `parser`.
+
+  If `default` is set, it replaces the default value of every argument.
+  """
+  def value(batch_default):
+    return batch_default if default is None else default
+
+  parser.add_argument(
+      "--manifest",
+      type=str,
+      required=False,
+      default=value(None),
+      help="""(Optional) A JSON or YAML file listing the custom images to
+      build, one entry of generate_custom_image.py arguments per image. Other
+      command-line arguments apply to every image.""")
+  parser.add_argument(
+      "--max-concurrent-builds",
+      type=int,
+      required=False,
+      default=value(4),
+      help="""(Optional) Maximum number of images built concurrently in
+      --manifest mode. Default is 4.""")
+  parser.add_argument(
+      "--max-builds-per-zone",
+      type=int,
+      required=False,
+      default=value(0),
+      help="""(Optional) Maximum number of concurrent builds in one zone in
+      --manifest mode. Default is 0 (no limit).""")
+  parser.add_argument(
+      "--max-builds-per-project",
+      type=int,
+      required=False,
+      default=value(0),
+      help="""(Optional) Maximum number of concurrent builds in one project in
+      --manifest mode. Default is 0 (no limit).""")
+
+
+def parse_batch_args(args):
+  """Parses the batch mode arguments.
+
+  Returns the parsed batch arguments and the remaining arguments, which are
+  applied to every image of the manifest.
+  """
+  parser = argparse.ArgumentParser(add_help=False)
+  _add_batch_arguments(parser)
+  return parser.parse_known_args(args)
@@ -0,0 +1,394 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Builds several custom images from one manifest.
+
+The manifest is a JSON or YAML file of the form:
+
+    defaults:                 # optional, applied to every image
+      zone: us-central1-a
+      gcs-bucket: gs://my-bucket
+    images:
+      - image-name: my-image-2-2-debian12
+        dataproc-version: 2.2-debian12
+        customization-script: my-script.sh
+      - image-name: my-image-2-2-rocky9
+        ...
+
+Each entry holds generate_custom_image.py arguments without the leading
+dashes. Builds run concurrently under a global limit and optional per-zone
+and per-project limits. Base image lookups shared by several entries are
+resolved once before the builds start.
+"""
+
+import collections
+from concurrent import futures
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from custom_image_utils import args_inferer
+from custom_image_utils import args_parser
+from custom_image_utils import image_builder
+from custom_image_utils import quota_checker
+from custom_image_utils import rate_limiter
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+
+
+class BuildEntry:
+  """One image of the manifest and the state of its build."""
+
+  def __init__(self, index, raw_args):
+    self.index = index
+    self.raw_args = raw_args
+    self.args = None
+    self.status = PENDING
+    self.error = None
+    self.start_time = None
+    self.end_time = None
+    self.log_file = None
+    # The zone and project the build holds a slot of while it runs. The
+    # build may place its VM in another zone of --zones.
+    self.slot = None
+
+  @property
+  def name(self):
+    if self.args is not None:
+      return self.args.image_name
+    return "entry-{}".format(self.index)
+
+  @property
+  def zone(self):
+    return self.args.zone
+
+  @property
+  def project(self):
+    return self.args.project_id
+
+  @property
+  def duration(self):
+    if self.start_time is None or self.end_time is None:
+      return None
+    return self.end_time - self.start_time
+
+  def fail(self, error):
+    self.status = FAILED
+    self.error = str(error)
+
+
+def load_manifest(path):
+  """Loads a JSON or YAML manifest. Returns (defaults, list of entries)."""
+  with open(path) as f:
+    content = f.read()
+  if path.endswith((".yaml", ".yml")):
+    try:
+      import yaml
+    except ImportError:
+      raise RuntimeError(
+          "PyYAML is required for YAML manifests, install it with "
+          "`pip install pyyaml` or use a JSON manifest.")
+    manifest = yaml.safe_load(content)
+  else:
+    manifest = json.loads(content)
+
+  if isinstance(manifest, list):
+    return {}, manifest
+  if not isinstance(manifest, dict) or "images" not in manifest:
+    raise RuntimeError(
+        "Invalid manifest {}: expected a list of images or a mapping with an "
+        "'images' list.".format(path))
+  return manifest.get("defaults") or {}, manifest["images"]
+
+
+def to_command_line(entry):
+  """Converts a manifest entry to generate_custom_image.py arguments."""
+  command_line = []
+  for key, value in entry.items():
+    flag = "--" + key.replace("_", "-")
+    if value is True:
+      command_line.append(flag)
+    elif value is False or value is None:
+      continue
+    elif isinstance(value, dict):
+      command_line.extend([flag, json.dumps(value)])
+    elif isinstance(value, list):
+      # Repeated flags, e.g. customization-layer.
+      for item in value:
+        command_line.extend([flag, str(item)])
+    else:
+      command_line.extend([flag, str(value)])
+  return command_line
+
+
+def parse_entries(defaults, images, common_args):
+  """Parses the arguments of every manifest entry.
+
+  Entry arguments take precedence over command-line arguments, which take
+  precedence over the manifest defaults.
+  """
+  entries = []
+  for index, image in enumerate(images):
+    entry = BuildEntry(index, to_command_line(defaults) + list(common_args) +
+                       to_command_line(image))
+    try:
+      entry.args = args_parser.parse_args(entry.raw_args)
+    except SystemExit:
+      entry.fail("Invalid arguments: {}".format(" ".join(entry.raw_args)))
+    entries.append(entry)
+  return entries
+
+
+def _base_image_key(args):
+  return (args.base_image_uri, args.dataproc_version, args.base_image_family,
+          args.api_backend, args.universe_domain, args.refresh_image_cache,
+          args.image_cache_ttl_sec)
+
+
+def resolve_shared_lookups(entries):
+  """Resolves the default project and base images once per distinct value."""
+  entries = [e for e in entries if e.status == PENDING]
+
+  need_project = [e for e in entries if not e.args.project_id]
+  if need_project:
+    try:
+      args_inferer.infer_project_id(need_project[0].args)
+    except RuntimeError as e:
+      for entry in need_project:
+        entry.fail(e)
+    else:
+      for entry in need_project[1:]:
+        entry.args.project_id = need_project[0].args.project_id
+
+  groups = collections.OrderedDict()
+  for entry in entries:
+    if entry.status == PENDING:
+      groups.setdefault(_base_image_key(entry.args), []).append(entry)
+  _LOG.info("Resolving %d distinct base images for %d builds", len(groups),
+            len(entries))
+
+  def resolve(group):
+    try:
+      args_inferer.infer_base_image(group[0].args)
+    except RuntimeError as e:
+      for entry in group:
+        entry.fail(e)
+      return
+    for entry in group[1:]:
+      entry.args.dataproc_base_image = group[0].args.dataproc_base_image
+      entry.args.dataproc_version = group[0].args.dataproc_version
+
+  if groups:
+    with futures.ThreadPoolExecutor(max_workers=len(groups)) as executor:
+      list(executor.map(resolve, groups.values()))
+
+
+class Scheduler:
+  """Runs builds concurrently under global, per-zone and per-project limits.
+
+  A limit of 0 means unlimited. Queued builds are started in manifest order,
+  skipping over builds whose zone or project is at its limit so that they do
+  not hold up builds elsewhere. With an `admission` QuotaLedger, builds are
+  also only started while the quotas have headroom for them, and builds
+  waiting for quota are admitted once the quotas read again have headroom.
+  """
+
+  def __init__(self, max_concurrent, max_per_zone=0, max_per_project=0,
+               admission=None):
+    self.max_concurrent = max(1, max_concurrent)
+    self.max_per_zone = max_per_zone
+    self.max_per_project = max_per_project
+    self.admission = admission
+    self.peak_concurrent = 0
+    self._running = 0
+    self._zones = collections.Counter()
+    self._projects = collections.Counter()
+    self._condition = threading.Condition()
+
+  def _can_start(self, entry):
+    if self._running >= self.max_concurrent:
+      return False
+    if self.max_per_zone and self._zones[entry.zone] >= self.max_per_zone:
+      return False
+    if (self.max_per_project and
+        self._projects[entry.project] >= self.max_per_project):
+      return False
+    return True
+
+  def _prepare(self, entry):
+    if self.admission is not None:
+      self.admission.prepare(entry.args)
+
+  def _admit(self, entry):
+    if self.admission is None:
+      return True
+    return self.admission.admit(entry.args)
+
+  def _next_entry(self, queue):
+    """Returns the first queued entry that can start, or None.
+
+    Entries which do not fit in the quotas at all are failed.
+    """
+    for entry in list(queue):
+      if not self._can_start(entry):
+        continue
+      try:
+        if self._admit(entry):
+          return entry
+      except quota_checker.QuotaError as e:
+        queue.remove(entry)
+        entry.fail(e)
+    return None
+
+  def _quota_refresh_delay(self):
+    if self.admission is None:
+      return None
+    return self.admission.refresh_delay()
+
+  def _wait_for_quota(self):
+    """Waits for a build to finish, or reads the quotas again when due.
+
+    Called with the lock held, which is released while the quotas are read.
+    """
+    delay = self._quota_refresh_delay()
+    if delay > 0:
+      self._condition.wait(delay)
+      return
+    self._condition.release()
+    try:
+      self.admission.refresh()
+    finally:
+      self._condition.acquire()
+
+  def _run_one(self, entry, build_func):
+    try:
+      build_func(entry)
+      entry.status = SUCCEEDED
+    except (Exception, SystemExit) as e:  # SystemExit of argparse errors.
+      entry.fail(e)
+    finally:
+      entry.end_time = time.time()
+      with self._condition:
+        zone, project = entry.slot
+        self._running -= 1
+        self._zones[zone] -= 1
+        self._projects[project] -= 1
+        if self.admission is not None:
+          self.admission.release(entry.args)
+        self._condition.notify_all()
+
+  def run(self, entries, build_func):
+    """Calls `build_func(entry)` for every pending entry."""
+    queue = [e for e in entries if e.status == PENDING]
+    # Reads the quotas over the network before holding the lock, so that
+    # admitting builds is done in memory.
+    for entry in queue:
+      self._prepare(entry)
+    threads = []
+    with self._condition:
+      while queue or self._running:
+        entry = self._next_entry(queue)
+        if entry is None:
+          if self._quota_refresh_delay() is not None:
+            self._wait_for_quota()
+          elif queue or self._running:
+            self._condition.wait()
+          continue
+        queue.remove(entry)
+        entry.slot = (entry.zone, entry.project)
+        self._running += 1
+        self._zones[entry.zone] += 1
+        self._projects[entry.project] += 1
+        self.peak_concurrent = max(self.peak_concurrent, self._running)
+        entry.status = RUNNING
+        entry.start_time = time.time()
+        thread = threading.Thread(target=self._run_one,
+                                  args=(entry, build_func),
+                                  name="build-" + entry.name)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+      thread.join()
+
+
+def _format_duration(seconds):
+  if seconds is None:
+    return "-"
+  return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def format_summary(entries):
+  """Formats the consolidated summary table of a batch run."""
+  rows = [("IMAGE", "PROJECT", "ZONE", "STATUS", "DURATION", "DETAILS")]
+  for entry in entries:
+    details = entry.error if entry.status == FAILED else entry.log_file
+    rows.append((entry.name,
+                 entry.project if entry.args else "-",
+                 entry.zone if entry.args else "-",
+                 entry.status,
+                 _format_duration(entry.duration),
+                 (details or "")[:120]))
+  widths = [max(len(str(row[i])) for row in rows) for i in range(5)]
+  lines = []
+  for row in rows:
+    lines.append("  ".join(
+        [str(value).ljust(width) for value, width in zip(row, widths)] +
+        [str(row[5])]).rstrip())
+  succeeded = sum(1 for e in entries if e.status == SUCCEEDED)
+  lines.append("{} of {} images built successfully.".format(
+      succeeded, len(entries)))
+  return "\n".join(lines)
+
+
+def run(batch_args, common_args):
+  """Builds every image of the manifest. Returns whether all succeeded."""
+  defaults, images = load_manifest(batch_args.manifest)
+  entries = parse_entries(defaults, images, common_args)
+  # The builds share the limiter of the process, set up for the first one.
+  for entry in entries:
+    if entry.status == PENDING:
+      rate_limiter.configure(entry.args)
+      break
+  resolve_shared_lookups(entries)
+
+  log_dir = "/tmp/custom-image-batch-{}".format(
+      datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+  os.makedirs(log_dir, exist_ok=True)
+  print("Building {} images, logs in {}".format(len(entries), log_dir))
+
+  def build(entry):
+    entry.log_file = os.path.join(log_dir, "{}.log".format(entry.name))
+    with open(entry.log_file, "w") as output:
+      image_builder.build(entry.args, output=output)
+
+  scheduler = Scheduler(batch_args.max_concurrent_builds,
+                        batch_args.max_builds_per_zone,
+                        batch_args.max_builds_per_project,
+                        admission=quota_checker.QuotaLedger())
+  scheduler.run(entries, build)
+  print(format_summary(entries))
+  api_report = rate_limiter.format_report()
+  if api_report:
+    print(api_report)
+  return all(entry.status == SUCCEEDED for entry in entries)
@@ -0,0 +1,132 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Build fingerprints, to reuse an image built from the same inputs.
+
+The fingerprint is a digest of everything that goes into an image: the
+resolved base image, the contents of the customization layers and script,
+startup scripts and extra sources, metadata, optional components,
+accelerator, disk size, slimming steps and secure boot certificate. It is stamped as the
+`custom-image-fingerprint` label of the image when it is created.
+
+With --on-matching-image, a build first looks up an image of the project with
+the same fingerprint. `reuse` then skips the build and reports the existing
+image, `alias` creates the requested image from the existing one, in
+--family if set, without running the customization again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import source_uploader
+
+FINGERPRINT_LABEL = "custom-image-fingerprint"
+
+BUILD = "build"
+REUSE = "reuse"
+ALIAS = "alias"
+POLICIES = (BUILD, REUSE, ALIAS)
+
+# Bump when the inputs of the fingerprint change, so that older images no
+# longer match.
+_FINGERPRINT_VERSION = 1
+# Label values are limited to 63 characters.
+_FINGERPRINT_LENGTH = 40
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+def build_sources(args):
+  """Returns the {name: path} sources of a build, as uploaded to GCS."""
+  sources = {
+      "run.sh": "startup_script/run.sh",
+      "init_actions.sh": args.customization_script,
+      "gce-proxy-setup.sh": "startup_script/gce-proxy-setup.sh"
+  }
+  sources.update(args.extra_sources)
+  return sources
+
+
+def compute(args):
+  """Returns the build fingerprint of inferred arguments."""
+  files = source_uploader.list_source_files(build_sources(args))
+  trusted_cert = None
+  if args.trusted_cert and os.path.isfile(args.trusted_cert):
+    trusted_cert = source_uploader.hash_file(args.trusted_cert)
+  inputs = {
+      "version": _FINGERPRINT_VERSION,
+      "base_image": args.dataproc_base_image,
+      "sources": sorted((f.name, source_uploader.hash_file(f.path))
+                        for f in files),
+      "metadata": args.metadata or "",
+      "optional_components": sorted(
+          (args.optional_components or "").split(",")),
+      "accelerator": args.accelerator or "",
+      "disk_size": args.disk_size,
+      "trusted_cert": trusted_cert,
+  }
+  # Layers and slimming are only part of the inputs when set, so that the
+  # fingerprints of builds without them do not change.
+  layers = getattr(args, "customization_layers", None)
+  if layers:
+    inputs["layers"] = [source_uploader.hash_file(l) for l in layers]
+  if getattr(args, "slim_image", None):
+    inputs["slim_image"] = sorted(args.slim_image.split(","))
+  digest = hashlib.sha256(
+      json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+  return digest[:_FINGERPRINT_LENGTH]
+
+
+def find_matching_image(backend, project_id, fingerprint):
+  """Returns the newest image with the fingerprint, or None."""
+  images = backend.list_images_by_label(project_id, FINGERPRINT_LABEL,
+                                        fingerprint)
+  return images[0] if images else None
+
+
+def use_matching_image(args, image, output=None):
+  """Reuses or aliases `image` instead of building args.image_name.
+
+  With `reuse`, args.image_name is set to the existing image so that the
+  following phases apply to it.
+  """
+  if args.on_matching_image == REUSE:
+    print("Reusing image {} built from the same inputs (fingerprint "
+          "{}).".format(image["name"], args.build_fingerprint), file=output)
+    args.image_name = image["name"]
+    args.image_creation_timestamp = image.get("creationTimestamp")
+    return
+  print("Creating image {} from image {} built from the same inputs "
+        "(fingerprint {}).".format(args.image_name, image["name"],
+                                   args.build_fingerprint), file=output)
+  if args.dry_run:
+    return
+  alias = {
+      "name": args.image_name,
+      "sourceImage": "projects/{}/global/images/{}".format(
+          args.project_id, image["name"]),
+      "labels": dict(image.get("labels", {})),
+  }
+  if args.family:
+    alias["family"] = args.family
+  if args.storage_location:
+    alias["storageLocations"] = [args.storage_location]
+  created = cloud_backend.get_backend(args).create_image(args.project_id,
+                                                        alias)
+  args.image_creation_timestamp = created.get("creationTimestamp")
@@ -0,0 +1,107 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Durable journal of the completed steps of a build.
+
+The journal is a JSON lines file with one record per completed step and the
+resources it created. It is written locally and mirrored to the GCS bucket
+after each step, so a build can be resumed with `--resume <run_id>` even
+from another workstation.
+"""
+
+import json
+import logging
+import os
+import time
+
+from custom_image_utils import cloud_backend
+
+JOURNAL_FILE = "journal.jsonl"
+
+_RUN_KEYS = ("image_name", "project_id", "zone")
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class BuildJournal:
+  """Records completed steps in a local file mirrored to GCS."""
+
+  def __init__(self, path, gcs_uri=None, backend=None):
+    self.path = path
+    self.gcs_uri = gcs_uri
+    self.backend = backend
+    self.run = None
+    self.steps = {}
+
+  def load(self):
+    """Loads the local journal, or the GCS copy if there is no local one.
+
+    Returns whether a journal was found.
+    """
+    if not os.path.exists(self.path) and self.gcs_uri:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      try:
+        self.backend.download_file(self.gcs_uri, self.path)
+      except cloud_backend.NotFoundError:
+        return False
+    if not os.path.exists(self.path):
+      return False
+    with open(self.path) as f:
+      for line in f:
+        if not line.strip():
+          continue
+        entry = json.loads(line)
+        if "run" in entry:
+          self.run = entry["run"]
+        else:
+          self.steps[entry["step"]] = entry.get("resources", {})
+    return True
+
+  def start(self, args):
+    """Records the run, or checks it matches the run being resumed."""
+    run = {key: getattr(args, key) for key in _RUN_KEYS}
+    if self.run is None:
+      self.run = run
+      self._append({"run": run, "time": time.time()})
+    elif self.run != run:
+      raise RuntimeError(
+          "Cannot resume: the journal {} was written for {}, not {}.".format(
+              self.path, self.run, run))
+
+  def completed(self, step_name):
+    return step_name in self.steps
+
+  def resources(self, step_name):
+    return self.steps.get(step_name, {})
+
+  def record(self, step_name, resources=None):
+    """Records a completed step and the resources it created."""
+    self.steps[step_name] = resources or {}
+    self._append({"step": step_name, "resources": resources or {},
+                  "time": time.time()})
+
+  def _append(self, entry):
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    with open(self.path, "a") as f:
+      f.write(json.dumps(entry, sort_keys=True) + "\n")
+      f.flush()
+      os.fsync(f.fileno())
+    if self.gcs_uri:
+      try:
+        self.backend.upload_file(self.path, self.gcs_uri)
+      except cloud_backend.CloudApiError as e:
+        # The local journal still allows resuming from this workstation.
+        _LOG.warning("Failed to copy the journal to %s: %s", self.gcs_uri, e)
@@ -0,0 +1,233 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Pluggable backend for the Compute Engine and Dataproc API calls made while
+building a custom image.
+
+Two backends are available:
+  * gcloud: runs one `gcloud` subprocess per call (the default).
+  * rest: talks to the REST APIs directly over pooled keep-alive connections,
+    falling back to gcloud when the REST API is unreachable.
+"""
+
+import threading
+
+GCLOUD = "gcloud"
+REST = "rest"
+BACKENDS = (GCLOUD, REST)
+
+_backends = {}
+_backends_lock = threading.Lock()
+_override = None
+
+
+class CloudApiError(RuntimeError):
+  """An API call failed."""
+
+  def __init__(self, message, status=None):
+    super(CloudApiError, self).__init__(message)
+    self.status = status
+
+
+class NotFoundError(CloudApiError):
+  """The requested resource does not exist."""
+
+  def __init__(self, message):
+    super(NotFoundError, self).__init__(message, status=404)
+
+
+class CloudBackend:
+  """Interface of the API calls used by the custom image tool.
+
+  Resources are returned as dicts in the shape of the REST API, restricted
+  to the fields the tool reads.
+  """
+
+  def get_project_id(self):
+    """Returns the default project of the active gcloud configuration."""
+    raise NotImplementedError()
+
+  def describe_image(self, project_id, image_name):
+    """Returns an image resource. Raises NotFoundError if it is missing."""
+    raise NotImplementedError()
+
+  def describe_image_from_family(self, project_id, family):
+    """Returns the latest non-deprecated image resource of a family."""
+    raise NotImplementedError()
+
+  def image_exists(self, project_id, image_name):
+    """Returns whether an image exists."""
+    raise NotImplementedError()
+
+  def list_dataproc_images(self, project_id, version_label, exact):
+    """Lists READY, non-EAP images by `goog-dataproc-version` label.
+
+    If `exact` is set the label must equal `version_label`, otherwise
+    `version_label` is a regular expression matched against the whole label.
+    Images are returned newest first.
+    """
+    raise NotImplementedError()
+
+  def list_images_by_label(self, project_id, key, value):
+    """Lists READY images of a project whose label `key` is `value`.
+
+    Images are returned newest first.
+    """
+    raise NotImplementedError()
+
+  def add_image_labels(self, project_id, image_name, labels):
+    """Adds labels to an image."""
+    raise NotImplementedError()
+
+  def describe_machine_type(self, project_id, zone, machine_type):
+    """Returns a machine type resource, with at least its guestCpus."""
+    raise NotImplementedError()
+
+  def get_region_quotas(self, project_id, region):
+    """Returns the Compute Engine quotas of a region.
+
+    Each quota is a dict with the `metric`, `limit` and `usage` fields.
+    """
+    raise NotImplementedError()
+
+  def get_project_quotas(self, project_id):
+    """Returns the global Compute Engine quotas of a project."""
+    raise NotImplementedError()
+
+  def describe_instance(self, project_id, zone, instance_name):
+    """Returns an instance resource. Raises NotFoundError if it is missing."""
+    raise NotImplementedError()
+
+  def get_serial_port_output(self, project_id, zone, instance_name, port,
+                             start):
+    """Returns serial port output starting at byte offset `start`.
+
+    The result has the `contents`, `start` and `next` fields of the API.
+    `start` is larger than requested if older output was discarded.
+    """
+    raise NotImplementedError()
+
+  def get_guest_attributes(self, project_id, zone, instance_name, namespace):
+    """Returns the {key: value} guest attributes of an instance namespace.
+
+    Raises NotFoundError if none was published yet.
+    """
+    raise NotImplementedError()
+
+  def create_disk(self, project_id, zone, disk):
+    """Creates a disk from its REST representation and waits for it."""
+    raise NotImplementedError()
+
+  def delete_disk(self, project_id, zone, disk_name):
+    """Deletes a disk and waits for it."""
+    raise NotImplementedError()
+
+  def describe_snapshot(self, project_id, snapshot_name):
+    """Returns a snapshot resource. Raises NotFoundError if it is missing."""
+    raise NotImplementedError()
+
+  def create_snapshot(self, project_id, zone, disk_name, snapshot):
+    """Snapshots a disk, `snapshot` being its REST representation."""
+    raise NotImplementedError()
+
+  def create_instance(self, project_id, zone, instance):
+    """Creates an instance from its REST representation and waits for it."""
+    raise NotImplementedError()
+
+  def stop_instance(self, project_id, zone, instance_name):
+    """Stops an instance and waits for it."""
+    raise NotImplementedError()
+
+  def start_instance(self, project_id, zone, instance_name):
+    """Starts a stopped instance and waits for it."""
+    raise NotImplementedError()
+
+  def delete_instance(self, project_id, zone, instance_name):
+    """Deletes an instance and waits for it."""
+    raise NotImplementedError()
+
+  def create_image(self, project_id, image):
+    """Creates an image from its REST representation and waits for it.
+
+    Returns the created image, with at least its creationTimestamp.
+    """
+    raise NotImplementedError()
+
+  def upload_file(self, local_path, gcs_uri):
+    """Copies a local file to a gs:// URI."""
+    raise NotImplementedError()
+
+  def object_exists(self, gcs_uri):
+    """Returns whether a gs:// object exists."""
+    raise NotImplementedError()
+
+  def download_file(self, gcs_uri, local_path):
+    """Copies a gs:// URI to a local file. Raises NotFoundError if missing."""
+    raise NotImplementedError()
+
+  def create_workflow_template(self, project_id, region, template):
+    """Creates a Dataproc workflow template from its REST representation."""
+    raise NotImplementedError()
+
+  def instantiate_workflow_template(self, project_id, region, template_id):
+    """Runs a Dataproc workflow template and waits for it to finish."""
+    raise NotImplementedError()
+
+  def delete_workflow_template(self, project_id, region, template_id):
+    """Deletes a Dataproc workflow template."""
+    raise NotImplementedError()
+
+  def create_cluster(self, project_id, region, cluster):
+    """Creates a Dataproc cluster from its REST representation and waits."""
+    raise NotImplementedError()
+
+  def submit_job(self, project_id, region, job):
+    """Runs a Dataproc job and waits for it. Raises CloudApiError if failed.
+
+    Only `sparkJob` and `pysparkJob` jobs are supported by all backends.
+    """
+    raise NotImplementedError()
+
+  def delete_cluster(self, project_id, region, cluster_name):
+    """Starts deleting a Dataproc cluster, without waiting."""
+    raise NotImplementedError()
+
+
+def set_backend(backend):
+  """Forces get_backend() to return `backend`, e.g. a fake in tests."""
+  global _override
+  _override = backend
+
+
+def get_backend(args):
+  """Returns the shared backend selected by --api-backend.
+
+  Its calls go through the rate limiter, which rate_limiter.configure sets
+  up from the build arguments.
+  """
+  if _override is not None:
+    return _override
+  key = (args.api_backend, args.universe_domain)
+  with _backends_lock:
+    if key not in _backends:
+      # Imported here since the backends depend on this module.
+      from custom_image_utils import gcloud_backend
+      from custom_image_utils import rest_backend
+      if args.api_backend == REST:
+        _backends[key] = rest_backend.RestBackend(
+            universe_domain=args.universe_domain,
+            fallback=gcloud_backend.GcloudBackend())
+      else:
+        _backends[key] = gcloud_backend.GcloudBackend()
+    return _backends[key]
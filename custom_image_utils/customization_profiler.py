@@ -0,0 +1,217 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Per-command profile of the customization script.
+
+With --profile-customization, run.sh runs the customization script with an
+xtrace line per command, written to a separate trace file as:
+
+    +<TAB><epoch seconds><TAB><file>:<line><TAB><functions><TAB><command>
+
+where the `+` are repeated once per subshell level and the functions are
+listed innermost first. The trace is uploaded next to the build logs.
+
+A command is taken to run until the next command is traced, so the time of
+background jobs is attributed to the commands running meanwhile. The
+analyzer reports the slowest commands and the time by program, and writes
+the time by function stack in the folded format of flamegraph.pl:
+
+    python -m custom_image_utils.customization_profiler \\
+        <log_dir>/customization.xtrace [--top 20] [--folded out.folded]
+"""
+
+import argparse
+import collections
+import logging
+import os
+import re
+import sys
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import finalizer
+
+TRACE_FILE = "customization.xtrace"
+REPORT_FILE = "customization-profile.txt"
+FOLDED_FILE = "customization-profile.folded"
+DEFAULT_TOP = 20
+# Written by run.sh once the customization script exited.
+_END_COMMAND = "# end"
+_TRACE_LINE = re.compile(
+    r"^(\++)\t(\d+(?:[.,]\d+)?)\t([^\t]*):(\d+)\t([^\t]*)\t(.*)$")
+_MAX_COMMAND_CHARS = 100
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class TracedCommand:
+  """A command of the trace and how long it ran."""
+
+  def __init__(self, start, depth, source, line, functions, command):
+    self.start = start
+    self.depth = depth
+    self.source = source
+    self.line = line
+    # Outermost first, without the implicit `main` and `source` frames.
+    self.functions = [f for f in reversed(functions.split())
+                      if f not in ("main", "source")]
+    self.command = command
+    self.duration = 0.0
+
+  @property
+  def program(self):
+    """The program or builtin run, without assignments and its path."""
+    for word in self.command.split():
+      if "=" not in word.split("/")[0]:
+        return os.path.basename(word)
+    return self.command.split("=")[0] + "="
+
+  @property
+  def location(self):
+    return "{}:{}".format(self.source, self.line)
+
+
+def parse(lines):
+  """Returns the TracedCommands of trace lines, with their duration.
+
+  Lines which do not start a command continue the previous one, as traced
+  commands may span several lines.
+  """
+  commands = []
+  end = None
+  for line in lines:
+    line = line.rstrip("\n")
+    match = _TRACE_LINE.match(line)
+    if not match:
+      if commands and line:
+        commands[-1].command += "\n" + line
+      continue
+    plus, start, source, lineno, functions, command = match.groups()
+    start = float(start.replace(",", "."))
+    if command == _END_COMMAND:
+      end = start
+      continue
+    commands.append(TracedCommand(start, len(plus), source, int(lineno),
+                                  functions, command))
+  for current, following in zip(commands, commands[1:]):
+    current.duration = max(following.start - current.start, 0.0)
+  if commands and end is not None:
+    commands[-1].duration = max(end - commands[-1].start, 0.0)
+  return commands
+
+
+def parse_file(path):
+  with open(path, errors="replace") as f:
+    return parse(f)
+
+
+def _shorten(command):
+  command = " ".join(command.split())
+  if len(command) > _MAX_COMMAND_CHARS:
+    command = command[:_MAX_COMMAND_CHARS - 3] + "..."
+  return command
+
+
+def format_report(commands, top=DEFAULT_TOP):
+  """Formats the slowest commands and the time by program."""
+  total = sum(c.duration for c in commands)
+  lines = ["Customization profile: {} commands, {:.1f}s".format(
+      len(commands), total)]
+  lines.append("Slowest commands:")
+  for command in sorted(commands, key=lambda c: -c.duration)[:top]:
+    lines.append("  {:9.3f}s {:5.1f}%  {:<24} {}".format(
+        command.duration, command.duration / total * 100 if total else 0.0,
+        command.location, _shorten(command.command)))
+  by_program = collections.defaultdict(lambda: [0.0, 0])
+  for command in commands:
+    by_program[command.program][0] += command.duration
+    by_program[command.program][1] += 1
+  lines.append("Time by program:")
+  for program, (duration, count) in sorted(
+      by_program.items(), key=lambda item: -item[1][0])[:top]:
+    lines.append("  {:9.3f}s {:5.1f}%  {:<24} {} calls".format(
+        duration, duration / total * 100 if total else 0.0, program, count))
+  return "\n".join(lines)
+
+
+def folded_stacks(commands):
+  """Returns the flamegraph.pl folded lines, weighted in milliseconds."""
+  stacks = collections.Counter()
+  for command in commands:
+    frames = [command.source] + command.functions + [command.program]
+    stacks[";".join(f.replace(";", ":").replace(" ", "_")
+                    for f in frames)] += command.duration * 1000
+  return ["{} {}".format(stack, int(round(ms)))
+          for stack, ms in sorted(stacks.items()) if round(ms) > 0]
+
+
+def analyze(trace_path, output_dir, top=DEFAULT_TOP):
+  """Writes the report and folded stacks of a trace. Returns the report."""
+  commands = parse_file(trace_path)
+  report = format_report(commands, top)
+  with open(os.path.join(output_dir, REPORT_FILE), "w") as f:
+    f.write(report + "\n")
+  with open(os.path.join(output_dir, FOLDED_FILE), "w") as f:
+    f.writelines(line + "\n" for line in folded_stacks(commands))
+  return report
+
+
+def trace_uri(gcs_log_dir):
+  """The gs:// URI run.sh uploads the trace to."""
+  return finalizer.log_uri(gcs_log_dir, TRACE_FILE)
+
+
+def report(args, output=None, backend=None):
+  """Downloads and analyzes the trace of a build, with --profile-customization.
+
+  A missing trace, e.g. when the customization did not run, only prints a
+  warning.
+  """
+  if not getattr(args, "profile_customization", False):
+    return
+  try:
+    trace_path = finalizer.download_log(args, TRACE_FILE, backend)
+    if not trace_path:
+      return
+    text = analyze(trace_path, args.log_dir)
+  except (cloud_backend.CloudApiError, IOError, OSError) as e:
+    print("Warning: no customization profile: {}".format(e), file=output)
+    return
+  print(text, file=output)
+  print("Customization profile written to {}/{}, flame graph stacks to "
+        "{}/{}".format(args.log_dir, REPORT_FILE, args.log_dir, FOLDED_FILE),
+        file=output)
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description="Reports the slowest commands of a customization trace.")
+  parser.add_argument("trace", help="customization.xtrace of a build.")
+  parser.add_argument("--top", type=int, default=DEFAULT_TOP,
+                      help="Number of commands and programs reported.")
+  parser.add_argument("--folded", default=None,
+                      help="Writes the stacks in the folded format of "
+                      "flamegraph.pl to this file.")
+  args = parser.parse_args(argv)
+  commands = parse_file(args.trace)
+  print(format_report(commands, args.top))
+  if args.folded:
+    with open(args.folded, "w") as f:
+      f.writelines(line + "\n" for line in folded_stacks(commands))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
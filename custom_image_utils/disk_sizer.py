@@ -0,0 +1,198 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Disk right-sizing from the disk usage measured on build VMs.
+
+While the customization script runs, run.sh samples the used space of the
+root filesystem and prints the peak to the startup script log as
+`maximum-disk-used-bytes`. After a build, the peak is recorded on disk for
+its Dataproc version (or base image) and purpose, the name of its
+customization script. With --auto-disk-size, later builds of the same
+version and purpose use the smallest --disk-size that fits the largest
+recorded peak with some headroom.
+
+Run as a script, it prints the recommended disk sizes of startup script logs
+as the Shell `case` lines of examples/secure-boot/pre-init.sh:
+
+  python -m custom_image_utils.disk_sizer \\
+      /tmp/custom-image-*/logs/startup-script.log
+"""
+
+import argparse
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+from custom_image_utils import image_cache
+
+HISTORY_FILE = "disk-usage.json"
+STARTUP_SCRIPT_LOG = "startup-script.log"
+# The default --disk-size, and the smallest size the examples build with.
+MIN_DISK_SIZE_GB = 30
+# Free space left on top of the peak usage.
+HEADROOM = 1.15
+# Peaks kept per version and purpose, the largest one is used.
+MAX_SAMPLES = 5
+
+_GIB = 1024 ** 3
+_PEAK = re.compile(r"maximum-disk-used-bytes: (\d+)")
+# Printed in KiB by the examples/secure-boot customization scripts.
+_LEGACY_PEAK = re.compile(r"maximum-disk-used: (\d+)")
+# /tmp/custom-image-dataproc-2-2-deb12-20250429-193537-tf-20250429-193700
+_BUILD_DIR = re.compile(
+    r"custom-image-dataproc-(\d+-\d+-(?:deb|roc|ubu)\d+)-(\d{8}-\d{6})-(.+)-"
+    r"\d{8}-\d{6}")
+_DISTROS = (("deb", "debian"), ("roc", "rocky"), ("ubu", "ubuntu"))
+
+_lock = threading.Lock()
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+def read_peak_usage(log_file):
+  """Returns the peak disk usage in bytes printed to a log, or None."""
+  peak = legacy_peak = None
+  try:
+    with open(log_file, errors="replace") as f:
+      for line in f:
+        match = _PEAK.search(line)
+        if match:
+          peak = max(peak or 0, int(match.group(1)))
+          continue
+        match = _LEGACY_PEAK.search(line)
+        if match:
+          legacy_peak = max(legacy_peak or 0, int(match.group(1)) * 1024)
+  except (IOError, OSError):
+    return None
+  return peak if peak is not None else legacy_peak
+
+
+def recommend_disk_size(peak_bytes, minimum=MIN_DISK_SIZE_GB):
+  """Returns the smallest safe disk size in GB for a peak usage."""
+  return max(minimum, int(math.ceil(peak_bytes / _GIB * HEADROOM)))
+
+
+def usage_key(args):
+  """Returns the (version, purpose) disk usage is recorded under."""
+  version = args.dataproc_version or os.path.basename(
+      args.dataproc_base_image or "")
+  purpose = os.path.splitext(os.path.basename(args.customization_script))[0]
+  return version, purpose
+
+
+class DiskUsageHistory:
+  """Peak disk usages of past builds, persisted to a JSON file."""
+
+  def __init__(self, cache_dir=None):
+    self.path = os.path.join(cache_dir or image_cache.default_cache_dir(),
+                             HISTORY_FILE)
+
+  def peak(self, key):
+    """Returns the largest recorded peak usage in bytes for `key`, or None."""
+    with _lock:
+      samples = image_cache.read_json_file(self.path).get("/".join(key), [])
+    return max(s["peak_bytes"] for s in samples) if samples else None
+
+  def record(self, key, peak_bytes, disk_size_gb, image_name):
+    def append(entries):
+      samples = entries.setdefault("/".join(key), [])
+      samples.append({
+          "peak_bytes": peak_bytes,
+          "disk_size_gb": disk_size_gb,
+          "image": image_name,
+          "recorded": time.time(),
+      })
+      del samples[:-MAX_SAMPLES]
+      return entries
+
+    with _lock:
+      try:
+        image_cache.update_json_file(self.path, append, indent=2,
+                                     sort_keys=True)
+      except (IOError, OSError) as e:
+        _LOG.warning("Unable to write disk usage history %s: %s", self.path, e)
+
+
+def apply(args, output=None, history=None):
+  """Sets args.disk_size from recorded usage, with --auto-disk-size."""
+  if not getattr(args, "auto_disk_size", False):
+    return
+  if getattr(args, "customization_layers", None):
+    # The build disk cannot be smaller than the image of the top layer,
+    # which is built with --disk-size.
+    print("--auto-disk-size is ignored with --customization-layer.",
+          file=output)
+    return
+  key = usage_key(args)
+  peak = (history or DiskUsageHistory()).peak(key)
+  if peak is None:
+    print("No disk usage recorded for {} {}, using --disk-size {}.".format(
+        key[0], key[1], args.disk_size), file=output)
+    return
+  args.disk_size = recommend_disk_size(peak)
+  print("Using --disk-size {} for a recorded peak usage of {:.2f} GiB of {} "
+        "{}.".format(args.disk_size, peak / _GIB, key[0], key[1]),
+        file=output)
+
+
+def record(args, output=None, history=None):
+  """Records the peak usage of a finished build and prints a recommendation."""
+  log_dir = getattr(args, "log_dir", None)
+  if not log_dir or args.dry_run:
+    return
+  peak = read_peak_usage(os.path.join(log_dir, STARTUP_SCRIPT_LOG))
+  if peak is None:
+    return
+  (history or DiskUsageHistory()).record(usage_key(args), peak,
+                                         args.disk_size, args.image_name)
+  recommended = recommend_disk_size(peak)
+  print("Peak disk usage {:.2f} GiB of {} GB, recommended --disk-size: "
+        "{}".format(peak / _GIB, args.disk_size, recommended), file=output)
+
+
+def format_case_line(log_file):
+  """Formats the recommended disk size of a build as a `case` line."""
+  peak = read_peak_usage(log_file)
+  match = _BUILD_DIR.search(log_file)
+  if peak is None or not match:
+    return None
+  short_version, timestamp, purpose = match.groups()
+  version = short_version.replace("-", ".", 1)
+  for short, distro in _DISTROS:
+    version = version.replace(short, distro)
+  return '  {:<15}) disk_size_gb="{}" ;; # {:.2f}G used # {}-{}'.format(
+      '"{}"'.format(version), recommend_disk_size(peak), peak / _GIB,
+      timestamp, purpose)
+
+
+def main(args):
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("log_files", nargs="+",
+                      help="startup-script.log files of builds.")
+  parsed_args = parser.parse_args(args)
+  for log_file in parsed_args.log_files:
+    line = format_case_line(log_file)
+    if line:
+      print(line)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
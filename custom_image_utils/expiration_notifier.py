@@ -17,8 +17,8 @@ Notify expiration for Dataproc custom images.
 
 import datetime
 import logging
-import subprocess
-import tempfile
+
+from custom_image_utils import cloud_backend
 
 logging.basicConfig()
 _LOG = logging.getLogger(__name__)
@@ -41,34 +41,29 @@ def _parse_date_time(timestamp_string):
                                     "%Y-%m-%dT%H:%M:%S.%f")
 
 
-def _get_image_creation_timestamp(image_name, project_id):
+def _get_image_creation_timestamp(image_name, project_id, backend):
   """Gets the creation timestamp of the custom image."""
 
-  # version regex already checked in arg parser
-  command = [
-      "gcloud", "compute", "images", "describe", image_name, "--project",
-      project_id, "--format=csv[no-heading=true](creationTimestamp)"
-  ]
-
-  with tempfile.NamedTemporaryFile() as temp_file:
-    pipe = subprocess.Popen(command, stdout=temp_file)
-    pipe.wait()
-    if pipe.returncode != 0:
-      raise RuntimeError("Cannot get custom image creation timestamp.")
-
-    # get creation timestamp
-    temp_file.seek(0)
-    stdout = temp_file.read()
-    return stdout.decode('utf-8').strip()
+  try:
+    return backend.describe_image(project_id, image_name)["creationTimestamp"]
+  except cloud_backend.CloudApiError:
+    raise RuntimeError("Cannot get custom image creation timestamp.")
 
 
 def notify(args):
-  """Notifies when the image will expire."""
+  """Notifies when the image will expire.
+
+  The creation timestamp is the one returned when the image was created, if
+  the workflow recorded it, otherwise it is described.
+  """
 
   if not args.dry_run:
     _LOG.info("Successfully built Dataproc custom image: %s", args.image_name)
-    creation_date = _parse_date_time(
-        _get_image_creation_timestamp(args.image_name, args.project_id))
+    timestamp = getattr(args, "image_creation_timestamp", None)
+    if not timestamp:
+      timestamp = _get_image_creation_timestamp(
+          args.image_name, args.project_id, cloud_backend.get_backend(args))
+    creation_date = _parse_date_time(timestamp)
     expiration_date = creation_date + datetime.timedelta(days=365)
     _LOG.info(
         _expiration_notification_text.format(args.image_name,
@@ -0,0 +1,181 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Concurrent finalization of a built custom image.
+
+Once the image is created, with its labels, the smoke test and the upload
+of the build logs do not depend on each other, so they run concurrently.
+The expiration notice announces a usable image, so it follows the smoke
+test, and is skipped if the smoke test failed. The finalization then takes
+as long as its slowest chain of tasks, its critical path, which is reported
+with the duration of each task.
+"""
+
+from concurrent import futures
+import logging
+import os
+import time
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import expiration_notifier
+from custom_image_utils import smoke_test_runner
+
+# Log files uploaded concurrently.
+_MAX_UPLOAD_WORKERS = 8
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class TaskTiming:
+  """Start and end of a finalization task, relative to its start."""
+
+  def __init__(self, name, start, end, error=None, skipped=False):
+    self.name = name
+    self.start = start
+    self.end = end
+    self.error = error
+    self.skipped = skipped
+
+  @property
+  def duration(self):
+    return self.end - self.start
+
+
+def log_uri(gcs_log_dir, name):
+  """The gs:// URI a log file of the build VM is uploaded to."""
+  return "{}/{}".format(gcs_log_dir, name)
+
+
+def download_log(args, name, backend=None):
+  """Downloads a log file uploaded by the build VM to the local log dir.
+
+  Returns its local path, or None in a dry run or without log directories.
+  Raises cloud_backend.CloudApiError if the file was not uploaded.
+  """
+  log_dir = getattr(args, "log_dir", None)
+  gcs_log_dir = getattr(args, "gcs_log_dir", None)
+  if args.dry_run or not log_dir or not gcs_log_dir:
+    return None
+  path = os.path.join(log_dir, name)
+  (backend or cloud_backend.get_backend(args)).download_file(
+      log_uri(gcs_log_dir, name), path)
+  return path
+
+
+def upload_logs(log_dir, gcs_log_dir, backend, names=None):
+  """Uploads the files of a local log directory concurrently.
+
+  Only the files in `names` are uploaded if it is set.
+  """
+  if names is None:
+    names = os.listdir(log_dir)
+  names = sorted(name for name in names
+                 if os.path.isfile(os.path.join(log_dir, name)))
+  if not names:
+    return
+  with futures.ThreadPoolExecutor(
+      max_workers=min(len(names), _MAX_UPLOAD_WORKERS)) as executor:
+    for future in [
+        executor.submit(backend.upload_file, os.path.join(log_dir, name),
+                        log_uri(gcs_log_dir, name)) for name in names
+    ]:
+      future.result()
+
+
+def run_tasks(tasks, tracer=None):
+  """Runs (name, func) tasks concurrently and returns their TaskTiming.
+
+  A task may be (name, func, after), to start once the task named `after`
+  succeeded. It is skipped if that task failed or was skipped. A task
+  raising does not stop the others, its TaskTiming holds the error.
+  """
+  origin = time.time()
+  done = {}
+
+  def timed(name, func, after=None):
+    if after is not None:
+      prerequisite = done[after].result()
+      if prerequisite.error is not None or prerequisite.skipped:
+        now = time.time() - origin
+        return TaskTiming(name, now, now, skipped=True)
+    start = time.time() - origin
+    try:
+      if tracer:
+        with tracer.span(name, category="finalization"):
+          func()
+      else:
+        func()
+    except Exception as e:  # pylint: disable=broad-except
+      return TaskTiming(name, start, time.time() - origin, error=e)
+    return TaskTiming(name, start, time.time() - origin)
+
+  # One worker per task, so that a task waiting on another never holds up
+  # the one it waits on.
+  with futures.ThreadPoolExecutor(max_workers=len(tasks) or 1) as executor:
+    for task in tasks:
+      done[task[0]] = executor.submit(timed, *task)
+    return [done[task[0]].result() for task in tasks]
+
+
+def _status(timing):
+  if timing.skipped:
+    return "skipped"
+  return "failed" if timing.error else "ok"
+
+
+def format_report(timings):
+  """Formats the duration of each task and the critical path."""
+  lines = ["Finalization timing report:"]
+  for t in timings:
+    lines.append("  {:<24} {:<6} start {:7.3f}s  duration {:7.3f}s".format(
+        t.name, _status(t), t.start, t.duration))
+  critical = max(timings, key=lambda t: t.end)
+  lines.append("  {:<24} critical path {} {:7.3f}s  sum of tasks "
+               "{:7.3f}s".format("total", critical.name, critical.end,
+                                 sum(t.duration for t in timings)))
+  return "\n".join(lines)
+
+
+def run(args, output=None, tracer=None, smoke_test=True):
+  """Runs the smoke test, then the notifier, and the deferred log upload.
+
+  Raises the error of the first failed task once all of them finished.
+  """
+  tasks = []
+  if smoke_test:
+    tasks.append(("smoke-test", lambda: smoke_test_runner.run(
+        args, output=output, tracer=tracer)))
+    tasks.append(("notify", lambda: expiration_notifier.notify(args),
+                  "smoke-test"))
+  else:
+    tasks.append(("notify", lambda: expiration_notifier.notify(args)))
+  if getattr(args, "defer_log_upload", False) and not args.dry_run:
+    backend = cloud_backend.get_backend(args)
+
+    def upload():
+      try:
+        upload_logs(args.log_dir, args.gcs_log_dir, backend)
+      except cloud_backend.CloudApiError as e:
+        _LOG.warning("Failed to upload logs to %s: %s", args.gcs_log_dir, e)
+
+    tasks.append(("upload-logs", upload))
+  timings = run_tasks(tasks, tracer=tracer)
+  if not args.dry_run:
+    print(format_report(timings), file=output)
+  for timing in timings:
+    if timing.error is not None:
+      raise timing.error
+  return timings
@@ -0,0 +1,411 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Cloud backend which runs one gcloud subprocess per API call.
+"""
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import rate_limiter
+
+# Tail of the error output of a failed command kept in the error message.
+_MAX_ERROR_CHARS = 2000
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+def _run_once(command, quiet):
+  _LOG.info("Running: {}".format(" ".join(command)))
+  with tempfile.NamedTemporaryFile() as temp_file, \
+      tempfile.TemporaryFile() as error_file:
+    pipe = subprocess.Popen(command, stdout=temp_file, stderr=error_file)
+    pipe.wait()
+    error_file.seek(0)
+    stderr = error_file.read().decode('utf-8', 'replace')
+    if not quiet and stderr:
+      sys.stderr.write(stderr)
+    if pipe.returncode != 0:
+      message = "Command failed with exit code {}: {}".format(
+          pipe.returncode, " ".join(command))
+      if stderr.strip():
+        message += "\n" + stderr.strip()[-_MAX_ERROR_CHARS:]
+      status = rate_limiter.gcloud_error_status(stderr)
+      if status == 404:
+        raise cloud_backend.NotFoundError(message)
+      raise cloud_backend.CloudApiError(message, status=status)
+    temp_file.seek(0)
+    return temp_file.read().decode('utf-8')
+
+
+def _run(command, quiet=False):
+  """Runs a gcloud command and returns its stdout.
+
+  The command is rate limited in its API family, and retried if it is
+  throttled. The HTTP status of a failure is read from its error message.
+  """
+  family = rate_limiter.command_family(command)
+  return rate_limiter.get_limiter().call(
+      family, lambda: _run_once(command, quiet),
+      idempotent=family != rate_limiter.COMPUTE_MUTATE and
+      family != rate_limiter.DATAPROC)
+
+
+def _basename(resource):
+  return resource.rsplit("/", 1)[-1]
+
+
+def _flag_value(resource):
+  """Returns the flag value for a network or subnetwork resource path.
+
+  Paths relative to the project, as built from a bare name, are passed to
+  gcloud as that name, anything else is passed unchanged.
+  """
+  if resource.startswith("global/") or resource.startswith("regions/"):
+    return _basename(resource)
+  return resource
+
+
+class GcloudBackend(cloud_backend.CloudBackend):
+  """Cloud backend based on gcloud subprocesses."""
+
+  def print_access_token(self):
+    return _run(["gcloud", "auth", "print-access-token"], quiet=True).strip()
+
+  def get_project_id(self):
+    return _run(["gcloud", "config", "get-value", "project"]).strip()
+
+  def describe_image(self, project_id, image_name):
+    return json.loads(_run([
+        "gcloud", "compute", "images", "describe", image_name, "--project",
+        project_id, "--format=json"
+    ]))
+
+  def describe_image_from_family(self, project_id, family):
+    return json.loads(_run([
+        "gcloud", "compute", "images", "describe-from-family", family,
+        "--project", project_id, "--format=json"
+    ]))
+
+  def image_exists(self, project_id, image_name):
+    try:
+      _run([
+          "gcloud", "compute", "images", "describe", image_name,
+          "--project={}".format(project_id)
+      ], quiet=True)
+      return True
+    except cloud_backend.NotFoundError:
+      return False
+
+  def list_dataproc_images(self, project_id, version_label, exact):
+    if exact:
+      label_filter = "labels.goog-dataproc-version = {}".format(version_label)
+    else:
+      label_filter = "labels.goog-dataproc-version ~ ^{}$".format(version_label)
+    # Push the filter of READY status and name not containing 'eap' to gcloud
+    # command so we don't have to iterate the list
+    filter_arg = label_filter + " AND NOT name ~ -eap$ AND status = READY"
+    return json.loads(_run([
+        "gcloud", "compute", "images", "list", "--project", project_id,
+        "--filter", filter_arg, "--format",
+        "json(name,labels,creationTimestamp)",
+        "--sort-by=~creationTimestamp"
+    ]))
+
+  def list_images_by_label(self, project_id, key, value):
+    return json.loads(_run([
+        "gcloud", "compute", "images", "list", "--project", project_id,
+        "--no-standard-images", "--filter",
+        "labels.{} = {} AND status = READY".format(key, value), "--format",
+        "json(name,family,labels,creationTimestamp,status)",
+        "--sort-by=~creationTimestamp"
+    ]))
+
+  def add_image_labels(self, project_id, image_name, labels):
+    label_flag = "--labels={}".format(",".join(
+        "{}={}".format(k, v) for k, v in sorted(labels.items())))
+    _run([
+        "gcloud", "compute", "images", "add-labels", image_name, "--project",
+        project_id, label_flag
+    ])
+
+  def describe_machine_type(self, project_id, zone, machine_type):
+    return json.loads(_run([
+        "gcloud", "compute", "machine-types", "describe", machine_type,
+        "--project", project_id, "--zone", zone, "--format=json"
+    ], quiet=True))
+
+  def get_region_quotas(self, project_id, region):
+    return json.loads(_run([
+        "gcloud", "compute", "regions", "describe", region, "--project",
+        project_id, "--format=json(quotas)"
+    ], quiet=True)).get("quotas", [])
+
+  def get_project_quotas(self, project_id):
+    return json.loads(_run([
+        "gcloud", "compute", "project-info", "describe", "--project",
+        project_id, "--format=json(quotas)"
+    ], quiet=True)).get("quotas", [])
+
+  def describe_instance(self, project_id, zone, instance_name):
+    return json.loads(_run([
+        "gcloud", "compute", "instances", "describe", instance_name,
+        "--project", project_id, "--zone", zone, "--format=json"
+    ], quiet=True))
+
+  def get_serial_port_output(self, project_id, zone, instance_name, port,
+                             start):
+    return json.loads(_run([
+        "gcloud", "compute", "instances", "get-serial-port-output",
+        instance_name, "--project", project_id, "--zone", zone,
+        "--port={}".format(port), "--start={}".format(start), "--format=json"
+    ], quiet=True))
+
+  def get_guest_attributes(self, project_id, zone, instance_name, namespace):
+    try:
+      items = json.loads(_run([
+          "gcloud", "compute", "instances", "get-guest-attributes",
+          instance_name, "--project", project_id, "--zone", zone,
+          "--query-path={}/".format(namespace), "--format=json"
+      ], quiet=True))
+    except cloud_backend.NotFoundError:
+      raise cloud_backend.NotFoundError(
+          "No guest attributes in {} of {}".format(namespace, instance_name))
+    return {item["key"]: item["value"] for item in items}
+
+  def create_disk(self, project_id, zone, disk):
+    command = [
+        "gcloud", "compute", "disks", "create", disk["name"], "--project",
+        project_id, "--zone", zone
+    ]
+    if "sourceSnapshot" in disk:
+      command.append("--source-snapshot={}".format(disk["sourceSnapshot"]))
+    else:
+      command.append("--image={}".format(disk["sourceImage"]))
+    if "type" in disk:
+      command.append("--type={}".format(_basename(disk["type"])))
+    if "sizeGb" in disk:
+      command.append("--size={}GB".format(disk["sizeGb"]))
+    _run(command)
+
+  def delete_disk(self, project_id, zone, disk_name):
+    _run([
+        "gcloud", "compute", "disks", "delete", disk_name, "--project",
+        project_id, "--zone", zone, "-q"
+    ])
+
+  def describe_snapshot(self, project_id, snapshot_name):
+    try:
+      return json.loads(_run([
+          "gcloud", "compute", "snapshots", "describe", snapshot_name,
+          "--project", project_id, "--format=json"
+      ], quiet=True))
+    except cloud_backend.NotFoundError:
+      raise cloud_backend.NotFoundError(
+          "Snapshot {} not found".format(snapshot_name))
+
+  def create_snapshot(self, project_id, zone, disk_name, snapshot):
+    command = [
+        "gcloud", "compute", "snapshots", "create", snapshot["name"],
+        "--project", project_id, "--source-disk", disk_name,
+        "--source-disk-zone", zone
+    ]
+    if snapshot.get("labels"):
+      command.append("--labels={}".format(",".join(
+          "{}={}".format(k, v)
+          for k, v in sorted(snapshot["labels"].items()))))
+    _run(command)
+
+  def create_instance(self, project_id, zone, instance):
+    command = [
+        "gcloud", "compute", "instances", "create", instance["name"],
+        "--project", project_id, "--zone", zone,
+        "--machine-type={}".format(_basename(instance["machineType"]))
+    ]
+    for disk in instance.get("disks", []):
+      command.append("--disk=auto-delete={},boot={},mode=rw,name={}".format(
+          "yes" if disk.get("autoDelete") else "no",
+          "yes" if disk.get("boot") else "no", _basename(disk["source"])))
+    for interface in instance.get("networkInterfaces", []):
+      if "subnetwork" in interface:
+        command.append("--subnet={}".format(
+            _flag_value(interface["subnetwork"])))
+      elif "network" in interface:
+        command.append("--network={}".format(
+            _flag_value(interface["network"])))
+      if not interface.get("accessConfigs"):
+        command.append("--no-address")
+    for account in instance.get("serviceAccounts", []):
+      if account.get("email", "default") != "default":
+        command.append("--service-account={}".format(account["email"]))
+      command.append("--scopes={}".format(",".join(
+          scope.rsplit("/", 1)[-1] for scope in account.get("scopes", []))))
+    for accelerator in instance.get("guestAccelerators", []):
+      command.append("--accelerator=type={},count={}".format(
+          _basename(accelerator["acceleratorType"]),
+          accelerator["acceleratorCount"]))
+    scheduling = instance.get("scheduling", {})
+    if scheduling.get("onHostMaintenance"):
+      command.append("--maintenance-policy={}".format(
+          scheduling["onHostMaintenance"]))
+    if scheduling.get("provisioningModel"):
+      command.append("--provisioning-model={}".format(
+          scheduling["provisioningModel"]))
+    if scheduling.get("instanceTerminationAction"):
+      command.append("--instance-termination-action={}".format(
+          scheduling["instanceTerminationAction"]))
+    if instance.get("shieldedInstanceConfig", {}).get("enableSecureBoot"):
+      command.append("--shielded-secure-boot")
+    with tempfile.TemporaryDirectory() as metadata_dir:
+      # Values are passed through files, they may contain commas or quotes.
+      metadata_files = []
+      for i, item in enumerate(
+          instance.get("metadata", {}).get("items", [])):
+        path = os.path.join(metadata_dir, str(i))
+        with open(path, "w") as f:
+          f.write(item["value"])
+        metadata_files.append("{}={}".format(item["key"], path))
+      if metadata_files:
+        command.append("--metadata-from-file={}".format(
+            ",".join(metadata_files)))
+      _run(command)
+
+  def stop_instance(self, project_id, zone, instance_name):
+    _run([
+        "gcloud", "compute", "instances", "stop", instance_name, "--project",
+        project_id, "--zone", zone
+    ])
+
+  def start_instance(self, project_id, zone, instance_name):
+    _run([
+        "gcloud", "compute", "instances", "start", instance_name, "--project",
+        project_id, "--zone", zone
+    ])
+
+  def delete_instance(self, project_id, zone, instance_name):
+    _run([
+        "gcloud", "compute", "instances", "delete", instance_name,
+        "--project", project_id, "--zone", zone, "-q"
+    ])
+
+  def create_image(self, project_id, image):
+    command = [
+        "gcloud", "compute", "images", "create", image["name"], "--project",
+        project_id
+    ]
+    if "sourceImage" in image:
+      # sourceImage is "projects/<project>/global/images/<image>".
+      source_project, _, _, source_image = image["sourceImage"].split(
+          "/")[-4:]
+      command += ["--source-image", source_image, "--source-image-project",
+                  source_project]
+    else:
+      # sourceDisk is "zones/<zone>/disks/<disk>".
+      _, zone, _, disk = image["sourceDisk"].split("/")[-4:]
+      command += ["--source-disk-zone", zone, "--source-disk", disk]
+    if image.get("family"):
+      command.append("--family={}".format(image["family"]))
+    for location in image.get("storageLocations", []):
+      command.append("--storage-location={}".format(location))
+    if image.get("labels"):
+      command.append("--labels={}".format(",".join(
+          "{}={}".format(k, v) for k, v in sorted(image["labels"].items()))))
+    command.append("--format=json")
+    return json.loads(_run(command))[0]
+
+  def upload_file(self, local_path, gcs_uri):
+    _run(["gcloud", "storage", "cp", local_path, gcs_uri], quiet=True)
+
+  def object_exists(self, gcs_uri):
+    try:
+      _run(["gcloud", "storage", "objects", "describe", gcs_uri,
+            "--format=value(name)"], quiet=True)
+      return True
+    except cloud_backend.NotFoundError:
+      return False
+
+  def download_file(self, gcs_uri, local_path):
+    try:
+      _run(["gcloud", "storage", "cp", gcs_uri, local_path], quiet=True)
+    except cloud_backend.NotFoundError:
+      raise cloud_backend.NotFoundError("{}: not found".format(gcs_uri))
+
+  def create_workflow_template(self, project_id, region, template):
+    source = dict(template)
+    template_id = source.pop("id")
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".json") as temp_file:
+      json.dump(source, temp_file)
+      temp_file.flush()
+      _run([
+          "gcloud", "dataproc", "workflow-templates", "import", template_id,
+          "--source", temp_file.name, "--project", project_id, "--region",
+          region, "--quiet"
+      ])
+
+  def instantiate_workflow_template(self, project_id, region, template_id):
+    _run([
+        "gcloud", "dataproc", "workflow-templates", "instantiate",
+        template_id, "--project", project_id, "--region", region
+    ])
+
+  def delete_workflow_template(self, project_id, region, template_id):
+    _run([
+        "gcloud", "dataproc", "workflow-templates", "delete", template_id,
+        "-q", "--project", project_id, "--region", region
+    ])
+
+  def create_cluster(self, project_id, region, cluster):
+    source = dict(cluster)
+    cluster_name = source.pop("clusterName")
+    source.pop("projectId", None)
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".json") as temp_file:
+      json.dump(source, temp_file)
+      temp_file.flush()
+      _run([
+          "gcloud", "dataproc", "clusters", "import", cluster_name,
+          "--source", temp_file.name, "--project", project_id, "--region",
+          region, "--quiet"
+      ])
+
+  def submit_job(self, project_id, region, job):
+    cluster_name = job["placement"]["clusterName"]
+    if "sparkJob" in job:
+      spark_job = job["sparkJob"]
+      command = ["spark", "--class", spark_job["mainClass"]]
+      if spark_job.get("jarFileUris"):
+        command += ["--jars", ",".join(spark_job["jarFileUris"])]
+    elif "pysparkJob" in job:
+      spark_job = job["pysparkJob"]
+      command = ["pyspark", spark_job["mainPythonFileUri"]]
+    else:
+      raise cloud_backend.CloudApiError("Unsupported job: {}".format(job))
+    # The driver output stays in the job logs, concurrent jobs would
+    # interleave it on the console.
+    _run(["gcloud", "dataproc", "jobs", "submit"] + command + [
+        "--cluster", cluster_name, "--project", project_id, "--region",
+        region
+    ] + ["--"] + spark_job.get("args", []), quiet=True)
+
+  def delete_cluster(self, project_id, region, cluster_name):
+    _run([
+        "gcloud", "dataproc", "clusters", "delete", cluster_name, "--async",
+        "-q", "--project", project_id, "--region", region
+    ])
@@ -0,0 +1,122 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Builds one custom image from parsed arguments.
+"""
+
+import logging
+
+from custom_image_utils import build_fingerprint
+from custom_image_utils import cloud_backend
+from custom_image_utils import customization_profiler
+from custom_image_utils import disk_sizer
+from custom_image_utils import finalizer
+from custom_image_utils import image_layers
+from custom_image_utils import preflight
+from custom_image_utils import python_image_creator
+from custom_image_utils import rate_limiter
+from custom_image_utils import shell_image_creator
+from custom_image_utils import spot_vm
+from custom_image_utils import tracing
+from custom_image_utils import vm_telemetry
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+def build(args, output=None, tracer=None):
+  """Runs pre-flight, image creation, then the finalization.
+
+  The image is labelled when it is created. The smoke test, followed by the
+  notifier, and the upload of the build logs then run concurrently, see
+  finalizer.
+
+  If pre-flight found an image built from the same inputs and
+  --on-matching-image allows it, that image is used instead of building one.
+
+  If `output` is set, the pre-flight report and the output of the image
+  creation workflow are written to that file object instead of the console.
+  Every phase is recorded as a span, exported to the log directory of the
+  build once it is done, unless it is a dry run. The trace is written after
+  the logs were uploaded, so it is uploaded on its own.
+
+  The caller sets up the rate limiter, which the builds of a batch share.
+  """
+  tracer = tracer or tracing.Tracer()
+  try:
+    with tracer.span("preflight"):
+      # Infers arguments and performs sanity checks concurrently.
+      preflight.run(args, output=output, tracer=tracer)
+    matching_image = getattr(args, "matching_image", None)
+    if matching_image:
+      with tracer.span("use-matching-image", policy=args.on_matching_image):
+        build_fingerprint.use_matching_image(args, matching_image, output)
+    else:
+      if getattr(args, "layers", None):
+        with tracer.span("layers"):
+          image_layers.build(args, _create, output=output, tracer=tracer)
+      # Set after the layers, which upload their own logs. A dry run script
+      # may be run on its own, and uploads them.
+      args.defer_log_upload = not args.dry_run
+      with tracer.span("image-creation", engine=args.workflow_engine):
+        try:
+          _create(args, output, tracer)
+        finally:
+          # Also reports on a failed customization.
+          customization_profiler.report(args, output)
+          vm_telemetry.report(args, output)
+      disk_sizer.record(args, output)
+    with tracer.span("finalization"):
+      # The matching image went through the smoke test when it was built.
+      finalizer.run(args, output=output, tracer=tracer,
+                    smoke_test=not matching_image)
+  finally:
+    _export_trace(args, tracer, output)
+
+
+def _create(args, output, tracer):
+  if args.workflow_engine == python_image_creator.PYTHON:
+    python_image_creator.create(args, output=output, tracer=tracer)
+  else:
+    shell_image_creator.create(args, output=output, tracer=tracer)
+
+
+def _export_trace(args, tracer, output):
+  log_dir = getattr(args, "log_dir", None)
+  if not log_dir or args.dry_run:
+    return
+  try:
+    tracer.export(log_dir)
+  except OSError as e:
+    _LOG.warning("Failed to write the build trace to %s: %s", log_dir, e)
+    return
+  gcs_log_dir = getattr(args, "gcs_log_dir", None)
+  if gcs_log_dir:
+    try:
+      finalizer.upload_logs(
+          log_dir, gcs_log_dir, cloud_backend.get_backend(args),
+          names=[tracing.JSONL_FILE, tracing.CHROME_TRACE_FILE])
+    except cloud_backend.CloudApiError as e:
+      _LOG.warning("Failed to upload the build trace to %s: %s", gcs_log_dir,
+                   e)
+  print(tracing.format_summary(tracer), file=output)
+  api_report = rate_limiter.format_report()
+  if api_report:
+    print(api_report, file=output)
+  if spot_vm.is_spot(args) and getattr(args, "preemptions", None):
+    print(args.preemptions.format_report(), file=output)
+  print("Build trace written to {}/{} and {}/{}".format(
+      log_dir, tracing.JSONL_FILE, log_dir, tracing.CHROME_TRACE_FILE),
+        file=output)
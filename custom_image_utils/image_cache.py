@@ -0,0 +1,187 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Persistent on-disk cache for Dataproc base image resolution.
+
+Resolving a base image costs one or more `gcloud compute images` calls. The
+results only change when a new Dataproc image is released, so they are cached
+in a small JSON file with a TTL and a bounded number of entries.
+
+The JSON files of the cache directory are written with `update_json_file`,
+which merges the changes of concurrent processes instead of losing them.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+  import fcntl
+except ImportError:  # Not available on Windows.
+  fcntl = None
+
+_DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "dataproc-custom-images")
+_CACHE_FILE_NAME = "image-cache.json"
+DEFAULT_TTL_SEC = 3600
+DEFAULT_MAX_ENTRIES = 256
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+def default_cache_dir():
+  return os.environ.get("DATAPROC_CUSTOM_IMAGES_CACHE_DIR", _DEFAULT_CACHE_DIR)
+
+
+def read_json_file(path):
+  """Returns the JSON object of a file, or {} if it is missing or invalid."""
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except (IOError, OSError, ValueError):
+    return {}
+
+
+def update_json_file(path, update, **dump_kwargs):
+  """Replaces the JSON object of a file with the one returned by `update`.
+
+  `update` is called with the object currently in the file. The file is read
+  and atomically replaced under an exclusive flock of `<path>.lock`, so that
+  concurrent processes do not overwrite each other's changes. Returns the
+  object written, and raises IOError or OSError if it cannot be written.
+  """
+  directory = os.path.dirname(path)
+  os.makedirs(directory, exist_ok=True)
+  with open(path + ".lock", "a") as lock:
+    if fcntl:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+    try:
+      value = update(read_json_file(path))
+      fd, temp_path = tempfile.mkstemp(
+          dir=directory, prefix=".{}-".format(os.path.basename(path)))
+      try:
+        with os.fdopen(fd, "w") as f:
+          json.dump(value, f, **dump_kwargs)
+        os.replace(temp_path, path)
+      except BaseException:
+        os.unlink(temp_path)
+        raise
+      return value
+    finally:
+      if fcntl:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _encode_key(key):
+  return json.dumps(list(key), separators=(",", ":"))
+
+
+class ImageCache:
+  """TTL cache of image lookups, persisted to a JSON file.
+
+  Entries are keyed on a tuple such as (project, filter, version spec). When
+  the number of entries exceeds `max_entries`, the least recently used
+  entries are evicted. With `refresh` set, lookups always miss and the fresh
+  results overwrite the cached ones.
+  """
+
+  def __init__(self, cache_dir=None, ttl_sec=DEFAULT_TTL_SEC,
+               max_entries=DEFAULT_MAX_ENTRIES, refresh=False):
+    self.path = os.path.join(cache_dir or default_cache_dir(),
+                             _CACHE_FILE_NAME)
+    self.ttl_sec = ttl_sec
+    self.max_entries = max_entries
+    self.refresh = refresh
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    self._entries = None
+
+  def _load(self):
+    if self._entries is None:
+      self._entries = self._fresh(read_json_file(self.path))
+
+  def _fresh(self, entries):
+    now = time.time()
+    return {key: entry for key, entry in entries.items()
+            if now - entry.get("created", 0) < self.ttl_sec}
+
+  def _save(self, key, entry):
+    """Stores `entry`, merged with the entries written by other processes."""
+
+    def merge(entries):
+      entries = self._fresh(entries)
+      entries[key] = entry
+      by_access = sorted(entries.items(),
+                         key=lambda item: item[1].get("accessed", 0))
+      for old_key, _ in by_access[:len(entries) - self.max_entries]:
+        del entries[old_key]
+      return entries
+
+    try:
+      self._entries = update_json_file(self.path, merge)
+    except (IOError, OSError) as e:
+      _LOG.warning("Unable to write image cache %s: %s", self.path, e)
+      self._entries[key] = entry
+
+  def get(self, key):
+    """Returns the cached value for `key`, or None on a miss."""
+    with self._lock:
+      if self.ttl_sec <= 0 or self.refresh:
+        self.misses += 1
+        return None
+      self._load()
+      encoded_key = _encode_key(key)
+      entry = self._entries.get(encoded_key)
+      if entry is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      # Persisted, so that eviction is least recently used across runs.
+      self._save(encoded_key, dict(entry, accessed=time.time()))
+      return entry["value"]
+
+  def put(self, key, value):
+    """Stores a JSON-serializable `value` under `key`."""
+    if self.ttl_sec <= 0:
+      return
+    with self._lock:
+      self._load()
+      now = time.time()
+      self._save(_encode_key(key), {
+          "value": value,
+          "created": now,
+          "accessed": now,
+      })
+
+  def get_or_compute(self, key, compute):
+    """Returns the cached value for `key`, calling `compute` on a miss."""
+    value = self.get(key)
+    if value is None:
+      value = compute()
+      self.put(key, value)
+    return value
+
+  def format_report(self):
+    """Formats the hits and misses of the lookups, empty if disabled."""
+    if self.ttl_sec <= 0:
+      return ""
+    return "Image cache {}: {} hits, {} misses{}".format(
+        self.path, self.hits, self.misses,
+        " (refreshed)" if self.refresh else "")
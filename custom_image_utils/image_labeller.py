@@ -12,32 +12,45 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Add label to Dataproc custom images.
+
+Images built by the workflow engines get their labels when they are created,
+from image_labels(). add_label() sets them on an existing image.
 """
 
 import logging
-import subprocess
+
+from custom_image_utils import build_fingerprint
+from custom_image_utils import cloud_backend
+
+DATAPROC_VERSION_LABEL = "goog-dataproc-version"
 
 logging.basicConfig()
 _LOG = logging.getLogger(__name__)
 _LOG.setLevel(logging.WARN)
 
 
-def _set_custom_image_label(image_name, version, project_id):
+def _version_label(version):
+  # Convert `1.5.0-RC1-debian9` version to `1-5-0-rc1-debian9` label
+  return version.replace('.', '-').lower()
+
+
+def image_labels(version, fingerprint=None):
+  """Returns the labels of a custom image, set when it is created."""
+  labels = {}
+  if version:
+    labels[DATAPROC_VERSION_LABEL] = _version_label(version)
+  if fingerprint:
+    labels[build_fingerprint.FINGERPRINT_LABEL] = fingerprint
+  return labels
+
+
+def _set_custom_image_label(image_name, version, project_id, backend):
   """Sets Dataproc version label in the custom image."""
 
-  # Convert `1.5.0-RC1-debian9` version to `1-5-0-rc1-debian9` label
-  version_label = version.replace('.', '-').lower()
-  label_flag = "--labels=goog-dataproc-version={}".format(version_label)
-  command = [
-      "gcloud", "compute", "images", "add-labels", image_name, "--project",
-      project_id, label_flag
-  ]
-  _LOG.info("Running: {}".format(" ".join(command)))
-
-  # get stdout from compute images list --filters
-  pipe = subprocess.Popen(command)
-  pipe.wait()
-  if pipe.returncode != 0:
+  try:
+    backend.add_image_labels(project_id, image_name,
+                             {DATAPROC_VERSION_LABEL: _version_label(version)})
+  except cloud_backend.CloudApiError:
     raise RuntimeError("Cannot set dataproc version to image label.")
 
 
@@ -47,7 +60,7 @@ def add_label(args):
   if not args.dry_run:
     _LOG.info("Setting label on custom image...")
     _set_custom_image_label(args.image_name, args.dataproc_version,
-                            args.project_id)
+                            args.project_id, cloud_backend.get_backend(args))
     _LOG.info("Successfully set label on custom image...")
   else:
     _LOG.info("Skip setting label on custom image (dry run).")
@@ -0,0 +1,130 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Layered image builds.
+
+With --customization-layer, each layer script is run on top of the image of
+the previous layer, starting from the base image, and captured as its own
+intermediate image. The customization script then runs on top of the last
+layer. A layer image is named after its build fingerprint, which covers its
+parent image and its script, so a layer is only built again when it or a
+layer below it changed, and later builds reuse it otherwise.
+
+Layer images are kept in the `dataproc-custom-image-layers` family, delete
+them with `gcloud compute images delete` once no longer needed.
+"""
+
+import argparse
+import logging
+import threading
+
+from custom_image_utils import build_fingerprint
+from custom_image_utils import cloud_backend
+
+LAYER_PREFIX = "custom-image-layer-"
+LAYER_FAMILY = "dataproc-custom-image-layers"
+# Leaves room for the -install suffix of the build disk and VM within the 63
+# characters of resource names.
+_NAME_FINGERPRINT_LENGTH = 32
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+def _lock(name):
+  with _locks_lock:
+    return _locks.setdefault(name, threading.Lock())
+
+
+class Layer:
+  """A customization layer and the image it is captured as."""
+
+  def __init__(self, index, script, parent_image, fingerprint, project_id):
+    self.index = index
+    self.script = script
+    self.parent_image = parent_image
+    self.fingerprint = fingerprint
+    self.image_name = LAYER_PREFIX + fingerprint[:_NAME_FINGERPRINT_LENGTH]
+    self.image = "projects/{}/global/images/{}".format(project_id,
+                                                       self.image_name)
+
+
+def _layer_args(args, script, parent_image, image_name=None):
+  """Returns the arguments of the build of one layer."""
+  layer_args = argparse.Namespace(**vars(args))
+  layer_args.customization_script = script
+  layer_args.customization_layers = None
+  layer_args.dataproc_base_image = parent_image
+  layer_args.family = LAYER_FAMILY
+  layer_args.resume = None
+  layer_args.matching_image = None
+  layer_args.on_matching_image = build_fingerprint.BUILD
+  # The final image is slimmed, which also clears what the layers left.
+  layer_args.slim_image = None
+  if image_name:
+    layer_args.image_name = image_name
+  # Set by the workflow engines for the build they run.
+  for attribute in ("run_id", "log_dir"):
+    if hasattr(layer_args, attribute):
+      delattr(layer_args, attribute)
+  return layer_args
+
+
+def plan(args):
+  """Returns the Layers of a build, from the base image up."""
+  layers = []
+  parent_image = args.dataproc_base_image
+  for index, script in enumerate(args.customization_layers or []):
+    fingerprint = build_fingerprint.compute(
+        _layer_args(args, script, parent_image))
+    layer = Layer(index, script, parent_image, fingerprint, args.project_id)
+    layers.append(layer)
+    parent_image = layer.image
+  return layers
+
+
+def build(args, create, output=None, tracer=None):
+  """Builds the missing layers and bases the build on the last one.
+
+  `create` runs an image creation workflow for arguments, as image_builder
+  does. Concurrent builds of a batch sharing a layer build it once.
+  """
+  backend = cloud_backend.get_backend(args)
+  layers = args.layers
+  for layer in layers:
+    with _lock(layer.image_name):
+      if backend.image_exists(args.project_id, layer.image_name):
+        print("Layer {} ({}): reusing image {}.".format(
+            layer.index, layer.script, layer.image_name), file=output)
+        continue
+      print("Layer {} ({}): building image {} from {}.".format(
+          layer.index, layer.script, layer.image_name, layer.parent_image),
+            file=output, flush=True)
+      if args.dry_run:
+        continue
+      layer_args = _layer_args(args, layer.script, layer.parent_image,
+                               image_name=layer.image_name)
+      layer_args.build_fingerprint = layer.fingerprint
+      if tracer:
+        with tracer.span("layer-{}".format(layer.index), category="layer",
+                         script=layer.script):
+          create(layer_args, output, tracer)
+      else:
+        create(layer_args, output, tracer)
+  if layers:
+    args.dataproc_base_image = layers[-1].image
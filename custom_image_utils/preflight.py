@@ -0,0 +1,244 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Concurrent pre-flight phase of a custom image build.
+
+Argument inference and sanity checks are expressed as a small dependency
+graph of probes. Probes whose dependencies are satisfied run concurrently,
+so the pre-flight wall time is bounded by the slowest chain of probes
+rather than by the sum of all network round trips.
+
+Inference probes return the arguments they inferred, which are set on the
+build arguments by the thread running the probes, so that concurrent probes
+never write to them.
+"""
+
+from concurrent import futures
+import copy
+import logging
+import os
+import time
+
+from custom_image_utils import args_inferer
+from custom_image_utils import build_fingerprint
+from custom_image_utils import cloud_backend
+from custom_image_utils import disk_sizer
+from custom_image_utils import image_layers
+from custom_image_utils import quota_checker
+
+INFERENCE = "inference"
+SANITY_CHECK = "sanity-check"
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class Probe:
+  """A named pre-flight step and the names of the probes it depends on.
+
+  `func` returns the {argument name: value} it inferred, or None.
+  """
+
+  def __init__(self, name, func, depends_on=(), category=INFERENCE):
+    self.name = name
+    self.func = func
+    self.depends_on = tuple(depends_on)
+    self.category = category
+
+
+class ProbeTiming:
+  """Start and end of a probe, in seconds relative to the pre-flight start."""
+
+  def __init__(self, name, start, end):
+    self.name = name
+    self.start = start
+    self.end = end
+
+  @property
+  def duration(self):
+    return self.end - self.start
+
+
+def check_customization_script(args):
+  if not os.path.isfile(args.customization_script):
+    raise Exception("Invalid path to customization script: '{}' is not a file.".format(
+        args.customization_script))
+  for layer in getattr(args, "customization_layers", None) or []:
+    if not os.path.isfile(layer):
+      raise Exception(
+          "Invalid path to customization layer: '{}' is not a file.".format(
+              layer))
+
+
+def plan_layers(args):
+  args.layers = image_layers.plan(args)
+
+
+def check_image_does_not_exist(args):
+  # The image of a previous build with the same inputs may be reused.
+  if getattr(args, "matching_image", None) and \
+      args.matching_image["name"] == args.image_name:
+    return
+  if cloud_backend.get_backend(args).image_exists(args.project_id,
+                                                  args.image_name):
+    raise RuntimeError("Image {} already exists.".format(args.image_name))
+
+
+def infer_build_fingerprint(args):
+  args.build_fingerprint = build_fingerprint.compute(args)
+
+
+def find_matching_image(args):
+  args.matching_image = None
+  if args.on_matching_image != build_fingerprint.BUILD:
+    args.matching_image = build_fingerprint.find_matching_image(
+        cloud_backend.get_backend(args), args.project_id,
+        args.build_fingerprint)
+
+
+def _inferred(func, args, *names):
+  """Runs `func` on a copy of `args`, returns the values of `names` it set."""
+  probe_args = copy.copy(args)
+  func(probe_args)
+  return {name: getattr(probe_args, name) for name in names}
+
+
+def _probes(args, output=None):
+  # Looking up a matching image only delays the existence check when the
+  # image may be reused.
+  existence_dependencies = ["project-id"]
+  if args.on_matching_image != build_fingerprint.BUILD:
+    existence_dependencies.append("matching-image")
+  return [
+      Probe("project-id", lambda: _inferred(
+          args_inferer.infer_project_id, args, "project_id")),
+      Probe("base-image", lambda: _inferred(
+          lambda a: args_inferer.infer_base_image(a, output), args,
+          "dataproc_base_image", "dataproc_version")),
+      Probe("oauth", lambda: _inferred(args_inferer.infer_oauth, args,
+                                       "oauth")),
+      Probe("network", lambda: _inferred(args_inferer.infer_network, args,
+                                         "network"),
+            depends_on=["project-id"]),
+      Probe("shutdown-timer", lambda: _inferred(
+          args_inferer.infer_shutdown_timer, args, "shutdown_timer_in_sec")),
+      Probe("customization-script",
+            lambda: check_customization_script(args),
+            category=SANITY_CHECK),
+      Probe("disk-size", lambda: _inferred(
+          lambda a: disk_sizer.apply(a, output), args, "disk_size"),
+            depends_on=["base-image"]),
+      Probe("build-fingerprint", lambda: _inferred(
+          infer_build_fingerprint, args, "build_fingerprint"),
+            depends_on=["base-image", "customization-script", "disk-size"]),
+      Probe("layers", lambda: _inferred(plan_layers, args, "layers"),
+            depends_on=["project-id", "base-image", "customization-script",
+                        "disk-size"]),
+      Probe("matching-image", lambda: _inferred(
+          find_matching_image, args, "matching_image"),
+            depends_on=["project-id", "build-fingerprint"],
+            category=SANITY_CHECK),
+      Probe("image-does-not-exist", lambda: check_image_does_not_exist(args),
+            depends_on=existence_dependencies, category=SANITY_CHECK),
+      Probe("quota", lambda: quota_checker.check(args, output),
+            depends_on=["project-id", "disk-size"], category=SANITY_CHECK),
+  ]
+
+
+def run_probes(probes, max_workers=None, tracer=None, args=None):
+  """Runs probes concurrently in dependency order.
+
+  Returns the list of ProbeTiming in completion order. If a probe fails, no
+  new probes are started and its exception is raised once the running ones
+  have finished. Each probe is recorded as a span of `tracer` if set.
+
+  The values a probe returns are set on `args`, if set, before its
+  dependents start.
+  """
+  by_name = {probe.name: probe for probe in probes}
+  for probe in probes:
+    for dependency in probe.depends_on:
+      if dependency not in by_name:
+        raise ValueError("Probe {} depends on unknown probe {}".format(
+            probe.name, dependency))
+
+  origin = time.time()
+  timings = []
+  done = set()
+  pending = list(probes)
+  running = {}
+
+  def timed(probe):
+    start = time.time() - origin
+    try:
+      if tracer:
+        with tracer.span(probe.name, category=probe.category):
+          return probe.func()
+      else:
+        return probe.func()
+    finally:
+      timings.append(ProbeTiming(probe.name, start, time.time() - origin))
+
+  error = None
+  with futures.ThreadPoolExecutor(
+      max_workers=max_workers or len(probes)) as executor:
+    while pending or running:
+      if error is None:
+        ready = [p for p in pending if set(p.depends_on) <= done]
+        for probe in ready:
+          pending.remove(probe)
+          running[executor.submit(timed, probe)] = probe
+      if not running:
+        if error is None:
+          raise ValueError("Probe dependency cycle: {}".format(
+              ", ".join(p.name for p in pending)))
+        break
+      completed, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+      for future in completed:
+        probe = running.pop(future)
+        if future.exception() is not None:
+          error = error or future.exception()
+        else:
+          if args is not None:
+            for name, value in (future.result() or {}).items():
+              setattr(args, name, value)
+          done.add(probe.name)
+  if error is not None:
+    raise error
+  return timings
+
+
+def format_report(timings):
+  """Formats a per-probe timing report."""
+  wall_time = max(t.end for t in timings) if timings else 0.0
+  lines = ["Pre-flight timing report:"]
+  for t in sorted(timings, key=lambda t: t.start):
+    lines.append("  {:<24} start {:7.3f}s  duration {:7.3f}s".format(
+        t.name, t.start, t.duration))
+  lines.append("  {:<24} wall {:7.3f}s  sum of probes {:7.3f}s".format(
+      "total", wall_time, sum(t.duration for t in timings)))
+  return "\n".join(lines)
+
+
+def run(args, output=None, tracer=None):
+  """Infers missing arguments and performs sanity checks concurrently.
+
+  The timing report is printed to `output` if set, otherwise to stdout.
+  """
+  _LOG.info("Running pre-flight probes...")
+  timings = run_probes(_probes(args, output), tracer=tracer, args=args)
+  _LOG.info("Inferred args: {}".format(args))
+  print(format_report(timings), file=output)
+  return timings
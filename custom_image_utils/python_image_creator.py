@@ -0,0 +1,477 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Python based custom image creator.
+
+Runs the same disk -> VM -> wait -> image workflow as the generated Shell
+script, as workflow_engine steps calling the cloud backend. Builds with a
+trusted certificate are delegated to the Shell script workflow.
+
+Completed steps are journaled. If a build fails for any other reason than
+the customization script failing, its disk or VM is kept and the build can
+be resumed with `--resume <run_id>`.
+"""
+
+from datetime import datetime
+import logging
+import os
+import sys
+import time
+
+from custom_image_utils import build_fingerprint
+from custom_image_utils import build_journal
+from custom_image_utils import cloud_backend
+from custom_image_utils import customization_profiler
+from custom_image_utils import finalizer
+from custom_image_utils import image_labeller
+from custom_image_utils import serial_port_follower
+from custom_image_utils import shell_image_creator
+from custom_image_utils import shell_script_generator
+from custom_image_utils import source_uploader
+from custom_image_utils import spot_vm
+from custom_image_utils import vm_telemetry
+from custom_image_utils import warm_pool
+from custom_image_utils import workflow_engine
+from custom_image_utils import zone_placement
+
+BASH = "bash"
+PYTHON = "python"
+ENGINES = (BASH, PYTHON)
+
+_API_STEP_TIMEOUT_SEC = 30 * 60
+_CUSTOMIZATION_TIMEOUT_SEC = 6 * 60 * 60
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class _Tee:
+  """Writes to the console (or `output`) and to the workflow log."""
+
+  def __init__(self, output, log_file):
+    self.output = output or sys.stdout
+    self.log_file = log_file
+
+  def write(self, text):
+    self.output.write(text)
+    self.log_file.write(text)
+
+  def flush(self):
+    self.output.flush()
+    self.log_file.flush()
+
+
+def _parse_metadata(metadata):
+  """Parses `key1=value1,key2=value2` as in gcloud --metadata."""
+  items = {}
+  for item in (metadata or "").split(","):
+    if item:
+      key, _, value = item.partition("=")
+      items[key] = value
+  return items
+
+
+class ImageWorkflow:
+  """Builds the steps and cleanup of a custom image workflow."""
+
+  def __init__(self, args, backend, output=None, run_id=None):
+    self.args = args
+    self.backend = backend
+    self.output = output
+    self.run_id = run_id or "custom-image-{}-{}".format(
+        args.image_name, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    self.bucket_name = args.gcs_bucket.replace("gs://", "")
+    self.custom_sources_path = "gs://{}/{}/sources".format(self.bucket_name,
+                                                          self.run_id)
+    self.custom_sources_manifest = "{}/{}".format(
+        self.custom_sources_path, source_uploader.MANIFEST_FILE)
+    self.log_dir = "/tmp/{}/logs".format(self.run_id)
+    self.gcs_log_dir = "gs://{}/{}/logs".format(self.bucket_name, self.run_id)
+    self.install_name = "{}-install".format(args.image_name)
+    self.region = "-".join(args.zone.split("-")[:-1])
+    self.journal = build_journal.BuildJournal(
+        "/tmp/{}/{}".format(self.run_id, build_journal.JOURNAL_FILE),
+        gcs_uri="gs://{}/{}/{}".format(self.bucket_name, self.run_id,
+                                       build_journal.JOURNAL_FILE),
+        backend=backend)
+    self.disk_created = False
+    self.vm_created = False
+    self.image_created = False
+    self.customization_failed = False
+    self.base_snapshot = None
+    self.zones = zone_placement.candidate_zones(args)
+
+  def sources(self):
+    return build_fingerprint.build_sources(self.args)
+
+  def metadata(self):
+    """Returns the instance metadata, as set by the Shell script."""
+    args = self.args
+    metadata = {
+        "shutdown-timer-in-sec": str(args.shutdown_timer_in_sec),
+        "custom-sources-path": self.custom_sources_path,
+        "custom-sources-manifest": self.custom_sources_manifest,
+        "universe-domain": args.universe_domain,
+        "dataproc-region": self.region,
+        # run.sh publishes the result as guest attributes.
+        "enable-guest-attributes": "TRUE",
+        "vm-telemetry-uri": vm_telemetry.telemetry_uri(self.gcs_log_dir),
+    }
+    if args.optional_components:
+      components = shell_script_generator.Generator()._get_optional_to_image_components(  # pylint: disable=protected-access
+          args.optional_components.split(","))
+      metadata["optional-components"] = ".".join(components)
+    if getattr(args, "slim_image", None):
+      metadata["image-slimming-steps"] = args.slim_image.replace(",", ".")
+    if args.dataproc_version:
+      metadata["dataproc_dataproc_version"] = args.dataproc_version
+    if getattr(args, "profile_customization", False):
+      metadata["customization-profile-uri"] = customization_profiler.trace_uri(
+          self.gcs_log_dir)
+    metadata.update(_parse_metadata(args.metadata))
+    with open("startup_script/run.sh") as f:
+      metadata["startup-script"] = f.read()
+    return metadata
+
+  def disk(self, zone=None):
+    disk = {
+        "name": self.install_name,
+        "type": "zones/{}/diskTypes/pd-ssd".format(zone or self.args.zone),
+        "sizeGb": str(self.args.disk_size),
+    }
+    if self.base_snapshot is not None:
+      disk["sourceSnapshot"] = self.base_snapshot.source
+    else:
+      disk["sourceImage"] = self.args.dataproc_base_image
+    return disk
+
+  def instance(self, zone=None):
+    args = self.args
+    zone = zone or args.zone
+    interface = {}
+    if args.subnetwork:
+      interface["subnetwork"] = args.subnetwork if "/" in args.subnetwork \
+          else "regions/{}/subnetworks/{}".format(self.region, args.subnetwork)
+    elif args.network:
+      interface["network"] = args.network if "/" in args.network \
+          else "global/networks/{}".format(args.network)
+    if not args.no_external_ip:
+      interface["accessConfigs"] = [{"type": "ONE_TO_ONE_NAT",
+                                     "name": "External NAT"}]
+    instance = {
+        "name": self.install_name,
+        "machineType": "zones/{}/machineTypes/{}".format(zone,
+                                                         args.machine_type),
+        "disks": [{
+            "boot": True,
+            "autoDelete": True,
+            "mode": "READ_WRITE",
+            "source": "zones/{}/disks/{}".format(zone, self.install_name),
+        }],
+        "networkInterfaces": [interface],
+        "serviceAccounts": [{
+            "email": args.service_account or "default",
+            "scopes": ["https://www.googleapis.com/auth/cloud-platform"],
+        }],
+        "metadata": {
+            "items": [{"key": k, "value": v}
+                      for k, v in self.metadata().items()],
+        },
+    }
+    scheduling = spot_vm.scheduling(args)
+    if args.accelerator:
+      accelerator = _parse_metadata(args.accelerator)
+      instance["guestAccelerators"] = [{
+          "acceleratorType": "zones/{}/acceleratorTypes/{}".format(
+              zone, accelerator["type"]),
+          "acceleratorCount": int(accelerator.get("count", 1)),
+      }]
+      scheduling["onHostMaintenance"] = "TERMINATE"
+    if scheduling:
+      instance["scheduling"] = scheduling
+    return instance
+
+  def image(self):
+    image = {
+        "name": self.args.image_name,
+        "sourceDisk": "zones/{}/disks/{}".format(self.args.zone,
+                                                 self.install_name),
+        "family": self.args.family,
+    }
+    labels = image_labeller.image_labels(
+        self.args.dataproc_version,
+        getattr(self.args, "build_fingerprint", None))
+    if labels:
+      image["labels"] = labels
+    if self.args.storage_location:
+      image["storageLocations"] = [self.args.storage_location]
+    return image
+
+  def upload_sources(self, context):
+    del context  # Unused.
+    files = source_uploader.upload_sources(self.sources(),
+                                           self.args.gcs_bucket, self.backend)
+    source_uploader.write_manifest(files, self.custom_sources_manifest,
+                                   self.backend)
+    print(source_uploader.format_summary(files), file=self.output,
+          flush=True)
+    return {"custom_sources_manifest": self.custom_sources_manifest}
+
+  def _ensure_base_snapshot(self):
+    base_image = self.args.dataproc_base_image
+    if self.args.reuse_base_disk_snapshot:
+      if warm_pool.supports(base_image):
+        self.base_snapshot = warm_pool.ensure_snapshot(
+            self.backend, self.args.project_id, self.args.zone, base_image)
+      else:
+        print("Base image families are not snapshotted, creating the disk "
+              "from {}.".format(base_image), file=self.output, flush=True)
+
+  def create_disk(self, context):
+    del context  # Unused.
+    self._ensure_base_snapshot()
+    start = time.time()
+    self.backend.create_disk(self.args.project_id, self.args.zone,
+                             self.disk())
+    self.disk_created = True
+    if self.base_snapshot is not None:
+      print(warm_pool.format_savings(self.base_snapshot, time.time() - start),
+            file=self.output, flush=True)
+    return {"disk": self.install_name, "zone": self.args.zone}
+
+  def restore_disk(self, resources):
+    del resources  # Unused.
+    self.disk_created = True
+
+  def create_instance(self, context):
+    del context  # Unused.
+    self.backend.create_instance(self.args.project_id, self.args.zone,
+                                 self.instance())
+    self.vm_created = True
+    return {"instance": self.install_name, "zone": self.args.zone}
+
+  def restore_instance(self, resources):
+    del resources  # Unused.
+    self.vm_created = True
+
+  def _create_vm_in_zone(self, zone):
+    """Creates the disk and VM in a zone, deleting the disk on failure."""
+    project_id = self.args.project_id
+    self.backend.create_disk(project_id, zone, self.disk(zone))
+    try:
+      self.backend.create_instance(project_id, zone, self.instance(zone))
+    except Exception:
+      try:
+        self.backend.delete_disk(project_id, zone, self.install_name)
+      except cloud_backend.CloudApiError as e:
+        _LOG.warning("Failed to delete disk %s in %s: %s", self.install_name,
+                     zone, e)
+      raise
+
+  def _delete_vm_in_zone(self, zone, result):
+    del result  # Unused.
+    try:
+      self.backend.delete_instance(self.args.project_id, zone,
+                                   self.install_name)
+    except cloud_backend.CloudApiError as e:
+      print("Failed to delete the unused VM {} in {}: {}".format(
+          self.install_name, zone, e), file=self.output, flush=True)
+
+  def place_instance(self, context):
+    """Creates the disk and VM in the first of the --zones with resources."""
+    del context  # Unused.
+    self._ensure_base_snapshot()
+    zone, _ = zone_placement.place(
+        self.zones, self._create_vm_in_zone, release=self._delete_vm_in_zone,
+        strategy=self.args.zone_strategy,
+        key=zone_placement.capacity_key(self.args), output=self.output)
+    self.args.zone = zone
+    self.disk_created = self.vm_created = True
+    return {"disk": self.install_name, "instance": self.install_name,
+            "zone": zone}
+
+  def restore_placement(self, resources):
+    self.args.zone = resources["zone"]
+    self.disk_created = self.vm_created = True
+
+  def wait_for_customization(self, context):
+    print("Monitor startup logs in {}/startup-script.log".format(
+        self.log_dir), file=self.output, flush=True)
+    log_file = os.path.join(self.log_dir, "startup-script.log")
+    # The output is read again from the start when resuming.
+    open(log_file, "w").close()
+    preemptions = self.args.preemptions = spot_vm.PreemptionStats()
+    while True:
+      boot_start = time.time()
+      follower = serial_port_follower.SerialPortFollower(
+          self.backend, self.args.project_id, self.args.zone,
+          self.install_name, log_file, guest_attributes=True)
+      result = follower.follow(timeout=context.remaining())
+      if (result != serial_port_follower.PREEMPTED or
+          preemptions.count >= spot_vm.MAX_PREEMPTIONS):
+        break
+      print("Spot VM {} was preempted, starting it again.".format(
+          self.install_name), file=self.output, flush=True)
+      # run.sh resumes the build from the progress recorded on the disk.
+      self.backend.start_instance(self.args.project_id, self.args.zone,
+                                  self.install_name)
+      preemptions.record(time.time() - boot_start)
+    if result == serial_port_follower.PREEMPTED:
+      raise RuntimeError("Spot VM {} was preempted {} times.".format(
+          self.install_name, preemptions.count + 1))
+    if result == serial_port_follower.FAILED:
+      self.customization_failed = True
+      raise RuntimeError(
+          "Customization script failed. See {}/startup-script.log for "
+          "details".format(self.log_dir))
+    if result != serial_port_follower.SUCCEEDED:
+      raise RuntimeError(
+          "Unable to determine the customization script result.")
+    print("Customization script succeeded.", file=self.output, flush=True)
+    return {"result": result, "preemptions": preemptions.count}
+
+  def stop_instance(self, context):
+    del context  # Unused.
+    self.backend.stop_instance(self.args.project_id, self.args.zone,
+                               self.install_name)
+
+  def create_image(self, context):
+    del context  # Unused.
+    image = self.backend.create_image(self.args.project_id, self.image())
+    self.image_created = True
+    # Saves a describe call to the expiration notifier.
+    self.args.image_creation_timestamp = image.get("creationTimestamp")
+    return {"image": self.args.image_name}
+
+  def restore_image(self, resources):
+    del resources  # Unused.
+    self.image_created = True
+
+  def steps(self):
+    step = workflow_engine.Step
+    api_retry = workflow_engine.API_RETRY
+    if len(self.zones) > 1:
+      vm_steps = [
+          step("place-instance", self.place_instance,
+               timeout_sec=_API_STEP_TIMEOUT_SEC, retry=api_retry,
+               restore=self.restore_placement),
+      ]
+    else:
+      vm_steps = [
+          step("create-disk", self.create_disk,
+               timeout_sec=_API_STEP_TIMEOUT_SEC, retry=api_retry,
+               restore=self.restore_disk),
+          step("create-instance", self.create_instance,
+               timeout_sec=_API_STEP_TIMEOUT_SEC, retry=api_retry,
+               restore=self.restore_instance),
+      ]
+    return [
+        step("upload-sources", self.upload_sources,
+             timeout_sec=_API_STEP_TIMEOUT_SEC, retry=api_retry),
+    ] + vm_steps + [
+        step("wait-for-customization", self.wait_for_customization,
+             timeout_sec=_CUSTOMIZATION_TIMEOUT_SEC),
+        step("stop-instance", self.stop_instance,
+             timeout_sec=_API_STEP_TIMEOUT_SEC, retry=api_retry),
+        step("create-image", self.create_image,
+             timeout_sec=_API_STEP_TIMEOUT_SEC, retry=api_retry,
+             restore=self.restore_image),
+    ]
+
+  def resumable(self, workflow):
+    """Returns whether the disk or VM of a failed build is worth keeping."""
+    return (not workflow.succeeded and not self.customization_failed and
+            (self.disk_created or self.vm_created))
+
+  def cleanup(self, workflow):
+    """Same as exit_handler of the Shell script, unless resumable."""
+    print("Cleaning up before exiting.", file=self.output, flush=True)
+    project_id, zone = self.args.project_id, self.args.zone
+    try:
+      if self.resumable(workflow):
+        print("Keeping {} to resume the build with --resume {}. Delete it "
+              "with 'gcloud compute {} delete {} --project={} --zone={}' if "
+              "you do not resume.".format(
+                  self.install_name, self.run_id,
+                  "instances" if self.vm_created else "disks",
+                  self.install_name, project_id, zone),
+              file=self.output, flush=True)
+      elif self.vm_created:
+        print("Deleting VM instance.", file=self.output, flush=True)
+        self.backend.delete_instance(project_id, zone, self.install_name)
+      elif self.disk_created:
+        print("Deleting disk.", file=self.output, flush=True)
+        self.backend.delete_disk(project_id, zone, self.install_name)
+    finally:
+      print(workflow_engine.format_report(workflow.records),
+            file=self.output)
+      # After a successful build, the logs are uploaded while the image is
+      # finalized.
+      if not (workflow.succeeded and
+              getattr(self.args, "defer_log_upload", False)):
+        print("Uploading local logs to GCS bucket.", file=self.output,
+              flush=True)
+        finalizer.upload_logs(self.log_dir, self.gcs_log_dir, self.backend)
+
+
+def create(args, output=None, tracer=None):
+  """Creates a custom image with the Python workflow engine.
+
+  Each step is recorded as a span of `tracer` if set.
+  """
+  # The bash workflow engine, used for secure boot, deletes the disk and VM
+  # of a failed build, and has no journal to resume from.
+  if args.resume and args.trusted_cert:
+    raise RuntimeError("--resume is not supported with --trusted-cert.")
+  if args.trusted_cert:
+    print("Secure boot certificates are only supported by the bash "
+          "workflow engine, using it instead.", file=output)
+    return shell_image_creator.create(args, output=output, tracer=tracer)
+
+  backend = cloud_backend.get_backend(args)
+  image_workflow = ImageWorkflow(args, backend, run_id=args.resume)
+  # Like the bash workflow generator, exposes where the build logs go.
+  args.run_id = image_workflow.run_id
+  args.log_dir = image_workflow.log_dir
+  args.gcs_log_dir = image_workflow.gcs_log_dir
+  steps = image_workflow.steps()
+  if args.dry_run:
+    print("Workflow steps: {}".format(", ".join(s.name for s in steps)),
+          file=output)
+    _LOG.info("Skip creating custom image (dry run).")
+    return
+
+  journal = image_workflow.journal
+  if args.resume and not journal.load():
+    raise RuntimeError("No journal found for run {} in {} or {}.".format(
+        args.resume, journal.path, journal.gcs_uri))
+  journal.start(args)
+  os.makedirs(image_workflow.log_dir, exist_ok=True)
+  with open(os.path.join(image_workflow.log_dir, "workflow.log"),
+            "a") as log_file:
+    image_workflow.output = _Tee(output, log_file)
+    workflow = workflow_engine.Workflow(steps, image_workflow.cleanup,
+                                        output=image_workflow.output,
+                                        journal=journal, tracer=tracer)
+    try:
+      workflow.run()
+    except workflow_engine.WorkflowError as e:
+      print(e, file=image_workflow.output)
+      raise RuntimeError("Error building custom image.")
+    finally:
+      print("Workflow {}, check logs at {}/ or {}/".format(
+          "succeeded" if workflow.succeeded else "failed",
+          image_workflow.log_dir, image_workflow.gcs_log_dir),
+            file=image_workflow.output, flush=True)
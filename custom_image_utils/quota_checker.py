@@ -0,0 +1,341 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Pre-flight check of the Compute Engine quota a build needs.
+
+The vCPUs, GPUs, SSD and instance a build VM uses are computed from
+--machine-type, --accelerator and --disk-size, and compared with the
+headroom of the regional and project quotas, read once. A build without
+enough headroom fails before any resource is created, or waits until the
+quota is available with --on-insufficient-quota=wait.
+
+In --manifest mode, a QuotaLedger reserves the quota of the running builds,
+so that builds are only started while headroom remains. Builds which do not
+fit in the quotas fail, or with --on-insufficient-quota=wait, are held back
+while the quotas are read again.
+"""
+
+import collections
+import logging
+import re
+import time
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import spot_vm
+from custom_image_utils import zone_placement
+
+FAIL = "fail"
+WAIT = "wait"
+IGNORE = "ignore"
+POLICIES = (FAIL, WAIT, IGNORE)
+# How often and how long --on-insufficient-quota=wait reads the quotas.
+WAIT_POLL_SEC = 60
+WAIT_TIMEOUT_SEC = 60 * 60
+
+REGION = "region"
+PROJECT = "project"
+_PREEMPTIBLE = "PREEMPTIBLE_"
+
+# Machine families whose vCPUs count against the CPUS quota, the others
+# have their own <FAMILY>_CPUS quota.
+_CPUS_FAMILIES = ("n1", "e2", "f1", "g1", "custom")
+_SHARED_CORE_CPUS = {
+    "e2-micro": 2,
+    "e2-small": 2,
+    "e2-medium": 2,
+    "f1-micro": 1,
+    "g1-small": 1,
+}
+_CUSTOM_MACHINE_TYPE = re.compile(r"(?:^|-)custom-(\d+)-\d+(?:-ext)?$")
+_PREDEFINED_MACHINE_TYPE = re.compile(r"^[a-z0-9]+-[a-z]+-(\d+)$")
+# GPU quota metrics not named after the accelerator type.
+_GPU_METRICS = {
+    "nvidia-h100-80gb": "NVIDIA_H100_GPUS",
+    "nvidia-h100-mega-80gb": "NVIDIA_H100_MEGA_GPUS",
+}
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class QuotaError(RuntimeError):
+  """The quota does not have the headroom for a build."""
+
+
+def parse_accelerator(accelerator):
+  """Returns the (type, count) of an --accelerator value, or (None, 0)."""
+  fields = {}
+  for item in (accelerator or "").split(","):
+    key, _, value = item.partition("=")
+    fields[key.strip()] = value.strip()
+  if not fields.get("type"):
+    return None, 0
+  return fields["type"], int(fields.get("count") or 1)
+
+
+def cpu_metric(machine_type):
+  family = machine_type.split("-")[0]
+  if family in _CPUS_FAMILIES:
+    return "CPUS"
+  return "{}_CPUS".format(family.upper())
+
+
+def gpu_metric(accelerator_type):
+  if accelerator_type in _GPU_METRICS:
+    return _GPU_METRICS[accelerator_type]
+  name = accelerator_type.replace("nvidia-tesla-", "nvidia-")
+  return "{}_GPUS".format(name.upper().replace("-", "_"))
+
+
+def machine_type_cpus(args, backend=None):
+  """Returns the vCPUs of --machine-type, from its name when possible."""
+  machine_type = args.machine_type
+  if machine_type in _SHARED_CORE_CPUS:
+    return _SHARED_CORE_CPUS[machine_type]
+  for pattern in (_CUSTOM_MACHINE_TYPE, _PREDEFINED_MACHINE_TYPE):
+    match = pattern.search(machine_type)
+    if match:
+      return int(match.group(1))
+  backend = backend or cloud_backend.get_backend(args)
+  return int(backend.describe_machine_type(args.project_id, args.zone,
+                                           machine_type)["guestCpus"])
+
+
+def requirements(args, backend=None):
+  """Returns the {(scope, metric): amount} quota a build uses.
+
+  The scope is REGION for the regional quotas of the build zone, and PROJECT
+  for the global quotas of the project.
+  """
+  cpus = machine_type_cpus(args, backend)
+  # Spot VMs use the preemptible quotas.
+  prefix = _PREEMPTIBLE if spot_vm.is_spot(args) else ""
+  required = {
+      (REGION, prefix + cpu_metric(args.machine_type)): cpus,
+      (REGION, "INSTANCES"): 1,
+      (REGION, "SSD_TOTAL_GB"): args.disk_size,
+      (PROJECT, "CPUS_ALL_REGIONS"): cpus,
+  }
+  accelerator_type, gpus = parse_accelerator(
+      getattr(args, "accelerator", None))
+  if gpus:
+    required[(REGION, prefix + gpu_metric(accelerator_type))] = gpus
+    required[(PROJECT, "GPUS_ALL_REGIONS")] = gpus
+  return required
+
+
+def read_quotas(args, backend=None):
+  """Reads the regional and project quotas as {(scope, metric): headroom}."""
+  backend = backend or cloud_backend.get_backend(args)
+  headroom = {}
+  limits = {}
+  for scope, quotas in (
+      (REGION, backend.get_region_quotas(args.project_id,
+                                         zone_placement.region_of(
+                                             args.zone))),
+      (PROJECT, backend.get_project_quotas(args.project_id))):
+    for quota in quotas:
+      key = (scope, quota["metric"])
+      limits[key] = float(quota.get("limit", 0))
+      headroom[key] = limits[key] - float(quota.get("usage", 0))
+  # Without a preemptible quota, spot VMs use the standard quota.
+  for scope, metric in list(headroom):
+    preemptible = (scope, _PREEMPTIBLE + metric)
+    if not metric.startswith(_PREEMPTIBLE) and not limits.get(preemptible):
+      headroom[preemptible] = headroom[(scope, metric)]
+  return headroom
+
+
+def shortfalls(required, headroom, reserved=None):
+  """Returns a message per quota without enough headroom.
+
+  Quotas missing from `headroom` are not enforced in the project, and are
+  skipped.
+  """
+  reserved = reserved or {}
+  messages = []
+  for key, amount in sorted(required.items()):
+    if key not in headroom:
+      continue
+    available = headroom[key] - reserved.get(key, 0)
+    if amount > available:
+      scope, metric = key
+      messages.append("{} {} quota: {:g} needed, {:g} available".format(
+          scope, metric, amount, max(available, 0)))
+  return messages
+
+
+def _skipped(args):
+  return (getattr(args, "dry_run", False) or
+          getattr(args, "on_insufficient_quota", FAIL) == IGNORE)
+
+
+def check(args, output=None, backend=None, sleep=time.sleep,
+          clock=time.time):
+  """Fails or waits unless the quotas have the headroom for the build.
+
+  Quotas which cannot be read only print a warning.
+  """
+  if _skipped(args) or getattr(args, "quota_admitted", False):
+    return
+  try:
+    required = requirements(args, backend)
+    headroom = read_quotas(args, backend)
+  except cloud_backend.CloudApiError as e:
+    print("Warning: unable to read the quotas of project {}, skipping the "
+          "quota check: {}".format(args.project_id, e), file=output)
+    return
+  deadline = clock() + WAIT_TIMEOUT_SEC
+  while True:
+    messages = shortfalls(required, headroom)
+    if not messages:
+      return
+    message = "Insufficient quota in project {} for the build: {}.".format(
+        args.project_id, "; ".join(messages))
+    if args.on_insufficient_quota != WAIT or clock() >= deadline:
+      raise QuotaError(message)
+    print("{} Waiting {}s for quota...".format(message, WAIT_POLL_SEC),
+          file=output, flush=True)
+    sleep(WAIT_POLL_SEC)
+    try:
+      headroom = read_quotas(args, backend)
+    except cloud_backend.CloudApiError as e:
+      _LOG.warning("Unable to read the quotas: %s", e)
+
+
+class QuotaLedger:
+  """Admits the builds of a batch while the quotas have headroom.
+
+  The quotas of each project and region are read once, by prepare(), so that
+  admit() does not call the API. The quota of a build is reserved when it is
+  admitted, and released when it finishes.
+
+  Builds with the `wait` policy which do not fit in the quotas are held back
+  for up to WAIT_TIMEOUT_SEC, while refresh() reads the quotas of their
+  regions again every WAIT_POLL_SEC. The usage read then includes the running
+  builds, which are also reserved: this only holds the waiting builds back
+  until those finish.
+  """
+
+  def __init__(self, backend=None, clock=time.time):
+    self._backend = backend
+    self._clock = clock
+    self._headroom = {}
+    # {id(args): (required, headroom)}, or None if the quotas are unknown.
+    self._prepared = {}
+    self._reserved = collections.Counter()
+    self._admitted = {}
+    # {id(args): (args, deadline)} of the builds waiting for quota.
+    self._waiting = {}
+    self._next_refresh = None
+
+  def _keys(self, args):
+    region = zone_placement.region_of(args.zone)
+    return {
+        REGION: (args.project_id, region),
+        PROJECT: (args.project_id, None),
+    }
+
+  def _headroom_of(self, args):
+    """Returns the headroom keyed like requirements() for a build."""
+    key = (args.project_id, zone_placement.region_of(args.zone))
+    if key not in self._headroom:
+      self._headroom[key] = read_quotas(args, self._backend)
+    return self._headroom[key]
+
+  def _reserved_of(self, args):
+    keys = self._keys(args)
+    return {(scope, metric): amount
+            for (owner, scope, metric), amount in self._reserved.items()
+            if owner == keys[scope]}
+
+  def prepare(self, args):
+    """Reads the quotas and the requirements of a build."""
+    if _skipped(args) or id(args) in self._prepared:
+      return
+    try:
+      self._prepared[id(args)] = (requirements(args, self._backend),
+                                  self._headroom_of(args))
+    except cloud_backend.CloudApiError as e:
+      _LOG.warning("Unable to read the quotas of project %s: %s",
+                   args.project_id, e)
+      self._prepared[id(args)] = None
+
+  def admit(self, args):
+    """Returns whether a build can start now, and reserves its quota.
+
+    Raises QuotaError if the build does not fit even with no other build
+    running.
+    """
+    if _skipped(args):
+      return True
+    self.prepare(args)
+    if self._prepared[id(args)] is None:
+      return True
+    required, headroom = self._prepared[id(args)]
+    messages = shortfalls(required, headroom)
+    if messages:
+      message = "Insufficient quota in project {} for the build: {}.".format(
+          args.project_id, "; ".join(messages))
+      if args.on_insufficient_quota != WAIT:
+        raise QuotaError(message)
+      if id(args) not in self._waiting:
+        _LOG.warning("%s Waiting up to %ss for quota...", message,
+                     WAIT_TIMEOUT_SEC)
+        self._waiting[id(args)] = (args, self._clock() + WAIT_TIMEOUT_SEC)
+        if self._next_refresh is None:
+          self._next_refresh = self._clock() + WAIT_POLL_SEC
+      if self._clock() >= self._waiting[id(args)][1]:
+        del self._waiting[id(args)]
+        raise QuotaError(message)
+      return False
+    self._waiting.pop(id(args), None)
+    if shortfalls(required, headroom, self._reserved_of(args)):
+      return False
+    keys = self._keys(args)
+    for (scope, metric), amount in required.items():
+      self._reserved[(keys[scope], scope, metric)] += amount
+    self._admitted[id(args)] = (keys, required)
+    args.quota_admitted = True
+    return True
+
+  def refresh_delay(self):
+    """Returns the seconds until refresh() is due, None if no build waits."""
+    if not self._waiting:
+      self._next_refresh = None
+      return None
+    return max(self._next_refresh - self._clock(), 0)
+
+  def refresh(self):
+    """Reads the quotas of the regions of the waiting builds again."""
+    regions = {}
+    for args, _ in self._waiting.values():
+      regions.setdefault(
+          (args.project_id, zone_placement.region_of(args.zone)), args)
+    for key, args in regions.items():
+      try:
+        self._headroom[key] = read_quotas(args, self._backend)
+      except cloud_backend.CloudApiError as e:
+        _LOG.warning("Unable to read the quotas: %s", e)
+    for args, _ in self._waiting.values():
+      required, _ = self._prepared[id(args)]
+      self._prepared[id(args)] = (required, self._headroom_of(args))
+    self._next_refresh = self._clock() + WAIT_POLL_SEC
+
+  def release(self, args):
+    """Releases the quota reserved for a build, if any."""
+    keys, required = self._admitted.pop(id(args), (None, {}))
+    for (scope, metric), amount in required.items():
+      self._reserved[(keys[scope], scope, metric)] -= amount
@@ -0,0 +1,443 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Process-wide rate limiting and retries of cloud API calls.
+
+Calls are grouped in API families, which have separate quotas: Compute
+Engine reads, Compute Engine mutations, serial port output, Cloud Storage
+and Dataproc. Each family has a token bucket, shared by every build of the
+process, so concurrent builds of a batch stay within the per-minute quotas
+instead of failing on them. With --shared-rate-limits, the buckets are kept
+in files locked with flock in the cache directory, and also shared with the
+generated workflow scripts and other builds running on the machine.
+
+Calls failing with a throttling or transient error are retried with
+exponential backoff and full jitter. Errors which would fail again, such as
+a missing resource or a denied permission, are never retried. The generated
+workflow script uses this module as a command:
+
+    python -m custom_image_utils.rate_limiter [--state-dir=<dir>] \\
+        acquire -- gcloud compute instances create ...
+    python -m custom_image_utils.rate_limiter retryable < <stderr file>
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import shlex
+import sys
+import threading
+import time
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import image_cache
+
+try:
+  import fcntl
+except ImportError:  # Not available on Windows.
+  fcntl = None
+
+COMPUTE_READ = "compute-read"
+COMPUTE_MUTATE = "compute-mutate"
+SERIAL_PORT = "serial-port"
+STORAGE = "storage"
+DATAPROC = "dataproc"
+FAMILIES = (COMPUTE_READ, COMPUTE_MUTATE, SERIAL_PORT, STORAGE, DATAPROC)
+# Requests per second of each family, well below the default per-minute
+# quotas of a project so that several builds fit in them.
+DEFAULT_RATES = {
+    COMPUTE_READ: 10.0,
+    COMPUTE_MUTATE: 2.0,
+    SERIAL_PORT: 1.0,
+    STORAGE: 20.0,
+    DATAPROC: 2.0,
+}
+# Calls allowed at once after the family was idle, in seconds of its rate.
+BURST_SEC = 5
+STATE_DIR = "rate-limits"
+
+# Attempts of a call failing with a throttling or transient error.
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SEC = 2.0
+BACKOFF_CAP_SEC = 60.0
+THROTTLED_STATUS = 429
+_RETRYABLE_STATUSES = (THROTTLED_STATUS, 500, 502, 503, 504)
+# Statuses of calls which the API did not act on, retried even if they are
+# not idempotent.
+_NOT_APPLIED_STATUSES = (THROTTLED_STATUS, 503)
+
+# A zone running out of the resources for a VM, which is not worth retrying
+# in the same zone right away.
+_CAPACITY_ERROR = re.compile(
+    r"ZONE_RESOURCE_POOL_EXHAUSTED|does not have enough resources available|"
+    r"resource pool exhausted", re.I)
+# Exit code of `retryable` for capacity errors.
+CAPACITY_EXIT_CODE = 2
+
+_READ_VERBS = ("describe", "list", "get-guest-attributes", "get-iam-policy")
+# Patterns of gcloud error messages, for errors without an HTTP status.
+_GCLOUD_ERROR_STATUSES = (
+    (re.compile(r"HTTPError (\d{3})"), None),
+    # Rate limits, unlike the quotas of resources such as CPUS, which fail
+    # again until resources are freed.
+    (re.compile(r"rateLimitExceeded|Rate Limit Exceeded|Too Many Requests|"
+                r"(?:Quota exceeded|RESOURCE_EXHAUSTED)[^\n]*"
+                r"(?:\brate\b|per minute|per second)", re.I),
+     THROTTLED_STATUS),
+    (re.compile(r"Quota '[^']+' exceeded|QUOTA_EXCEEDED|Quota exceeded|"
+                r"RESOURCE_EXHAUSTED", re.I), 403),
+    # An internal error may come after the request was applied, unlike an
+    # unavailable service.
+    (re.compile(r"UNAVAILABLE|Service Unavailable", re.I), 503),
+    (re.compile(r"backendError|internal error", re.I), 500),
+    (re.compile(r"was not found|NOT_FOUND|does not exist|No URLs matched|"
+                r"matched no objects|not found: 404"), 404),
+    (re.compile(r"already exists|ALREADY_EXISTS"), 409),
+    (re.compile(r"PERMISSION_DENIED|Required '[^']+' permission|"
+                r"does not have permission"), 403),
+    (re.compile(r"Invalid value|INVALID_ARGUMENT|unrecognized arguments|"
+                r"argument .*: "), 400),
+)
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+def command_family(command):
+  """Returns the API family of a gcloud command, or None if not limited."""
+  words = [w for w in command if not w.startswith("-") and "=" not in w]
+  if words and os.path.basename(words[0]) == "gsutil":
+    return STORAGE
+  if not words or os.path.basename(words[0]) != "gcloud":
+    return None
+  words = [w for w in words[1:] if w not in ("alpha", "beta")]
+  if not words:
+    return None
+  if words[0] == "storage":
+    return STORAGE
+  if words[0] == "dataproc":
+    return DATAPROC
+  if words[0] != "compute":
+    return None
+  if "get-serial-port-output" in words:
+    return SERIAL_PORT
+  if any(verb in words for verb in _READ_VERBS):
+    return COMPUTE_READ
+  return COMPUTE_MUTATE
+
+
+def gcloud_error_status(stderr):
+  """Returns the HTTP status of a gcloud error message, or None."""
+  for pattern, status in _GCLOUD_ERROR_STATUSES:
+    match = pattern.search(stderr or "")
+    if match:
+      return status or int(match.group(1))
+  return None
+
+
+def is_capacity_error(message):
+  """Whether an error message tells that a zone is out of resources."""
+  return bool(_CAPACITY_ERROR.search(message or ""))
+
+
+def is_retryable(error):
+  """Whether a failed step may succeed if attempted again.
+
+  API errors of unknown cause may, but not the ones which would fail again,
+  such as a missing resource or a denied permission, nor a zone out of
+  resources, for which another zone is tried with --zones.
+  """
+  if not isinstance(error, cloud_backend.CloudApiError):
+    return False
+  if is_capacity_error(str(error)):
+    return False
+  return error.status is None or error.status in _RETRYABLE_STATUSES
+
+
+def _should_retry_call(error, idempotent):
+  status = getattr(error, "status", None)
+  if status in _NOT_APPLIED_STATUSES:
+    return True
+  return idempotent and status in _RETRYABLE_STATUSES
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE_SEC, cap=BACKOFF_CAP_SEC):
+  """Returns the delay before retrying after `attempt` failed attempts.
+
+  Full jitter spreads the retries of concurrent builds, which are often
+  throttled at the same time, instead of retrying them in lockstep.
+  """
+  return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+@contextlib.contextmanager
+def _locked_state(path):
+  """Yields the JSON state of a file, written back under an exclusive lock."""
+  with open(path, "a+") as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+      f.seek(0)
+      try:
+        state = json.loads(f.read() or "{}")
+      except ValueError:
+        state = {}
+      yield state
+      f.seek(0)
+      f.truncate()
+      json.dump(state, f)
+      f.flush()
+    finally:
+      fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class TokenBucket:
+  """Token bucket, kept in memory or in a file shared between processes.
+
+  A call takes a token, and waits for it if the bucket is empty. Tokens are
+  reserved before waiting, so callers are served in order without polling.
+  """
+
+  def __init__(self, rate, burst=None, path=None, clock=time.time,
+               sleep=time.sleep):
+    self.rate = rate
+    self.burst = burst or max(1.0, rate * BURST_SEC)
+    self.path = path
+    self._clock = clock
+    self._sleep = sleep
+    self._state = {}
+    self._lock = threading.Lock()
+
+  def _reserve(self, state, now):
+    """Takes a token from `state`, returns the seconds to wait for it."""
+    tokens = state.get("tokens", self.burst)
+    elapsed = max(0.0, now - state.get("updated", now))
+    tokens = min(self.burst, tokens + elapsed * self.rate) - 1
+    state["tokens"] = tokens
+    state["updated"] = now
+    return max(0.0, -tokens / self.rate)
+
+  def acquire(self):
+    """Waits for a token. Returns the seconds waited."""
+    with self._lock:
+      now = self._clock()
+      try:
+        if self.path:
+          with _locked_state(self.path) as state:
+            wait = self._reserve(state, now)
+      except OSError as e:
+        _LOG.warning("Unable to use the shared rate limit %s: %s", self.path,
+                     e)
+        self.path = None
+      if not self.path:
+        wait = self._reserve(self._state, now)
+    if wait > 0:
+      self._sleep(wait)
+    return wait
+
+
+class FamilyStats:
+  """Counters of the calls of an API family."""
+
+  def __init__(self):
+    self.calls = 0
+    # Calls which waited for a token or were throttled by the API.
+    self.throttled = 0
+    self.retried = 0
+    self.wait_sec = 0.0
+
+
+class RateLimiter:
+  """Token buckets and call counters of the API families."""
+
+  def __init__(self, rates=None, state_dir=None, clock=time.time,
+               sleep=time.sleep):
+    self.rates = dict(DEFAULT_RATES, **(rates or {}))
+    self.state_dir = state_dir
+    if state_dir and fcntl is None:
+      _LOG.warning("File locks are not supported, rate limits are not "
+                   "shared between processes.")
+      self.state_dir = None
+    if self.state_dir:
+      try:
+        os.makedirs(self.state_dir, exist_ok=True)
+      except OSError as e:
+        _LOG.warning("Unable to create %s, rate limits are not shared "
+                     "between processes: %s", self.state_dir, e)
+        self.state_dir = None
+    self._sleep = sleep
+    self._buckets = {}
+    for family, rate in self.rates.items():
+      path = None
+      if self.state_dir:
+        path = os.path.join(self.state_dir, family + ".json")
+      self._buckets[family] = TokenBucket(rate, path=path, clock=clock,
+                                          sleep=sleep)
+    self._stats = {}
+    self._lock = threading.Lock()
+
+  def _family_stats(self, family):
+    with self._lock:
+      return self._stats.setdefault(family, FamilyStats())
+
+  def acquire(self, family):
+    """Waits for a token of `family`, if it is rate limited."""
+    bucket = self._buckets.get(family)
+    if bucket is None:
+      return 0.0
+    wait = bucket.acquire()
+    stats = self._family_stats(family)
+    with self._lock:
+      stats.calls += 1
+      if wait > 0:
+        stats.throttled += 1
+        stats.wait_sec += wait
+    return wait
+
+  def call(self, family, func, idempotent=True, max_attempts=MAX_ATTEMPTS):
+    """Calls `func` within the rate of `family`, retrying transient errors.
+
+    Calls which are not `idempotent` are only retried on errors telling
+    that the API did not act on them.
+    """
+    if family is None:
+      return func()
+    attempt = 0
+    while True:
+      attempt += 1
+      self.acquire(family)
+      try:
+        return func()
+      except cloud_backend.CloudApiError as e:
+        stats = self._family_stats(family)
+        with self._lock:
+          if e.status == THROTTLED_STATUS:
+            stats.throttled += 1
+        if attempt >= max_attempts or not _should_retry_call(e, idempotent):
+          raise
+        delay = backoff_delay(attempt)
+        _LOG.warning("%s call failed with HTTP %s, retrying in %.1f seconds.",
+                     family, e.status, delay)
+        with self._lock:
+          stats.retried += 1
+        self._sleep(delay)
+
+  def stats(self):
+    """Returns the FamilyStats of the families called so far."""
+    with self._lock:
+      return dict(self._stats)
+
+
+_limiter = RateLimiter()
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+  return _limiter
+
+
+def set_limiter(limiter):
+  """Replaces the process-wide limiter, e.g. with a fake in tests."""
+  global _limiter
+  with _limiter_lock:
+    _limiter = limiter or RateLimiter()
+
+
+def default_state_dir():
+  return os.path.join(image_cache.default_cache_dir(), STATE_DIR)
+
+
+def parse_rates(value):
+  """Parses `family=rate,...` into a dict of requests per second."""
+  rates = {}
+  for item in filter(None, (value or "").split(",")):
+    family, _, rate = item.partition("=")
+    family = family.strip()
+    if family not in FAMILIES:
+      raise ValueError("Unknown API family {!r}, expected one of {}".format(
+          family, ", ".join(FAMILIES)))
+    rates[family] = float(rate)
+    if rates[family] <= 0:
+      raise ValueError("The rate of {} must be positive".format(family))
+  return rates
+
+
+def configure(args):
+  """Configures the process-wide limiter from the build arguments."""
+  rates = parse_rates(getattr(args, "api_rate_limits", None))
+  state_dir = None
+  if getattr(args, "shared_rate_limits", False):
+    state_dir = default_state_dir()
+  with _limiter_lock:
+    if _limiter.state_dir == state_dir and _limiter.rates == dict(
+        DEFAULT_RATES, **rates):
+      return
+  set_limiter(RateLimiter(rates=rates, state_dir=state_dir))
+
+
+def format_report(limiter=None):
+  """Formats the API call counters, or returns None if nothing was called."""
+  stats = (limiter or _limiter).stats()
+  if not stats:
+    return None
+  lines = ["API calls:"]
+  for family in FAMILIES:
+    if family in stats:
+      s = stats[family]
+      lines.append("  {:<16} calls {:5d}  throttled {:4d}  retried {:4d}  "
+                   "waited {:8.3f}s".format(family, s.calls, s.throttled,
+                                            s.retried, s.wait_sec))
+  return "\n".join(lines)
+
+
+def main(args):
+  parser = argparse.ArgumentParser(
+      description="Rate limiting of the workflow script API calls.")
+  parser.add_argument("--state-dir", default=None,
+                      help="Directory of the shared token buckets.")
+  parser.add_argument("--api-rate-limits", default=None)
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  acquire = subparsers.add_parser(
+      "acquire", help="Waits for a token for the API family of a command.")
+  acquire.add_argument("gcloud_command", nargs=argparse.REMAINDER,
+                       help="The command, as one or several arguments.")
+  subparsers.add_parser(
+      "retryable",
+      help="Exits with 0 if the gcloud error on stdin may be retried, {} if "
+      "the zone is out of resources and 1 otherwise.".format(
+          CAPACITY_EXIT_CODE))
+  parsed_args = parser.parse_args(args)
+  if parsed_args.command == "retryable":
+    stderr = sys.stdin.read()
+    if is_capacity_error(stderr):
+      return CAPACITY_EXIT_CODE
+    status = gcloud_error_status(stderr)
+    return 0 if status is None or status in _RETRYABLE_STATUSES else 1
+  command = " ".join(w for w in parsed_args.gcloud_command if w != "--")
+  try:
+    command = shlex.split(command)
+  except ValueError:
+    command = command.split()
+  limiter = RateLimiter(rates=parse_rates(parsed_args.api_rate_limits),
+                        state_dir=parsed_args.state_dir)
+  limiter.acquire(command_family(command))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
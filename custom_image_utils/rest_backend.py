@@ -0,0 +1,626 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Cloud backend which calls the Compute Engine and Dataproc REST APIs directly.
+
+Requests go through a pool of keep-alive HTTP connections, so a build pays
+for TLS setup once per host instead of one gcloud process per call. Calls
+that cannot reach the API at all are retried with the gcloud fallback, as
+long as none of their requests was sent. Resources are created with a
+request ID, reused when the outcome of a create is unknown, so that the API
+returns the resource of the first attempt instead of creating it twice.
+"""
+
+import configparser
+import functools
+import http.client
+import json
+import logging
+import os
+import re
+import select
+import threading
+import time
+from urllib import parse
+import uuid
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import rate_limiter
+
+_COMPUTE_ENDPOINT = "https://compute.{universe_domain}/compute/v1"
+_DATAPROC_ENDPOINT = "https://{region}-dataproc.{universe_domain}/v1"
+_STORAGE_ENDPOINT = "https://storage.{universe_domain}"
+_TOKEN_LIFETIME_SEC = 45 * 60
+# Larger files are uploaded by the gcloud fallback, which streams them and
+# uses parallel composite uploads.
+_MAX_REST_UPLOAD_BYTES = 64 * 1024 * 1024
+_OPERATION_POLL_SEC = 5
+_JOB_FINAL_STATES = ("DONE", "ERROR", "CANCELLED")
+# Compute Engine reports rate limits as HTTP 403 with these reasons.
+_RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+# Methods whose requests may be sent again if their response is lost.
+_IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class RequestNotSentError(ConnectionError):
+  """A request failed before it was sent, so the API did not act on it."""
+
+
+def _is_dropped(connection):
+  """Whether the server closed an idle connection."""
+  if connection.sock is None:
+    return True
+  try:
+    readable, _, _ = select.select([connection.sock], [], [], 0)
+  except (OSError, ValueError):
+    return True
+  # An idle connection only becomes readable when the server closes it.
+  return bool(readable)
+
+
+class ConnectionPool:
+  """Thread-safe pool of keep-alive HTTP(S) connections, per host."""
+
+  def __init__(self, max_idle_per_host=8, timeout=60):
+    self.max_idle_per_host = max_idle_per_host
+    self.timeout = timeout
+    self.connections_opened = 0
+    self._idle = {}
+    self._lock = threading.Lock()
+
+  def _acquire(self, scheme, netloc):
+    with self._lock:
+      idle = self._idle.get((scheme, netloc), [])
+      while idle:
+        connection = idle.pop()
+        if not _is_dropped(connection):
+          return connection, True
+        connection.close()
+      self.connections_opened += 1
+    if scheme == "https":
+      return http.client.HTTPSConnection(netloc, timeout=self.timeout), False
+    return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+  def _release(self, scheme, netloc, connection):
+    with self._lock:
+      idle = self._idle.setdefault((scheme, netloc), [])
+      if len(idle) < self.max_idle_per_host:
+        idle.append(connection)
+        return
+    connection.close()
+
+  def request(self, method, url, body=None, headers=None):
+    """Sends a request and returns (status, response body bytes).
+
+    Raises RequestNotSentError if the request could not be sent. Requests
+    which were sent are only sent again if their method is idempotent.
+    """
+    parsed = parse.urlsplit(url)
+    path = parsed.path + ("?" + parsed.query if parsed.query else "")
+    while True:
+      connection, reused = self._acquire(parsed.scheme, parsed.netloc)
+      try:
+        connection.request(method, path, body=body, headers=headers or {})
+      except (http.client.HTTPException, OSError) as e:
+        connection.close()
+        # The server may have closed an idle connection, retry on a new one.
+        if reused:
+          continue
+        raise RequestNotSentError("{} {}: {}".format(method, url, e))
+      try:
+        response = connection.getresponse()
+        data = response.read()
+      except (http.client.HTTPException, OSError):
+        connection.close()
+        # The server may have closed the connection before reading the
+        # request, or after acting on it.
+        if reused and method in _IDEMPOTENT_METHODS:
+          continue
+        raise
+      if response.will_close:
+        connection.close()
+      else:
+        self._release(parsed.scheme, parsed.netloc, connection)
+      return response.status, data
+
+  def close(self):
+    with self._lock:
+      for idle in self._idle.values():
+        for connection in idle:
+          connection.close()
+      self._idle = {}
+
+
+def _gcloud_config_project():
+  """Reads the default project from the active gcloud configuration files."""
+  project = os.environ.get("CLOUDSDK_CORE_PROJECT")
+  if project:
+    return project
+  config_dir = os.environ.get(
+      "CLOUDSDK_CONFIG", os.path.expanduser("~/.config/gcloud"))
+  config_name = os.environ.get("CLOUDSDK_ACTIVE_CONFIG_NAME")
+  if not config_name:
+    try:
+      with open(os.path.join(config_dir, "active_config")) as f:
+        config_name = f.read().strip()
+    except (IOError, OSError):
+      config_name = "default"
+  config = configparser.ConfigParser()
+  config.read(os.path.join(config_dir, "configurations",
+                           "config_" + config_name))
+  return config.get("core", "project", fallback=None)
+
+
+def _with_fallback(method):
+  """Retries a call with the gcloud backend if the API is unreachable.
+
+  Calls which sent a request, which the API may have acted on, are not
+  retried.
+  """
+
+  @functools.wraps(method)
+  def wrapper(self, *args, **kwargs):
+    sent = self._requests_sent()  # pylint: disable=protected-access
+    try:
+      return method(self, *args, **kwargs)
+    except (http.client.HTTPException, OSError) as e:
+      if (self.fallback is None or not isinstance(e, RequestNotSentError) or
+          self._requests_sent() != sent):  # pylint: disable=protected-access
+        raise cloud_backend.CloudApiError(
+            "Unable to reach the API: {}".format(e))
+      _LOG.warning("REST call %s failed (%s), falling back to gcloud.",
+                   method.__name__, e)
+      return getattr(self.fallback, method.__name__)(*args, **kwargs)
+
+  return wrapper
+
+
+class RestBackend(cloud_backend.CloudBackend):
+  """Cloud backend based on the REST APIs."""
+
+  def __init__(self, universe_domain="googleapis.com", fallback=None,
+               token_provider=None, compute_endpoint=None,
+               dataproc_endpoint=None, storage_endpoint=None, pool=None):
+    self.fallback = fallback
+    self.compute_endpoint = compute_endpoint or _COMPUTE_ENDPOINT.format(
+        universe_domain=universe_domain)
+    self.dataproc_endpoint = dataproc_endpoint or _DATAPROC_ENDPOINT.replace(
+        "{universe_domain}", universe_domain)
+    self.storage_endpoint = storage_endpoint or _STORAGE_ENDPOINT.format(
+        universe_domain=universe_domain)
+    self.pool = pool or ConnectionPool()
+    self._token_provider = token_provider or self._gcloud_access_token
+    self._token = None
+    self._token_expiry = 0
+    self._token_lock = threading.Lock()
+    self._local = threading.local()
+    # {(url, body): request ID} of the creates whose outcome is unknown.
+    self._request_ids = {}
+    self._request_ids_lock = threading.Lock()
+
+  def _requests_sent(self):
+    """Returns the number of requests the current thread sent."""
+    return getattr(self._local, "sent", 0)
+
+  def _gcloud_access_token(self):
+    if self.fallback is None:
+      raise cloud_backend.CloudApiError("No access token provider.")
+    # One gcloud call per token lifetime instead of one per API call.
+    return self.fallback.print_access_token()
+
+  def _access_token(self):
+    with self._token_lock:
+      if self._token is None or time.time() >= self._token_expiry:
+        self._token = self._token_provider()
+        self._token_expiry = time.time() + _TOKEN_LIFETIME_SEC
+      return self._token
+
+  def _family(self, method, url):
+    """Returns the rate limiter API family of a request."""
+    if url.startswith(self.storage_endpoint):
+      return rate_limiter.STORAGE
+    if not url.startswith(self.compute_endpoint):
+      return rate_limiter.DATAPROC
+    if "/getSerialPortOutput" in url:
+      return rate_limiter.SERIAL_PORT
+    if method == "GET" or "/operations/" in url:
+      return rate_limiter.COMPUTE_READ
+    return rate_limiter.COMPUTE_MUTATE
+
+  def _call(self, method, url, body=None, params=None, data=None, raw=False):
+    """Calls an API with a JSON `body`, or with raw bytes in `data`.
+
+    Returns the parsed JSON response, or its bytes if `raw` is set. The call
+    is rate limited in its API family, and retried if it is throttled.
+    """
+    if params:
+      url += "?" + parse.urlencode(params)
+    family = self._family(method, url)
+    return rate_limiter.get_limiter().call(
+        family, lambda: self._send(method, url, body, data, raw),
+        idempotent=method in ("GET", "PUT", "DELETE") or
+        "/operations/" in url)
+
+  def _send(self, method, url, body, data, raw):
+    headers = {
+        "Authorization": "Bearer " + self._access_token(),
+        "Accept": "application/json",
+    }
+    if body is not None:
+      data = json.dumps(body).encode("utf-8")
+      headers["Content-Type"] = "application/json"
+    elif data is not None:
+      headers["Content-Type"] = "application/octet-stream"
+    _LOG.info("Calling: %s %s", method, url)
+    try:
+      status, response = self.pool.request(method, url, body=data,
+                                           headers=headers)
+    except RequestNotSentError:
+      raise
+    except (http.client.HTTPException, OSError):
+      self._local.sent = self._requests_sent() + 1
+      raise
+    self._local.sent = self._requests_sent() + 1
+    if status == 404:
+      raise cloud_backend.NotFoundError("{} {}: not found".format(method, url))
+    if status == 403 and any(r in response for r in _RATE_LIMIT_REASONS):
+      status = rate_limiter.THROTTLED_STATUS
+    if status >= 400:
+      raise cloud_backend.CloudApiError(
+          "{} {} failed with HTTP {}: {}".format(
+              method, url, status, response.decode("utf-8", "replace")),
+          status=status)
+    if raw:
+      return response
+    return json.loads(response.decode("utf-8")) if response else {}
+
+  def _insert(self, url, body, id_in_body=False):
+    """POSTs a new resource with a request ID. Returns the response.
+
+    If the outcome is unknown because the connection was lost, a later
+    identical call reuses the request ID, so that the API returns the
+    resource the first call created.
+    """
+    key = (url, json.dumps(body, sort_keys=True))
+    with self._request_ids_lock:
+      request_id = self._request_ids.setdefault(key, str(uuid.uuid4()))
+    try:
+      if id_in_body:
+        response = self._call("POST", url, body=dict(body,
+                                                      requestId=request_id))
+      else:
+        response = self._call("POST", url, body=body,
+                              params={"requestId": request_id})
+    except RequestNotSentError:
+      self._forget_request_id(key)
+      raise
+    except (http.client.HTTPException, OSError):
+      # The API may have acted on the request, keep its ID.
+      raise
+    except Exception:
+      self._forget_request_id(key)
+      raise
+    self._forget_request_id(key)
+    return response
+
+  def _forget_request_id(self, key):
+    with self._request_ids_lock:
+      self._request_ids.pop(key, None)
+
+  def _compute(self, path):
+    return "{}/{}".format(self.compute_endpoint, path)
+
+  def _dataproc(self, region, path):
+    return "{}/{}".format(self.dataproc_endpoint.format(region=region), path)
+
+  def _wait_for_compute_operation(self, project_id, operation):
+    if operation.get("zone"):
+      scope = "zones/{}".format(operation["zone"].rsplit("/", 1)[-1])
+    else:
+      scope = "global"
+    while operation.get("status") != "DONE":
+      # operations.wait blocks server-side until the operation is done.
+      operation = self._call("POST", self._compute(
+          "projects/{}/{}/operations/{}/wait".format(
+              project_id, scope, operation["name"])))
+    if "error" in operation:
+      raise cloud_backend.CloudApiError(
+          "Operation {} failed: {}".format(operation["name"],
+                                           operation["error"]))
+    return operation
+
+  def _wait_for_dataproc_operation(self, region, operation):
+    while not operation.get("done"):
+      time.sleep(_OPERATION_POLL_SEC)
+      operation = self._call("GET", self._dataproc(region, operation["name"]))
+    if "error" in operation:
+      raise cloud_backend.CloudApiError(
+          "Operation {} failed: {}".format(operation["name"],
+                                           operation["error"]))
+    return operation
+
+  def get_project_id(self):
+    project_id = _gcloud_config_project()
+    if project_id:
+      return project_id
+    if self.fallback is None:
+      raise cloud_backend.CloudApiError("No default project configured.")
+    return self.fallback.get_project_id()
+
+  @_with_fallback
+  def describe_image(self, project_id, image_name):
+    return self._call("GET", self._compute(
+        "projects/{}/global/images/{}".format(project_id, image_name)))
+
+  @_with_fallback
+  def describe_image_from_family(self, project_id, family):
+    return self._call("GET", self._compute(
+        "projects/{}/global/images/family/{}".format(project_id, family)))
+
+  @_with_fallback
+  def image_exists(self, project_id, image_name):
+    try:
+      self._call("GET", self._compute(
+          "projects/{}/global/images/{}".format(project_id, image_name)),
+                 params={"fields": "name"})
+      return True
+    except cloud_backend.NotFoundError:
+      return False
+
+  @_with_fallback
+  def list_dataproc_images(self, project_id, version_label, exact):
+    version_label = version_label.lower()
+    pattern = re.escape(version_label) if exact else version_label
+    params = {
+        "filter": '(status eq READY) (labels.goog-dataproc-version eq "{}")'
+                  .format(pattern),
+        "fields": "items(name,labels,creationTimestamp,status),nextPageToken",
+        "maxResults": 500,
+    }
+    images = []
+    while True:
+      page = self._call("GET", self._compute(
+          "projects/{}/global/images".format(project_id)), params=params)
+      images.extend(page.get("items", []))
+      if not page.get("nextPageToken"):
+        break
+      params["pageToken"] = page["nextPageToken"]
+    matcher = re.compile("^{}$".format(pattern))
+    images = [
+        image for image in images
+        if image.get("status") == "READY" and
+        not image["name"].endswith("-eap") and
+        matcher.match(image.get("labels", {}).get("goog-dataproc-version", ""))
+    ]
+    return sorted(images, key=lambda image: image["creationTimestamp"],
+                  reverse=True)
+
+  @_with_fallback
+  def list_images_by_label(self, project_id, key, value):
+    params = {
+        "filter": '(status eq READY) (labels.{} eq "{}")'.format(
+            key, re.escape(value)),
+        "fields": "items(name,family,labels,creationTimestamp,status),"
+                  "nextPageToken",
+        "maxResults": 500,
+    }
+    images = []
+    while True:
+      page = self._call("GET", self._compute(
+          "projects/{}/global/images".format(project_id)), params=params)
+      images.extend(page.get("items", []))
+      if not page.get("nextPageToken"):
+        break
+      params["pageToken"] = page["nextPageToken"]
+    return sorted(images, key=lambda image: image["creationTimestamp"],
+                  reverse=True)
+
+  @_with_fallback
+  def add_image_labels(self, project_id, image_name, labels):
+    image = self._call("GET", self._compute(
+        "projects/{}/global/images/{}".format(project_id, image_name)),
+                       params={"fields": "labels,labelFingerprint"})
+    new_labels = dict(image.get("labels", {}))
+    new_labels.update(labels)
+    operation = self._call("POST", self._compute(
+        "projects/{}/global/images/{}/setLabels".format(
+            project_id, image_name)), body={
+                "labels": new_labels,
+                "labelFingerprint": image["labelFingerprint"],
+            })
+    self._wait_for_compute_operation(project_id, operation)
+
+  @_with_fallback
+  def describe_machine_type(self, project_id, zone, machine_type):
+    return self._call("GET", self._compute(
+        "projects/{}/zones/{}/machineTypes/{}".format(project_id, zone,
+                                                      machine_type)))
+
+  @_with_fallback
+  def get_region_quotas(self, project_id, region):
+    return self._call("GET", self._compute(
+        "projects/{}/regions/{}".format(project_id, region)),
+                      params={"fields": "quotas"}).get("quotas", [])
+
+  @_with_fallback
+  def get_project_quotas(self, project_id):
+    return self._call("GET", self._compute("projects/{}".format(project_id)),
+                      params={"fields": "quotas"}).get("quotas", [])
+
+  @_with_fallback
+  def describe_instance(self, project_id, zone, instance_name):
+    return self._call("GET", self._compute(
+        "projects/{}/zones/{}/instances/{}".format(project_id, zone,
+                                                   instance_name)))
+
+  @_with_fallback
+  def get_serial_port_output(self, project_id, zone, instance_name, port,
+                             start):
+    return self._call("GET", self._compute(
+        "projects/{}/zones/{}/instances/{}/serialPort".format(
+            project_id, zone, instance_name)),
+                      params={"port": port, "start": start})
+
+  @_with_fallback
+  def get_guest_attributes(self, project_id, zone, instance_name, namespace):
+    response = self._call("GET", self._compute(
+        "projects/{}/zones/{}/instances/{}/getGuestAttributes".format(
+            project_id, zone, instance_name)),
+                          params={"queryPath": namespace + "/"})
+    return {item["key"]: item["value"]
+            for item in response.get("queryValue", {}).get("items", [])}
+
+  @_with_fallback
+  def create_disk(self, project_id, zone, disk):
+    operation = self._insert(self._compute(
+        "projects/{}/zones/{}/disks".format(project_id, zone)), disk)
+    self._wait_for_compute_operation(project_id, operation)
+
+  @_with_fallback
+  def delete_disk(self, project_id, zone, disk_name):
+    operation = self._call("DELETE", self._compute(
+        "projects/{}/zones/{}/disks/{}".format(project_id, zone, disk_name)))
+    self._wait_for_compute_operation(project_id, operation)
+
+  @_with_fallback
+  def describe_snapshot(self, project_id, snapshot_name):
+    return self._call("GET", self._compute(
+        "projects/{}/global/snapshots/{}".format(project_id, snapshot_name)))
+
+  @_with_fallback
+  def create_snapshot(self, project_id, zone, disk_name, snapshot):
+    operation = self._insert(self._compute(
+        "projects/{}/zones/{}/disks/{}/createSnapshot".format(
+            project_id, zone, disk_name)), snapshot)
+    self._wait_for_compute_operation(project_id, operation)
+
+  @_with_fallback
+  def create_instance(self, project_id, zone, instance):
+    operation = self._insert(self._compute(
+        "projects/{}/zones/{}/instances".format(project_id, zone)), instance)
+    self._wait_for_compute_operation(project_id, operation)
+
+  @_with_fallback
+  def stop_instance(self, project_id, zone, instance_name):
+    operation = self._call("POST", self._compute(
+        "projects/{}/zones/{}/instances/{}/stop".format(
+            project_id, zone, instance_name)))
+    self._wait_for_compute_operation(project_id, operation)
+
+  @_with_fallback
+  def start_instance(self, project_id, zone, instance_name):
+    operation = self._call("POST", self._compute(
+        "projects/{}/zones/{}/instances/{}/start".format(
+            project_id, zone, instance_name)))
+    self._wait_for_compute_operation(project_id, operation)
+
+  @_with_fallback
+  def delete_instance(self, project_id, zone, instance_name):
+    operation = self._call("DELETE", self._compute(
+        "projects/{}/zones/{}/instances/{}".format(
+            project_id, zone, instance_name)))
+    self._wait_for_compute_operation(project_id, operation)
+
+  @_with_fallback
+  def create_image(self, project_id, image):
+    operation = self._insert(self._compute(
+        "projects/{}/global/images".format(project_id)), image)
+    self._wait_for_compute_operation(project_id, operation)
+    # The insertTime of the operation is when it was queued, not when the
+    # image was created.
+    return self.describe_image(project_id, image["name"])
+
+  @_with_fallback
+  def upload_file(self, local_path, gcs_uri):
+    if (self.fallback is not None and
+        os.path.getsize(local_path) > _MAX_REST_UPLOAD_BYTES):
+      return self.fallback.upload_file(local_path, gcs_uri)
+    bucket, _, name = gcs_uri.replace("gs://", "", 1).partition("/")
+    with open(local_path, "rb") as f:
+      data = f.read()
+    self._call("POST", "{}/upload/storage/v1/b/{}/o".format(
+        self.storage_endpoint, bucket),
+               params={"uploadType": "media", "name": name}, data=data)
+
+  @_with_fallback
+  def object_exists(self, gcs_uri):
+    bucket, _, name = gcs_uri.replace("gs://", "", 1).partition("/")
+    try:
+      self._call("GET", "{}/storage/v1/b/{}/o/{}".format(
+          self.storage_endpoint, bucket, parse.quote(name, safe="")),
+                 params={"fields": "name"})
+      return True
+    except cloud_backend.NotFoundError:
+      return False
+
+  @_with_fallback
+  def download_file(self, gcs_uri, local_path):
+    bucket, _, name = gcs_uri.replace("gs://", "", 1).partition("/")
+    data = self._call("GET", "{}/storage/v1/b/{}/o/{}".format(
+        self.storage_endpoint, bucket, parse.quote(name, safe="")),
+                      params={"alt": "media"}, raw=True)
+    with open(local_path, "wb") as f:
+      f.write(data)
+
+  @_with_fallback
+  def create_workflow_template(self, project_id, region, template):
+    self._call("POST", self._dataproc(
+        region, "projects/{}/regions/{}/workflowTemplates".format(
+            project_id, region)), body=template)
+
+  @_with_fallback
+  def instantiate_workflow_template(self, project_id, region, template_id):
+    operation = self._insert(self._dataproc(
+        region, "projects/{}/regions/{}/workflowTemplates/{}:instantiate"
+        .format(project_id, region, template_id)), {}, id_in_body=True)
+    self._wait_for_dataproc_operation(region, operation)
+
+  @_with_fallback
+  def delete_workflow_template(self, project_id, region, template_id):
+    self._call("DELETE", self._dataproc(
+        region, "projects/{}/regions/{}/workflowTemplates/{}".format(
+            project_id, region, template_id)))
+
+  @_with_fallback
+  def create_cluster(self, project_id, region, cluster):
+    operation = self._insert(self._dataproc(
+        region, "projects/{}/regions/{}/clusters".format(project_id, region)),
+                             cluster)
+    self._wait_for_dataproc_operation(region, operation)
+
+  @_with_fallback
+  def submit_job(self, project_id, region, job):
+    jobs = "projects/{}/regions/{}/jobs".format(project_id, region)
+    submitted = self._insert(self._dataproc(region, jobs + ":submit"),
+                             {"job": job}, id_in_body=True)
+    job_id = submitted["reference"]["jobId"]
+    state = submitted.get("status", {}).get("state")
+    while state not in _JOB_FINAL_STATES:
+      time.sleep(_OPERATION_POLL_SEC)
+      submitted = self._call("GET", self._dataproc(
+          region, "{}/{}".format(jobs, job_id)))
+      state = submitted.get("status", {}).get("state")
+    if state != "DONE":
+      raise cloud_backend.CloudApiError("Job {} ended in state {}: {}".format(
+          job_id, state, submitted["status"].get("details", "")))
+
+  @_with_fallback
+  def delete_cluster(self, project_id, region, cluster_name):
+    self._call("DELETE", self._dataproc(
+        region, "projects/{}/regions/{}/clusters/{}".format(
+            project_id, region, cluster_name)))
@@ -0,0 +1,253 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Incremental follower of the build VM's serial port output.
+
+The follower polls the serial port from the `next` offset returned by the
+previous poll, backing off while the VM is quiet. Startup script lines are
+streamed to the startup script log as they arrive, and the follower returns
+as soon as the build success or failure marker appears, instead of waiting
+for the VM to shut down.
+
+With --guest-attributes, the follower also checks the `custom-image/status`
+guest attribute that run.sh publishes once the result is known and its
+output flushed. Guest attributes are read once per serial port poll, backing
+off with it, so that following a long build does not add API calls.
+
+It is run by the generated workflow script:
+
+    python -m custom_image_utils.serial_port_follower \\
+        --project-id=<project> --zone=<zone> --instance=<instance> \\
+        --log-file=<log_dir>/startup-script.log [--guest-attributes]
+
+Exit code is 0 if the build succeeded, 1 if it failed, 2 if the result
+could not be determined and 3 if the build VM is a spot VM which was
+preempted before the result was known.
+"""
+
+import argparse
+import logging
+import random
+import re
+import sys
+import time
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import rate_limiter
+from custom_image_utils import spot_vm
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+UNKNOWN = "unknown"
+PREEMPTED = "preempted"
+
+_SUCCESS_MARKER = "BuildSucceeded:"
+_FAILURE_MARKER = "BuildFailed:"
+_STOPPED_STATUSES = ("STOPPING", "STOPPED", "SUSPENDED", "TERMINATED")
+# Published by run.sh.
+GUEST_ATTRIBUTES_NAMESPACE = "custom-image"
+_PUBLISHED_RESULTS = {"succeeded": SUCCEEDED, "failed": FAILED}
+# Serial port polls to read the last lines once the result is published.
+_DRAIN_POLLS = 5
+_EXIT_CODES = {SUCCEEDED: 0, FAILED: 1, UNKNOWN: 2, PREEMPTED: 3}
+PREEMPTED_EXIT_CODE = _EXIT_CODES[PREEMPTED]
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class SerialPortFollower:
+  """Follows serial port output of an instance into a log file."""
+
+  def __init__(self, backend, project_id, zone, instance_name, log_file,
+               port=1, min_interval=2.0, max_interval=30.0,
+               sleep=time.sleep, clock=time.time, guest_attributes=False):
+    self.backend = backend
+    self.project_id = project_id
+    self.zone = zone
+    self.instance_name = instance_name
+    self.log_file = log_file
+    self.port = port
+    self.min_interval = min_interval
+    self.max_interval = max_interval
+    self.polls = 0
+    self.guest_attributes = guest_attributes
+    self._sleep = sleep
+    self._clock = clock
+    self._offset = 0
+    self._partial_line = ""
+    self._stopped_instance = None
+    self._prefix = re.compile(
+        r" {}.*startup-script:".format(re.escape(instance_name)))
+
+  def _filter(self, line):
+    """Keeps startup script lines, as the former grep/sed chain did."""
+    if "startup-script" not in line or line.startswith("["):
+      return None
+    return self._prefix.sub("", line)
+
+  def _poll(self, output):
+    """Reads new output. Returns (whether output arrived, result or None)."""
+    self.polls += 1
+    response = self.backend.get_serial_port_output(
+        self.project_id, self.zone, self.instance_name, self.port,
+        self._offset)
+    start = int(response.get("start", self._offset))
+    if start > self._offset:
+      _LOG.warning("Serial port output between bytes %d and %d was lost.",
+                   self._offset, start)
+    contents = response.get("contents", "")
+    self._offset = int(response.get("next", start + len(contents)))
+    if not contents:
+      return False, None
+
+    lines = (self._partial_line + contents).split("\n")
+    self._partial_line = lines.pop()
+    result = None
+    for line in lines:
+      line = self._filter(line.rstrip("\r"))
+      if line is None:
+        continue
+      output.write(line + "\n")
+      if result is None and _SUCCESS_MARKER in line:
+        result = SUCCEEDED
+      elif result is None and _FAILURE_MARKER in line:
+        result = FAILED
+    return True, result
+
+  def _instance_stopped(self):
+    try:
+      instance = self.backend.describe_instance(self.project_id, self.zone,
+                                                self.instance_name)
+    except cloud_backend.NotFoundError:
+      return True
+    except cloud_backend.CloudApiError as e:
+      _LOG.warning("Failed to get status of %s: %s", self.instance_name, e)
+      return False
+    if instance.get("status") not in _STOPPED_STATUSES:
+      return False
+    self._stopped_instance = instance
+    return True
+
+  def _published_result(self):
+    """Returns the result published as a guest attribute, or None."""
+    try:
+      attributes = self.backend.get_guest_attributes(
+          self.project_id, self.zone, self.instance_name,
+          GUEST_ATTRIBUTES_NAMESPACE)
+    except cloud_backend.CloudApiError:
+      return None
+    if "log-flushed" not in attributes:
+      return None
+    return _PUBLISHED_RESULTS.get(attributes.get("status"))
+
+  def _wait(self, seconds):
+    """Sleeps until the next poll. Returns the published result, if any."""
+    self._sleep(seconds)
+    if not self.guest_attributes:
+      return None
+    return self._published_result()
+
+  def _drain(self, output, published):
+    """Reads the output up to the result marker, trusting `published`."""
+    for _ in range(_DRAIN_POLLS):
+      try:
+        _, result = self._poll(output)
+      except cloud_backend.CloudApiError:
+        break
+      if result is not None:
+        break
+      self._sleep(self.min_interval)
+    return published
+
+  def follow(self, timeout=None):
+    """Follows the output until a result marker or the instance stops."""
+    deadline = None if timeout is None else self._clock() + timeout
+    interval = self.min_interval
+    with open(self.log_file, "a", buffering=64 * 1024) as output:
+      while True:
+        api_error = False
+        try:
+          got_output, result = self._poll(output)
+        except cloud_backend.NotFoundError:
+          _LOG.warning("Instance %s no longer exists.", self.instance_name)
+          return UNKNOWN
+        except cloud_backend.CloudApiError as e:
+          _LOG.warning("Failed to read serial port output: %s", e)
+          api_error, got_output, result = True, False, None
+        if result is not None:
+          return result
+        output.flush()
+        if got_output:
+          interval = self.min_interval
+        else:
+          if self._instance_stopped():
+            if api_error:
+              return UNKNOWN
+            # Read whatever was written before the shutdown.
+            try:
+              _, result = self._poll(output)
+            except cloud_backend.CloudApiError:
+              result = None
+            if result is None and spot_vm.is_spot_instance(
+                self._stopped_instance):
+              # run.sh only shuts the VM down once the result is printed.
+              return PREEMPTED
+            return result or UNKNOWN
+          interval = min(interval * 2, self.max_interval)
+        if deadline is not None and self._clock() >= deadline:
+          _LOG.warning("Timed out following serial port output.")
+          return UNKNOWN
+        # Jitter spreads polls of concurrent builds over the quota window.
+        published = self._wait(interval * random.uniform(0.8, 1.2))
+        if published is not None:
+          return self._drain(output, published)
+
+
+def _parse_args(args):
+  parser = argparse.ArgumentParser(
+      description="Follows the serial port output of the build VM.")
+  parser.add_argument("--project-id", required=True)
+  parser.add_argument("--zone", required=True)
+  parser.add_argument("--instance", required=True)
+  parser.add_argument("--log-file", required=True)
+  parser.add_argument("--port", type=int, default=1)
+  parser.add_argument("--timeout-sec", type=int, default=None)
+  parser.add_argument("--api-backend", choices=cloud_backend.BACKENDS,
+                      default=cloud_backend.GCLOUD)
+  parser.add_argument("--universe-domain", default="googleapis.com")
+  parser.add_argument("--guest-attributes", action="store_true",
+                      help="Also check the result published by run.sh as "
+                      "guest attributes.")
+  parser.add_argument("--shared-rate-limits", action="store_true")
+  parser.add_argument("--api-rate-limits", default=None)
+  return parser.parse_args(args)
+
+
+def main(args):
+  args = _parse_args(args)
+  rate_limiter.configure(args)
+  follower = SerialPortFollower(cloud_backend.get_backend(args),
+                                args.project_id, args.zone, args.instance,
+                                args.log_file, port=args.port,
+                                guest_attributes=args.guest_attributes)
+  result = follower.follow(timeout=args.timeout_sec)
+  print("Customization result from serial port: {} ({} polls)".format(
+      result, follower.polls))
+  return _EXIT_CODES[result]
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -17,17 +17,34 @@ Shell script based custom image creator.
 """
 
 import logging
+import os
+import time
 
 from custom_image_utils import shell_script_executor
 from custom_image_utils import shell_script_generator
+from custom_image_utils import spot_vm
+from custom_image_utils import tracing
+from custom_image_utils import zone_placement
 
 logging.basicConfig()
 _LOG = logging.getLogger(__name__)
 _LOG.setLevel(logging.WARN)
 
 
-def create(args):
-  """Creates a custom image with generated Shell script."""
+def _read_run_file(run_id, name):
+  """Returns the value the script wrote to a file of the run, or None."""
+  try:
+    with open("/tmp/{}/{}".format(run_id, name)) as f:
+      return f.read().strip() or None
+  except (IOError, OSError):
+    return None
+
+
+def create(args, output=None, tracer=None):
+  """Creates a custom image with generated Shell script.
+
+  The phases recorded by the script are added to `tracer` if set.
+  """
 
   # Generate Shell script.
   _LOG.info("Generating Shell script...")
@@ -40,7 +57,25 @@ def create(args):
   # Run the script to build custom image.
   if not args.dry_run:
     _LOG.info("Creating custom image...")
-    shell_script_executor.run(script)
+    try:
+      shell_script_executor.run(script, output=output)
+      # Written by `images create`, saves a describe call to the notifier.
+      args.image_creation_timestamp = _read_run_file(
+          args.run_id, "image_creation_timestamp")
+    finally:
+      if getattr(args, "zones", None):
+        zone_placement.record_log(
+            os.path.join(args.log_dir, "workflow.log"),
+            zone_placement.capacity_key(args))
+      if spot_vm.is_spot(args):
+        args.preemptions = spot_vm.read_log(
+            os.path.join(args.log_dir, "workflow.log"))
+      # The zone the build VM was placed in, used by the smoke test.
+      args.zone = _read_run_file(args.run_id, "build_zone") or args.zone
+      if tracer:
+        tracing.read_bash_spans(
+            os.path.join(args.log_dir, tracing.BASH_SPANS_FILE), tracer,
+            end_time=time.time())
     _LOG.info("Successfully created custom image...")
   else:
     _LOG.info("Skip creating custom image (dry run).")
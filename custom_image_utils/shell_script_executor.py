@@ -22,8 +22,12 @@ import sys
 import tempfile
 
 
-def run(shell_script):
-  """Runs a Shell script."""
+def run(shell_script, output=None):
+  """Runs a Shell script.
+
+  The script's stdout and stderr go to `output` if set, otherwise to the
+  console.
+  """
 
   # Write the script to a temp file.
   temp_file = tempfile.NamedTemporaryFile(delete=False)
@@ -32,11 +36,14 @@ def run(shell_script):
     temp_file.flush()
     temp_file.close()  # close this file but do not delete
 
+    if output:
+      output.flush()
+
     # Run the shell script from the temp file, then wait for it to complete.
     pipe = subprocess.Popen(
         ['bash', temp_file.name],
-        stdout=sys.stdout,
-        stderr=sys.stderr
+        stdout=output or sys.stdout,
+        stderr=output or sys.stderr
     )
     #for line in iter(pipe.stdout.readline, b''):
     #  if not line:
@@ -15,12 +15,24 @@
 Shell script based image creation workflow generator.
 """
 
+import argparse
 from datetime import datetime
 import os
 import re
+import shlex
 import sys
 
+from custom_image_utils import customization_profiler
+from custom_image_utils import image_labeller
+from custom_image_utils import rate_limiter
+from custom_image_utils import serial_port_follower
+from custom_image_utils import source_uploader
+from custom_image_utils import spot_vm
+from custom_image_utils import tracing
+from custom_image_utils import vm_telemetry
+from custom_image_utils import zone_placement
 
+_REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
 _template = """#!/usr/bin/env bash
 
@@ -37,10 +49,30 @@ base_obj_type="images"
 function execute_with_retries() (
   set +x
   local -r cmd="$*"
+  local -r error_file="$(mktemp)"
+  trap 'rm -f "${{error_file}}"' EXIT
 
   for ((i = 0; i < 3; i++)); do
-    if eval "$cmd"; then return 0 ; fi
-    sleep 12
+    {rate_limit_acquire}
+    if eval "$cmd" 2> "${{error_file}}"; then
+      cat "${{error_file}}" >&2
+      return 0
+    fi
+    cat "${{error_file}}" >&2
+    # Errors which would fail again, such as a missing resource, are not
+    # retried, nor a zone out of resources, which returns its own status.
+    local retryable=0
+    {python_cmd} -m custom_image_utils.rate_limiter retryable \
+        < "${{error_file}}" || retryable=$?
+    if (( retryable != 0 )); then
+      return "${{retryable}}"
+    fi
+    if (( i < 2 )); then
+      # Exponential backoff with jitter, so that throttled concurrent builds
+      # do not retry in lockstep.
+      local delay=$(( 8 << i ))
+      sleep $(( delay / 2 + RANDOM % (delay / 2 + 1) ))
+    fi
   done
   return 1
 )
@@ -57,20 +89,42 @@ function prepare() {{
   fi
 }}
 
+# Records the boundaries of a workflow phase, read back into the build
+# trace by tracing.read_bash_spans once the script exits.
+function span() {{
+  local -r event="$1" name="$2"
+  if [[ "${{event}}" == "begin" ]]; then
+    date
+  fi
+  printf '%s\\t%s\\t%s\\n' "${{event}}" "${{name}}" "$(date +%s.%N)" \
+    >> {log_dir}/{spans_file}
+}}
+
 function exit_handler() {{
+  span begin cleanup
   echo 'Cleaning up before exiting.'
 
+  local -r build_zone="$(cat /tmp/{run_id}/build_zone 2>/dev/null || echo {zone})"
   if [[ -f /tmp/{run_id}/vm_created ]]; then
     echo 'Deleting VM instance.'
     execute_with_retries \
-      gcloud compute instances delete {image_name}-install --project={project_id} --zone={zone} -q
+      gcloud compute instances delete {image_name}-install --project={project_id} --zone=${{build_zone}} -q
   elif [[ -f /tmp/{run_id}/disk_created ]]; then
     echo 'Deleting disk.'
-    execute_with_retries gcloud compute ${{base_obj_type}} delete {image_name}-install --project={project_id} -q
+    # Disks are zonal, images are global.
+    local zone_flag=""
+    if [[ "${{base_obj_type}}" == "disks" ]]; then
+      zone_flag="--zone=${{build_zone}}"
+    fi
+    execute_with_retries \
+      gcloud compute ${{base_obj_type}} delete {image_name}-install --project={project_id} ${{zone_flag}} -q
   fi
+  span end cleanup
 
-  echo 'Uploading local logs to GCS bucket.'
-  ${{rsync_cmd}} -r {log_dir}/ {gcs_log_dir}/
+  if [[ ! -f /tmp/{run_id}/image_created || "{defer_log_upload_flag}" != "true" ]]; then
+    echo 'Uploading local logs to GCS bucket.'
+    ${{rsync_cmd}} -r {log_dir}/ {gcs_log_dir}/
+  fi
 
   if [[ -f /tmp/{run_id}/image_created ]]; then
     echo -e "${{GREEN}}Workflow succeeded${{NC}}, check logs at {log_dir}/ or {gcs_log_dir}/"
@@ -118,12 +172,23 @@ function print_img_dbs_modulus_md5sums() {{
 }}
 
 function main() {{
+  span begin upload-sources
   echo 'Uploading files to GCS bucket.'
   declare -a sources_k=({sources_map_k})
   declare -a sources_v=({sources_map_v})
+  local -a source_args=()
   for i in "${{!sources_k[@]}}"; do
-    ${{gsutil_cmd}} cp "${{sources_v[i]}}" "{custom_sources_path}/${{sources_k[i]}}" > /dev/null 2>&1
+    source_args+=("--source=${{sources_k[i]}}=${{sources_v[i]}}")
   done
+  # Uploads only the files missing from the content-addressed prefix of the
+  # bucket, concurrently, and writes the manifest read by run.sh.
+  {python_cmd} -m custom_image_utils.source_uploader \
+      --gcs-bucket={gcs_bucket} \
+      --manifest-uri={custom_sources_manifest} \
+      --api-backend={api_backend} \
+      --universe-domain={universe_domain} \
+      "${{source_args[@]}}" {rate_limit_flags}
+  span end upload-sources
 
   local cert_args=""
   local num_src_certs="0"
@@ -181,7 +246,7 @@ function main() {{
     fi
   fi
 
-  date
+  span begin create-disk
 
   if [[ -z "${{cert_args}}" && "${{num_src_certs}}" -ne "0" ]]; then
     echo 'Re-using base image'
@@ -201,58 +266,120 @@ function main() {{
       --family={family}
     touch "/tmp/{run_id}/disk_created"
   else
-    echo 'Creating disk.'
+    # The disk is created in the zone the VM is placed in.
     base_obj_type="disks"
     instance_disk_args='--disk=auto-delete=yes,boot=yes,mode=rw,name={image_name}-install'
-    execute_with_retries gcloud compute disks create {image_name}-install \
-      --project={project_id} \
-      --zone={zone} \
-      --image={dataproc_base_image} \
-      --type=pd-ssd \
-      --size={disk_size}GB
-    touch "/tmp/{run_id}/disk_created"
   fi
 
-  date
-  echo 'Creating VM instance to run customization script.'
-  execute_with_retries gcloud compute instances create {image_name}-install \
-      --project={project_id} \
-      --zone={zone} \
-      {network_flag} \
-      {subnetwork_flag} \
-      {no_external_ip_flag} \
-      --machine-type={machine_type} \
-      ${{instance_disk_args}} \
-      {accelerator_flag} \
-      {service_account_flag} \
-      --scopes=cloud-platform \
-      {shielded_secure_boot_flag} \
-      {metadata_flag} \
-      --metadata-from-file startup-script=startup_script/run.sh
+  span end create-disk
+
+  # Tries the candidate zones in ranked order, moving to the next one as
+  # soon as a zone does not have the resources for the VM. Each attempt is
+  # a span of its own, named after its zone.
+  span begin place-instance
+  local placed="false" status zone_start
+  for build_zone in {candidate_zones}; do
+    echo "${{build_zone}}" > /tmp/{run_id}/build_zone
+    zone_start="${{SECONDS}}"
+    if [[ "${{base_obj_type}}" == "disks" ]]; then
+      span begin "create-disk:${{build_zone}}"
+      echo "Creating disk in ${{build_zone}}."
+      execute_with_retries gcloud compute disks create {image_name}-install \
+        --project={project_id} \
+        --zone=${{build_zone}} \
+        --image={dataproc_base_image} \
+        --type=pd-ssd \
+        --size={disk_size}GB
+      touch "/tmp/{run_id}/disk_created"
+      span end "create-disk:${{build_zone}}"
+    fi
+    span begin "create-instance:${{build_zone}}"
+    echo "Creating VM instance in ${{build_zone}} to run customization script."
+    status=0
+    execute_with_retries gcloud compute instances create {image_name}-install \
+        --project={project_id} \
+        --zone=${{build_zone}} \
+        {network_flag} \
+        {subnetwork_flag} \
+        {no_external_ip_flag} \
+        --machine-type={machine_type} \
+        ${{instance_disk_args}} \
+        {accelerator_flag} \
+        {provisioning_model_flag} \
+        {service_account_flag} \
+        --scopes=cloud-platform \
+        {shielded_secure_boot_flag} \
+        {metadata_flag} \
+        --metadata-from-file startup-script=startup_script/run.sh \
+      || status=$?
+    span end "create-instance:${{build_zone}}"
+    if (( status == 0 )); then
+      echo "zone-placement: ${{build_zone}} created $(( SECONDS - zone_start ))"
+      placed="true"
+      break
+    fi
+    if (( status != {capacity_exit_code} )); then
+      exit 1
+    fi
+    echo "zone-placement: ${{build_zone}} exhausted $(( SECONDS - zone_start ))"
+    echo "Zone ${{build_zone}} does not have the resources for the VM, trying the next zone."
+    if [[ "${{base_obj_type}}" == "disks" ]]; then
+      execute_with_retries gcloud compute disks delete {image_name}-install \
+        --project={project_id} --zone=${{build_zone}} -q
+      rm -f "/tmp/{run_id}/disk_created"
+    fi
+  done
+  if [[ "${{placed}}" != "true" ]]; then
+    echo -e "${{RED}}None of the zones {candidate_zones} has the resources for the VM.${{NC}}"
+    exit 1
+  fi
 
   touch /tmp/{run_id}/vm_created
+  span end place-instance
 
   # clean up intermediate install image
   if [[ "${{base_obj_type}}" == "images" ]] ; then
+    span begin delete-install-image
     gcloud compute images delete -q {image_name}-install --project={project_id}
+    span end delete-install-image
   fi
 
+  span begin wait-for-customization
   echo "Monitor startup logs in {log_dir}/startup-script.log"
-  echo 'Waiting for customization script to finish and VM shutdown.'
+  echo 'Waiting for customization script to finish.'
   set -x
-  # too many serial port output requests per minute occur if they all occur at once
-  sleep $(( ( RANDOM % 60 ) + 20 ))
-
-  execute_with_retries gcloud compute instances tail-serial-port-output {image_name}-install \
+  local preemptions=0 follower_status boot_start
+  while true; do
+    boot_start="${{SECONDS}}"
+    # Streams startup script output and returns as soon as the build result
+    # marker appears, polling with backoff to stay within serial port quota.
+    follower_status=0
+    {python_cmd} -m custom_image_utils.serial_port_follower \
+        --project-id={project_id} \
+        --zone=${{build_zone}} \
+        --instance={image_name}-install \
+        --api-backend={api_backend} \
+        --universe-domain={universe_domain} \
+        --log-file={log_dir}/startup-script.log \
+        --guest-attributes {rate_limit_flags} \
+        || follower_status=$?
+    if (( follower_status != {preempted_exit_code} )); then
+      break
+    fi
+    if (( preemptions >= {max_preemptions} )); then
+      echo "Spot VM was preempted $(( preemptions + 1 )) times."
+      exit 1
+    fi
+    # run.sh resumes the build from the progress recorded on the disk.
+    echo 'Spot VM was preempted, starting it again.'
+    execute_with_retries gcloud compute instances start {image_name}-install \
       --project={project_id} \
-      --zone={zone} \
-      --port=1 2>&1 \
-      | grep 'startup-script' | grep -v '^\\[' \
-      | sed -e 's/ {image_name}-install.*startup-script://g' \
-      | dd bs=1 status=none of={log_dir}/startup-script.log \
-      || true
+      --zone=${{build_zone}}
+    preemptions=$(( preemptions + 1 ))
+    echo "spot-preemption: ${{preemptions}} lost $(( SECONDS - boot_start ))"
+  done
+  span end wait-for-customization
   echo 'Checking customization script result.'
-  date
   if grep -q 'BuildSucceeded:' {log_dir}/startup-script.log; then
     echo -e "${{GREEN}}Customization script succeeded.${{NC}}"
   elif grep -q 'BuildFailed:' {log_dir}/startup-script.log; then
@@ -264,14 +391,24 @@ function main() {{
     exit 1
   fi
 
-  date
+  span begin stop-instance
+  echo 'Stopping VM instance.'
+  execute_with_retries gcloud compute instances stop {image_name}-install \
+    --project={project_id} \
+    --zone=${{build_zone}}
+  span end stop-instance
+
+  span begin create-image
   echo 'Creating custom image.'
   execute_with_retries gcloud compute images create {image_name} \
     --project={project_id} \
-    --source-disk-zone={zone} \
+    --source-disk-zone=${{build_zone}} \
     --source-disk={image_name}-install \
     {storage_location_flag} \
-    --family={family}
+    {image_labels_flag} \
+    --family={family} \
+    "--format='value(creationTimestamp)'" > /tmp/{run_id}/image_creation_timestamp
+  span end create-image
 
   touch /tmp/{run_id}/image_created
 }}
@@ -292,6 +429,8 @@ class Generator:
           timestamp=datetime.now().strftime("%Y%m%d-%H%M%S"), **self.args)
     self.args["bucket_name"] = self.args["gcs_bucket"].replace("gs://", "")
     self.args["custom_sources_path"] = "gs://{bucket_name}/{run_id}/sources".format(**self.args)
+    self.args["custom_sources_manifest"] = "{}/{}".format(
+        self.args["custom_sources_path"], source_uploader.MANIFEST_FILE)
 
     all_sources = {
         "run.sh": "startup_script/run.sh",
@@ -306,7 +445,21 @@ class Generator:
     self.args["sources_map_v"] = " ".join([
         "[{}]='{}'".format(i, kv[1].replace("'", "'\\''")) for i, kv in sources_map_items])
 
+    self.args["python_cmd"] = "PYTHONPATH={} {}".format(
+        shlex.quote(_REPO_DIR), shlex.quote(sys.executable or "python3"))
+    self.args.setdefault("api_backend", "gcloud")
+    self._set_rate_limit_args()
+    self.args["candidate_zones"] = " ".join(
+        zone_placement.candidate_zones(argparse.Namespace(**self.args)))
+    self.args["capacity_exit_code"] = rate_limiter.CAPACITY_EXIT_CODE
+    self.args["provisioning_model_flag"] = spot_vm.gcloud_flags(
+        argparse.Namespace(**self.args))
+    self.args["preempted_exit_code"] = (
+        serial_port_follower.PREEMPTED_EXIT_CODE)
+    self.args["max_preemptions"] = spot_vm.MAX_PREEMPTIONS
+    self.args.setdefault("universe_domain", "googleapis.com")
     self.args["log_dir"] = "/tmp/{run_id}/logs".format(**self.args)
+    self.args["spans_file"] = tracing.BASH_SPANS_FILE
     self.args["gcs_log_dir"] = "gs://{bucket_name}/{run_id}/logs".format(
       **self.args)
     if self.args["subnetwork"]:
@@ -327,10 +480,21 @@ class Generator:
     self.args[
       "storage_location_flag"] = "--storage-location={storage_location}".format(
         **self.args) if self.args["storage_location"] else ""
+    labels = image_labeller.image_labels(self.args.get("dataproc_version"),
+                                         self.args.get("build_fingerprint"))
+    self.args["image_labels_flag"] = "--labels={}".format(",".join(
+        "{}={}".format(k, v) for k, v in sorted(labels.items()))
+    ) if labels else ""
+    # After a successful build, image_builder uploads the logs while the
+    # image is finalized.
+    self.args["defer_log_upload_flag"] = "true" if self.args.get(
+        "defer_log_upload") else "false"
     metadata_flag_template = (
         "--metadata=shutdown-timer-in-sec={shutdown_timer_in_sec},"
         "custom-sources-path={custom_sources_path},"
-        "universe-domain={universe_domain}"
+        "custom-sources-manifest={custom_sources_manifest},"
+        "universe-domain={universe_domain},"
+        "enable-guest-attributes=TRUE"
     )
     if self.args["zone"]:
       region = "-".join(self.args["zone"].split("-")[:-1])
@@ -340,6 +504,10 @@ class Generator:
       # convert to component names used inside image and join to set as metadata value
       optional_image_components = '.'.join(self._get_optional_to_image_components(optional_components))
       metadata_flag_template += ',optional-components="{}"'.format(optional_image_components)
+    if self.args.get("slim_image"):
+      # Steps are joined with dots, commas separate metadata entries.
+      metadata_flag_template += ',image-slimming-steps="{}"'.format(
+          self.args["slim_image"].replace(",", "."))
 
     if self.args["dataproc_version"]:
       dataproc_version = self.args["dataproc_version"]
@@ -393,10 +561,32 @@ class Generator:
         print(f"ERROR: {resolved_path} not found")
         # Handle error
     self.args["shielded_secure_boot_flag"] = ""
+    metadata_flag_template += ",vm-telemetry-uri={}".format(
+        vm_telemetry.telemetry_uri(self.args["gcs_log_dir"]))
+    if self.args.get("profile_customization"):
+      metadata_flag_template += ",customization-profile-uri={}".format(
+          customization_profiler.trace_uri(self.args["gcs_log_dir"]))
     if self.args["metadata"]:
       metadata_flag_template += ",{metadata}"
     self.args["metadata_flag"] = metadata_flag_template.format(**self.args)
 
+  def _set_rate_limit_args(self):
+    """Shares the rate limits of the API calls with --shared-rate-limits."""
+    rate_limits = self.args.get("api_rate_limits")
+    rate_limits_flag = ("--api-rate-limits={}".format(shlex.quote(rate_limits))
+                        if rate_limits else "")
+    if not self.args.get("shared_rate_limits"):
+      self.args["rate_limit_acquire"] = ":"
+      self.args["rate_limit_flags"] = ""
+      return
+    self.args["rate_limit_acquire"] = (
+        '{} -m custom_image_utils.rate_limiter --state-dir={} {} acquire -- '
+        '"$cmd" || true'.format(self.args["python_cmd"],
+                                shlex.quote(rate_limiter.default_state_dir()),
+                                rate_limits_flag))
+    self.args["rate_limit_flags"] = " ".join(
+        filter(None, ["--shared-rate-limits", rate_limits_flag]))
+
   def _get_optional_to_image_components(self, optional_components):
     """Get the equivalent component names in the image for user provided optional components."""
     # Add new component here, if component name inside image scripts is different.
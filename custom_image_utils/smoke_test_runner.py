@@ -12,103 +12,145 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Run smoke test for Dataproc custom images.
+
+In the `workflow` mode, a workflow template runs SparkPi on a managed
+cluster. In the `cluster` mode, one single-node cluster is created on the
+image and a suite of checks runs on it concurrently, as Dataproc jobs, with
+a timing report per check. The cluster is deleted without waiting, and
+deletes itself after an hour of idleness if that fails.
 """
 
+from concurrent import futures
 import datetime
 import logging
-import subprocess
+import os
+import time
 import uuid
 
+from custom_image_utils import cloud_backend
+
+WORKFLOW = "workflow"
+CLUSTER = "cluster"
+MODES = (WORKFLOW, CLUSTER)
+
+SPARK_PI = "spark-pi"
+PYSPARK = "pyspark"
+COMPONENTS = "components"
+GPU = "gpu"
+CHECKS = (SPARK_PI, PYSPARK, COMPONENTS, GPU)
+
+# Scripts of the PySpark based checks, uploaded to --gcs-bucket.
+_CHECK_SCRIPTS = {
+    PYSPARK: "smoke_test/pyspark_check.py",
+    COMPONENTS: "smoke_test/component_health.py",
+    GPU: "smoke_test/gpu_visibility.py",
+}
+_SPARK_PI_JOB = {
+    "mainClass": "org.apache.spark.examples.SparkPi",
+    "jarFileUris": ["file:///usr/lib/spark/examples/jars/spark-examples.jar"],
+    "args": ["1000"],
+}
+# Deletes the test cluster if deleting it at the end of the suite failed.
+_IDLE_DELETE_TTL = "3600s"
+
 logging.basicConfig()
 _LOG = logging.getLogger(__name__)
 _LOG.setLevel(logging.WARN)
 
-def _create_workflow_template(workflow_name, image_name, project_id, zone, region,
-                              network, subnet, no_external_ip):
-  """Create a Dataproc workflow template for testing."""
-  create_command = [
-      "gcloud", "dataproc", "workflow-templates", "create",
-      workflow_name, "--project", project_id, "--region", region
-  ]
-  set_cluster_command = [
-      "gcloud", "dataproc", "workflow-templates",
-      "set-managed-cluster", workflow_name, "--project", project_id, "--image",
-      image_name, "--zone", zone, "--region", region
-  ]
+
+class CheckTiming:
+  """Outcome and wall time of one check of the suite."""
+
+  def __init__(self, name, start, end, error=None):
+    self.name = name
+    self.start = start
+    self.end = end
+    self.error = error
+
+  @property
+  def duration(self):
+    return self.end - self.start
+
+
+def _gce_cluster_config(zone, network, subnet, no_external_ip):
+  gce_cluster_config = {"zoneUri": zone}
   if network and not subnet:
-    set_cluster_command.extend(["--network", network])
+    gce_cluster_config["networkUri"] = network
   else:
-    set_cluster_command.extend(["--subnet", subnet])
+    gce_cluster_config["subnetworkUri"] = subnet
   if no_external_ip:
-    set_cluster_command.extend(["--no-address"])
-  add_job_command = [
-      "gcloud", "dataproc", "workflow-templates", "add-job", "spark",
-      "--workflow-template", workflow_name, "--project", project_id, "--region", region,
-      "--step-id", "001", "--class", "org.apache.spark.examples.SparkPi",
-      "--jars", "file:///usr/lib/spark/examples/jars/spark-examples.jar", "--",
-      "1000"
-  ]
-  pipe = subprocess.Popen(create_command)
-  pipe.wait()
-  if pipe.returncode != 0:
-    raise RuntimeError("Error creating Dataproc workflow template '%s'.",
-                       workflow_name)
+    gce_cluster_config["internalIpOnly"] = True
+  return gce_cluster_config
+
 
-  pipe = subprocess.Popen(set_cluster_command)
-  pipe.wait()
-  if pipe.returncode != 0:
-    raise RuntimeError(
-        "Error setting cluster for Dataproc workflow template '%s'.",
-        workflow_name)
-
-  pipe = subprocess.Popen(add_job_command)
-  pipe.wait()
-  if pipe.returncode != 0:
-    raise RuntimeError("Error adding job to Dataproc workflow template '%s'.",
+def _create_workflow_template(workflow_name, image_name, project_id, zone, region,
+                              network, subnet, no_external_ip, backend):
+  """Create a Dataproc workflow template for testing."""
+  image_uri = "projects/{}/global/images/{}".format(project_id, image_name)
+  gce_cluster_config = _gce_cluster_config(zone, network, subnet,
+                                           no_external_ip)
+  template = {
+      "id": workflow_name,
+      "placement": {
+          "managedCluster": {
+              "clusterName": workflow_name,
+              "config": {
+                  "gceClusterConfig": gce_cluster_config,
+                  "masterConfig": {"imageUri": image_uri},
+                  "workerConfig": {"imageUri": image_uri},
+              },
+          },
+      },
+      "jobs": [{
+          "stepId": "001",
+          "sparkJob": _SPARK_PI_JOB,
+      }],
+  }
+  try:
+    backend.create_workflow_template(project_id, region, template)
+  except cloud_backend.CloudApiError:
+    raise RuntimeError("Error creating Dataproc workflow template '%s'." %
                        workflow_name)
 
 
-def _instantiate_workflow_template(workflow_name, project_id, region):
+def _instantiate_workflow_template(workflow_name, project_id, region, backend):
   """Run a Dataproc workflow template to test the newly built custom image."""
-  command = [
-      "gcloud", "dataproc", "workflow-templates", "instantiate",
-      workflow_name, "--project", project_id, "--region", region
-  ]
-  pipe = subprocess.Popen(command)
-  pipe.wait()
-  if pipe.returncode != 0:
+  try:
+    backend.instantiate_workflow_template(project_id, region, workflow_name)
+  except cloud_backend.CloudApiError:
     raise RuntimeError("Unable to instantiate workflow template.")
 
 
-def _delete_workflow_template(workflow_name, project_id, region):
+def _delete_workflow_template(workflow_name, project_id, region, backend):
   """Delete a Dataproc workflow template."""
-  command = [
-      "gcloud", "dataproc", "workflow-templates", "delete",
-      workflow_name, "-q", "--project", project_id, "--region", region
-  ]
-  pipe = subprocess.Popen(command)
-  pipe.wait()
-  if pipe.returncode != 0:
-    raise RuntimeError("Error deleting workfloe template %s.", workflow_name)
+  try:
+    backend.delete_workflow_template(project_id, region, workflow_name)
+  except cloud_backend.CloudApiError:
+    raise RuntimeError("Error deleting workflow template %s." % workflow_name)
 
 
-def _verify_custom_image(image_name, project_id, zone, network, subnetwork, no_external_ip):
-  """Verifies if custom image works with Dataproc."""
-  region = zone[:-2]
+def _verify_name():
   date = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-  # Note: workflow_name can collide if the script runs more than 10000
+  # Note: the name can collide if the script runs more than 10000
   # times/second.
-  workflow_name = "verify-image-{}-{}".format(date, uuid.uuid4().hex[-8:])
+  return "verify-image-{}-{}".format(date, uuid.uuid4().hex[-8:])
+
+
+def _verify_custom_image(image_name, project_id, zone, network, subnetwork,
+                         no_external_ip, backend):
+  """Verifies if custom image works with Dataproc."""
+  region = zone[:-2]
+  workflow_name = _verify_name()
   try:
     _LOG.info("Creating Dataproc workflow-template %s with image %s...",
               workflow_name, image_name)
     _create_workflow_template(workflow_name, image_name, project_id, zone, region,
-                              network, subnetwork, no_external_ip)
+                              network, subnetwork, no_external_ip, backend)
     _LOG.info(
         "Successfully created Dataproc workflow-template %s with image %s...",
         workflow_name, image_name)
     _LOG.info("Smoke testing Dataproc workflow-template %s...")
-    _instantiate_workflow_template(workflow_name, project_id, region)
+    _instantiate_workflow_template(workflow_name, project_id, region, backend)
     _LOG.info("Successfully smoke tested Dataproc workflow-template %s...",
               workflow_name)
   except RuntimeError as e:
@@ -119,21 +161,148 @@ def _verify_custom_image(image_name, project_id, zone, network, subnetwork, no_e
   finally:
     try:
       _LOG.info("Deleting Dataproc workflow-template %s...", workflow_name)
-      _delete_workflow_template(workflow_name, project_id, region)
+      _delete_workflow_template(workflow_name, project_id, region, backend)
       _LOG.info("Successfully deleted Dataproc workflow-template %s...",
                 workflow_name)
     except RuntimeError:
       pass
 
 
-def run(args):
+def _parse_accelerator(accelerator):
+  """Converts a --accelerator value to a cluster accelerator config."""
+  fields = dict(field.split("=", 1) for field in accelerator.split(","))
+  return {"acceleratorTypeUri": fields["type"],
+          "acceleratorCount": int(fields.get("count", 1))}
+
+
+def default_checks(args):
+  """Returns the checks run when --smoke-test-checks is not set."""
+  checks = [SPARK_PI, PYSPARK, COMPONENTS]
+  if args.accelerator:
+    checks.append(GPU)
+  return checks
+
+
+def _test_cluster(cluster_name, args):
+  """Returns the single-node test cluster of the image."""
+  master_config = {
+      "numInstances": 1,
+      "imageUri": "projects/{}/global/images/{}".format(args.project_id,
+                                                         args.image_name),
+  }
+  if args.accelerator:
+    master_config["accelerators"] = [_parse_accelerator(args.accelerator)]
+  return {
+      "projectId": args.project_id,
+      "clusterName": cluster_name,
+      "config": {
+          "gceClusterConfig": _gce_cluster_config(
+              args.zone, args.network, args.subnetwork, args.no_external_ip),
+          "masterConfig": master_config,
+          "softwareConfig": {
+              "properties": {"dataproc:dataproc.allow.zero.workers": "true"},
+          },
+          "lifecycleConfig": {"idleDeleteTtl": _IDLE_DELETE_TTL},
+      },
+  }
+
+
+def _check_job(check, cluster_name, script_uris):
+  job = {"placement": {"clusterName": cluster_name}}
+  if check == SPARK_PI:
+    job["sparkJob"] = _SPARK_PI_JOB
+  else:
+    job["pysparkJob"] = {"mainPythonFileUri": script_uris[check]}
+  return job
+
+
+def _run_check(check, job, project_id, region, backend, origin, tracer):
+  start = time.time() - origin
+  error = None
+  try:
+    if tracer:
+      with tracer.span(check, category="smoke-test"):
+        backend.submit_job(project_id, region, job)
+    else:
+      backend.submit_job(project_id, region, job)
+  except cloud_backend.CloudApiError as e:
+    error = str(e)
+  return CheckTiming(check, start, time.time() - origin, error)
+
+
+def run_suite(args, backend, checks, output=None, tracer=None):
+  """Runs the checks concurrently on a single-node cluster on the image.
+
+  Returns the CheckTiming of each check. Raises RuntimeError once all
+  checks finished if any of them failed.
+  """
+  region = args.zone[:-2]
+  cluster_name = _verify_name()
+  script_uris = {}
+  for check in checks:
+    if check in _CHECK_SCRIPTS:
+      script_uris[check] = "{}/smoke-test/{}/{}".format(
+          args.gcs_bucket.rstrip("/"), cluster_name,
+          os.path.basename(_CHECK_SCRIPTS[check]))
+      backend.upload_file(_CHECK_SCRIPTS[check], script_uris[check])
+
+  print("Creating smoke test cluster {} with image {}...".format(
+      cluster_name, args.image_name), file=output, flush=True)
+  origin = time.time()
+  try:
+    try:
+      backend.create_cluster(args.project_id, region,
+                             _test_cluster(cluster_name, args))
+    except cloud_backend.CloudApiError as e:
+      raise RuntimeError(
+          "Verification of custom image {} failed: unable to create "
+          "cluster {}: {}".format(args.image_name, cluster_name, e))
+    boot = CheckTiming("cluster-create", 0.0, time.time() - origin)
+    with futures.ThreadPoolExecutor(max_workers=len(checks)) as executor:
+      timings = list(executor.map(
+          lambda check: _run_check(
+              check, _check_job(check, cluster_name, script_uris),
+              args.project_id, region, backend, origin, tracer), checks))
+  finally:
+    try:
+      backend.delete_cluster(args.project_id, region, cluster_name)
+    except cloud_backend.CloudApiError as e:
+      _LOG.warning("Failed to delete cluster %s: %s", cluster_name, e)
+  print(format_report([boot] + timings), file=output)
+  failed = [t for t in timings if t.error]
+  if failed:
+    raise RuntimeError("Verification of custom image {} failed: {}".format(
+        args.image_name, "; ".join(
+            "{}: {}".format(t.name, t.error) for t in failed)))
+  return timings
+
+
+def format_report(timings):
+  """Formats a per-check timing report."""
+  lines = ["Smoke test timing report:"]
+  for t in timings:
+    lines.append("  {:<24} {:<6} start {:8.3f}s  duration {:8.3f}s".format(
+        t.name, "failed" if t.error else "ok", t.start, t.duration))
+  lines.append("  {:<24} {:<6} wall {:8.3f}s".format(
+      "total", "", max(t.end for t in timings)))
+  return "\n".join(lines)
+
+
+def run(args, output=None, tracer=None):
   """Runs smoke test."""
 
   if not args.dry_run:
     if not args.no_smoke_test:
       _LOG.info("Verifying the custom image...")
-      _verify_custom_image(args.image_name, args.project_id, args.zone,
-                           args.network, args.subnetwork, args.no_external_ip)
+      backend = cloud_backend.get_backend(args)
+      if getattr(args, "smoke_test_mode", WORKFLOW) == CLUSTER:
+        checks = (args.smoke_test_checks.split(",")
+                  if args.smoke_test_checks else default_checks(args))
+        run_suite(args, backend, checks, output=output, tracer=tracer)
+      else:
+        _verify_custom_image(args.image_name, args.project_id, args.zone,
+                             args.network, args.subnetwork,
+                             args.no_external_ip, backend)
       _LOG.info("Successfully verified the custom image...")
   else:
     _LOG.info("Skip running smoke test (dry run).")
@@ -0,0 +1,179 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Content-addressed upload of the customization sources.
+
+Each source file is stored once in the GCS bucket, under its SHA-256 digest
+in `gs://<bucket>/custom-image-sources/sha256/`. Files already present from
+earlier builds are not uploaded again, and the others are uploaded
+concurrently. A manifest maps each file name to its object, and the build
+VM downloads the sources it lists.
+
+The manifest has one line per source file, with the tab separated file
+name, SHA-256 digest, size in bytes and gs:// URI of its object.
+
+It is run by the generated workflow script:
+
+    python -m custom_image_utils.source_uploader \\
+        --gcs-bucket=gs://<bucket> --manifest-uri=<gs:// URI> \\
+        --source=run.sh=startup_script/run.sh ...
+"""
+
+import argparse
+from concurrent import futures
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import rate_limiter
+
+SOURCES_PREFIX = "custom-image-sources/sha256"
+MANIFEST_FILE = "sources.manifest"
+
+_MAX_WORKERS = 8
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class SourceFile:
+  """A local source file and its content-addressed object."""
+
+  def __init__(self, name, path):
+    self.name = name
+    self.path = path
+    self.sha256 = None
+    self.size = None
+    self.uri = None
+    self.uploaded = False
+
+
+def hash_file(path):
+  """Returns the hex SHA-256 digest of a file."""
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def list_source_files(sources):
+  """Expands a {name: path} dict of files and directories into SourceFiles.
+
+  Files in a directory are named after their path relative to it, under the
+  directory's name.
+  """
+  files = []
+  for name, path in sources.items():
+    if not os.path.isdir(path):
+      files.append(SourceFile(name, path))
+      continue
+    for root, _, file_names in sorted(os.walk(path)):
+      for file_name in sorted(file_names):
+        file_path = os.path.join(root, file_name)
+        relative_path = os.path.relpath(file_path, path)
+        files.append(SourceFile(
+            "/".join([name] + relative_path.split(os.sep)), file_path))
+  return files
+
+
+def _hash(source, gcs_bucket):
+  source.sha256 = hash_file(source.path)
+  source.size = os.path.getsize(source.path)
+  source.uri = "gs://{}/{}/{}".format(gcs_bucket.replace("gs://", ""),
+                                      SOURCES_PREFIX, source.sha256)
+
+
+def _upload(source, backend):
+  if not backend.object_exists(source.uri):
+    backend.upload_file(source.path, source.uri)
+    source.uploaded = True
+
+
+def upload_sources(sources, gcs_bucket, backend, max_workers=_MAX_WORKERS):
+  """Uploads sources missing from the bucket. Returns the SourceFiles."""
+  files = list_source_files(sources)
+  with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+    for result in [executor.submit(_hash, source, gcs_bucket)
+                   for source in files]:
+      result.result()
+    # Files with identical contents share one object.
+    unique = {source.uri: source for source in files}
+    for result in [executor.submit(_upload, source, backend)
+                   for source in unique.values()]:
+      result.result()
+  return files
+
+
+def format_manifest(files):
+  return "".join("{}\t{}\t{}\t{}\n".format(f.name, f.sha256, f.size, f.uri)
+                 for f in files)
+
+
+def write_manifest(files, manifest_uri, backend):
+  """Writes the manifest of uploaded sources to `manifest_uri`."""
+  with tempfile.NamedTemporaryFile(mode="w", suffix=".manifest") as f:
+    f.write(format_manifest(files))
+    f.flush()
+    backend.upload_file(f.name, manifest_uri)
+
+
+def format_summary(files):
+  uploaded = [f for f in files if f.uploaded]
+  return ("Sources: {} files, {} uploaded ({} bytes), {} already in the "
+          "bucket ({} bytes).".format(
+              len(files), len(uploaded), sum(f.size for f in uploaded),
+              len(files) - len(uploaded),
+              sum(f.size for f in files if not f.uploaded)))
+
+
+def _parse_source(value):
+  name, separator, path = value.partition("=")
+  if not separator:
+    raise argparse.ArgumentTypeError(
+        "Expected NAME=PATH, got '{}'".format(value))
+  return name, path
+
+
+def _parse_args(args):
+  parser = argparse.ArgumentParser(
+      description="Uploads customization sources to a GCS bucket.")
+  parser.add_argument("--gcs-bucket", required=True)
+  parser.add_argument("--manifest-uri", required=True)
+  parser.add_argument("--source", type=_parse_source, action="append",
+                      default=[], help="NAME=PATH of a file or directory.")
+  parser.add_argument("--api-backend", choices=cloud_backend.BACKENDS,
+                      default=cloud_backend.GCLOUD)
+  parser.add_argument("--universe-domain", default="googleapis.com")
+  parser.add_argument("--shared-rate-limits", action="store_true")
+  parser.add_argument("--api-rate-limits", default=None)
+  return parser.parse_args(args)
+
+
+def main(args):
+  args = _parse_args(args)
+  rate_limiter.configure(args)
+  backend = cloud_backend.get_backend(args)
+  files = upload_sources(dict(args.source), args.gcs_bucket, backend)
+  write_manifest(files, args.manifest_uri, backend)
+  print(format_summary(files))
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
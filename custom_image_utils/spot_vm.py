@@ -0,0 +1,89 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Spot build VMs, restarted when they are preempted.
+
+With --provisioning-model=spot, the build VM is a Spot VM which is stopped,
+not deleted, when it is preempted, so that its boot disk is kept. The
+serial port follower reports a spot VM which stopped without a build result
+as preempted, and the workflow starts it again on the same boot disk. run.sh
+then resumes the build from the progress it recorded on the disk.
+
+The workflow prints a marker per preemption with the time it lost, which is
+the time since the VM was started plus the time to start it again.
+"""
+
+import re
+
+STANDARD = "standard"
+SPOT = "spot"
+PROVISIONING_MODELS = (STANDARD, SPOT)
+# Preemptions after which the build gives up.
+MAX_PREEMPTIONS = 3
+# Printed by the workflow script for each preemption, at the start of the
+# line unlike its xtrace.
+_MARKER = re.compile(r"spot-preemption: (\d+) lost (\d+(?:\.\d+)?)$")
+
+
+def is_spot(args):
+  return getattr(args, "provisioning_model", STANDARD) == SPOT
+
+
+def scheduling(args):
+  """Returns the scheduling fields of the build VM, or {}."""
+  if not is_spot(args):
+    return {}
+  return {"provisioningModel": "SPOT", "instanceTerminationAction": "STOP"}
+
+
+def gcloud_flags(args):
+  """Returns the `instances create` flags of the provisioning model."""
+  if not is_spot(args):
+    return ""
+  return "--provisioning-model=SPOT --instance-termination-action=STOP"
+
+
+def is_spot_instance(instance):
+  return (instance or {}).get("scheduling", {}).get(
+      "provisioningModel") == "SPOT"
+
+
+class PreemptionStats:
+  """Preemptions of the build VM and the time they cost."""
+
+  def __init__(self):
+    self.count = 0
+    self.lost_sec = 0.0
+
+  def record(self, lost_sec):
+    self.count += 1
+    self.lost_sec += lost_sec
+
+  def format_report(self):
+    return "Spot VM preempted {} time(s), {:.0f}s of build time lost.".format(
+        self.count, self.lost_sec)
+
+
+def read_log(log_file):
+  """Returns the PreemptionStats printed by the workflow script to a log."""
+  stats = PreemptionStats()
+  try:
+    with open(log_file, errors="replace") as f:
+      for line in f:
+        match = _MARKER.match(line.rstrip())
+        if match:
+          stats.record(float(match.group(2)))
+  except (IOError, OSError):
+    pass
+  return stats
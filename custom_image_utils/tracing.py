@@ -0,0 +1,180 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Span instrumentation of the phases of a build.
+
+Every phase of a build is recorded as a span: pre-flight probes, the steps
+of the image creation workflow, labelling, smoke test and notifier. The
+generated Shell script records its phases in a spans file, which is read
+back once it exits. At the end of a build, spans are written to the log
+directory both as JSON lines (`trace.jsonl`) and as a Chrome trace
+(`trace.json`), which can be opened in chrome://tracing or Perfetto.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+JSONL_FILE = "trace.jsonl"
+CHROME_TRACE_FILE = "trace.json"
+BASH_SPANS_FILE = "spans.tsv"
+
+OK = "ok"
+ERROR = "error"
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class Span:
+  """A named phase of a build, with start and end in epoch seconds."""
+
+  def __init__(self, name, category, start, end=None, thread=None,
+               status=OK, attrs=None):
+    self.name = name
+    self.category = category
+    self.start = start
+    self.end = end
+    self.thread = thread
+    self.status = status
+    self.attrs = attrs or {}
+
+  @property
+  def duration(self):
+    return (self.end or self.start) - self.start
+
+  def to_dict(self):
+    return {
+        "name": self.name,
+        "category": self.category,
+        "start": self.start,
+        "end": self.end,
+        "duration": self.duration,
+        "thread": self.thread,
+        "status": self.status,
+        "attrs": self.attrs,
+    }
+
+
+class Tracer:
+  """Thread-safe collector of spans."""
+
+  def __init__(self, clock=time.time):
+    self.spans = []
+    self._clock = clock
+    self._lock = threading.Lock()
+
+  def add_span(self, span):
+    with self._lock:
+      self.spans.append(span)
+
+  @contextlib.contextmanager
+  def span(self, name, category="build", **attrs):
+    """Records the enclosed block as a span, failed if it raises."""
+    span = Span(name, category, self._clock(),
+                thread=threading.current_thread().name, attrs=attrs)
+    try:
+      yield span
+    except BaseException:
+      span.status = ERROR
+      raise
+    finally:
+      span.end = self._clock()
+      self.add_span(span)
+
+  def sorted_spans(self):
+    with self._lock:
+      return sorted(self.spans, key=lambda span: span.start)
+
+  def export(self, directory):
+    """Writes the spans as JSON lines and as a Chrome trace."""
+    os.makedirs(directory, exist_ok=True)
+    spans = self.sorted_spans()
+    with open(os.path.join(directory, JSONL_FILE), "w") as f:
+      for span in spans:
+        f.write(json.dumps(span.to_dict(), sort_keys=True) + "\n")
+    with open(os.path.join(directory, CHROME_TRACE_FILE), "w") as f:
+      json.dump({"traceEvents": to_trace_events(spans),
+                 "displayTimeUnit": "ms"}, f)
+
+
+def to_trace_events(spans):
+  """Converts spans to Chrome trace_event complete events."""
+  thread_ids = {}
+  events = []
+  for span in spans:
+    tid = thread_ids.setdefault(span.thread or "main", len(thread_ids) + 1)
+    args = dict(span.attrs, status=span.status)
+    events.append({
+        "name": span.name,
+        "cat": span.category,
+        "ph": "X",
+        "ts": int(span.start * 1e6),
+        "dur": int(span.duration * 1e6),
+        "pid": 1,
+        "tid": tid,
+        "args": args,
+    })
+  for thread, tid in thread_ids.items():
+    events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                   "args": {"name": thread}})
+  return events
+
+
+def read_bash_spans(path, tracer, end_time=None):
+  """Adds the spans recorded by the `span` function of the Shell script.
+
+  Each line of the file is `begin|end<TAB>name<TAB>epoch seconds`. Spans
+  left open, because the script exited during them, end at `end_time` and
+  are marked failed.
+  """
+  if not os.path.exists(path):
+    return
+  open_spans = {}
+  with open(path) as f:
+    for line in f:
+      fields = line.rstrip("\n").split("\t")
+      if len(fields) != 3:
+        continue
+      event, name, timestamp = fields[0], fields[1], float(fields[2])
+      if event == "begin":
+        open_spans[name] = Span(name, "workflow", timestamp, thread="bash")
+      elif event == "end" and name in open_spans:
+        span = open_spans.pop(name)
+        span.end = timestamp
+        tracer.add_span(span)
+  for span in open_spans.values():
+    span.end = end_time or span.start
+    span.status = ERROR
+    tracer.add_span(span)
+
+
+def format_summary(tracer):
+  """Formats the top-level phases of a build with their share of time."""
+  spans = [span for span in tracer.sorted_spans()
+           if span.category == "build"]
+  if not spans:
+    return ""
+  total = max(span.end for span in spans) - min(span.start for span in spans)
+  lines = ["Build phase report:"]
+  for span in spans:
+    share = span.duration / total * 100 if total else 0.0
+    lines.append("  {:<24} {:<6} duration {:8.3f}s {:5.1f}%".format(
+        span.name, span.status, span.duration, share))
+  lines.append("  {:<24} {:<6} duration {:8.3f}s".format("total", "", total))
+  return "\n".join(lines)
@@ -0,0 +1,280 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Resource telemetry of the build VM during the customization.
+
+While the customization script runs, run.sh samples the cumulative CPU,
+memory, swap, disk and network counters of the VM and its used space every
+few seconds into vm-telemetry.csv, uploaded to the log directory. After the
+build, the samples are summarized, and the build is flagged as CPU-, IO- or
+network-bound after the resource which was saturated the longest:
+
+  * CPU, when most of the vCPUs were busy. A build running on one core of a
+    large machine type is not CPU-bound: more vCPUs would not speed it up.
+  * IO, when the disk was busy most of the time, or the CPUs waited on it.
+  * Network, when neither was saturated but data was being transferred.
+
+Run as a script, it summarizes the telemetry of a build:
+
+  python -m custom_image_utils.vm_telemetry <log_dir>/vm-telemetry.csv
+"""
+
+import argparse
+import logging
+import sys
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import finalizer
+
+TELEMETRY_FILE = "vm-telemetry.csv"
+CPU = "CPU"
+IO = "IO"
+NETWORK = "network"
+# Thresholds above which an interval is bound by a resource.
+CPU_BOUND_UTILIZATION = 0.75
+DISK_BOUND_UTILIZATION = 0.7
+IOWAIT_BOUND_SHARE = 0.2
+NETWORK_ACTIVE_BYTES_PER_SEC = 1024 * 1024
+# Share of the customization a resource must be bound for to flag the build.
+BOUND_SHARE = 0.3
+_MIB = 1024 * 1024
+_GIB = 1024 * _MIB
+# Counters which never decrease within a boot.
+_COUNTERS = ("cpu_busy_jiffies", "cpu_iowait_jiffies", "cpu_total_jiffies",
+             "disk_reads", "disk_writes", "disk_read_bytes",
+             "disk_write_bytes", "disk_busy_ms", "net_rx_bytes",
+             "net_tx_bytes")
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class Interval:
+  """The resource usage of the VM between two samples."""
+
+  def __init__(self, before, after):
+    self.duration = after["time"] - before["time"]
+    delta = {c: after[c] - before[c] for c in _COUNTERS}
+    cpu_total = delta["cpu_total_jiffies"] or 1
+    self.cpu = delta["cpu_busy_jiffies"] / cpu_total
+    self.iowait = delta["cpu_iowait_jiffies"] / cpu_total
+    self.disk_utilization = min(
+        delta["disk_busy_ms"] / 1000.0 / self.duration, 1.0)
+    self.read_bytes_per_sec = delta["disk_read_bytes"] / self.duration
+    self.write_bytes_per_sec = delta["disk_write_bytes"] / self.duration
+    self.iops = (delta["disk_reads"] + delta["disk_writes"]) / self.duration
+    self.rx_bytes_per_sec = delta["net_rx_bytes"] / self.duration
+    self.tx_bytes_per_sec = delta["net_tx_bytes"] / self.duration
+
+  @property
+  def bound(self):
+    """The resource the interval was bound by, or None."""
+    if self.cpu >= CPU_BOUND_UTILIZATION:
+      return CPU
+    if (self.disk_utilization >= DISK_BOUND_UTILIZATION or
+        self.iowait >= IOWAIT_BOUND_SHARE):
+      return IO
+    if (self.rx_bytes_per_sec + self.tx_bytes_per_sec >=
+        NETWORK_ACTIVE_BYTES_PER_SEC):
+      return NETWORK
+    return None
+
+
+def parse(lines):
+  """Returns the ({key: value} of the comments, samples) of telemetry lines.
+
+  Each sample is a {column: float}, plus the `boot` of the VM it was taken
+  in, from the comment run.sh writes on each boot. The last value of a
+  comment key wins.
+  """
+  info = {}
+  columns = None
+  samples = []
+  for line in lines:
+    line = line.strip()
+    if not line:
+      continue
+    if line.startswith("#"):
+      for item in line[1:].split():
+        key, _, value = item.partition("=")
+        info[key] = value
+    elif columns is None:
+      columns = line.split(",")
+    else:
+      values = line.split(",")
+      if len(values) != len(columns):
+        # Interrupted while writing the line.
+        continue
+      try:
+        sample = dict(zip(columns, (float(v) for v in values)))
+      except ValueError:
+        continue
+      sample["boot"] = info.get("boot")
+      samples.append(sample)
+  return info, samples
+
+
+def intervals(samples):
+  """Returns the Intervals between samples of the same boot."""
+  result = []
+  for before, after in zip(samples, samples[1:]):
+    if (after["boot"] != before["boot"] or after["time"] <= before["time"] or
+        any(after[c] < before[c] for c in _COUNTERS)):
+      # The VM restarted in between, its counters restarted from 0.
+      continue
+    result.append(Interval(before, after))
+  return result
+
+
+def _weighted_mean(values, weights):
+  total = sum(weights)
+  return sum(v * w for v, w in zip(values, weights)) / total if total else 0.0
+
+
+class Summary:
+  """The resource usage of the VM over the customization."""
+
+  def __init__(self, info, samples):
+    self.cpus = info.get("cpus")
+    self.boots = len(set(s["boot"] for s in samples))
+    spans = intervals(samples)
+    self.duration = sum(i.duration for i in spans)
+    weights = [i.duration for i in spans]
+
+    def mean(attribute):
+      return _weighted_mean([getattr(i, attribute) for i in spans], weights)
+
+    def peak(attribute):
+      return max([getattr(i, attribute) for i in spans] or [0.0])
+
+    self.cpu = mean("cpu")
+    self.cpu_peak = peak("cpu")
+    self.iowait = mean("iowait")
+    self.disk_utilization = mean("disk_utilization")
+    self.read_bytes_per_sec = mean("read_bytes_per_sec")
+    self.write_bytes_per_sec = mean("write_bytes_per_sec")
+    self.disk_bytes_per_sec_peak = max(
+        [i.read_bytes_per_sec + i.write_bytes_per_sec for i in spans] or
+        [0.0])
+    self.iops = mean("iops")
+    self.iops_peak = peak("iops")
+    self.rx_bytes_per_sec = mean("rx_bytes_per_sec")
+    self.tx_bytes_per_sec = mean("tx_bytes_per_sec")
+    self.net_bytes_per_sec_peak = max(
+        [i.rx_bytes_per_sec + i.tx_bytes_per_sec for i in spans] or [0.0])
+    self.mem_total_bytes = max(
+        [s["mem_total_kb"] * 1024 for s in samples] or [0.0])
+    self.mem_used_bytes_peak = max(
+        [(s["mem_total_kb"] - s["mem_available_kb"]) * 1024 for s in samples]
+        or [0.0])
+    self.swap_used_bytes_peak = max(
+        [(s["swap_total_kb"] - s["swap_free_kb"]) * 1024 for s in samples] or
+        [0.0])
+    self.disk_used_bytes_peak = max(
+        [s["disk_used_bytes"] for s in samples] or [0.0])
+    # {resource: share of the customization bound by it}
+    self.bound_shares = {CPU: 0.0, IO: 0.0, NETWORK: 0.0}
+    for interval in spans:
+      if interval.bound and self.duration:
+        self.bound_shares[interval.bound] += interval.duration / self.duration
+
+  @property
+  def bound(self):
+    """The resource the build was bound by, or None."""
+    resource = max(self.bound_shares, key=self.bound_shares.get)
+    if self.bound_shares[resource] < BOUND_SHARE:
+      return None
+    return resource
+
+  def format_report(self):
+    boots = ", {} boots".format(self.boots) if self.boots > 1 else ""
+    lines = ["VM telemetry over {:.0f}s of customization on {} vCPUs{}:".format(
+        self.duration, self.cpus or "?", boots)]
+    lines.append("  CPU       {:.1f}% mean, {:.1f}% peak, {:.1f}% iowait".format(
+        self.cpu * 100, self.cpu_peak * 100, self.iowait * 100))
+    lines.append("  memory    {:.1f} GiB peak of {:.1f} GiB, "
+                 "{:.1f} GiB swap peak".format(
+                     self.mem_used_bytes_peak / _GIB,
+                     self.mem_total_bytes / _GIB,
+                     self.swap_used_bytes_peak / _GIB))
+    lines.append("  disk      {:.1f} MiB/s read, {:.1f} MiB/s written, "
+                 "{:.1f} MiB/s peak, {:.0f} IOPS mean, {:.0f} IOPS peak, "
+                 "{:.0f}% busy".format(
+                     self.read_bytes_per_sec / _MIB,
+                     self.write_bytes_per_sec / _MIB,
+                     self.disk_bytes_per_sec_peak / _MIB, self.iops,
+                     self.iops_peak, self.disk_utilization * 100))
+    lines.append("  network   {:.1f} MiB/s received, {:.1f} MiB/s sent, "
+                 "{:.1f} MiB/s peak".format(
+                     self.rx_bytes_per_sec / _MIB,
+                     self.tx_bytes_per_sec / _MIB,
+                     self.net_bytes_per_sec_peak / _MIB))
+    lines.append("  disk used {:.1f} GiB peak".format(
+        self.disk_used_bytes_peak / _GIB))
+    shares = ", ".join("{} {:.0f}%".format(resource, share * 100)
+                       for resource, share in self.bound_shares.items())
+    if self.bound:
+      lines.append("The build was {}-bound ({} of the time).".format(
+          self.bound, shares))
+    else:
+      lines.append("The build was not bound by CPU, IO or network ({} of "
+                   "the time).".format(shares))
+    if self.swap_used_bytes_peak:
+      lines.append("The VM swapped: a machine type with more memory may "
+                   "build faster.")
+    return "\n".join(lines)
+
+
+def summarize_file(path):
+  with open(path, errors="replace") as f:
+    return Summary(*parse(f))
+
+
+def telemetry_uri(gcs_log_dir):
+  """The gs:// URI run.sh uploads the telemetry to."""
+  return finalizer.log_uri(gcs_log_dir, TELEMETRY_FILE)
+
+
+def report(args, output=None, backend=None):
+  """Downloads and prints the telemetry summary of a build.
+
+  Builds whose VM did not run the customization have no telemetry, and
+  telemetry which cannot be summarized is only logged, as the report also
+  runs after a failed build.
+  """
+  try:
+    path = finalizer.download_log(args, TELEMETRY_FILE, backend)
+    if not path:
+      return
+    summary = summarize_file(path)
+  except (cloud_backend.CloudApiError, IOError, OSError, KeyError,
+          ValueError) as e:
+    _LOG.info("No VM telemetry: %s", e)
+    return
+  if summary.duration:
+    print(summary.format_report(), file=output)
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description="Summarizes the resource usage of a build VM.")
+  parser.add_argument("telemetry", help="vm-telemetry.csv of a build.")
+  args = parser.parse_args(argv)
+  print(summarize_file(args.telemetry).format_report())
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,114 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Reuse of a snapshot of the base image disk across builds.
+
+With --reuse-base-disk-snapshot, the first build on a base image creates a
+disk from the image once, snapshots it and deletes it. That build and the
+following ones on the same base image create their build disk from the
+snapshot instead of the image. The time it took to create the disk from the
+image is kept as a label of the snapshot, so each build reports the time it
+saved.
+
+Snapshots are kept for later builds and named after the base image, delete
+them with `gcloud compute snapshots delete` once no longer needed.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+
+from custom_image_utils import cloud_backend
+
+SNAPSHOT_PREFIX = "custom-image-base-"
+_DURATION_LABEL = "base-disk-create-sec"
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+def snapshot_name(base_image):
+  """Returns the snapshot name for a base image path."""
+  digest = hashlib.sha256(base_image.encode("utf-8")).hexdigest()
+  return SNAPSHOT_PREFIX + digest[:40]
+
+
+def supports(base_image):
+  """Whether the base image is pinned, families resolve to newer images."""
+  return "/family/" not in base_image
+
+
+def _lock(name):
+  with _locks_lock:
+    return _locks.setdefault(name, threading.Lock())
+
+
+class BaseDiskSnapshot:
+  """A snapshot of the base image disk and how long the image disk took."""
+
+  def __init__(self, name, image_disk_sec):
+    self.name = name
+    self.image_disk_sec = image_disk_sec
+
+  @property
+  def source(self):
+    return "global/snapshots/{}".format(self.name)
+
+
+def ensure_snapshot(backend, project_id, zone, base_image, clock=time.time):
+  """Returns the BaseDiskSnapshot of a base image, creating it if needed.
+
+  Concurrent builds of a batch on the same base image wait for the first one
+  to create the snapshot. Returns None if another process is creating it.
+  """
+  name = snapshot_name(base_image)
+  with _lock(name):
+    try:
+      snapshot = backend.describe_snapshot(project_id, name)
+      if snapshot.get("status", "READY") != "READY":
+        return None
+      return BaseDiskSnapshot(name, float(
+          snapshot.get("labels", {}).get(_DURATION_LABEL, 0)))
+    except cloud_backend.NotFoundError:
+      pass
+
+    disk_name = name + "-disk"
+    start = clock()
+    backend.create_disk(project_id, zone, {
+        "name": disk_name,
+        "sourceImage": base_image,
+        "type": "zones/{}/diskTypes/pd-ssd".format(zone),
+    })
+    image_disk_sec = clock() - start
+    try:
+      backend.create_snapshot(project_id, zone, disk_name, {
+          "name": name,
+          "description": "Disk of base image {}".format(base_image),
+          "labels": {_DURATION_LABEL: str(int(round(image_disk_sec)))},
+      })
+    finally:
+      backend.delete_disk(project_id, zone, disk_name)
+    return BaseDiskSnapshot(name, image_disk_sec)
+
+
+def format_savings(snapshot, snapshot_disk_sec):
+  return ("Created the build disk from snapshot {} in {:.1f}s, from the base "
+          "image it took {:.1f}s: saved {:.1f}s.".format(
+              snapshot.name, snapshot_disk_sec, snapshot.image_disk_sec,
+              snapshot.image_disk_sec - snapshot_disk_sec))
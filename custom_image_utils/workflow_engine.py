@@ -0,0 +1,261 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Small state machine running the steps of an image build workflow.
+
+Each step has its own timeout and retry policy, and its state, attempts and
+timing are recorded. A cleanup function runs when the workflow ends, whether
+it succeeded or not, like the `exit_handler` trap of the bash workflow.
+
+With a build_journal.BuildJournal, completed steps are recorded as they
+finish, and steps completed by a previous run are skipped.
+"""
+
+import logging
+import random
+import threading
+import time
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import rate_limiter
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+SKIPPED = "SKIPPED"
+RESUMED = "RESUMED"
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class StepTimeoutError(RuntimeError):
+  """A step did not finish within its timeout."""
+
+
+class WorkflowError(RuntimeError):
+  """A step of the workflow failed."""
+
+  def __init__(self, step_name, cause):
+    super(WorkflowError, self).__init__("Step {} failed: {}".format(
+        step_name, cause))
+    self.step_name = step_name
+    self.cause = cause
+
+
+class RetryPolicy:
+  """How often and after which errors a step is attempted again."""
+
+  def __init__(self, max_attempts=1, delay_sec=0, backoff=1.0,
+               retry_on=(cloud_backend.CloudApiError,), retryable=None,
+               jitter=False):
+    self.max_attempts = max_attempts
+    self.delay_sec = delay_sec
+    self.backoff = backoff
+    self.retry_on = tuple(retry_on)
+    self.retryable = retryable
+    self.jitter = jitter
+
+  def should_retry(self, attempt, error):
+    if self.retryable is not None and not self.retryable(error):
+      return False
+    return attempt < self.max_attempts and isinstance(error, self.retry_on)
+
+  def delay(self, attempt):
+    """Returns the delay before the attempt following `attempt`.
+
+    With `jitter`, the delay is drawn between half and all of it.
+    """
+    delay = self.delay_sec * self.backoff ** (attempt - 1)
+    if self.jitter:
+      delay = round(random.uniform(delay / 2, delay), 1)
+    return delay
+
+
+NO_RETRY = RetryPolicy()
+# Same as execute_with_retries in the bash workflow.
+API_RETRY = RetryPolicy(max_attempts=3, delay_sec=8, backoff=2,
+                        retryable=rate_limiter.is_retryable, jitter=True)
+
+
+class Step:
+  """A named workflow step.
+
+  `action` is called with a StepContext and may return a dict of the
+  resources it created, which is journaled. When the step is skipped because
+  a previous run completed it, `restore` is called with those resources.
+  `timeout_sec` bounds each attempt, None means no timeout.
+  """
+
+  def __init__(self, name, action, timeout_sec=None, retry=NO_RETRY,
+               restore=None):
+    self.name = name
+    self.action = action
+    self.timeout_sec = timeout_sec
+    self.retry = retry
+    self.restore = restore
+
+
+class StepContext:
+  """Passed to a step action. Long running actions should honor deadline."""
+
+  def __init__(self, step, attempt, deadline, clock):
+    self.step = step
+    self.attempt = attempt
+    self.deadline = deadline
+    self._clock = clock
+
+  def remaining(self):
+    """Returns the seconds left before the step times out, or None."""
+    if self.deadline is None:
+      return None
+    return max(0.0, self.deadline - self._clock())
+
+
+class StepRecord:
+  """State and timing of a step, in seconds relative to the workflow start."""
+
+  def __init__(self, name):
+    self.name = name
+    self.status = PENDING
+    self.attempts = 0
+    self.start = None
+    self.end = None
+    self.error = None
+
+  @property
+  def duration(self):
+    if self.start is None or self.end is None:
+      return 0.0
+    return self.end - self.start
+
+
+class Workflow:
+  """Runs steps in order, stopping at the first step that fails."""
+
+  def __init__(self, steps, cleanup=None, output=None, sleep=time.sleep,
+               clock=time.time, journal=None, tracer=None):
+    self.steps = list(steps)
+    self.cleanup = cleanup
+    self.output = output
+    self.journal = journal
+    self.tracer = tracer
+    self.records = [StepRecord(step.name) for step in self.steps]
+    self._sleep = sleep
+    self._clock = clock
+    self._origin = None
+
+  def _print(self, message):
+    print(message, file=self.output, flush=True)
+
+  def _attempt(self, step, attempt):
+    deadline = None
+    if step.timeout_sec is not None:
+      deadline = self._clock() + step.timeout_sec
+    context = StepContext(step, attempt, deadline, self._clock)
+    if step.timeout_sec is None:
+      return step.action(context)
+    # The action runs in a daemon thread so that a hung call cannot hold
+    # the workflow past the timeout. It is left to finish on its own.
+    errors = []
+    results = []
+
+    def target():
+      try:
+        results.append(step.action(context))
+      except BaseException as e:  # pylint: disable=broad-except
+        errors.append(e)
+
+    thread = threading.Thread(target=target, name=step.name, daemon=True)
+    thread.start()
+    thread.join(step.timeout_sec)
+    if thread.is_alive():
+      raise StepTimeoutError("Step {} timed out after {} seconds.".format(
+          step.name, step.timeout_sec))
+    if errors:
+      raise errors[0]
+    return results[0]
+
+  def _run_step(self, step, record):
+    if self.journal is not None and self.journal.completed(step.name):
+      record.status = RESUMED
+      if step.restore is not None:
+        step.restore(self.journal.resources(step.name))
+      self._print("Skipping step {}, completed by a previous run.".format(
+          step.name))
+      return
+    record.status = RUNNING
+    record.start = self._clock() - self._origin
+    self._print("Running step {}.".format(step.name))
+    try:
+      while True:
+        record.attempts += 1
+        try:
+          resources = self._attempt(step, record.attempts)
+          record.status = SUCCEEDED
+          if self.journal is not None:
+            self.journal.record(step.name, resources)
+          return
+        except Exception as e:  # pylint: disable=broad-except
+          if not step.retry.should_retry(record.attempts, e):
+            record.status = FAILED
+            record.error = e
+            raise WorkflowError(step.name, e)
+          delay = step.retry.delay(record.attempts)
+          self._print("Step {} failed ({}), retrying in {} seconds.".format(
+              step.name, e, delay))
+          self._sleep(delay)
+    finally:
+      record.end = self._clock() - self._origin
+
+  def _traced(self, name, func):
+    if self.tracer is None:
+      return func()
+    with self.tracer.span(name, category="workflow"):
+      return func()
+
+  def run(self):
+    """Runs the workflow. Raises WorkflowError if a step fails."""
+    self._origin = self._clock()
+    try:
+      for step, record in zip(self.steps, self.records):
+        self._traced(step.name, lambda: self._run_step(step, record))
+    finally:
+      for record in self.records:
+        if record.status == PENDING:
+          record.status = SKIPPED
+      if self.cleanup is not None:
+        try:
+          self._traced("cleanup", lambda: self.cleanup(self))
+        except Exception as e:  # pylint: disable=broad-except
+          # Like the bash trap, cleanup problems do not hide the outcome.
+          _LOG.warning("Workflow cleanup failed: %s", e)
+
+  @property
+  def succeeded(self):
+    return all(record.status in (SUCCEEDED, RESUMED)
+               for record in self.records)
+
+
+def format_report(records):
+  """Formats a per-step state and timing report."""
+  lines = ["Workflow step report:"]
+  for record in records:
+    lines.append("  {:<24} {:<9} attempts {}  duration {:8.3f}s".format(
+        record.name, record.status, record.attempts, record.duration))
+  lines.append("  {:<24} {:<9} {:>10}  duration {:8.3f}s".format(
+      "total", "", "", sum(record.duration for record in records)))
+  return "\n".join(lines)
@@ -0,0 +1,255 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Capacity-aware placement of the build VM in one of several zones.
+
+With --zones, the build VM may be created in any of the candidate zones of
+a region. The zones are ranked from the outcome of earlier placements of
+the same machine and accelerator type, recorded in the cache directory:
+zones which recently did not have the resources come last, then zones by
+their share of failed placements and by how long creating the VM took.
+
+The `ranked` strategy tries the zones one after the other, and moves to the
+next one as soon as a zone does not have the resources, instead of retrying
+it. The `parallel` strategy creates the VM in several zones at once, keeps
+the first one created and deletes the others. The disk, VM and image steps
+of the build then use the chosen zone.
+"""
+
+from concurrent import futures
+import logging
+import os
+import re
+import threading
+import time
+
+from custom_image_utils import image_cache
+from custom_image_utils import rate_limiter
+
+RANKED = "ranked"
+PARALLEL = "parallel"
+STRATEGIES = (RANKED, PARALLEL)
+HISTORY_FILE = "zone-placement.json"
+# A zone which did not have the resources this recently is tried last.
+EXHAUSTED_MEMORY_SEC = 60 * 60
+# Zones tried at once by the parallel strategy.
+MAX_PARALLEL_ZONES = 3
+MAX_SAMPLES = 20
+
+CREATED = "created"
+EXHAUSTED = "exhausted"
+# Printed by the workflow script for each zone it tried.
+_MARKER = re.compile(r"zone-placement: (\S+) ({}|{}) (\d+(?:\.\d+)?)".format(
+    CREATED, EXHAUSTED))
+
+_lock = threading.Lock()
+
+logging.basicConfig()
+_LOG = logging.getLogger(__name__)
+_LOG.setLevel(logging.WARN)
+
+
+class PlacementError(RuntimeError):
+  """No candidate zone had the resources for the build VM."""
+
+
+def region_of(zone):
+  return "-".join(zone.split("-")[:-1])
+
+
+def capacity_key(args):
+  """Returns the machine and accelerator type placements are recorded for."""
+  accelerator = ""
+  for item in (getattr(args, "accelerator", None) or "").split(","):
+    key, _, value = item.partition("=")
+    if key == "type":
+      accelerator = value
+  return args.machine_type, accelerator
+
+
+class ZoneHistory:
+  """Outcomes of past placements per zone, persisted to a JSON file."""
+
+  def __init__(self, cache_dir=None, clock=time.time):
+    self.path = os.path.join(cache_dir or image_cache.default_cache_dir(),
+                             HISTORY_FILE)
+    self._clock = clock
+
+  def samples(self, key, zone):
+    with _lock:
+      entries = image_cache.read_json_file(self.path)
+    return entries.get("/".join(key), {}).get(zone, [])
+
+  def record(self, key, zone, outcome, latency_sec):
+    def append(entries):
+      samples = entries.setdefault("/".join(key), {}).setdefault(zone, [])
+      samples.append({
+          "outcome": outcome,
+          "latency_sec": round(latency_sec, 3),
+          "recorded": self._clock(),
+      })
+      del samples[:-MAX_SAMPLES]
+      return entries
+
+    with _lock:
+      try:
+        image_cache.update_json_file(self.path, append, indent=2,
+                                     sort_keys=True)
+      except (IOError, OSError) as e:
+        _LOG.warning("Unable to write zone placement history %s: %s",
+                     self.path, e)
+
+  def rank(self, key, zones):
+    """Returns `zones` ordered by their recorded placements.
+
+    Zones without any placement keep their order, ahead of zones which
+    recently did not have the resources.
+    """
+    now = self._clock()
+
+    def score(indexed_zone):
+      index, zone = indexed_zone
+      samples = self.samples(key, zone)
+      exhausted = [s for s in samples if s["outcome"] == EXHAUSTED]
+      recently_exhausted = any(now - s["recorded"] < EXHAUSTED_MEMORY_SEC
+                               for s in exhausted)
+      failure_share = len(exhausted) / len(samples) if samples else 0.0
+      latencies = [s["latency_sec"] for s in samples
+                   if s["outcome"] == CREATED]
+      latency = sum(latencies) / len(latencies) if latencies else 0.0
+      return recently_exhausted, failure_share, latency, index
+
+    return [zone for _, zone in sorted(enumerate(zones), key=score)]
+
+
+def candidate_zones(args, history=None):
+  """Returns the zones to try for the build VM, best first."""
+  zones = list(getattr(args, "zones", None) or [args.zone])
+  if len(zones) == 1:
+    return zones
+  return (history or ZoneHistory()).rank(capacity_key(args), zones)
+
+
+def is_capacity_error(error):
+  return rate_limiter.is_capacity_error(str(error))
+
+
+def _ranked(zones, create, record, output):
+  for zone in zones:
+    start = time.time()
+    try:
+      result = create(zone)
+    except Exception as e:  # pylint: disable=broad-except
+      if not is_capacity_error(e):
+        raise
+      record(zone, EXHAUSTED, time.time() - start)
+      print("Zone {} does not have the resources for the VM, trying the "
+            "next zone.".format(zone), file=output, flush=True)
+      continue
+    record(zone, CREATED, time.time() - start)
+    return zone, result
+  raise PlacementError("None of the zones {} has the resources for the "
+                       "VM.".format(", ".join(zones)))
+
+
+def _parallel(zones, create, release, record, output):
+  """Creates the VM in up to MAX_PARALLEL_ZONES zones at a time."""
+  chosen = []
+  chosen_lock = threading.Lock()
+  done = threading.Event()
+
+  def attempt(zone):
+    start = time.time()
+    try:
+      result = create(zone)
+    except Exception as e:  # pylint: disable=broad-except
+      if is_capacity_error(e):
+        record(zone, EXHAUSTED, time.time() - start)
+      raise
+    record(zone, CREATED, time.time() - start)
+    with chosen_lock:
+      if not chosen:
+        chosen.append((zone, result))
+        done.set()
+        return
+    # Another zone won, the VM is not needed anymore.
+    release(zone, result)
+
+  executor = futures.ThreadPoolExecutor(
+      max_workers=min(len(zones), MAX_PARALLEL_ZONES))
+  pending = set(executor.submit(attempt, zone) for zone in zones)
+  errors = []
+  try:
+    while pending and not done.is_set():
+      finished, pending = futures.wait(
+          pending, return_when=futures.FIRST_COMPLETED)
+      for future in finished:
+        if future.exception() is not None:
+          errors.append(future.exception())
+  finally:
+    # The losing attempts still running release their VM in the background.
+    for future in pending:
+      future.cancel()
+    executor.shutdown(wait=False)
+  if chosen:
+    return chosen[0]
+  for error in errors:
+    if not is_capacity_error(error):
+      raise error
+  raise PlacementError("None of the zones {} has the resources for the "
+                       "VM.".format(", ".join(zones)))
+
+
+def place(zones, create, release=None, strategy=RANKED, key=None,
+          history=None, output=None):
+  """Creates the build VM in one of `zones` and returns (zone, result).
+
+  `create(zone)` creates the disk and VM in a zone and returns a result,
+  it must clean up its disk if it raises. With the parallel strategy,
+  `release(zone, result)` deletes the VMs created in zones not chosen.
+  """
+  if key is not None:
+    history = history or ZoneHistory()
+
+  def record(zone, outcome, latency_sec):
+    if key is not None:
+      history.record(key, zone, outcome, latency_sec)
+
+  if strategy == PARALLEL and len(zones) > 1:
+    zone, result = _parallel(zones, create, release, record, output)
+  else:
+    zone, result = _ranked(zones, create, record, output)
+  print("Build VM placed in zone {}.".format(zone), file=output, flush=True)
+  return zone, result
+
+
+def record_log(log_file, key, history=None):
+  """Records the placements printed by the workflow script to a log.
+
+  Returns the zone the VM was created in, or None.
+  """
+  history = history or ZoneHistory()
+  created = None
+  try:
+    with open(log_file, errors="replace") as f:
+      for line in f:
+        match = _MARKER.search(line)
+        if match:
+          zone, outcome, latency = match.groups()
+          history.record(key, zone, outcome, float(latency))
+          if outcome == CREATED:
+            created = zone
+  except (IOError, OSError):
+    return None
+  return created
@@ -63,13 +63,14 @@ function find_disk_usage() {
   print_status "Analyzing disk usage... "
   #  grep maximum-disk-used /tmp/custom-image-*/logs/startup-script.log
   grep -H '^[^\+].*Cust.*ript' /tmp/custom-image-*${timestamp}*/logs/workflow.log
-  echo '# DP_IMG_VER       RECOMMENDED_DISK_SIZE   DSK_SZ  D_USED   D_FREE  D%F     PURPOSE'
+  echo '# DP_IMG_VER       RECOMMENDED_DISK_SIZE   PEAK_USED   PURPOSE'
 # workflow_log=/tmp/custom-image-dataproc-2-0-deb10-20250424-232955-tf-20250425-230559/logs/workflow.log
+  local -a startup_logs=()
   for workflow_log in $(grep -Hl "Customization script" /tmp/custom-image-*/logs/workflow.log) ; do
-    startup_log="${workflow_log/workflow/startup-script}"
-    grep -v '^\['  "${startup_log}" \
-      | grep -A20 'Filesystem.*Avail' | tail -20 \
-      | perl examples/secure-boot/genline.pl "${startup_log}"
+    startup_logs+=("${workflow_log/workflow/startup-script}")
   done
+  if [[ ${#startup_logs[@]} -gt 0 ]]; then
+    python3 -m custom_image_utils.disk_sizer "${startup_logs[@]}"
+  fi
   report_result "Done"
 }
@@ -0,0 +1,58 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Smoke check: verifies the Dataproc services of the test cluster are healthy.
+
+Runs on the master node, as the driver of a PySpark job. Fails if one of
+the core services is not active, or if any Hadoop, Hive, Spark or Dataproc
+unit failed.
+"""
+
+import subprocess
+import sys
+
+_REQUIRED_SERVICES = [
+    "hadoop-hdfs-namenode",
+    "hadoop-yarn-resourcemanager",
+    "hive-metastore",
+]
+_CHECKED_PREFIXES = ("hadoop-", "hive-", "spark-", "google-dataproc")
+
+
+def _is_active(service):
+  return subprocess.call(["systemctl", "is-active", "--quiet", service]) == 0
+
+
+def _failed_units():
+  output = subprocess.check_output(
+      ["systemctl", "list-units", "--state=failed", "--no-legend",
+       "--plain"]).decode("utf-8")
+  units = [line.split()[0] for line in output.splitlines() if line.strip()]
+  return [unit for unit in units if unit.startswith(_CHECKED_PREFIXES)]
+
+
+def main():
+  errors = ["{} is not active".format(service)
+            for service in _REQUIRED_SERVICES if not _is_active(service)]
+  errors += ["{} failed".format(unit) for unit in _failed_units()]
+  for error in errors:
+    print(error)
+  if errors:
+    return 1
+  print("Component health check passed.")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
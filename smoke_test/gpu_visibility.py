@@ -0,0 +1,50 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Smoke check: verifies GPUs are visible on the test cluster.
+
+Runs `nvidia-smi -L` on the driver and in an executor task.
+"""
+
+import subprocess
+import sys
+
+from pyspark.sql import SparkSession
+
+
+def _list_gpus(_=None):
+  try:
+    output = subprocess.check_output(["nvidia-smi", "-L"]).decode("utf-8")
+  except (OSError, subprocess.CalledProcessError) as e:
+    return ["error: {}".format(e)]
+  return [line for line in output.splitlines() if line.startswith("GPU")]
+
+
+def main():
+  spark = SparkSession.builder.appName("smoke-test-gpu").getOrCreate()
+  driver_gpus = _list_gpus()
+  executor_gpus = spark.sparkContext.parallelize([0], 1).flatMap(
+      _list_gpus).collect()
+  spark.stop()
+  print("Driver: {}".format(driver_gpus))
+  print("Executor: {}".format(executor_gpus))
+  for gpus in (driver_gpus, executor_gpus):
+    if not gpus or any(gpu.startswith("error") for gpu in gpus):
+      return 1
+  print("GPU visibility check passed.")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
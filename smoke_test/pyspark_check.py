@@ -0,0 +1,36 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Smoke check: runs a small PySpark job on the test cluster.
+"""
+
+import sys
+
+from pyspark.sql import SparkSession
+
+
+def main():
+  spark = SparkSession.builder.appName("smoke-test-pyspark").getOrCreate()
+  count = spark.sparkContext.parallelize(range(1000), 10).map(
+      lambda x: x * x).filter(lambda x: x % 2 == 0).count()
+  spark.stop()
+  if count != 500:
+    print("Unexpected count: {}".format(count))
+    return 1
+  print("PySpark check passed.")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -22,8 +22,14 @@
 # 1. Download user's custom init action script from cloud Storage bucket.
 # 2. Run the custom init action script.
 # 3. Check for init action script output, and print success or failure
-#    message.
-# 4. Shutdown GCE instance.
+#    message. On success, slim the image first if requested.
+# 4. Publish the result as guest attributes, so that the workflow stops the
+#    instance as soon as it is known.
+# 5. Shutdown GCE instance, if the workflow did not stop it.
+#
+# run.sh runs again when a preempted spot VM is started again. The steps
+# completed before the preemption, recorded in STATE_DIR on the boot disk,
+# are then skipped.
 
 set -x
 
@@ -42,8 +48,22 @@ echo "startup-script: DEBUG: Starting startup_script/run.sh"
 
 # get custom-sources-path
 CUSTOM_SOURCES_PATH=$(/usr/share/google/get_metadata_value attributes/custom-sources-path)
+# get the manifest of content-addressed sources, if any
+CUSTOM_SOURCES_MANIFEST=$(/usr/share/google/get_metadata_value attributes/custom-sources-manifest || echo "")
 # get time to wait for stdout to flush
 SHUTDOWN_TIMER_IN_SEC=$(/usr/share/google/get_metadata_value attributes/shutdown-timer-in-sec)
+# get the steps of the pre-capture slimming stage, dot separated, if any
+IMAGE_SLIMMING_STEPS=$(/usr/share/google/get_metadata_value attributes/image-slimming-steps | tr '.' ' ' || echo "")
+# guest attributes namespace read by custom_image_utils/serial_port_follower.py
+readonly GUEST_ATTRIBUTES_NAMESPACE="custom-image"
+# Progress of the build, removed before the disk is captured.
+readonly STATE_DIR="/var/lib/dataproc-custom-image"
+# gs:// URI the xtrace of the customization script is uploaded to when it
+# is profiled, read by custom_image_utils/customization_profiler.py.
+CUSTOMIZATION_PROFILE_URI=$(/usr/share/google/get_metadata_value attributes/customization-profile-uri || echo "")
+readonly CUSTOMIZATION_TRACE="${PWD}/customization.xtrace"
+# gs:// URI the telemetry of the VM during the customization is uploaded to.
+VM_TELEMETRY_URI=$(/usr/share/google/get_metadata_value attributes/vm-telemetry-uri || echo "")
 
 USER_DATAPROC_COMPONENTS=$( /usr/share/google/get_metadata_value attributes/optional-components | tr '[:upper:]' '[:lower:]' | tr '.' ' ' || echo "")
 DATAPROC_IMAGE_VERSION=$(/usr/share/google/get_metadata_value attributes/dataproc_dataproc_version | cut -c1-3 | tr '-' '.' || echo "")
@@ -90,7 +110,84 @@ function wait_until_ready() {
   fi
 }
 
+# Number of sources downloaded concurrently.
+MAX_PARALLEL_DOWNLOADS=8
+# Objects larger than this are downloaded in concurrent slices.
+SLICED_DOWNLOAD_THRESHOLD=150M
+SLICED_DOWNLOAD_MAX_COMPONENTS=8
+
+function print_throughput() {
+  local -r label="$1" size="$2" start="$3" end="$4"
+  awk -v label="${label}" -v size="${size}" -v start="${start}" -v end="${end}" 'BEGIN {
+    elapsed = end - start
+    if (elapsed <= 0) elapsed = 0.001
+    printf("startup-script: INFO: downloaded %s: %d bytes in %.2fs, %.2f MiB/s\n",
+           label, size, elapsed, size / elapsed / 1048576)
+  }'
+}
+
+function download_source() {
+  local -r name="$1" sha256="$2" size="$3" uri="$4"
+  local -a cp_cmd=(gcloud storage cp)
+  if [[ "${gsutil_cmd}" == "gsutil" ]]; then
+    cp_cmd=(gsutil
+      -o "GSUtil:sliced_object_download_threshold=${SLICED_DOWNLOAD_THRESHOLD}"
+      -o "GSUtil:sliced_object_download_max_components=${SLICED_DOWNLOAD_MAX_COMPONENTS}"
+      cp)
+  fi
+  local start end
+  start=$(date +%s.%N)
+  mkdir -p "$(dirname "./${name}")"
+  if ! "${cp_cmd[@]}" "${uri}" "./${name}" < /dev/null; then
+    echo "startup-script: ERROR: failed to download ${uri} to ./${name}"
+    return 1
+  fi
+  end=$(date +%s.%N)
+  if [[ "$(sha256sum "./${name}" | cut -d' ' -f1)" != "${sha256}" ]]; then
+    echo "startup-script: ERROR: checksum mismatch for ./${name}, expected sha256 ${sha256}"
+    return 1
+  fi
+  print_throughput "${name}" "${size}" "${start}" "${end}"
+}
+
+function download_sources_from_manifest() {
+  # Each manifest line is: name, sha256, size and gs:// URI, tab separated.
+  echo "startup-script: DEBUG: Downloading sources listed in ${CUSTOM_SOURCES_MANIFEST}"
+  ${gsutil_cp_cmd} "${CUSTOM_SOURCES_MANIFEST}" ./sources.manifest || return 1
+
+  export CLOUDSDK_STORAGE_SLICED_OBJECT_DOWNLOAD_THRESHOLD="${SLICED_DOWNLOAD_THRESHOLD}"
+  export CLOUDSDK_STORAGE_SLICED_OBJECT_DOWNLOAD_MAX_COMPONENTS="${SLICED_DOWNLOAD_MAX_COMPONENTS}"
+  local failures_dir
+  failures_dir=$(mktemp -d)
+  local start end total_size=0
+  local name sha256 size uri
+  start=$(date +%s.%N)
+  while IFS=$'\t' read -r -u 3 name sha256 size uri; do
+    while (( $(jobs -rp | wc -l) >= MAX_PARALLEL_DOWNLOADS )); do
+      wait -n || true
+    done
+    total_size=$(( total_size + size ))
+    ( download_source "${name}" "${sha256}" "${size}" "${uri}" \
+        || touch "${failures_dir}/${sha256}" ) &
+  done 3< ./sources.manifest
+  wait
+  end=$(date +%s.%N)
+
+  local failures
+  failures=$(ls "${failures_dir}" | wc -l)
+  rm -rf "${failures_dir}"
+  if (( failures > 0 )); then
+    echo "startup-script: ERROR: ${failures} sources failed to download or verify."
+    return 1
+  fi
+  print_throughput "all sources" "${total_size}" "${start}" "${end}"
+}
+
 function download_scripts() {
+  if [[ -n "${CUSTOM_SOURCES_MANIFEST}" ]]; then
+    download_sources_from_manifest
+    return
+  fi
   echo "startup-script: DEBUG: Attempting to download scripts from ${CUSTOM_SOURCES_PATH}"
   ${gsutil_cp_cmd} -r "${CUSTOM_SOURCES_PATH}/*" ./
   echo "startup-script: DEBUG: gsutil exit code: $?"
@@ -112,22 +209,207 @@ function setup_proxy() {
   return 0
 }
 
+# Publishes the build result as guest attributes, once the startup script
+# output is flushed. GCE_METADATA_HOST points to a fake metadata server in
+# tests. Publishing fails harmlessly when guest attributes are disabled.
+function publish_result() {
+  local -r status="$1"
+  local -r url="http://${GCE_METADATA_HOST:-metadata.google.internal}/computeMetadata/v1/instance/guest-attributes/${GUEST_ATTRIBUTES_NAMESPACE}"
+  sync
+  curl -sf -X PUT -H "Metadata-Flavor: Google" --data "${status}" \
+      "${url}/status" &&
+    curl -sf -X PUT -H "Metadata-Flavor: Google" --data "$(date +%s)" \
+      "${url}/log-flushed"
+}
+
 function run_custom_script() {
   # run init actions
   echo "startup-script: DEBUG: Running init_actions.sh"
+  if [[ -n "${CUSTOMIZATION_PROFILE_URI}" ]]; then
+    run_profiled_custom_script
+    return $?
+  fi
   bash -x ./init_actions.sh
 
   # return code
   return $?
 }
 
+# Runs init_actions.sh with a timestamp on each xtrace line, written to
+# CUSTOMIZATION_TRACE instead of the log, then uploads the trace.
+function run_profiled_custom_script() {
+  # EPOCHREALTIME is only available from bash 5.0.
+  local clock='${EPOCHREALTIME}'
+  if [[ -z "${EPOCHREALTIME:-}" ]]; then
+    clock='$(date +%s.%N)'
+  fi
+  local -r prelude="$(mktemp)"
+  # Sourced by the shell of the customization script before its first
+  # command, and not by the shells it starts.
+  cat > "${prelude}" <<'PRELUDE'
+unset BASH_ENV
+exec {__custom_image_trace_fd}>>"${CUSTOMIZATION_TRACE}"
+BASH_XTRACEFD=${__custom_image_trace_fd}
+PS4=$'+\t'"${CUSTOMIZATION_TRACE_CLOCK}"$'\t${BASH_SOURCE[0]##*/}:${LINENO}\t${FUNCNAME[*]:-}\t'
+unset CUSTOMIZATION_TRACE_CLOCK
+set -x
+PRELUDE
+  : > "${CUSTOMIZATION_TRACE}"
+  CUSTOMIZATION_TRACE="${CUSTOMIZATION_TRACE}" \
+    CUSTOMIZATION_TRACE_CLOCK="${clock}" BASH_ENV="${prelude}" \
+    bash ./init_actions.sh
+  local -r ret_code=$?
+  # Ends the last command of the trace.
+  printf '+\t%s\trun.sh:0\t\t# end\n' "$(date +%s.%N)" >> "${CUSTOMIZATION_TRACE}"
+  rm -f "${prelude}"
+  echo "startup-script: INFO: uploading the customization trace to ${CUSTOMIZATION_PROFILE_URI}"
+  ${gsutil_cp_cmd} "${CUSTOMIZATION_TRACE}" "${CUSTOMIZATION_PROFILE_URI}" ||
+    echo "startup-script: WARNING: failed to upload the customization trace."
+  return ${ret_code}
+}
+
 function cleanup() {
   # .config and .gsutil dirs are created by the gsutil command. It contains
   # transient authentication keys to access gcs bucket. The init_actions.sh and
   # run.sh are your customization and bootstrap scripts (this) which must be
   # removed after creating the image
   rm -rf ~/.config/ ~/.gsutil/
-  rm ./init_actions.sh ./run.sh
+  rm -f ./init_actions.sh ./run.sh ./sources.manifest "${CUSTOMIZATION_TRACE}"
+}
+
+function used_space_bytes() {
+  df -B1 --output=used / | tail -n1 | tr -d ' '
+}
+
+# Seconds between samples of the VM telemetry during the customization.
+TELEMETRY_SAMPLE_SEC=5
+# Raw counters of the VM, one line per sample, read by
+# custom_image_utils/vm_telemetry.py. Kept on the boot disk, so that the
+# samples of a build preempted on a spot VM are kept across the restart.
+readonly TELEMETRY_FILE="${STATE_DIR}/vm-telemetry.csv"
+readonly TELEMETRY_COLUMNS="time,cpu_busy_jiffies,cpu_iowait_jiffies,cpu_total_jiffies,mem_total_kb,mem_available_kb,swap_total_kb,swap_free_kb,disk_reads,disk_writes,disk_read_bytes,disk_write_bytes,disk_busy_ms,net_rx_bytes,net_tx_bytes,disk_used_bytes"
+
+# Appends the cumulative CPU, memory, disk and network counters of the VM,
+# and the used space, to TELEMETRY_FILE.
+function sample_telemetry() {
+  awk -v now="${EPOCHREALTIME:-$(date +%s.%N)}" -v used="$(used_space_bytes)" '
+    FILENAME == "/proc/stat" && $1 == "cpu" {
+      # user nice system idle iowait irq softirq steal, guest is in user.
+      for (i = 2; i <= 9; i++) total += $i
+      idle = $5; iowait = $6
+    }
+    FILENAME == "/proc/meminfo" { mem[$1] = $2 }
+    FILENAME == "/proc/diskstats" &&
+        $3 ~ /^(sd[a-z]+|vd[a-z]+|xvd[a-z]+|nvme[0-9]+n[0-9]+)$/ {
+      reads += $4; read_sectors += $6; writes += $8; write_sectors += $10
+      busy_ms += $13
+    }
+    FILENAME == "/proc/net/dev" && /:/ {
+      sub(/^[ \t]+/, ""); split($0, f, /[: \t]+/)
+      if (f[1] != "lo") { rx += f[2]; tx += f[10] }
+    }
+    END {
+      printf "%s,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%.0f,%s\n",
+          now, total - idle - iowait, iowait, total,
+          mem["MemTotal:"], mem["MemAvailable:"], mem["SwapTotal:"], mem["SwapFree:"],
+          reads, writes, read_sectors * 512, write_sectors * 512, busy_ms,
+          rx, tx, used
+    }' /proc/stat /proc/meminfo /proc/diskstats /proc/net/dev >> "${TELEMETRY_FILE}"
+}
+
+function start_telemetry_sampler() {
+  if [[ ! -s "${TELEMETRY_FILE}" ]]; then
+    echo "${TELEMETRY_COLUMNS}" > "${TELEMETRY_FILE}"
+  fi
+  # Counters restart from 0 on every boot.
+  echo "# boot=${BOOT_COUNT} cpus=$(nproc) interval-sec=${TELEMETRY_SAMPLE_SEC}" >> "${TELEMETRY_FILE}"
+  (
+    set +x
+    while true; do
+      sample_telemetry
+      sleep "${TELEMETRY_SAMPLE_SEC}"
+    done
+  ) &
+  telemetry_sampler_pid=$!
+}
+
+# Prints the peak used space, read by custom_image_utils/disk_sizer.py to
+# recommend --disk-size, and uploads the telemetry.
+function stop_telemetry_sampler() {
+  kill "${telemetry_sampler_pid}"
+  wait "${telemetry_sampler_pid}" 2>/dev/null
+  sample_telemetry
+  local peak disk_size
+  peak=$(awk -F, '/^[0-9]/ && $NF > peak { peak = $NF } END { printf "%.0f", peak }' "${TELEMETRY_FILE}")
+  disk_size=$(df -B1 --output=size / | tail -n1 | tr -d ' ')
+  echo "startup-script: INFO: maximum-disk-used-bytes: ${peak} disk-size-bytes: ${disk_size}"
+  if [[ -n "${VM_TELEMETRY_URI}" ]]; then
+    ${gsutil_cp_cmd} "${TELEMETRY_FILE}" "${VM_TELEMETRY_URI}" ||
+      echo "startup-script: WARNING: failed to upload the VM telemetry."
+  fi
+}
+
+function slim_caches() {
+  if command -v apt-get >/dev/null; then
+    apt-get clean
+  fi
+  if command -v dnf >/dev/null; then
+    dnf clean all
+  fi
+  local conda_bin
+  conda_bin=$(command -v conda || ls /opt/conda/*/bin/conda 2>/dev/null | head -n1)
+  if [[ -n "${conda_bin}" ]]; then
+    "${conda_bin}" clean --all --yes
+  fi
+  rm -rf /root/.cache/pip /home/*/.cache/pip
+}
+
+function slim_logs() {
+  if command -v journalctl >/dev/null; then
+    journalctl --rotate
+    journalctl --vacuum-time=1s
+  fi
+  # Rotated logs are removed, current ones emptied. The journal is left to
+  # journald.
+  find /var/log -path /var/log/journal -prune -o -type f \
+      \( -name '*.gz' -o -name '*.[0-9]' -o -name '*.old' \) -print0 |
+    xargs -0 -r rm -f
+  find /var/log -path /var/log/journal -prune -o -type f -print0 |
+    xargs -0 -r truncate -s 0
+}
+
+function slim_zero() {
+  # dd stops with an error once the disk is full, which is expected.
+  local -r zero_file="/zero.fill"
+  dd if=/dev/zero of="${zero_file}" bs=1M status=none || true
+  sync
+  rm -f "${zero_file}"
+  sync
+}
+
+function slim_trim() {
+  fstrim -av
+}
+
+# Shrinks the disk before it is captured, running the requested steps in a
+# fixed order. A failed step does not fail the build.
+function slim_image() {
+  if [[ -z "${IMAGE_SLIMMING_STEPS}" ]]; then
+    return 0
+  fi
+  local before after step
+  before=$(used_space_bytes)
+  echo "startup-script: INFO: image slimming: ${IMAGE_SLIMMING_STEPS}, used space before: $((before / 1048576)) MiB"
+  for step in caches logs zero trim; do
+    if [[ " ${IMAGE_SLIMMING_STEPS} " != *" ${step} "* ]]; then
+      continue
+    fi
+    if ! "slim_${step}"; then
+      echo "startup-script: WARNING: image slimming step ${step} failed, continuing."
+    fi
+  done
+  after=$(used_space_bytes)
+  echo "startup-script: INFO: image slimming: used space after: $((after / 1048576)) MiB, freed $(((before - after) / 1048576)) MiB"
 }
 
 function repair_boto() {
@@ -221,6 +503,10 @@ function run_install_optional_components_script() {
   if ! is_version_at_least "2.3" || [[ -z "$USER_DATAPROC_COMPONENTS" ]]; then
     return
   fi
+  if [[ -f "${STATE_DIR}/components-installed" ]]; then
+    echo "startup-script: INFO: optional components already installed before the restart."
+    return
+  fi
 
   (
     export BDUTIL_DIR="/usr/local/share/google/dataproc/bdutil"
@@ -248,12 +534,37 @@ function run_install_optional_components_script() {
     echo "startup-script: BuildFailed: Dataproc optional component installation Failed. Please check logs."
     exit ${RET_CODE}
   fi
+  touch "${STATE_DIR}/components-installed"
+}
+
+# Counts the boots of the build VM, more than one after a preemption.
+function record_boot() {
+  mkdir -p "${STATE_DIR}"
+  BOOT_COUNT=$(( $(cat "${STATE_DIR}/boots" 2>/dev/null || echo 0) + 1 ))
+  echo "${BOOT_COUNT}" > "${STATE_DIR}/boots"
+  if (( BOOT_COUNT > 1 )); then
+    echo "startup-script: INFO: build VM restarted (boot ${BOOT_COUNT}), resuming the build."
+  fi
 }
 
 function main() {
+  # Failures exit early, after printing BuildFailed.
+  trap '[[ "${BUILD_STATUS}" == "failed" ]] && publish_result failed' EXIT
   wait_until_ready
 
-  if [[ "${ready}" == "true" ]]; then
+  record_boot
+
+  if [[ "${ready}" == "true" ]] && [[ -f "${STATE_DIR}/customized" ]]; then
+    echo "startup-script: INFO: customization completed before the restart."
+    slim_image
+    rm -rf "${STATE_DIR}"
+    BUILD_STATUS="succeeded"
+    echo "startup-script: BuildSucceeded: Customization complete."
+    publish_result succeeded
+  elif [[ "${ready}" == "true" ]]; then
+    if [[ -f "${STATE_DIR}/customizing" ]]; then
+      echo "startup-script: WARNING: the customization script was interrupted, running it again."
+    fi
     if ! download_scripts; then
       BUILD_STATUS="failed"
       echo "startup-script: BuildFailed: failed to download scripts from ${CUSTOM_SOURCES_PATH}."
@@ -265,23 +576,36 @@ function main() {
       exit 1
     fi
 
+    start_telemetry_sampler
     run_install_optional_components_script
+    touch "${STATE_DIR}/customizing"
     run_custom_script
     local script_ret_code=$?
+    stop_telemetry_sampler
 
     patch_bdutil_universe
     cleanup
+    if [[ ${script_ret_code} -eq 0 ]]; then
+      touch "${STATE_DIR}/customized"
+    fi
 
     if [[ ${script_ret_code} -ne 0 ]]; then
       BUILD_STATUS="failed"
       echo "startup-script: BuildFailed: Customization failed."
       exit 1
     else
+      # Before the result is reported, the workflow stops the instance once
+      # it reads it.
+      slim_image
+      rm -rf "${STATE_DIR}"
       BUILD_STATUS="succeeded"
       echo "startup-script: BuildSucceeded: Customization complete."
+      publish_result succeeded
     fi
   fi
 
+  # The workflow stops the instance once it read the result, the sleep only
+  # lets stdout flush when it is not there to do so.
   echo "startup-script: Sleep ${SHUTDOWN_TIMER_IN_SEC}s before shutting down..."
   echo "You can change the timeout value with --shutdown-instance-timer-sec"
   sleep "${SHUTDOWN_TIMER_IN_SEC}" # wait for stdout to flush
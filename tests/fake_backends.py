@@ -0,0 +1,29 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Fake cloud backends shared by the tests."""
+
+from custom_image_utils import cloud_backend
+
+
+class FakeLogBackend(cloud_backend.CloudBackend):
+  """Serves the logs uploaded by the build VM from a {gcs_uri: content}."""
+
+  def __init__(self, objects):
+    self.objects = objects
+
+  def download_file(self, gcs_uri, local_path):
+    if gcs_uri not in self.objects:
+      raise cloud_backend.CloudApiError("No URLs matched", status=404)
+    with open(local_path, "w") as f:
+      f.write(self.objects[gcs_uri])
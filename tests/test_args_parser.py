@@ -14,6 +14,8 @@
 
 import unittest
 import argparse
+import io
+from unittest import mock
 from custom_image_utils import args_parser
 
 
@@ -24,6 +26,60 @@ class TestArgsParser(unittest.TestCase):
     with self.assertRaises(SystemExit) as e:
       args_parser.parse_args([])
 
+  def test_help(self):
+    """Verifies the help of every argument can be printed."""
+    with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+      with self.assertRaises(SystemExit) as e:
+        args_parser.parse_args(['--help'])
+
+    self.assertEqual(e.exception.code, 0)
+    self.assertIn('15% headroom', stdout.getvalue())
+    for flag in ('--manifest', '--max-concurrent-builds',
+                 '--max-builds-per-zone', '--max-builds-per-project'):
+      self.assertIn(flag, stdout.getvalue())
+
+  def test_batch_args(self):
+    """Verifies batch arguments are split from the per-image arguments."""
+    batch_args, remaining_args = args_parser.parse_batch_args(
+        ['--manifest', 'images.json', '--max-builds-per-zone', '2',
+         '--zone', 'us-west1-a'])
+
+    self.assertEqual(batch_args.manifest, 'images.json')
+    self.assertEqual(batch_args.max_concurrent_builds, 4)
+    self.assertEqual(batch_args.max_builds_per_zone, 2)
+    self.assertEqual(remaining_args, ['--zone', 'us-west1-a'])
+
+  def test_slim_image(self):
+    """Verifies slimming steps default when omitted and are validated."""
+    required = ['--image-name', 'img', '--dataproc-version', '2.2.0-debian12',
+                '--customization-script', '/tmp/my-script.sh',
+                '--zone', 'us-west1-a', '--gcs-bucket', 'gs://my-bucket']
+
+    self.assertEqual(
+        args_parser.parse_args(required + ['--slim-image']).slim_image,
+        'caches,logs,trim')
+    self.assertEqual(
+        args_parser.parse_args(required + ['--slim-image', 'zero']).slim_image,
+        'zero')
+    with self.assertRaises(SystemExit):
+      args_parser.parse_args(required + ['--slim-image', 'caches,disk'])
+
+  def test_zones(self):
+    """Verifies --zone is the first candidate and zones share its region."""
+    required = ['--image-name', 'img', '--dataproc-version', '2.2.0-debian12',
+                '--customization-script', '/tmp/my-script.sh',
+                '--zone', 'us-west1-a', '--gcs-bucket', 'gs://my-bucket']
+
+    self.assertEqual(
+        args_parser.parse_args(
+            required + ['--zones', 'us-west1-b,us-west1-a']).zones,
+        ['us-west1-a', 'us-west1-b'])
+    for invalid_args in (['--zones', 'us-east1-b'],
+                         ['--zones', 'us-west1-b',
+                          '--zone-strategy', 'parallel']):
+      with self.assertRaises(SystemExit):
+        args_parser.parse_args(required + invalid_args)
+
   def test_minimal_required_args(self):
     """Verifies it succeeds if all required args are present."""
     customization_script = '/tmp/my-script.sh'
@@ -62,7 +118,19 @@ class TestArgsParser(unittest.TestCase):
         zone=zone,
         metadata=None,
         trusted_cert='tls/db.der',
-        optional_components=None
+        optional_components=None,
+        universe_domain='googleapis.com',
+        api_backend='gcloud',
+        refresh_image_cache=False,
+        image_cache_ttl_sec=3600,
+        workflow_engine='bash',
+        resume=None,
+        reuse_base_disk_snapshot=False, on_matching_image='build',
+        customization_layers=None, slim_image=None, auto_disk_size=False,
+        smoke_test_mode='workflow', smoke_test_checks=None,
+        api_rate_limits=None, shared_rate_limits=False,
+        zones=None, zone_strategy='ranked', on_insufficient_quota='fail',
+        provisioning_model='standard', profile_customization=False
     )
     self.assertEqual(args, expected_result)
 
@@ -137,7 +205,19 @@ class TestArgsParser(unittest.TestCase):
         subnetwork=subnetwork,
         zone=zone,
         trusted_cert='tls/db.der',
-        optional_components=None
+        optional_components=None,
+        universe_domain='googleapis.com',
+        api_backend='gcloud',
+        refresh_image_cache=False,
+        image_cache_ttl_sec=3600,
+        workflow_engine='bash',
+        resume=None,
+        reuse_base_disk_snapshot=False, on_matching_image='build',
+        customization_layers=None, slim_image=None, auto_disk_size=False,
+        smoke_test_mode='workflow', smoke_test_checks=None,
+        api_rate_limits=None, shared_rate_limits=False,
+        zones=None, zone_strategy='ranked', on_insufficient_quota='fail',
+        provisioning_model='standard', profile_customization=False
     )
     self.assertEqual(args, expected_result)
 
@@ -182,7 +262,19 @@ class TestArgsParser(unittest.TestCase):
           zone=zone,
           metadata=None,
           trusted_cert='tls/db.der',
-          optional_components=None
+          optional_components=None,
+          universe_domain='googleapis.com',
+          api_backend='gcloud',
+          refresh_image_cache=False,
+          image_cache_ttl_sec=3600,
+          workflow_engine='bash',
+          resume=None,
+          reuse_base_disk_snapshot=False, on_matching_image='build',
+        customization_layers=None, slim_image=None, auto_disk_size=False,
+        smoke_test_mode='workflow', smoke_test_checks=None,
+        api_rate_limits=None, shared_rate_limits=False,
+        zones=None, zone_strategy='ranked', on_insufficient_quota='fail',
+        provisioning_model='standard', profile_customization=False
     )
 
     def _args_exception(dataproc_version):
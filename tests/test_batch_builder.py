@@ -0,0 +1,217 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import collections
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from custom_image_utils import batch_builder
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CUSTOMIZATION_SCRIPT = os.path.join(_REPO_DIR, "examples",
+                                     "customization_script.sh")
+
+# Answers the gcloud calls made before a dry-run build and logs each call.
+_FAKE_GCLOUD = """#!/bin/bash
+echo "$*" >> "{calls_log}"
+case "$*" in
+  "config get-value project") echo fake-project ;;
+  *"images list"*)
+    echo '[{{"name": "dataproc-2-2-deb12-20240101-000000-rc01",
+            "labels": {{"goog-dataproc-version": "2-2-5-debian12"}}}},
+           {{"name": "dataproc-2-2-rocky9-20240101-000000-rc01",
+            "labels": {{"goog-dataproc-version": "2-2-5-rocky9"}}}}]' ;;
+  *"images describe"*)
+    echo "ERROR: (gcloud.compute.images.describe) The resource was not found" >&2
+    exit 1 ;;
+esac
+"""
+
+
+def _entry(name, zone="us-central1-a", project="p"):
+  entry = batch_builder.BuildEntry(0, [])
+  entry.args = argparse.Namespace(image_name=name, zone=zone,
+                                  project_id=project)
+  return entry
+
+
+class TestScheduler(unittest.TestCase):
+
+  def _run(self, entries, scheduler):
+    lock = threading.Lock()
+    running = collections.Counter()
+    peaks = collections.Counter()
+
+    def build(entry):
+      with lock:
+        for key in ("all", entry.zone, entry.project):
+          running[key] += 1
+          peaks[key] = max(peaks[key], running[key])
+      time.sleep(0.05)
+      with lock:
+        for key in ("all", entry.zone, entry.project):
+          running[key] -= 1
+
+    scheduler.run(entries, build)
+    return peaks
+
+  def test_global_limit(self):
+    """Verifies no more than max_concurrent builds run at once."""
+    entries = [_entry("image-{}".format(i)) for i in range(6)]
+
+    peaks = self._run(entries, batch_builder.Scheduler(max_concurrent=2))
+
+    self.assertEqual(peaks["all"], 2)
+    self.assertTrue(all(e.status == batch_builder.SUCCEEDED for e in entries))
+
+  def test_zone_and_project_limits(self):
+    """Verifies per-zone and per-project limits are honored."""
+    entries = ([_entry("a-{}".format(i), zone="zone-a") for i in range(3)] +
+               [_entry("b-{}".format(i), zone="zone-b", project="q")
+                for i in range(3)])
+
+    peaks = self._run(entries, batch_builder.Scheduler(
+        max_concurrent=10, max_per_zone=1, max_per_project=1))
+
+    self.assertEqual(peaks["zone-a"], 1)
+    self.assertEqual(peaks["zone-b"], 1)
+    # zone-b builds are not held up behind queued zone-a builds.
+    self.assertEqual(peaks["all"], 2)
+
+  def test_zone_slot_released_after_placement(self):
+    """Verifies the zone slot taken is released when --zones moves the VM."""
+    entries = [_entry("a-{}".format(i), zone="zone-a") for i in range(3)]
+    scheduler = batch_builder.Scheduler(max_concurrent=10, max_per_zone=1)
+
+    def build(entry):
+      entry.args.zone = "zone-b"
+
+    scheduler.run(entries, build)
+
+    self.assertTrue(all(e.status == batch_builder.SUCCEEDED for e in entries))
+    self.assertEqual(scheduler.peak_concurrent, 1)
+    self.assertEqual(set(scheduler._zones.values()), {0})  # pylint: disable=protected-access
+
+  def test_failures_are_recorded(self):
+    """Verifies a failing build does not stop the others."""
+    entries = [_entry("ok"), _entry("broken")]
+
+    def build(entry):
+      if entry.name == "broken":
+        raise RuntimeError("Error building custom image.")
+
+    batch_builder.Scheduler(max_concurrent=1).run(entries, build)
+
+    self.assertEqual(entries[0].status, batch_builder.SUCCEEDED)
+    self.assertEqual(entries[1].status, batch_builder.FAILED)
+    self.assertIn("broken", batch_builder.format_summary(entries))
+    self.assertIn("1 of 2 images built successfully",
+                  batch_builder.format_summary(entries))
+
+
+class TestBatchRun(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.calls_log = os.path.join(self.temp_dir, "calls.log")
+    gcloud = os.path.join(self.temp_dir, "gcloud")
+    with open(gcloud, "w") as f:
+      f.write(_FAKE_GCLOUD.format(calls_log=self.calls_log))
+    os.chmod(gcloud, os.stat(gcloud).st_mode | stat.S_IEXEC)
+    path = self.temp_dir + os.pathsep + os.environ["PATH"]
+    self.env = mock.patch.dict(os.environ, {"PATH": path})
+    self.env.start()
+
+  def tearDown(self):
+    self.env.stop()
+    shutil.rmtree(self.temp_dir)
+
+  def _write_manifest(self, manifest):
+    path = os.path.join(self.temp_dir, "manifest.json")
+    with open(path, "w") as f:
+      json.dump(manifest, f)
+    return path
+
+  def test_dry_run_manifest_deduplicates_lookups(self):
+    """Verifies shared lookups run once and the limiter is set up once."""
+    manifest = self._write_manifest({
+        "defaults": {
+            "customization-script": _CUSTOMIZATION_SCRIPT,
+            "gcs-bucket": "gs://my-bucket",
+            "trusted-cert": "",
+            "image-cache-ttl-sec": 0,
+            "dry-run": True,
+        },
+        "images": [
+            {"image-name": "deb-a", "dataproc-version": "2.2-debian12"},
+            {"image-name": "deb-b", "dataproc-version": "2.2-debian12"},
+            {"image-name": "deb-c", "dataproc-version": "2.2-debian12"},
+            {"image-name": "rocky", "dataproc-version": "2.2-rocky9"},
+        ],
+    })
+    batch_args = argparse.Namespace(manifest=manifest,
+                                    max_concurrent_builds=2,
+                                    max_builds_per_zone=0,
+                                    max_builds_per_project=0)
+
+    configure = mock.Mock(wraps=batch_builder.rate_limiter.configure)
+    with mock.patch.object(batch_builder.rate_limiter, "configure", configure):
+      succeeded = batch_builder.run(batch_args, ["--zone", "us-central1-a"])
+
+    self.assertTrue(succeeded)
+    # The builds share the limiter, which is not reset by each of them.
+    configure.assert_called_once()
+    with open(self.calls_log) as f:
+      calls = f.read().splitlines()
+    self.assertEqual(sum("config get-value project" in c for c in calls), 1)
+    self.assertEqual(sum("images list" in c for c in calls), 2)
+    self.assertEqual(sum("images describe" in c for c in calls), 4)
+
+  def test_invalid_entry_fails_without_stopping_batch(self):
+    """Verifies entries with invalid arguments are reported as failed."""
+    defaults, images = batch_builder.load_manifest(self._write_manifest(
+        [{"image-name": "no-zone", "customization-script": "s.sh"}]))
+
+    with mock.patch("sys.stderr"):
+      entries = batch_builder.parse_entries(defaults, images, [])
+
+    self.assertEqual(entries[0].status, batch_builder.FAILED)
+
+  def test_to_command_line(self):
+    """Verifies manifest values are converted to flags."""
+    self.assertEqual(
+        batch_builder.to_command_line({
+            "image_name": "img",
+            "no-smoke-test": True,
+            "dry-run": False,
+            "disk-size": 50,
+            "extra-sources": {"a.txt": "/tmp/a.txt"},
+            "customization-layer": ["driver.sh", "cuda.sh"],
+        }),
+        ["--image-name", "img", "--no-smoke-test", "--disk-size", "50",
+         "--extra-sources", '{"a.txt": "/tmp/a.txt"}',
+         "--customization-layer", "driver.sh", "--customization-layer",
+         "cuda.sh"])
+
+
+if __name__ == '__main__':
+  unittest.main()
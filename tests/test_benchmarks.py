@@ -0,0 +1,93 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import fake_gcloud
+from benchmarks import run_benchmark
+
+
+class TestFakeGcloud(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.state = fake_gcloud.State(self.temp_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _run(self, *argv):
+    positionals, flags = fake_gcloud._parse(list(argv))
+    key = fake_gcloud.command_key(positionals)
+    return fake_gcloud.run_command(self.state, key, positionals, flags,
+                                   {"customization_sec": 0})
+
+  def test_image_lifecycle(self):
+    """Verifies created images are seen by later calls."""
+    with self.assertRaises(fake_gcloud.FakeGcloudError):
+      self._run("compute", "images", "describe", "custom", "--project=p")
+
+    self._run("compute", "images", "create", "custom", "--project=p",
+              "--family=f")
+
+    image = json.loads(self._run("compute", "images", "describe", "custom",
+                                 "--project", "p", "--format=json"))
+    self.assertEqual(image["family"], "f")
+
+  def test_base_image_listing(self):
+    """Verifies the listed base image matches the requested version."""
+    images = json.loads(self._run(
+        "compute", "images", "list", "--project", "cloud-dataproc",
+        "--filter", r"labels.goog-dataproc-version ~ ^2-2-\d+-debian12$ AND "
+        "status = READY"))
+
+    self.assertEqual(images[0]["labels"]["goog-dataproc-version"],
+                     "2-2-0-debian12")
+    self.assertTrue(images[0]["name"].startswith("dataproc-2-2-"))
+
+  def test_serial_port_output(self):
+    """Verifies the build result is reported from the requested offset."""
+    self._run("compute", "instances", "create", "vm", "--zone=z")
+
+    output = json.loads(self._run(
+        "compute", "instances", "get-serial-port-output", "vm", "--zone=z",
+        "--start=0", "--format=json"))
+
+    self.assertIn("BuildSucceeded:", output["contents"])
+    self.assertEqual(output["next"], len(output["contents"]))
+
+
+class TestRunBenchmark(unittest.TestCase):
+
+  def test_phase_overheads(self):
+    """Verifies overlapping cloud time is counted once per phase."""
+    calls = [
+        {"latency_start": 1.0, "latency_end": 3.0, "end": 3.0},
+        {"latency_start": 2.0, "latency_end": 4.0, "end": 4.0,
+         "busy_until": 6.0},
+    ]
+    spans = [{"name": "wait", "category": "workflow", "start": 0.0,
+              "end": 10.0, "duration": 10.0}]
+
+    phases = run_benchmark.phase_overheads(spans, calls)
+
+    self.assertEqual(phases[0]["cloud_sec"], 5.0)
+    self.assertEqual(phases[0]["overhead_sec"], 5.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
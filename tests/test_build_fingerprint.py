@@ -0,0 +1,133 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import build_fingerprint
+from custom_image_utils import cloud_backend
+from custom_image_utils import preflight
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeImageBackend(cloud_backend.CloudBackend):
+  """Keeps images in memory."""
+
+  def __init__(self, images=()):
+    self.images = {image["name"]: image for image in images}
+
+  def list_images_by_label(self, project_id, key, value):
+    return [image for image in self.images.values()
+            if image.get("labels", {}).get(key) == value]
+
+  def image_exists(self, project_id, image_name):
+    return image_name in self.images
+
+  def create_image(self, project_id, image):
+    self.images[image["name"]] = image
+    return dict(image, creationTimestamp="2026-01-01T00:00:00.000-07:00")
+
+
+class TestBuildFingerprint(unittest.TestCase):
+
+  def setUp(self):
+    self.cwd = os.getcwd()
+    os.chdir(_REPO_DIR)
+    self.temp_dir = tempfile.mkdtemp()
+    self.script = os.path.join(self.temp_dir, "customize.sh")
+    self._write_script("echo customize")
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree(self.temp_dir)
+    cloud_backend.set_backend(None)
+
+  def _write_script(self, contents):
+    with open(self.script, "w") as f:
+      f.write(contents)
+
+  def _args(self, **kwargs):
+    args = dict(
+        image_name="img", project_id="p", customization_script=self.script,
+        extra_sources={}, dataproc_base_image="projects/p/global/images/base",
+        metadata="key1=value1", optional_components="HIVE,PIG",
+        accelerator=None, disk_size=30, trusted_cert="", family="f",
+        storage_location=None, dry_run=False,
+        on_matching_image=build_fingerprint.ALIAS)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+  def test_fingerprint_depends_on_inputs(self):
+    """Verifies the fingerprint only changes with the build inputs."""
+    fingerprint = build_fingerprint.compute(self._args())
+
+    self.assertEqual(fingerprint, build_fingerprint.compute(
+        self._args(image_name="other", optional_components="PIG,HIVE")))
+    self.assertNotEqual(fingerprint, build_fingerprint.compute(
+        self._args(metadata="key1=value2")))
+    self.assertNotEqual(fingerprint, build_fingerprint.compute(
+        self._args(slim_image="caches,trim")))
+    self._write_script("echo changed")
+    self.assertNotEqual(fingerprint,
+                        build_fingerprint.compute(self._args()))
+    self.assertLessEqual(len(fingerprint), 63)
+
+  def test_alias_matching_image(self):
+    """Verifies a matching image is found and aliased in the family."""
+    args = self._args()
+    fingerprint = build_fingerprint.compute(args)
+    backend = FakeImageBackend([{
+        "name": "nightly-1",
+        "labels": {build_fingerprint.FINGERPRINT_LABEL: fingerprint},
+    }])
+    cloud_backend.set_backend(backend)
+
+    preflight.infer_build_fingerprint(args)
+    preflight.find_matching_image(args)
+    build_fingerprint.use_matching_image(args, args.matching_image,
+                                         output=io.StringIO())
+
+    alias = backend.images["img"]
+    self.assertEqual(alias["sourceImage"],
+                     "projects/p/global/images/nightly-1")
+    self.assertEqual(alias["family"], "f")
+    self.assertEqual(
+        alias["labels"][build_fingerprint.FINGERPRINT_LABEL], fingerprint)
+
+  def test_reuse_existing_image_name(self):
+    """Verifies reusing an image does not fail the existence check."""
+    args = self._args(image_name="nightly-1",
+                      on_matching_image=build_fingerprint.REUSE)
+    preflight.infer_build_fingerprint(args)
+    cloud_backend.set_backend(FakeImageBackend([{
+        "name": "nightly-1",
+        "labels": {build_fingerprint.FINGERPRINT_LABEL:
+                   args.build_fingerprint},
+    }]))
+
+    preflight.find_matching_image(args)
+    preflight.check_image_does_not_exist(args)
+    build_fingerprint.use_matching_image(args, args.matching_image,
+                                         output=io.StringIO())
+
+    self.assertEqual(args.image_name, "nightly-1")
+
+
+if __name__ == '__main__':
+  unittest.main()
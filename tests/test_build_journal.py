@@ -0,0 +1,78 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import build_journal
+from custom_image_utils import cloud_backend
+
+
+class FakeStorageBackend(cloud_backend.CloudBackend):
+  """Keeps uploaded files in memory."""
+
+  def __init__(self):
+    self.objects = {}
+
+  def upload_file(self, local_path, gcs_uri):
+    with open(local_path) as f:
+      self.objects[gcs_uri] = f.read()
+
+  def download_file(self, gcs_uri, local_path):
+    if gcs_uri not in self.objects:
+      raise cloud_backend.NotFoundError(gcs_uri)
+    with open(local_path, "w") as f:
+      f.write(self.objects[gcs_uri])
+
+
+class TestBuildJournal(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.backend = FakeStorageBackend()
+    self.args = argparse.Namespace(image_name="img", project_id="p",
+                                   zone="z")
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _journal(self, name):
+    return build_journal.BuildJournal(
+        os.path.join(self.temp_dir, name, build_journal.JOURNAL_FILE),
+        gcs_uri="gs://bucket/run/journal.jsonl", backend=self.backend)
+
+  def test_resume_from_gcs_copy(self):
+    """Verifies a journal can be resumed from its GCS copy."""
+    journal = self._journal("first")
+    journal.start(self.args)
+    journal.record("create-disk", {"disk": "img-install"})
+
+    resumed = self._journal("second")
+
+    self.assertTrue(resumed.load())
+    resumed.start(self.args)
+    self.assertTrue(resumed.completed("create-disk"))
+    self.assertFalse(resumed.completed("create-instance"))
+    self.assertEqual(resumed.resources("create-disk"), {"disk": "img-install"})
+
+  def test_missing_journal(self):
+    """Verifies load() reports a journal that does not exist."""
+    self.assertFalse(self._journal("missing").load())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,124 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import customization_profiler
+from tests import fake_backends
+
+# As written by run.sh, with a command spanning two lines.
+_TRACE = """\
++\t100.000\tinit_actions.sh:3\tinstall_pkgs main\tapt-get install -y foo
+++\t102.500\tinit_actions.sh:8\thelper install_pkgs main\t/usr/bin/pip install \\
+  bar
++\t103,000\tinit_actions.sh:4\tinstall_pkgs main\tapt-get install -y baz
++\t104.000\tinit_actions.sh:12\t\tFOO=1 echo done
++\t104.250\trun.sh:0\t\t# end
+"""
+
+
+class TestParse(unittest.TestCase):
+
+  def test_parse(self):
+    """Verifies commands are timed until the next one and the end marker."""
+    commands = customization_profiler.parse(io.StringIO(_TRACE))
+
+    self.assertEqual([c.duration for c in commands], [2.5, 0.5, 1.0, 0.25])
+    self.assertEqual(commands[1].depth, 2)
+    self.assertEqual(commands[1].functions, ["install_pkgs", "helper"])
+    self.assertEqual(commands[1].command, "/usr/bin/pip install \\\n  bar")
+    self.assertEqual(commands[1].program, "pip")
+    self.assertEqual(commands[3].program, "echo")
+    self.assertEqual(commands[3].location, "init_actions.sh:12")
+
+  def test_format_report(self):
+    """Verifies the slowest commands and programs come first."""
+    report = customization_profiler.format_report(
+        customization_profiler.parse(io.StringIO(_TRACE)), top=2)
+
+    lines = report.splitlines()
+    self.assertEqual(lines[0], "Customization profile: 4 commands, 4.2s")
+    self.assertIn("init_actions.sh:3", lines[2])
+    self.assertIn("apt-get install -y foo", lines[2])
+    self.assertIn("init_actions.sh:4", lines[3])
+    self.assertEqual(lines[4], "Time by program:")
+    self.assertIn("apt-get", lines[5])
+    self.assertIn("2 calls", lines[5])
+    self.assertEqual(len(lines), 7)
+
+  def test_folded_stacks(self):
+    """Verifies stacks are folded outermost first, in milliseconds."""
+    folded = customization_profiler.folded_stacks(
+        customization_profiler.parse(io.StringIO(_TRACE)))
+
+    self.assertEqual(folded, [
+        "init_actions.sh;echo 250",
+        "init_actions.sh;install_pkgs;apt-get 3500",
+        "init_actions.sh;install_pkgs;helper;pip 500",
+    ])
+
+
+class TestReport(unittest.TestCase):
+
+  def setUp(self):
+    self.log_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.log_dir)
+
+  def _args(self, profile=True):
+    return argparse.Namespace(profile_customization=profile, dry_run=False,
+                              log_dir=self.log_dir,
+                              gcs_log_dir="gs://bucket/run/logs")
+
+  def test_report(self):
+    """Verifies the trace is downloaded and analyzed into the log dir."""
+    backend = fake_backends.FakeLogBackend(
+        {"gs://bucket/run/logs/customization.xtrace": _TRACE})
+    output = io.StringIO()
+
+    customization_profiler.report(self._args(), output, backend)
+
+    self.assertIn("Slowest commands:", output.getvalue())
+    for name in (customization_profiler.TRACE_FILE,
+                 customization_profiler.REPORT_FILE,
+                 customization_profiler.FOLDED_FILE):
+      self.assertTrue(os.path.exists(os.path.join(self.log_dir, name)), name)
+
+  def test_missing_trace_only_warns(self):
+    """Verifies a build without a trace only prints a warning."""
+    output = io.StringIO()
+
+    customization_profiler.report(self._args(), output,
+                                  fake_backends.FakeLogBackend({}))
+
+    self.assertIn("Warning: no customization profile", output.getvalue())
+
+  def test_disabled(self):
+    """Verifies nothing is downloaded without --profile-customization."""
+    output = io.StringIO()
+
+    customization_profiler.report(self._args(profile=False), output,
+                                  fake_backends.FakeLogBackend({}))
+
+    self.assertEqual(output.getvalue(), "")
+
+
+if __name__ == "__main__":
+  unittest.main()
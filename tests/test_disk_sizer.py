@@ -0,0 +1,104 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import disk_sizer
+
+_GIB = 1024 ** 3
+
+
+class TestDiskSizer(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.history = disk_sizer.DiskUsageHistory(cache_dir=self.temp_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _write_log(self, path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      f.write("\n".join(lines) + "\n")
+    return path
+
+  def _args(self, **kwargs):
+    args = dict(
+        image_name="img", dataproc_version="2.2.0-debian12",
+        dataproc_base_image="projects/p/global/images/base",
+        customization_script="/scripts/cuda.sh", disk_size=100,
+        auto_disk_size=True, customization_layers=None, dry_run=False,
+        log_dir=os.path.join(self.temp_dir, "logs"))
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+  def test_read_peak_usage(self):
+    """Verifies the byte marker wins over the legacy KiB marker."""
+    log = self._write_log(os.path.join(self.temp_dir, "a.log"), [
+        "startup-script: maximum-disk-used: 1048576",
+        "startup-script: INFO: maximum-disk-used-bytes: 2048 "
+        "disk-size-bytes: 4096",
+    ])
+    legacy = self._write_log(os.path.join(self.temp_dir, "b.log"), [
+        "startup-script:  maximum-disk-used: 1048576",
+    ])
+
+    self.assertEqual(disk_sizer.read_peak_usage(log), 2048)
+    self.assertEqual(disk_sizer.read_peak_usage(legacy), _GIB)
+    self.assertIsNone(disk_sizer.read_peak_usage(
+        os.path.join(self.temp_dir, "missing.log")))
+
+  def test_recommend_disk_size(self):
+    """Verifies headroom is added and the minimum size is kept."""
+    self.assertEqual(disk_sizer.recommend_disk_size(10 * _GIB), 30)
+    self.assertEqual(disk_sizer.recommend_disk_size(40 * _GIB), 46)
+
+  def test_record_then_apply(self):
+    """Verifies a recorded peak sets the disk size of the next build."""
+    args = self._args()
+    self._write_log(os.path.join(args.log_dir, "startup-script.log"), [
+        "startup-script: INFO: maximum-disk-used-bytes: {} "
+        "disk-size-bytes: 0".format(40 * _GIB)])
+    disk_sizer.record(args, io.StringIO(), history=self.history)
+
+    args = self._args(image_name="img2")
+    disk_sizer.apply(args, io.StringIO(), history=self.history)
+    self.assertEqual(args.disk_size, 46)
+
+    args = self._args(customization_script="/scripts/rapids.sh")
+    disk_sizer.apply(args, io.StringIO(), history=self.history)
+    self.assertEqual(args.disk_size, 100)
+
+  def test_format_case_line(self):
+    """Verifies the case line of a pre-init build log."""
+    log = self._write_log(os.path.join(
+        self.temp_dir,
+        "custom-image-dataproc-2-2-deb12-20250429-193537-tf-20250429-193700",
+        "logs", "startup-script.log"),
+        ["maximum-disk-used-bytes: {}".format(44 * _GIB)])
+
+    self.assertEqual(
+        disk_sizer.format_case_line(log),
+        '  "2.2-debian12" ) disk_size_gb="51" ;; # 44.00G used # '
+        '20250429-193537-tf')
+
+
+if __name__ == '__main__':
+  unittest.main()
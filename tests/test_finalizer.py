@@ -0,0 +1,120 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import finalizer
+
+
+class FakeStorageBackend(cloud_backend.CloudBackend):
+
+  def __init__(self):
+    self.uploads = []
+    self._lock = threading.Lock()
+
+  def upload_file(self, local_path, gcs_uri):
+    with self._lock:
+      self.uploads.append((os.path.basename(local_path), gcs_uri))
+
+
+class FinalizerTest(unittest.TestCase):
+
+  def test_tasks_run_concurrently(self):
+    barrier = threading.Barrier(3, timeout=5)
+    timings = finalizer.run_tasks([(name, barrier.wait)
+                                   for name in ("a", "b", "c")])
+    self.assertEqual(["a", "b", "c"], [t.name for t in timings])
+    self.assertTrue(all(t.error is None for t in timings))
+
+  def test_failed_task_does_not_stop_others(self):
+    ran = []
+
+    def fail():
+      raise RuntimeError("boom")
+
+    timings = finalizer.run_tasks([("fail", fail),
+                                   ("ok", lambda: ran.append("ok"))])
+    self.assertEqual(["ok"], ran)
+    self.assertEqual("boom", str(timings[0].error))
+    self.assertIsNone(timings[1].error)
+
+  def test_task_runs_after_its_prerequisite(self):
+    events = []
+    upload_started = threading.Event()
+
+    def smoke_test():
+      # The upload does not wait on the smoke test.
+      self.assertTrue(upload_started.wait(5))
+      events.append("smoke-test")
+
+    timings = finalizer.run_tasks([
+        ("smoke-test", smoke_test),
+        ("notify", lambda: events.append("notify"), "smoke-test"),
+        ("upload-logs", upload_started.set),
+    ])
+    self.assertEqual(["smoke-test", "notify"], events)
+    self.assertGreaterEqual(timings[1].start, timings[0].end)
+
+  def test_task_skipped_after_failed_prerequisite(self):
+    ran = []
+
+    def fail():
+      raise RuntimeError("boom")
+
+    timings = finalizer.run_tasks([
+        ("smoke-test", fail),
+        ("notify", lambda: ran.append("notify"), "smoke-test"),
+    ])
+    self.assertEqual([], ran)
+    self.assertTrue(timings[1].skipped)
+    self.assertIsNone(timings[1].error)
+    self.assertRegex(finalizer.format_report(timings), r"notify +skipped")
+
+  def test_format_report(self):
+    report = finalizer.format_report([
+        finalizer.TaskTiming("smoke-test", 0.0, 30.0),
+        finalizer.TaskTiming("upload-logs", 0.0, 2.0, error=RuntimeError()),
+    ])
+    self.assertIn("critical path smoke-test  30.000s", report)
+    self.assertIn("sum of tasks  32.000s", report)
+    self.assertRegex(report, r"upload-logs +failed")
+
+  def test_upload_logs(self):
+    log_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, log_dir)
+    for name in ("workflow.log", "startup-script.log"):
+      with open(os.path.join(log_dir, name), "w") as f:
+        f.write(name)
+    os.mkdir(os.path.join(log_dir, "subdir"))
+    backend = FakeStorageBackend()
+    finalizer.upload_logs(log_dir, "gs://bucket/logs", backend)
+    self.assertEqual([
+        ("startup-script.log", "gs://bucket/logs/startup-script.log"),
+        ("workflow.log", "gs://bucket/logs/workflow.log"),
+    ], sorted(backend.uploads))
+
+    backend = FakeStorageBackend()
+    finalizer.upload_logs(log_dir, "gs://bucket/logs", backend,
+                          names=["workflow.log", "missing.log"])
+    self.assertEqual([("workflow.log", "gs://bucket/logs/workflow.log")],
+                     backend.uploads)
+
+
+if __name__ == "__main__":
+  unittest.main()
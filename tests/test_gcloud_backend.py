@@ -0,0 +1,99 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import gcloud_backend
+
+# Fails every command with the error message in $FAKE_GCLOUD_ERROR.
+_FAKE_GCLOUD = """#!/bin/bash
+echo "${FAKE_GCLOUD_ERROR}" >&2
+exit 1
+"""
+
+_NOT_FOUND_ERRORS = {
+    "image_exists": "ERROR: (gcloud.compute.images.describe) Could not "
+                    "fetch resource:\n - The resource 'projects/p/global/"
+                    "images/img' was not found",
+    "object_exists": "ERROR: (gcloud.storage.objects.describe) gs://b/o "
+                     "not found: 404.",
+    "download_file": "ERROR: (gcloud.storage.cp) The following URLs "
+                     "matched no objects or files:\n-gs://b/o",
+}
+_PERMISSION_ERROR = ("ERROR: (gcloud) PERMISSION_DENIED: Required "
+                     "'compute.images.get' permission for 'projects/p'")
+
+
+class TestGcloudBackend(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    gcloud = os.path.join(self.temp_dir, "gcloud")
+    with open(gcloud, "w") as f:
+      f.write(_FAKE_GCLOUD)
+    os.chmod(gcloud, os.stat(gcloud).st_mode | stat.S_IEXEC)
+    path = self.temp_dir + os.pathsep + os.environ["PATH"]
+    self.env = mock.patch.dict(os.environ, {"PATH": path})
+    self.env.start()
+    self.backend = gcloud_backend.GcloudBackend()
+    self.calls = {
+        "image_exists": lambda: self.backend.image_exists("p", "img"),
+        "object_exists": lambda: self.backend.object_exists("gs://b/o"),
+        "download_file": lambda: self.backend.download_file(
+            "gs://b/o", os.path.join(self.temp_dir, "o")),
+        "get_guest_attributes": lambda: self.backend.get_guest_attributes(
+            "p", "us-central1-a", "vm", "dataproc-build"),
+        "describe_snapshot": lambda: self.backend.describe_snapshot(
+            "p", "snapshot"),
+    }
+
+  def tearDown(self):
+    self.env.stop()
+    shutil.rmtree(self.temp_dir)
+
+  def _fail_with(self, message):
+    os.environ["FAKE_GCLOUD_ERROR"] = message
+
+  def test_not_found(self):
+    """Verifies missing resources are reported as not found."""
+    for name in ("image_exists", "object_exists"):
+      self._fail_with(_NOT_FOUND_ERRORS[name])
+      self.assertFalse(self.calls[name](), name)
+    self._fail_with(_NOT_FOUND_ERRORS["download_file"])
+    with self.assertRaises(cloud_backend.NotFoundError):
+      self.calls["download_file"]()
+    self._fail_with(_NOT_FOUND_ERRORS["image_exists"])
+    for name in ("get_guest_attributes", "describe_snapshot"):
+      with self.assertRaises(cloud_backend.NotFoundError):
+        self.calls[name]()
+
+  def test_other_errors_are_raised(self):
+    """Verifies errors other than a missing resource are not hidden."""
+    self._fail_with(_PERMISSION_ERROR)
+    for name, call in self.calls.items():
+      with self.assertRaises(cloud_backend.CloudApiError) as e:
+        call()
+      self.assertNotIsInstance(e.exception, cloud_backend.NotFoundError,
+                               name)
+      self.assertEqual(e.exception.status, 403, name)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,130 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent import futures
+import itertools
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from custom_image_utils import image_cache
+
+
+class TestImageCache(unittest.TestCase):
+
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_dir)
+
+  def test_persists_across_instances(self):
+    """Verifies a value stored by one run is a hit for the next run."""
+    key = ("cloud-dataproc", "filter", "2.2-debian12")
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir)
+    compute = mock.Mock(return_value=["projects/p/global/images/i", "2-2-1"])
+
+    self.assertEqual(cache.get_or_compute(key, compute),
+                     ["projects/p/global/images/i", "2-2-1"])
+    self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir)
+    self.assertEqual(cache.get_or_compute(key, compute),
+                     ["projects/p/global/images/i", "2-2-1"])
+    self.assertEqual((cache.hits, cache.misses), (1, 0))
+    self.assertIn(": 1 hits, 0 misses", cache.format_report())
+    compute.assert_called_once_with()
+
+  def test_expired_entries_miss(self):
+    """Verifies entries older than the TTL are not returned."""
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir, ttl_sec=60)
+    cache.put(("p", "f", "v"), "1-5-9-debian10")
+
+    with mock.patch.object(time, "time", return_value=time.time() + 120):
+      cache = image_cache.ImageCache(cache_dir=self.cache_dir, ttl_sec=60)
+      self.assertIsNone(cache.get(("p", "f", "v")))
+
+  def test_disabled_cache_has_no_report(self):
+    """Verifies a cache with a TTL of 0 reports nothing."""
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir, ttl_sec=0)
+    self.assertIsNone(cache.get(("k",)))
+
+    self.assertEqual(cache.format_report(), "")
+
+  def test_refresh_bypasses_cache(self):
+    """Verifies --refresh-image-cache recomputes and overwrites entries."""
+    image_cache.ImageCache(cache_dir=self.cache_dir).put(("k",), "old")
+
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir, refresh=True)
+    self.assertEqual(cache.get_or_compute(("k",), lambda: "new"), "new")
+
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir)
+    self.assertEqual(cache.get(("k",)), "new")
+
+  def test_evicts_least_recently_used(self):
+    """Verifies the cache is bounded by max_entries, across runs."""
+    with mock.patch.object(time, "time", side_effect=itertools.count(1.0)):
+      cache = image_cache.ImageCache(cache_dir=self.cache_dir, max_entries=2)
+      cache.put(("a",), "a")
+      cache.put(("b",), "b")
+      cache = image_cache.ImageCache(cache_dir=self.cache_dir, max_entries=2)
+      cache.get(("a",))
+      cache = image_cache.ImageCache(cache_dir=self.cache_dir, max_entries=2)
+      cache.put(("c",), "c")
+
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir, max_entries=2,
+                                   ttl_sec=float("inf"))
+    self.assertEqual(cache.get(("a",)), "a")
+    self.assertIsNone(cache.get(("b",)))
+    self.assertEqual(cache.get(("c",)), "c")
+
+  def test_concurrent_runs_keep_each_others_entries(self):
+    """Verifies a run does not overwrite the entries stored by another."""
+    first = image_cache.ImageCache(cache_dir=self.cache_dir)
+    second = image_cache.ImageCache(cache_dir=self.cache_dir)
+    self.assertIsNone(first.get(("a",)))
+    self.assertIsNone(second.get(("b",)))
+
+    first.put(("a",), "a")
+    second.put(("b",), "b")
+
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir)
+    self.assertEqual(cache.get(("a",)), "a")
+    self.assertEqual(cache.get(("b",)), "b")
+
+  def test_update_json_file_serializes_writers(self):
+    """Verifies concurrent updates of a JSON file are all kept."""
+    path = os.path.join(self.cache_dir, "counter.json")
+
+    def increment(_):
+      image_cache.update_json_file(
+          path, lambda state: dict(state, count=state.get("count", 0) + 1))
+
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+      list(executor.map(increment, range(40)))
+
+    self.assertEqual(image_cache.read_json_file(path), {"count": 40})
+
+  def test_zero_ttl_disables_cache(self):
+    """Verifies a TTL of 0 never stores or returns values."""
+    cache = image_cache.ImageCache(cache_dir=self.cache_dir, ttl_sec=0)
+    cache.put(("k",), "v")
+    self.assertIsNone(cache.get(("k",)))
+
+
+if __name__ == '__main__':
+  unittest.main()
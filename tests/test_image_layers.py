@@ -0,0 +1,105 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import image_layers
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_BASE_IMAGE = "projects/cloud-dataproc/global/images/dataproc-2-2-deb12"
+
+
+class FakeImageBackend(cloud_backend.CloudBackend):
+  """Knows which images exist."""
+
+  def __init__(self, images=()):
+    self.images = set(images)
+
+  def image_exists(self, project_id, image_name):
+    return image_name in self.images
+
+
+class TestImageLayers(unittest.TestCase):
+
+  def setUp(self):
+    self.cwd = os.getcwd()
+    os.chdir(_REPO_DIR)
+    self.temp_dir = tempfile.mkdtemp()
+    self.scripts = [self._write(name, "echo " + name)
+                    for name in ("driver.sh", "cuda.sh", "dask.sh")]
+    self.created = []
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree(self.temp_dir)
+    cloud_backend.set_backend(None)
+
+  def _write(self, name, contents):
+    path = os.path.join(self.temp_dir, name)
+    with open(path, "w") as f:
+      f.write(contents)
+    return path
+
+  def _args(self):
+    return argparse.Namespace(
+        image_name="gpu", project_id="p",
+        customization_script="examples/customization_script.sh",
+        customization_layers=list(self.scripts), extra_sources={},
+        dataproc_base_image=_BASE_IMAGE, metadata=None,
+        optional_components=None, accelerator="type=nvidia-tesla-t4",
+        disk_size=30, trusted_cert="", family="gpu-images", resume=None,
+        on_matching_image="build", dry_run=False)
+
+  def _create(self, args, output, tracer):
+    self.created.append((args.image_name, args.dataproc_base_image,
+                         args.customization_script, args.family))
+
+  def test_changed_layer_rebuilds_layers_above(self):
+    """Verifies a changed layer only changes its image and those above."""
+    before = image_layers.plan(self._args())
+    self._write("cuda.sh", "echo cuda 12")
+    after = image_layers.plan(self._args())
+
+    self.assertEqual(before[0].image_name, after[0].image_name)
+    self.assertNotEqual(before[1].image_name, after[1].image_name)
+    self.assertNotEqual(before[2].image_name, after[2].image_name)
+    self.assertEqual(after[1].parent_image, after[0].image)
+    self.assertLessEqual(len(after[0].image_name + "-install"), 63)
+
+  def test_build_reuses_existing_layers(self):
+    """Verifies only missing layers are built, on top of their parent."""
+    args = self._args()
+    args.layers = image_layers.plan(args)
+    cloud_backend.set_backend(FakeImageBackend([args.layers[0].image_name]))
+
+    image_layers.build(args, self._create, output=io.StringIO())
+
+    self.assertEqual(self.created, [
+        (args.layers[1].image_name, args.layers[0].image, self.scripts[1],
+         image_layers.LAYER_FAMILY),
+        (args.layers[2].image_name, args.layers[1].image, self.scripts[2],
+         image_layers.LAYER_FAMILY),
+    ])
+    self.assertEqual(args.dataproc_base_image, args.layers[2].image)
+    self.assertEqual(args.image_name, "gpu")
+
+
+if __name__ == '__main__':
+  unittest.main()
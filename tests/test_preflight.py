@@ -0,0 +1,124 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import threading
+import time
+import unittest
+
+from custom_image_utils import preflight
+
+
+class TestPreflight(unittest.TestCase):
+
+  def test_independent_probes_run_concurrently(self):
+    """Verifies wall time is bounded by the slowest probe, not the sum."""
+    probes = [
+        preflight.Probe(name, lambda: time.sleep(0.2))
+        for name in ("a", "b", "c", "d")
+    ]
+
+    start = time.time()
+    timings = preflight.run_probes(probes)
+    elapsed = time.time() - start
+
+    self.assertEqual(len(timings), 4)
+    self.assertLess(elapsed, 0.6)
+
+  def test_dependencies_run_in_order(self):
+    """Verifies a probe starts only after its dependencies finished."""
+    order = []
+    lock = threading.Lock()
+
+    def record(name):
+      def func():
+        time.sleep(0.05)
+        with lock:
+          order.append(name)
+      return func
+
+    probes = [
+        preflight.Probe("network", record("network"),
+                        depends_on=["project-id"]),
+        preflight.Probe("project-id", record("project-id")),
+        preflight.Probe("image", record("image"), depends_on=["network"]),
+    ]
+
+    preflight.run_probes(probes)
+
+    self.assertEqual(order, ["project-id", "network", "image"])
+
+  def test_failure_stops_dependents(self):
+    """Verifies a failing probe is raised and its dependents never run."""
+    ran = []
+
+    def fail():
+      raise RuntimeError("Cannot find gcloud project ID.")
+
+    probes = [
+        preflight.Probe("project-id", fail),
+        preflight.Probe("network", lambda: ran.append("network"),
+                        depends_on=["project-id"]),
+    ]
+
+    with self.assertRaisesRegex(RuntimeError, "project ID"):
+      preflight.run_probes(probes)
+    self.assertEqual(ran, [])
+
+  def test_inferred_values_set_before_dependents(self):
+    """Verifies probe values are set on the args before dependents start."""
+    threads = []
+
+    class RecordingNamespace(argparse.Namespace):
+
+      def __setattr__(self, name, value):
+        threads.append(threading.current_thread())
+        super().__setattr__(name, value)
+
+    args = RecordingNamespace(project_id=None, network="default")
+    probes = [
+        preflight.Probe("project-id", lambda: {"project_id": "p"}),
+        preflight.Probe(
+            "network",
+            lambda: {"network": "projects/{}/global/networks/{}".format(
+                args.project_id, args.network)},
+            depends_on=["project-id"]),
+    ]
+    threads.clear()
+
+    preflight.run_probes(probes, args=args)
+
+    self.assertEqual(args.project_id, "p")
+    self.assertEqual(args.network, "projects/p/global/networks/default")
+    self.assertEqual(threads, [threading.current_thread()] * 2)
+
+  def test_unknown_dependency(self):
+    """Verifies a misconfigured graph is rejected."""
+    with self.assertRaises(ValueError):
+      preflight.run_probes(
+          [preflight.Probe("a", lambda: None, depends_on=["missing"])])
+
+  def test_format_report(self):
+    """Verifies the report lists each probe and the wall time."""
+    report = preflight.format_report([
+        preflight.ProbeTiming("project-id", 0.0, 1.5),
+        preflight.ProbeTiming("base-image", 0.0, 2.0),
+    ])
+
+    self.assertIn("project-id", report)
+    self.assertIn("wall   2.000s  sum of probes   3.500s", report)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,247 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import os
+import shutil
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import python_image_creator
+from custom_image_utils import workflow_engine
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeCloudBackend(cloud_backend.CloudBackend):
+  """Records calls and reports the given customization script result."""
+
+  def __init__(self, marker="BuildSucceeded: done", image_failures=0,
+               preemptions=0):
+    self.calls = []
+    self.preemptions = preemptions
+    self.instances = {}
+    self.images = {}
+    self.marker = marker
+    self.image_failures = image_failures
+
+  def upload_file(self, local_path, gcs_uri):
+    self.calls.append(("upload_file", gcs_uri))
+
+  def object_exists(self, gcs_uri):
+    return False
+
+  def download_file(self, gcs_uri, local_path):
+    raise cloud_backend.NotFoundError(gcs_uri)
+
+  def create_disk(self, project_id, zone, disk):
+    self.calls.append(("create_disk", disk["name"]))
+
+  def delete_disk(self, project_id, zone, disk_name):
+    self.calls.append(("delete_disk", disk_name))
+
+  def create_instance(self, project_id, zone, instance):
+    self.calls.append(("create_instance", instance["name"]))
+    self.instances[instance["name"]] = instance
+
+  def describe_instance(self, project_id, zone, instance_name):
+    if self.preemptions:
+      return {"status": "TERMINATED",
+              "scheduling": self.instances[instance_name]["scheduling"]}
+    return {"status": "RUNNING"}
+
+  def get_serial_port_output(self, project_id, zone, instance_name, port,
+                             start):
+    contents = "{} startup-script: {}\n".format(instance_name, self.marker)
+    if self.preemptions:
+      contents = ""
+    return {"contents": contents[start:], "start": start,
+            "next": len(contents)}
+
+  def stop_instance(self, project_id, zone, instance_name):
+    self.calls.append(("stop_instance", instance_name))
+
+  def start_instance(self, project_id, zone, instance_name):
+    self.calls.append(("start_instance", instance_name))
+    self.preemptions -= 1
+
+  def delete_instance(self, project_id, zone, instance_name):
+    self.calls.append(("delete_instance", instance_name))
+
+  def create_image(self, project_id, image):
+    self.calls.append(("create_image", image["name"]))
+    if self.image_failures:
+      self.image_failures -= 1
+      raise cloud_backend.CloudApiError("quota exceeded")
+    self.images[image["name"]] = image
+    return dict(image, creationTimestamp="2026-01-01T00:00:00.000-07:00")
+
+
+def _args(**kwargs):
+  args = dict(
+      image_name="img", zone="us-central1-a", project_id="p",
+      gcs_bucket="gs://bucket",
+      customization_script="examples/customization_script.sh",
+      extra_sources={}, dataproc_base_image="projects/p/global/images/base",
+      dataproc_version="2.2.5-debian12", disk_size=30,
+      machine_type="n1-standard-2",
+      network="", subnetwork="", no_external_ip=True,
+      service_account="default", accelerator="type=nvidia-tesla-t4,count=2",
+      storage_location=None, family="dataproc-custom-image",
+      shutdown_timer_in_sec=300, universe_domain="googleapis.com",
+      optional_components=None, metadata="key1=value1", trusted_cert="",
+      dry_run=False, resume=None, reuse_base_disk_snapshot=False)
+  args.update(kwargs)
+  return argparse.Namespace(**args)
+
+
+class TestPythonImageCreator(unittest.TestCase):
+
+  def setUp(self):
+    self.cwd = os.getcwd()
+    os.chdir(_REPO_DIR)
+    self.run_id = "test-python-image-creator-{}".format(os.getpid())
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree("/tmp/{}".format(self.run_id), ignore_errors=True)
+
+  def _run(self, backend, args):
+    image_workflow = python_image_creator.ImageWorkflow(
+        args, backend, output=io.StringIO(), run_id=self.run_id)
+    os.makedirs(image_workflow.log_dir, exist_ok=True)
+    if args.resume:
+      image_workflow.journal.load()
+    image_workflow.journal.start(args)
+    workflow = workflow_engine.Workflow(
+        image_workflow.steps(), image_workflow.cleanup,
+        output=image_workflow.output, sleep=lambda delay: None,
+        journal=image_workflow.journal)
+    workflow.run()
+    return image_workflow
+
+  def test_successful_build(self):
+    """Verifies the steps and cleanup calls of a successful build."""
+    backend = FakeCloudBackend()
+
+    image_workflow = self._run(backend, _args())
+
+    calls = [call for call in backend.calls if call[0] != "upload_file"]
+    self.assertEqual(calls, [
+        ("create_disk", "img-install"),
+        ("create_instance", "img-install"),
+        ("stop_instance", "img-install"),
+        ("create_image", "img"),
+        ("delete_instance", "img-install"),
+    ])
+    uploads = [call[1] for call in backend.calls if call[0] == "upload_file"]
+    self.assertIn(image_workflow.custom_sources_manifest, uploads)
+    self.assertTrue(any("/custom-image-sources/sha256/" in uri
+                        for uri in uploads))
+    self.assertIn(image_workflow.gcs_log_dir + "/startup-script.log", uploads)
+    self.assertTrue(image_workflow.image_created)
+    # Labels are set at creation, and the timestamp kept for the notifier.
+    self.assertEqual(backend.images["img"]["labels"],
+                     {"goog-dataproc-version": "2-2-5-debian12"})
+    self.assertEqual(image_workflow.args.image_creation_timestamp,
+                     "2026-01-01T00:00:00.000-07:00")
+
+    instance = backend.instances["img-install"]
+    metadata = {item["key"]: item["value"]
+                for item in instance["metadata"]["items"]}
+    self.assertEqual(metadata["key1"], "value1")
+    self.assertEqual(metadata["dataproc-region"], "us-central1")
+    self.assertNotIn("image-slimming-steps", metadata)
+    self.assertNotIn("accessConfigs", instance["networkInterfaces"][0])
+    self.assertEqual(instance["guestAccelerators"][0]["acceleratorCount"], 2)
+
+  def test_failed_customization_deletes_vm(self):
+    """Verifies a failed customization stops the workflow and cleans up."""
+    backend = FakeCloudBackend(marker="BuildFailed: oops")
+
+    with self.assertRaises(workflow_engine.WorkflowError) as e:
+      self._run(backend, _args())
+
+    self.assertEqual(e.exception.step_name, "wait-for-customization")
+    names = [call[0] for call in backend.calls]
+    self.assertNotIn("create_image", names)
+    self.assertIn("delete_instance", names)
+    self.assertNotIn("delete_disk", names)
+
+  def test_preempted_spot_vm_is_restarted(self):
+    """Verifies a preempted spot VM is started again and reported."""
+    backend = FakeCloudBackend(preemptions=2)
+
+    image_workflow = self._run(backend, _args(provisioning_model="spot"))
+
+    calls = [call[0] for call in backend.calls if call[0] != "upload_file"]
+    self.assertEqual(calls, [
+        "create_disk", "create_instance", "start_instance", "start_instance",
+        "stop_instance", "create_image", "delete_instance",
+    ])
+    self.assertEqual(backend.instances["img-install"]["scheduling"], {
+        "provisioningModel": "SPOT",
+        "instanceTerminationAction": "STOP",
+        "onHostMaintenance": "TERMINATE",
+    })
+    self.assertEqual(image_workflow.args.preemptions.count, 2)
+    self.assertTrue(image_workflow.image_created)
+
+  def test_slimming_steps_metadata(self):
+    """Verifies slimming steps are passed to run.sh, dot separated."""
+    image_workflow = python_image_creator.ImageWorkflow(
+        _args(slim_image="caches,trim"), FakeCloudBackend(),
+        output=io.StringIO(), run_id=self.run_id)
+
+    metadata = image_workflow.metadata()
+
+    self.assertEqual(metadata["image-slimming-steps"], "caches.trim")
+
+  def test_resume_after_failed_capture(self):
+    """Verifies a failed image capture keeps the VM and can be resumed."""
+    backend = FakeCloudBackend(image_failures=3)
+    with self.assertRaises(workflow_engine.WorkflowError):
+      self._run(backend, _args())
+    names = [call[0] for call in backend.calls]
+    self.assertNotIn("delete_instance", names)
+
+    backend = FakeCloudBackend()
+    self._run(backend, _args(resume=self.run_id))
+
+    calls = [call for call in backend.calls if call[0] != "upload_file"]
+    self.assertEqual(calls, [
+        ("create_image", "img"),
+        ("delete_instance", "img-install"),
+    ])
+
+  def test_resume_checks_run(self):
+    """Verifies a journal is not resumed for a different image."""
+    with self.assertRaises(workflow_engine.WorkflowError):
+      self._run(FakeCloudBackend(image_failures=3), _args())
+
+    with self.assertRaises(RuntimeError):
+      self._run(FakeCloudBackend(),
+                _args(image_name="other", resume=self.run_id))
+
+  def test_resume_requires_python_engine(self):
+    """Verifies a build falling back to bash cannot be resumed."""
+    with self.assertRaises(RuntimeError):
+      python_image_creator.create(
+          _args(resume=self.run_id, trusted_cert="tls/db.der"),
+          output=io.StringIO())
+
+
+if __name__ == '__main__':
+  unittest.main()
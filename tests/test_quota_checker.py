@@ -0,0 +1,232 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+
+from custom_image_utils import batch_builder
+from custom_image_utils import cloud_backend
+from custom_image_utils import quota_checker
+
+
+class FakeQuotaBackend(cloud_backend.CloudBackend):
+  """Answers quota reads from a local {metric: (limit, usage)} response."""
+
+  def __init__(self, region_quotas, project_quotas=None):
+    self.region_quotas = region_quotas
+    self.project_quotas = project_quotas or {}
+    self.reads = 0
+
+  def _response(self, quotas):
+    self.reads += 1
+    return [{"metric": metric, "limit": limit, "usage": usage}
+            for metric, (limit, usage) in quotas.items()]
+
+  def get_region_quotas(self, project_id, region):
+    assert region == "us-central1", region
+    return self._response(self.region_quotas)
+
+  def get_project_quotas(self, project_id):
+    return self._response(self.project_quotas)
+
+  def describe_machine_type(self, project_id, zone, machine_type):
+    return {"name": machine_type, "guestCpus": 12}
+
+
+def _args(machine_type="n1-standard-4", accelerator=None, disk_size=30,
+          policy=quota_checker.FAIL, name="image"):
+  return argparse.Namespace(image_name=name, project_id="p",
+                            zone="us-central1-a", machine_type=machine_type,
+                            accelerator=accelerator, disk_size=disk_size,
+                            on_insufficient_quota=policy, dry_run=False)
+
+
+class TestRequirements(unittest.TestCase):
+
+  def test_requirements(self):
+    """Verifies vCPUs, GPUs and SSD are computed from the arguments."""
+    backend = FakeQuotaBackend({})
+
+    required = quota_checker.requirements(
+        _args("n2-highmem-8", "type=nvidia-tesla-t4,count=2", 50), backend)
+
+    self.assertEqual(required, {
+        ("region", "N2_CPUS"): 8,
+        ("region", "INSTANCES"): 1,
+        ("region", "SSD_TOTAL_GB"): 50,
+        ("region", "NVIDIA_T4_GPUS"): 2,
+        ("project", "CPUS_ALL_REGIONS"): 8,
+        ("project", "GPUS_ALL_REGIONS"): 2,
+    })
+    self.assertEqual(
+        quota_checker.machine_type_cpus(_args("e2-medium"), backend), 2)
+    self.assertEqual(
+        quota_checker.machine_type_cpus(_args("n1-custom-6-23040"), backend),
+        6)
+    self.assertEqual(
+        quota_checker.machine_type_cpus(_args("a2-highgpu-1g"), backend), 12)
+    self.assertEqual(quota_checker.gpu_metric("nvidia-h100-80gb"),
+                     "NVIDIA_H100_GPUS")
+
+
+class TestCheck(unittest.TestCase):
+
+  def test_passes_with_headroom(self):
+    """Verifies a build within the quotas passes, skipping unknown quotas."""
+    backend = FakeQuotaBackend({"CPUS": (24, 20), "SSD_TOTAL_GB": (500, 0)},
+                               {"CPUS_ALL_REGIONS": (100, 20)})
+
+    quota_checker.check(_args(), backend=backend)
+
+    self.assertEqual(backend.reads, 2)
+
+  def test_spot_uses_preemptible_quota(self):
+    """Verifies spot VMs use the preemptible quota once it is granted."""
+    args = _args()
+    args.provisioning_model = "spot"
+
+    quota_checker.check(args, backend=FakeQuotaBackend(
+        {"CPUS": (24, 24), "PREEMPTIBLE_CPUS": (8, 0)}))
+    with self.assertRaises(quota_checker.QuotaError):
+      quota_checker.check(args, backend=FakeQuotaBackend(
+          {"CPUS": (24, 24), "PREEMPTIBLE_CPUS": (0, 0)}))
+
+  def test_fails_fast(self):
+    """Verifies missing headroom fails the build with every shortfall."""
+    backend = FakeQuotaBackend({"CPUS": (24, 22), "NVIDIA_T4_GPUS": (0, 0)})
+
+    with self.assertRaises(quota_checker.QuotaError) as context:
+      quota_checker.check(_args(accelerator="type=nvidia-tesla-t4"),
+                          backend=backend)
+
+    self.assertIn("region CPUS quota: 4 needed, 2 available",
+                  str(context.exception))
+    self.assertIn("NVIDIA_T4_GPUS", str(context.exception))
+
+  def test_waits_for_quota(self):
+    """Verifies the wait policy reads the quotas until they have headroom."""
+    backend = FakeQuotaBackend({"CPUS": (24, 22)})
+    sleeps = []
+
+    def sleep(seconds):
+      sleeps.append(seconds)
+      backend.region_quotas["CPUS"] = (24, 8)
+
+    output = io.StringIO()
+    quota_checker.check(_args(policy=quota_checker.WAIT), output=output,
+                        backend=backend, sleep=sleep)
+
+    self.assertEqual(sleeps, [quota_checker.WAIT_POLL_SEC])
+    self.assertIn("Waiting", output.getvalue())
+
+  def test_unreadable_quotas_only_warn(self):
+    """Verifies a failed quota read does not fail the build."""
+
+    class FailingBackend(FakeQuotaBackend):
+
+      def get_region_quotas(self, project_id, region):
+        raise cloud_backend.CloudApiError("Permission denied", status=403)
+
+    output = io.StringIO()
+    quota_checker.check(_args(), output=output,
+                        backend=FailingBackend({}))
+
+    self.assertIn("skipping the quota check", output.getvalue())
+
+
+class TestQuotaLedger(unittest.TestCase):
+
+  def test_batch_admits_builds_within_headroom(self):
+    """Verifies batch builds only run while the quotas have headroom."""
+    backend = FakeQuotaBackend({"CPUS": (10, 0)})
+    entries = []
+    for i in range(4):
+      entry = batch_builder.BuildEntry(i, [])
+      entry.args = _args(name="image-{}".format(i))
+      entries.append(entry)
+    big = batch_builder.BuildEntry(4, [])
+    big.args = _args("n1-standard-16", name="big")
+    entries.append(big)
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def build(entry):
+      with lock:
+        running[0] += 1
+        running[1] = max(running[1], running[0])
+      time.sleep(0.05)
+      with lock:
+        running[0] -= 1
+
+    ledger = quota_checker.QuotaLedger(backend)
+    batch_builder.Scheduler(max_concurrent=10, admission=ledger).run(
+        entries, build)
+
+    # 2 builds of 4 vCPUs fit in 10 vCPUs, the 16 vCPUs build never fits.
+    self.assertEqual(running[1], 2)
+    self.assertEqual(backend.reads, 2)
+    self.assertTrue(all(e.status == batch_builder.SUCCEEDED
+                        for e in entries[:4]))
+    self.assertEqual(big.status, batch_builder.FAILED)
+    self.assertIn("16 needed", big.error)
+    self.assertTrue(entries[0].args.quota_admitted)
+
+  def test_batch_waits_for_quota(self):
+    """Verifies a build with the wait policy starts once quota is freed."""
+
+    class FreeingBackend(FakeQuotaBackend):
+
+      def get_region_quotas(self, project_id, region):
+        quotas = super().get_region_quotas(project_id, region)
+        # Another workload frees its vCPUs after the first read.
+        self.region_quotas = {"CPUS": (10, 0)}
+        return quotas
+
+    backend = FreeingBackend({"CPUS": (10, 8)})
+    entry = batch_builder.BuildEntry(0, [])
+    entry.args = _args(policy=quota_checker.WAIT)
+
+    with mock.patch.object(quota_checker, "WAIT_POLL_SEC", 0.01):
+      batch_builder.Scheduler(
+          max_concurrent=10,
+          admission=quota_checker.QuotaLedger(backend)).run(
+              [entry], lambda entry: None)
+
+    self.assertEqual(entry.status, batch_builder.SUCCEEDED)
+    # The region and project quotas, read twice.
+    self.assertEqual(backend.reads, 4)
+
+  def test_batch_wait_times_out(self):
+    """Verifies a build waiting for quota fails after WAIT_TIMEOUT_SEC."""
+    entry = batch_builder.BuildEntry(0, [])
+    entry.args = _args("n1-standard-16", policy=quota_checker.WAIT)
+
+    with mock.patch.object(quota_checker, "WAIT_POLL_SEC", 0.01), \
+         mock.patch.object(quota_checker, "WAIT_TIMEOUT_SEC", 0.05):
+      batch_builder.Scheduler(
+          max_concurrent=10,
+          admission=quota_checker.QuotaLedger(
+              FakeQuotaBackend({"CPUS": (10, 0)}))).run(
+                  [entry], lambda entry: None)
+
+    self.assertEqual(entry.status, batch_builder.FAILED)
+    self.assertIn("16 needed", entry.error)
+
+
+if __name__ == "__main__":
+  unittest.main()
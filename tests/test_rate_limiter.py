@@ -0,0 +1,189 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import rate_limiter
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 1000.0
+    self.sleeps = []
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = FakeClock()
+
+  def _limiter(self, **kwargs):
+    return rate_limiter.RateLimiter(clock=self.clock.time,
+                                    sleep=self.clock.sleep, **kwargs)
+
+  def test_token_bucket(self):
+    """Verifies a burst is served at once, then calls wait for the rate."""
+    bucket = rate_limiter.TokenBucket(2.0, burst=2, clock=self.clock.time,
+                                      sleep=self.clock.sleep)
+
+    waits = [bucket.acquire() for _ in range(4)]
+
+    self.assertEqual(waits, [0.0, 0.0, 0.5, 0.5])
+    self.clock.now += 10
+    self.assertEqual(bucket.acquire(), 0.0)
+
+  def test_shared_token_bucket(self):
+    """Verifies limiters with the same state directory share their tokens."""
+    state_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, state_dir)
+    rates = {rate_limiter.COMPUTE_MUTATE: 0.2}
+    first = self._limiter(rates=rates, state_dir=state_dir)
+    second = self._limiter(rates=rates, state_dir=state_dir)
+
+    # A burst of 1 token at 0.2 per second.
+    first.acquire(rate_limiter.COMPUTE_MUTATE)
+    second.acquire(rate_limiter.COMPUTE_MUTATE)
+
+    self.assertEqual(self.clock.sleeps, [5.0])
+    stats = second.stats()[rate_limiter.COMPUTE_MUTATE]
+    self.assertEqual((stats.calls, stats.throttled), (1, 1))
+
+  def test_call_retries_throttled_errors(self):
+    """Verifies throttled calls are retried, even if not idempotent."""
+    errors = [cloud_backend.CloudApiError("throttled", status=429)] * 2
+    limiter = self._limiter()
+
+    def func():
+      if errors:
+        raise errors.pop()
+      return "done"
+
+    self.assertEqual(
+        limiter.call(rate_limiter.COMPUTE_MUTATE, func, idempotent=False),
+        "done")
+    stats = limiter.stats()[rate_limiter.COMPUTE_MUTATE]
+    self.assertEqual((stats.calls, stats.throttled, stats.retried), (3, 2, 2))
+
+  def test_call_does_not_retry_permanent_errors(self):
+    """Verifies non-retryable and non-idempotent failures are raised."""
+    limiter = self._limiter()
+    for status, idempotent in ((409, True), (404, True), (500, False)):
+      calls = []
+
+      def func():
+        calls.append(status)
+        raise cloud_backend.CloudApiError("failed", status=status)
+
+      with self.assertRaises(cloud_backend.CloudApiError):
+        limiter.call(rate_limiter.COMPUTE_READ, func, idempotent=idempotent)
+      self.assertEqual(len(calls), 1)
+
+  def test_call_does_not_resend_after_internal_error(self):
+    """Verifies a mutation failing with an internal error is not sent again."""
+    limiter = self._limiter()
+    message = ("ERROR: (gcloud.compute.instances.create) Could not fetch "
+               "resource:\n - Internal error. Please try again or contact "
+               "Google Support. (Code: 'backendError')")
+    calls = []
+
+    def func():
+      calls.append(message)
+      raise cloud_backend.CloudApiError(
+          message, status=rate_limiter.gcloud_error_status(message))
+
+    with self.assertRaises(cloud_backend.CloudApiError):
+      limiter.call(rate_limiter.COMPUTE_MUTATE, func, idempotent=False)
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(rate_limiter.gcloud_error_status(message), 500)
+    self.assertEqual(rate_limiter.gcloud_error_status(
+        "ERROR: (gcloud) UNAVAILABLE: Service Unavailable"), 503)
+
+  def test_call_does_not_retry_resource_quota_errors(self):
+    """Verifies exhausted resource quotas are not retried as throttling."""
+    limiter = self._limiter()
+    message = "Quota 'CPUS' exceeded.  Limit: 24.0 in region us-central1."
+    calls = []
+
+    def func():
+      calls.append(message)
+      raise cloud_backend.CloudApiError(
+          message, status=rate_limiter.gcloud_error_status(message))
+
+    with self.assertRaises(cloud_backend.CloudApiError):
+      limiter.call(rate_limiter.COMPUTE_MUTATE, func, idempotent=False)
+    self.assertEqual(len(calls), 1)
+    self.assertFalse(rate_limiter.is_retryable(cloud_backend.CloudApiError(
+        message, status=rate_limiter.gcloud_error_status(message))))
+
+  def test_command_family(self):
+    """Verifies gcloud commands are mapped to their API family."""
+    cases = {
+        "gcloud compute images describe img --project=p":
+            rate_limiter.COMPUTE_READ,
+        "gcloud compute instances create vm --zone us-west1-a":
+            rate_limiter.COMPUTE_MUTATE,
+        "gcloud compute instances get-serial-port-output vm --start=10":
+            rate_limiter.SERIAL_PORT,
+        "gcloud storage cp a gs://b/a": rate_limiter.STORAGE,
+        "gsutil -m rsync -r a gs://b": rate_limiter.STORAGE,
+        "gcloud beta dataproc clusters import c": rate_limiter.DATAPROC,
+        "gcloud auth print-access-token": None,
+    }
+    for command, family in cases.items():
+      self.assertEqual(rate_limiter.command_family(command.split()), family,
+                       command)
+
+  def test_gcloud_error_status(self):
+    """Verifies the status of gcloud errors is read from their message."""
+    self.assertEqual(rate_limiter.gcloud_error_status(
+        "ERROR: (gcloud.compute.images.create) HTTPError 409: exists"), 409)
+    self.assertEqual(rate_limiter.gcloud_error_status(
+        "Quota exceeded for quota metric 'Read requests' and limit "
+        "'Read requests per minute'"), 429)
+    self.assertEqual(rate_limiter.gcloud_error_status(
+        "RESOURCE_EXHAUSTED: rateLimitExceeded"), 429)
+    self.assertEqual(rate_limiter.gcloud_error_status(
+        "ERROR: (gcloud.compute.instances.create) Could not fetch resource:"
+        "\n - Quota 'CPUS' exceeded.  Limit: 24.0 in region us-central1."),
+        403)
+    self.assertEqual(rate_limiter.gcloud_error_status(
+        "ERROR: (gcloud) The resource 'images/img' was not found"), 404)
+    self.assertEqual(rate_limiter.gcloud_error_status(
+        "ERROR: (gcloud.storage.cp) No URLs matched: gs://b/o"), 404)
+    self.assertIsNone(rate_limiter.gcloud_error_status("Killed"))
+    self.assertFalse(rate_limiter.is_retryable(
+        cloud_backend.NotFoundError("gone")))
+    self.assertTrue(rate_limiter.is_retryable(
+        cloud_backend.CloudApiError("unknown")))
+
+  def test_parse_rates(self):
+    self.assertEqual(rate_limiter.parse_rates("storage=5,serial-port=0.5"),
+                     {"storage": 5.0, "serial-port": 0.5})
+    with self.assertRaises(ValueError):
+      rate_limiter.parse_rates("compute=5")
+
+
+if __name__ == "__main__":
+  unittest.main()
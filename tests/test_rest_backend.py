@@ -0,0 +1,285 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import server
+import json
+import threading
+import unittest
+from unittest import mock
+from urllib import parse
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import rest_backend
+
+
+class FakeApiServer(server.ThreadingHTTPServer):
+  """Local HTTP server answering requests from a (method, path) route table."""
+
+  def __init__(self):
+    super(FakeApiServer, self).__init__(("127.0.0.1", 0), _FakeApiHandler)
+    self.routes = {}
+    self.requests = []
+    self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+    self.thread.start()
+
+  @property
+  def endpoint(self):
+    return "http://127.0.0.1:{}".format(self.server_address[1])
+
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+
+
+class _FakeApiHandler(server.BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def _handle(self):
+    url = parse.urlsplit(self.path)
+    length = int(self.headers.get("Content-Length") or 0)
+    body = json.loads(self.rfile.read(length)) if length else None
+    self.server.requests.append(
+        (self.command, url.path, parse.parse_qs(url.query), body,
+         self.headers.get("Authorization")))
+    route = self.server.routes.get((self.command, url.path))
+    if route is None:
+      status, response = 404, {"error": {"code": 404}}
+    elif callable(route):
+      status, response = route(parse.parse_qs(url.query), body)
+    else:
+      status, response = route
+    if status is None:
+      # Drops the connection after reading the request.
+      self.close_connection = True
+      return
+    data = json.dumps(response).encode("utf-8")
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  do_GET = do_POST = do_DELETE = _handle
+
+  def log_message(self, *args):
+    pass
+
+
+class TestRestBackend(unittest.TestCase):
+
+  def setUp(self):
+    self.server = FakeApiServer()
+    self.fallback = mock.Mock()
+    self.backend = rest_backend.RestBackend(
+        fallback=self.fallback,
+        token_provider=lambda: "fake-token",
+        compute_endpoint=self.server.endpoint + "/compute/v1",
+        dataproc_endpoint=self.server.endpoint + "/v1")
+
+  def tearDown(self):
+    self.backend.pool.close()
+    self.server.stop()
+
+  def test_describe_image_reuses_connection(self):
+    """Verifies consecutive calls share one keep-alive connection."""
+    path = "/compute/v1/projects/p/global/images/img"
+    self.server.routes[("GET", path)] = (200, {
+        "name": "img",
+        "labels": {"goog-dataproc-version": "2-2-1-debian12"},
+    })
+
+    for _ in range(3):
+      image = self.backend.describe_image("p", "img")
+
+    self.assertEqual(image["labels"]["goog-dataproc-version"],
+                     "2-2-1-debian12")
+    self.assertEqual(self.backend.pool.connections_opened, 1)
+    self.assertEqual(self.server.requests[0][4], "Bearer fake-token")
+
+  def test_image_exists(self):
+    """Verifies a 404 maps to a missing image."""
+    self.server.routes[("GET", "/compute/v1/projects/p/global/images/a")] = (
+        200, {"name": "a"})
+
+    self.assertTrue(self.backend.image_exists("p", "a"))
+    self.assertFalse(self.backend.image_exists("p", "b"))
+    with self.assertRaises(cloud_backend.NotFoundError):
+      self.backend.describe_image("p", "b")
+
+  def test_list_dataproc_images_pages_and_filters(self):
+    """Verifies paging, client-side filtering and newest-first ordering."""
+
+    def list_images(query, _):
+      if "pageToken" not in query:
+        return 200, {
+            "items": [
+                {"name": "dataproc-2-2-deb12-20240101", "status": "READY",
+                 "creationTimestamp": "2024-01-01T00:00:00.000-07:00",
+                 "labels": {"goog-dataproc-version": "2-2-1-debian12"}},
+                {"name": "dataproc-2-2-deb12-20240102-eap", "status": "READY",
+                 "creationTimestamp": "2024-01-02T00:00:00.000-07:00",
+                 "labels": {"goog-dataproc-version": "2-2-2-debian12"}},
+            ],
+            "nextPageToken": "next",
+        }
+      return 200, {"items": [
+          {"name": "dataproc-2-2-deb12-20240103", "status": "READY",
+           "creationTimestamp": "2024-01-03T00:00:00.000-07:00",
+           "labels": {"goog-dataproc-version": "2-2-3-debian12"}},
+          {"name": "dataproc-2-2-rocky9-20240104", "status": "READY",
+           "creationTimestamp": "2024-01-04T00:00:00.000-07:00",
+           "labels": {"goog-dataproc-version": "2-2-3-rocky9"}},
+      ]}
+
+    path = "/compute/v1/projects/cloud-dataproc/global/images"
+    self.server.routes[("GET", path)] = list_images
+
+    images = self.backend.list_dataproc_images("cloud-dataproc",
+                                               r"2-2-\d+-debian12", False)
+
+    self.assertEqual([image["name"] for image in images], [
+        "dataproc-2-2-deb12-20240103", "dataproc-2-2-deb12-20240101"
+    ])
+    self.assertIn(r'(labels.goog-dataproc-version eq "2-2-\d+-debian12")',
+                  self.server.requests[0][2]["filter"][0])
+
+  def test_add_image_labels_waits_for_operation(self):
+    """Verifies labels are merged and the operation is waited on."""
+    image_path = "/compute/v1/projects/p/global/images/img"
+    self.server.routes[("GET", image_path)] = (200, {
+        "labels": {"existing": "label"},
+        "labelFingerprint": "abc",
+    })
+    self.server.routes[("POST", image_path + "/setLabels")] = (200, {
+        "name": "op-1", "status": "RUNNING"
+    })
+    self.server.routes[(
+        "POST", "/compute/v1/projects/p/global/operations/op-1/wait")] = (
+            200, {"name": "op-1", "status": "DONE"})
+
+    self.backend.add_image_labels("p", "img", {"goog-dataproc-version": "v"})
+
+    self.assertEqual(self.server.requests[1][3], {
+        "labels": {"existing": "label", "goog-dataproc-version": "v"},
+        "labelFingerprint": "abc",
+    })
+    self.assertEqual(self.server.requests[2][1],
+                     "/compute/v1/projects/p/global/operations/op-1/wait")
+
+  def test_create_instance_waits_for_zonal_operation(self):
+    """Verifies zonal operations are waited on in their zone."""
+    self.server.routes[("POST", "/compute/v1/projects/p/zones/z/instances")] = (
+        200, {"name": "op-2", "status": "RUNNING",
+              "zone": "https://compute.googleapis.com/compute/v1/projects/p"
+                      "/zones/z"})
+    self.server.routes[(
+        "POST", "/compute/v1/projects/p/zones/z/operations/op-2/wait")] = (
+            200, {"name": "op-2", "status": "DONE"})
+
+    self.backend.create_instance("p", "z", {"name": "vm"})
+
+    self.assertEqual(self.server.requests[0][3], {"name": "vm"})
+    self.assertEqual(self.server.requests[1][1],
+                     "/compute/v1/projects/p/zones/z/operations/op-2/wait")
+
+  def test_create_image_returns_created_image(self):
+    """Verifies the image is described once its operation is done."""
+    images = "/compute/v1/projects/p/global/images"
+    self.server.routes[("POST", images)] = (200, {
+        "name": "op-3", "status": "RUNNING",
+        "insertTime": "2024-01-01T00:00:00.000-07:00"})
+    self.server.routes[(
+        "POST", "/compute/v1/projects/p/global/operations/op-3/wait")] = (
+            200, {"name": "op-3", "status": "DONE"})
+    self.server.routes[("GET", images + "/img")] = (200, {
+        "name": "img", "creationTimestamp": "2024-01-01T00:05:00.000-07:00"})
+
+    image = self.backend.create_image("p", {"name": "img"})
+
+    self.assertEqual(image["creationTimestamp"],
+                     "2024-01-01T00:05:00.000-07:00")
+    self.assertEqual(self.server.requests[2][:2], ("GET", images + "/img"))
+
+  def test_workflow_template_lifecycle(self):
+    """Verifies workflow templates are created, run and deleted."""
+    templates = "/v1/projects/p/regions/r/workflowTemplates"
+    self.server.routes[("POST", templates)] = (200, {})
+    self.server.routes[("POST", templates + "/t:instantiate")] = (200, {
+        "name": "projects/p/regions/r/operations/op", "done": True
+    })
+    self.server.routes[("DELETE", templates + "/t")] = (200, {})
+
+    self.backend.create_workflow_template("p", "r", {"id": "t"})
+    self.backend.instantiate_workflow_template("p", "r", "t")
+    self.backend.delete_workflow_template("p", "r", "t")
+
+    self.assertEqual([request[0] for request in self.server.requests],
+                     ["POST", "POST", "DELETE"])
+
+  def test_failed_operation_raises(self):
+    """Verifies a failed Dataproc operation is reported."""
+    templates = "/v1/projects/p/regions/r/workflowTemplates"
+    self.server.routes[("POST", templates + "/t:instantiate")] = (200, {
+        "name": "projects/p/regions/r/operations/op",
+        "done": True,
+        "error": {"message": "job failed"},
+    })
+
+    with self.assertRaises(cloud_backend.CloudApiError):
+      self.backend.instantiate_workflow_template("p", "r", "t")
+
+  def test_falls_back_to_gcloud_when_unreachable(self):
+    """Verifies transport failures are retried with the gcloud backend."""
+    self.server.stop()
+    self.fallback.describe_image.return_value = {"name": "img"}
+
+    self.assertEqual(self.backend.describe_image("p", "img"), {"name": "img"})
+    self.fallback.describe_image.assert_called_once_with("p", "img")
+    self.server = FakeApiServer()
+
+  def test_lost_create_is_not_sent_twice(self):
+    """Verifies a create whose response is lost reuses its request ID."""
+    path = "/compute/v1/projects/p/zones/z/instances"
+    responses = [(None, None)] + [(200, {"name": "op", "status": "DONE"})] * 2
+    self.server.routes[("POST", path)] = lambda query, body: responses.pop(0)
+
+    with self.assertRaises(cloud_backend.CloudApiError):
+      self.backend.create_instance("p", "z", {"name": "vm"})
+    self.backend.create_instance("p", "z", {"name": "vm"})
+    self.backend.create_instance("p", "z", {"name": "vm"})
+
+    self.fallback.create_instance.assert_not_called()
+    request_ids = [request[2]["requestId"][0]
+                   for request in self.server.requests]
+    self.assertEqual(len(request_ids), 3)
+    # The retry of the lost create is deduplicated by the API, a new create
+    # once it succeeded is not.
+    self.assertEqual(request_ids[0], request_ids[1])
+    self.assertNotEqual(request_ids[1], request_ids[2])
+
+  def test_lost_job_submission_does_not_fall_back(self):
+    """Verifies a job submitted on a lost connection is not resubmitted."""
+    self.server.routes[("POST", "/v1/projects/p/regions/r/jobs:submit")] = (
+        None, None)
+
+    with self.assertRaises(cloud_backend.CloudApiError):
+      self.backend.submit_job("p", "r", {"placement": {}})
+
+    self.fallback.submit_job.assert_not_called()
+    self.assertEqual(len(self.server.requests), 1)
+    self.assertIn("requestId", self.server.requests[0][3])
+
+
+if __name__ == '__main__':
+  unittest.main()
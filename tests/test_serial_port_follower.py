@@ -0,0 +1,204 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import serial_port_follower
+
+
+class FakeSerialPortBackend(cloud_backend.CloudBackend):
+  """Serves serial port output that grows by one chunk per poll."""
+
+  def __init__(self, chunks, status="RUNNING", discard=0, attributes=None,
+               published_after=0, scheduling=None):
+    self.chunks = list(chunks)
+    self.status = status
+    self.scheduling = scheduling or {}
+    self.discard = discard
+    self.attributes = attributes
+    self.published_after = published_after
+    self.attribute_reads = 0
+    self.output = ""
+    self.starts = []
+
+  def get_serial_port_output(self, project_id, zone, instance_name, port,
+                             start):
+    self.starts.append(start)
+    if self.chunks:
+      self.output += self.chunks.pop(0)
+    start = max(start, self.discard)
+    return {"contents": self.output[start:], "start": start,
+            "next": len(self.output)}
+
+  def describe_instance(self, project_id, zone, instance_name):
+    if self.status is None:
+      raise cloud_backend.NotFoundError("not found")
+    return {"status": self.status, "scheduling": self.scheduling}
+
+  def get_guest_attributes(self, project_id, zone, instance_name, namespace):
+    self.attribute_reads += 1
+    if self.attributes is None or self.attribute_reads <= self.published_after:
+      raise cloud_backend.NotFoundError("no guest attributes")
+    return dict(self.attributes)
+
+
+def _line(text):
+  return "Jan 01 00:00:00 img-install google_metadata_script_runner" \
+         "[1]: startup-script: {}\n".format(text)
+
+
+class TestSerialPortFollower(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.log_file = os.path.join(self.temp_dir, "startup-script.log")
+    self.sleeps = []
+    self.now = 0.0
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+  def _follow(self, backend, **kwargs):
+    follower = serial_port_follower.SerialPortFollower(
+        backend, "p", "z", "img-install", self.log_file, sleep=self._sleep,
+        clock=lambda: self.now, **kwargs)
+    return follower, follower.follow()
+
+  def _log(self):
+    with open(self.log_file) as f:
+      return f.read()
+
+  def test_returns_on_success_marker(self):
+    """Verifies the follower stops at the marker and reads incrementally."""
+    backend = FakeSerialPortBackend([
+        _line("installing") + "[  OK  ] kernel line\n",
+        "",
+        _line("BuildSucceeded: Dataproc Initialization Actions Succeeded."),
+    ])
+
+    follower, result = self._follow(backend)
+
+    self.assertEqual(result, serial_port_follower.SUCCEEDED)
+    self.assertEqual(follower.polls, 3)
+    # Each poll starts where the previous one ended.
+    self.assertEqual(backend.starts[0], 0)
+    self.assertEqual(backend.starts[1], backend.starts[2])
+    self.assertEqual(
+        self._log(),
+        "Jan 01 00:00:00 installing\n"
+        "Jan 01 00:00:00 BuildSucceeded: Dataproc Initialization Actions "
+        "Succeeded.\n")
+
+  def test_partial_lines_are_joined(self):
+    """Verifies a line split across polls is written once, complete."""
+    line = _line("BuildFailed: Cannot run customization script.")
+    backend = FakeSerialPortBackend([line[:30], line[30:]])
+
+    _, result = self._follow(backend)
+
+    self.assertEqual(result, serial_port_follower.FAILED)
+    self.assertEqual(self._log().count("BuildFailed:"), 1)
+
+  def test_backs_off_while_quiet(self):
+    """Verifies the poll interval doubles up to the maximum when idle."""
+    backend = FakeSerialPortBackend(
+        [_line("start"), "", "", "", "", _line("BuildSucceeded: done")])
+
+    self._follow(backend, min_interval=1, max_interval=4)
+
+    self.assertEqual(len(self.sleeps), 5)
+    bounds = [(0.8, 1.2), (1.6, 2.4), (3.2, 4.8), (3.2, 4.8), (3.2, 4.8)]
+    for slept, (low, high) in zip(self.sleeps, bounds):
+      self.assertTrue(low <= slept <= high, (slept, low, high))
+
+  def test_stopped_instance_without_marker(self):
+    """Verifies the follower returns when the instance stops."""
+    backend = FakeSerialPortBackend([_line("start")], status="TERMINATED")
+
+    _, result = self._follow(backend)
+
+    self.assertEqual(result, serial_port_follower.UNKNOWN)
+
+  def test_preempted_spot_instance(self):
+    """Verifies a spot instance stopped without marker is preempted."""
+    backend = FakeSerialPortBackend([_line("start")], status="TERMINATED",
+                                    scheduling={"provisioningModel": "SPOT"})
+
+    _, result = self._follow(backend)
+
+    self.assertEqual(result, serial_port_follower.PREEMPTED)
+
+  def test_lost_output_is_skipped(self):
+    """Verifies discarded output does not stall the follower."""
+    backend = FakeSerialPortBackend(
+        [_line("old") + _line("BuildSucceeded: done")],
+        discard=len(_line("old")))
+
+    _, result = self._follow(backend)
+
+    self.assertEqual(result, serial_port_follower.SUCCEEDED)
+    self.assertNotIn("old", self._log())
+
+  def test_published_result_read_at_poll_times(self):
+    """Verifies guest attributes are read once per backed off poll."""
+    backend = FakeSerialPortBackend(
+        [_line("start"), "", "", _line("BuildSucceeded: done")],
+        attributes={"status": "succeeded", "log-flushed": "1"},
+        published_after=2)
+
+    follower, result = self._follow(backend, min_interval=10,
+                                    guest_attributes=True)
+
+    self.assertEqual(result, serial_port_follower.SUCCEEDED)
+    # The waits back off, each followed by one attribute read, then the log
+    # is drained.
+    self.assertEqual(backend.attribute_reads, 3)
+    self.assertEqual(len(self.sleeps), 3)
+    self.assertLess(self.sleeps[0], self.sleeps[1])
+    self.assertLess(self.sleeps[1], self.sleeps[2])
+    self.assertEqual(follower.polls, 4)
+    self.assertIn("BuildSucceeded: done", self._log())
+
+  def test_result_requires_flushed_log(self):
+    """Verifies a status without log-flushed is not trusted."""
+    backend = FakeSerialPortBackend(
+        [_line("start"), "", _line("BuildFailed: oops")],
+        attributes={"status": "succeeded"})
+
+    _, result = self._follow(backend, min_interval=1, guest_attributes=True)
+
+    self.assertEqual(result, serial_port_follower.FAILED)
+
+  def test_drain_is_bounded(self):
+    """Verifies the published result is returned if no marker shows up."""
+    backend = FakeSerialPortBackend(
+        [_line("start")],
+        attributes={"status": "failed", "log-flushed": "1"})
+
+    follower, result = self._follow(backend, guest_attributes=True)
+
+    self.assertEqual(result, serial_port_follower.FAILED)
+    self.assertEqual(follower.polls, 1 + serial_port_follower._DRAIN_POLLS)
+
+
+if __name__ == '__main__':
+  unittest.main()
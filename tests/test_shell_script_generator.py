@@ -12,122 +12,131 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import re
+import subprocess
+import tempfile
 import unittest
 
+from custom_image_utils import args_parser
 from custom_image_utils import shell_script_generator
 
-_expected_script = """
-#!/usr/bin/env bash
-
-# Script for creating Dataproc custom image.
-
-set -euxo pipefail
-
-RED='\\e[0;31m'
-GREEN='\\e[0;32m'
-NC='\\e[0m'
-
-function exit_handler() {
-  echo 'Cleaning up before exiting.'
-
-  if [[ -f /tmp/custom-image-my-image-20190611-160823/vm_created ]]; then
-    echo 'Deleting VM instance.'
-    gcloud compute instances delete my-image-install         --project=my-project --zone=us-west1-a -q
-  elif [[ -f /tmp/custom-image-my-image-20190611-160823/disk_created ]]; then
-    echo 'Deleting disk.'
-    gcloud compute disks delete my-image-install --project=my-project --zone=us-west1-a -q
-  fi
-
-  echo 'Uploading local logs to GCS bucket.'
-  gcloud storage rsync --recursive /tmp/custom-image-my-image-20190611-160823/logs/ gs://my-bucket/custom-image-my-image-20190611-160823/logs/
-
-  if [[ -f /tmp/custom-image-my-image-20190611-160823/image_created ]]; then
-    echo -e "${GREEN}Workflow succeeded, check logs at /tmp/custom-image-my-image-20190611-160823/logs/ or gs://my-bucket/custom-image-my-image-20190611-160823/logs/${NC}"
-    exit 0
-  else
-    echo -e "${RED}Workflow failed, check logs at /tmp/custom-image-my-image-20190611-160823/logs/ or gs://my-bucket/custom-image-my-image-20190611-160823/logs/${NC}"
-    exit 1
-  fi
-}
-
-function main() {
-  echo 'Uploading files to GCS bucket.'
-  declare -a sources_k=([0]='run.sh' [1]='init_actions.sh' [2]='ext'\\''ra_src.txt')
-  declare -a sources_v=([0]='startup_script/run.sh' [1]='/tmp/my-script.sh' [2]='/path/to/extra.txt')
-  for i in "${!sources_k[@]}"; do
-    gcloud storage cp "${sources_v[i]}" "gs://my-bucket/custom-image-my-image-20190611-160823/sources/${sources_k[i]}"
-  done
-
-  echo 'Creating disk.'
-  if [[ 'projects/my-dataproc-project/global/images/family/debian-10' = '' ||  'projects/my-dataproc-project/global/images/family/debian-10' = 'None' ]]; then
-     IMAGE_SOURCE="--image=projects/cloud-dataproc/global/images/dataproc-1-4-deb9-20190510-000000-rc01"
-  else
-     IMAGE_SOURCE="--image-family=projects/my-dataproc-project/global/images/family/debian-10"
-  fi
-  
-  gcloud compute disks create my-image-install       --project=my-project       --zone=us-west1-a       ${IMAGE_SOURCE}       --type=pd-ssd       --size=40GB
-
-  touch "/tmp/custom-image-my-image-20190611-160823/disk_created"
-
-  echo 'Creating VM instance to run customization script.'
-  gcloud compute instances create my-image-install       --project=my-project       --zone=us-west1-a              --subnet=my-subnet       --no-address       --machine-type=n1-standard-2       --disk=auto-delete=yes,boot=yes,mode=rw,name=my-image-install       --accelerator=type=nvidia-tesla-v100,count=2 --maintenance-policy terminate       --service-account=my-service-account       --scopes=cloud-platform       --metadata=shutdown-timer-in-sec=500,custom-sources-path=gs://my-bucket/custom-image-my-image-20190611-160823/sources,key1=value1,key2=value2       --metadata-from-file startup-script=startup_script/run.sh
-  touch /tmp/custom-image-my-image-20190611-160823/vm_created
-
-  echo 'Waiting for customization script to finish and VM shutdown.'
-  gcloud compute instances tail-serial-port-output my-image-install       --project=my-project       --zone=us-west1-a       --port=1 2>&1       | grep 'startup-script'       | tee /tmp/custom-image-my-image-20190611-160823/logs/startup-script.log       || true
-
-  echo 'Checking customization script result.'
-  if grep 'BuildFailed:' /tmp/custom-image-my-image-20190611-160823/logs/startup-script.log; then
-    echo -e "${RED}Customization script failed.${NC}"
-    exit 1
-  elif grep 'BuildSucceeded:' /tmp/custom-image-my-image-20190611-160823/logs/startup-script.log; then
-    echo -e "${GREEN}Customization script succeeded.${NC}"
-  else
-    echo 'Unable to determine the customization script result.'
-    exit 1
-  fi
-
-  echo 'Creating custom image.'
-  gcloud compute images create my-image       --project=my-project       --source-disk-zone=us-west1-a       --source-disk=my-image-install       --storage-location=us-east1       --family=debian9
-  touch /tmp/custom-image-my-image-20190611-160823/image_created
-}
-
-trap exit_handler EXIT
-mkdir -p /tmp/custom-image-my-image-20190611-160823/logs
-main "$@" 2>&1 | tee /tmp/custom-image-my-image-20190611-160823/logs/workflow.log
-"""
+_RUN_ID = 'custom-image-my-image-20190611-160823'
+_LOG_DIR = 'gs://my-bucket/{}/logs'.format(_RUN_ID)
+
+
+def _args(*extra_args):
+  """Returns the generator arguments of a build, as image_builder sets them."""
+  args = vars(args_parser.parse_args([
+      '--image-name', 'my-image',
+      '--dataproc-version', '2.2.5-debian12',
+      '--customization-script', '/tmp/my-script.sh',
+      '--gcs-bucket', 'gs://my-bucket',
+      '--project-id', 'my-project',
+      '--metadata', 'key1=value1,key2=value2',
+      '--machine-type', 'n1-standard-2',
+      '--disk-size', '40',
+      '--subnetwork', 'my-subnet',
+      '--no-external-ip',
+      '--service-account', 'my-service-account',
+      '--storage-location', 'us-east1',
+      '--trusted-cert', '',
+  ] + list(extra_args)))
+  args.update({
+      'run_id': _RUN_ID,
+      'dataproc_base_image': 'projects/cloud-dataproc/global/images/'
+                             'dataproc-2-2-deb12-20250101-000000-rc01',
+      'extra_sources': {"ext'ra_src.txt": '/path/to/extra.txt'},
+      'defer_log_upload': True,
+      'shutdown_timer_in_sec': 300,
+  })
+  return args
 
 
 class TestShellScriptGenerator(unittest.TestCase):
+
   def test_generate_shell_script(self):
-    args = {
-        'run_id': 'custom-image-my-image-20190611-160823',
-        'family': 'debian9',
-        'image_name': 'my-image',
-        'customization_script': '/tmp/my-script.sh',
-        'metadata': 'key1=value1,key2=value2',
-        'extra_sources': {"ext'ra_src.txt": "/path/to/extra.txt"},
-        'machine_type': 'n1-standard-2',
-        'disk_size': 40,
-        'accelerator': 'type=nvidia-tesla-v100,count=2',
-        'gcs_bucket': 'gs://my-bucket',
-        'network': 'my-network',
-        'subnetwork': 'my-subnet',
-        'no_external_ip': True,
-        'zone': 'us-west1-a',
-        'dataproc_base_image':
-          'projects/cloud-dataproc/global/images/dataproc-1-4-deb9-20190510-000000-rc01',
-        'service_account': 'my-service-account',
-        'oauth': '',
-        'project_id': 'my-project',
-        'storage_location': 'us-east1',
-        'shutdown_timer_in_sec': 500,
-        'base_image_family': 'projects/my-dataproc-project/global/images/family/debian-10'
-    }
-
-    script = shell_script_generator.Generator().generate(args)
-
-    self.assertEqual(script, _expected_script)
+    """Verifies the workflow of a single zone, standard VM build."""
+    script = shell_script_generator.Generator().generate(
+        _args('--zone', 'us-west1-a'))
+
+    self.assertIn("[3]='ext'\\''ra_src.txt'", script)
+    self.assertIn('for build_zone in us-west1-a; do', script)
+    self.assertIn('--machine-type=n1-standard-2', script)
+    self.assertIn('--subnet=my-subnet', script)
+    self.assertIn('--no-address', script)
+    self.assertNotIn('--provisioning-model', script)
+    self.assertIn(
+        '--metadata=shutdown-timer-in-sec=300,'
+        'custom-sources-path=gs://my-bucket/{}/sources,'.format(_RUN_ID),
+        script)
+    self.assertIn(
+        'vm-telemetry-uri={}/vm-telemetry.csv,key1=value1,key2=value2'.format(
+            _LOG_DIR), script)
+    self.assertNotIn('customization-profile-uri', script)
+    self.assertIn('--labels=goog-dataproc-version=2-2-5-debian12', script)
+    self.assertIn('--storage-location=us-east1', script)
+    # Without shared rate limits, calls are not throttled across builds.
+    self.assertIn('    :\n    if eval "$cmd"', script)
+    self.assertIn('--guest-attributes', script)
+    self.assertIn('zone_flag="--zone=${build_zone}"', script)
+    self.assertNotIn('--shared-rate-limits', script)
+    # The logs of a successful build are uploaded by image_builder.
+    self.assertIn('"true" != "true" ]]; then', script)
+
+  def test_zones_spot_and_rate_limits(self):
+    """Verifies the zone loop, the spot restart loop and shared limits."""
+    script = shell_script_generator.Generator().generate(_args(
+        '--zone', 'us-west1-a', '--zones', 'us-west1-a,us-west1-b',
+        '--provisioning-model', 'spot', '--shared-rate-limits',
+        '--profile-customization'))
+
+    self.assertIn('for build_zone in us-west1-a us-west1-b; do', script)
+    self.assertIn('if (( status != {} )); then'.format(
+        shell_script_generator.rate_limiter.CAPACITY_EXIT_CODE), script)
+    self.assertIn(
+        '--provisioning-model=SPOT --instance-termination-action=STOP', script)
+    self.assertIn('if (( follower_status != {} )); then'.format(
+        shell_script_generator.serial_port_follower.PREEMPTED_EXIT_CODE),
+                  script)
+    self.assertIn('if (( preemptions >= {} )); then'.format(
+        shell_script_generator.spot_vm.MAX_PREEMPTIONS), script)
+    self.assertIn('gcloud compute instances start my-image-install', script)
+    self.assertIn('-m custom_image_utils.rate_limiter --state-dir=', script)
+    self.assertIn('--guest-attributes --shared-rate-limits', script)
+    self.assertIn('"${source_args[@]}" --shared-rate-limits', script)
+    self.assertIn(
+        'customization-profile-uri={}/customization.xtrace'.format(_LOG_DIR),
+        script)
+
+  def test_spans_are_balanced(self):
+    """Verifies each span has one begin and one end, per zone in the loop."""
+    script = shell_script_generator.Generator().generate(_args(
+        '--zone', 'us-west1-a', '--zones', 'us-west1-a,us-west1-b'))
+
+    events = collections.Counter(
+        re.findall(r'^\s*span (begin|end) (\S+)$', script, re.MULTILINE))
+
+    names = set(name for _, name in events)
+    self.assertIn('place-instance', names)
+    self.assertIn('"create-instance:${build_zone}"', names)
+    for name in names:
+      self.assertEqual(events['begin', name], 1, name)
+      self.assertEqual(events['end', name], 1, name)
+
+  def test_generated_script_is_valid_bash(self):
+    """Verifies the generated scripts parse with bash -n."""
+    for extra_args in ((), ('--zones', 'us-west1-a,us-west1-b',
+                            '--provisioning-model', 'spot',
+                            '--shared-rate-limits')):
+      script = shell_script_generator.Generator().generate(
+          _args('--zone', 'us-west1-a', *extra_args))
+      with tempfile.NamedTemporaryFile('w', suffix='.sh') as f:
+        f.write(script)
+        f.flush()
+        result = subprocess.run(['bash', '-n', f.name], capture_output=True,
+                                text=True, check=False)
+      self.assertEqual(result.returncode, 0, result.stderr)
 
 
 if __name__ == '__main__':
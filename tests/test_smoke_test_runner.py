@@ -0,0 +1,122 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import os
+import threading
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import smoke_test_runner
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeDataprocBackend(cloud_backend.CloudBackend):
+  """Records cluster calls; jobs wait for each other to prove concurrency."""
+
+  def __init__(self, jobs, failing=()):
+    self.calls = []
+    self.clusters = {}
+    self.failing = failing
+    self._barrier = threading.Barrier(jobs, timeout=5)
+    self._lock = threading.Lock()
+
+  def upload_file(self, local_path, gcs_uri):
+    with self._lock:
+      self.calls.append(("upload_file", gcs_uri))
+
+  def create_cluster(self, project_id, region, cluster):
+    self.calls.append(("create_cluster", cluster["clusterName"]))
+    self.clusters[cluster["clusterName"]] = cluster
+
+  def submit_job(self, project_id, region, job):
+    self._barrier.wait()
+    script = job.get("pysparkJob", {}).get("mainPythonFileUri", "")
+    with self._lock:
+      self.calls.append(("submit_job", script or "spark-pi"))
+    if any(script.endswith(name) for name in self.failing):
+      raise cloud_backend.CloudApiError("job failed")
+
+  def delete_cluster(self, project_id, region, cluster_name):
+    self.calls.append(("delete_cluster", cluster_name))
+
+
+def _args(**kwargs):
+  args = dict(
+      image_name="img", project_id="p", zone="us-central1-a",
+      network="", subnetwork="", no_external_ip=True,
+      accelerator=None, gcs_bucket="gs://bucket/", dry_run=False,
+      no_smoke_test=False, smoke_test_mode=smoke_test_runner.CLUSTER,
+      smoke_test_checks=None)
+  args.update(kwargs)
+  return argparse.Namespace(**args)
+
+
+class TestSmokeTestRunner(unittest.TestCase):
+
+  def setUp(self):
+    self.cwd = os.getcwd()
+    os.chdir(_REPO_DIR)
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    cloud_backend.set_backend(None)
+
+  def test_checks_run_concurrently_on_one_cluster(self):
+    """Verifies the checks share one single-node cluster, deleted after."""
+    backend = FakeDataprocBackend(jobs=3)
+    cloud_backend.set_backend(backend)
+    output = io.StringIO()
+
+    smoke_test_runner.run(_args(), output=output)
+
+    names = [call[0] for call in backend.calls]
+    self.assertEqual(names.count("create_cluster"), 1)
+    self.assertEqual(names.count("submit_job"), 3)
+    self.assertEqual(names[-1], "delete_cluster")
+    self.assertTrue(all(uri.startswith("gs://bucket/smoke-test/")
+                        for name, uri in backend.calls
+                        if name == "upload_file"))
+    cluster = list(backend.clusters.values())[0]
+    self.assertEqual(cluster["config"]["softwareConfig"]["properties"],
+                     {"dataproc:dataproc.allow.zero.workers": "true"})
+    self.assertEqual(cluster["config"]["masterConfig"]["imageUri"],
+                     "projects/p/global/images/img")
+    report = output.getvalue()
+    for check in ("cluster-create", "spark-pi", "pyspark", "components"):
+      self.assertIn(check, report)
+
+  def test_failed_check_is_reported(self):
+    """Verifies a failed check fails the test once all checks finished."""
+    backend = FakeDataprocBackend(jobs=2, failing=("gpu_visibility.py",))
+    cloud_backend.set_backend(backend)
+
+    with self.assertRaises(RuntimeError) as e:
+      smoke_test_runner.run(
+          _args(accelerator="type=nvidia-tesla-t4,count=2",
+                smoke_test_checks="spark-pi,gpu"),
+          output=io.StringIO())
+
+    self.assertIn("gpu: job failed", str(e.exception))
+    self.assertEqual(backend.calls[-1][0], "delete_cluster")
+    cluster = list(backend.clusters.values())[0]
+    self.assertEqual(cluster["config"]["masterConfig"]["accelerators"],
+                     [{"acceleratorTypeUri": "nvidia-tesla-t4",
+                       "acceleratorCount": 2}])
+
+
+if __name__ == '__main__':
+  unittest.main()
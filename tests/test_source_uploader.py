@@ -0,0 +1,99 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import source_uploader
+
+
+class FakeStorageBackend(cloud_backend.CloudBackend):
+  """Keeps uploaded objects in memory."""
+
+  def __init__(self):
+    self.objects = {}
+    self.uploads = []
+    self.lock = threading.Lock()
+
+  def object_exists(self, gcs_uri):
+    return gcs_uri in self.objects
+
+  def upload_file(self, local_path, gcs_uri):
+    with open(local_path) as f:
+      contents = f.read()
+    with self.lock:
+      self.objects[gcs_uri] = contents
+      self.uploads.append(gcs_uri)
+
+
+class TestSourceUploader(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.backend = FakeStorageBackend()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _write(self, name, contents):
+    path = os.path.join(self.temp_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      f.write(contents)
+    return path
+
+  def test_uploads_only_missing_objects(self):
+    """Verifies unchanged and duplicate sources are uploaded once."""
+    sources = {
+        "run.sh": self._write("run.sh", "echo run"),
+        "init_actions.sh": self._write("init.sh", "echo init"),
+        "copy.sh": self._write("copy.sh", "echo init"),
+    }
+
+    files = source_uploader.upload_sources(sources, "gs://bucket",
+                                           self.backend)
+    self.assertEqual(len(self.backend.uploads), 2)
+    source_uploader.upload_sources(sources, "gs://bucket", self.backend)
+
+    self.assertEqual(len(self.backend.uploads), 2)
+    digest = hashlib.sha256(b"echo run").hexdigest()
+    self.assertEqual(
+        files[0].uri,
+        "gs://bucket/custom-image-sources/sha256/{}".format(digest))
+
+  def test_directories_and_manifest(self):
+    """Verifies directories are expanded and listed in the manifest."""
+    self._write("wheels/a.whl", "a")
+    self._write("wheels/sub/b.whl", "bb")
+
+    files = source_uploader.upload_sources(
+        {"wheels": os.path.join(self.temp_dir, "wheels")}, "gs://bucket",
+        self.backend)
+    source_uploader.write_manifest(files, "gs://bucket/run/sources.manifest",
+                                   self.backend)
+
+    lines = self.backend.objects["gs://bucket/run/sources.manifest"].split(
+        "\n")
+    self.assertEqual([line.split("\t")[0] for line in lines if line],
+                     ["wheels/a.whl", "wheels/sub/b.whl"])
+    self.assertEqual(lines[1].split("\t")[2], "2")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import spot_vm
+
+
+class TestSpotVm(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def test_read_log(self):
+    """Verifies preemption markers are summed, ignoring their xtrace."""
+    log_file = os.path.join(self.temp_dir, "workflow.log")
+    with open(log_file, "w") as f:
+      f.write("+ echo 'spot-preemption: 1 lost 95'\n"
+              "spot-preemption: 1 lost 95\n"
+              "Customization result from serial port: preempted (3 polls)\n"
+              "spot-preemption: 2 lost 40\n")
+
+    stats = spot_vm.read_log(log_file)
+
+    self.assertEqual(stats.count, 2)
+    self.assertEqual(stats.lost_sec, 135)
+    self.assertEqual(stats.format_report(),
+                     "Spot VM preempted 2 time(s), 135s of build time lost.")
+
+  def test_gcloud_flags(self):
+    """Verifies only spot VMs get scheduling flags."""
+    self.assertEqual(
+        spot_vm.gcloud_flags(argparse.Namespace(provisioning_model="spot")),
+        "--provisioning-model=SPOT --instance-termination-action=STOP")
+    self.assertEqual(
+        spot_vm.gcloud_flags(argparse.Namespace(
+            provisioning_model="standard")), "")
+    self.assertEqual(spot_vm.scheduling(argparse.Namespace()), {})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,82 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import tracing
+
+
+class TestTracing(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.times = iter([10.0, 12.5, 13.0, 14.0])
+    self.tracer = tracing.Tracer(clock=lambda: next(self.times))
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def test_failed_span(self):
+    """Verifies spans record their duration and failures."""
+    with self.tracer.span("preflight"):
+      pass
+    with self.assertRaises(RuntimeError):
+      with self.tracer.span("label", image="i"):
+        raise RuntimeError("label failed")
+
+    spans = self.tracer.sorted_spans()
+    self.assertEqual([(s.name, s.duration, s.status) for s in spans],
+                     [("preflight", 2.5, tracing.OK),
+                      ("label", 1.0, tracing.ERROR)])
+    self.assertEqual(spans[1].attrs, {"image": "i"})
+    self.assertIn("preflight", tracing.format_summary(self.tracer))
+
+  def test_export(self):
+    """Verifies spans are written as JSON lines and as a Chrome trace."""
+    with self.tracer.span("preflight"):
+      pass
+
+    self.tracer.export(self.temp_dir)
+
+    with open(os.path.join(self.temp_dir, tracing.JSONL_FILE)) as f:
+      lines = [json.loads(line) for line in f]
+    self.assertEqual(lines[0]["name"], "preflight")
+    with open(os.path.join(self.temp_dir, tracing.CHROME_TRACE_FILE)) as f:
+      events = json.load(f)["traceEvents"]
+    self.assertEqual(events[0]["ph"], "X")
+    self.assertEqual(events[0]["ts"], 10000000)
+    self.assertEqual(events[0]["dur"], 2500000)
+
+  def test_read_bash_spans(self):
+    """Verifies spans of the Shell script are read, open ones failed."""
+    path = os.path.join(self.temp_dir, tracing.BASH_SPANS_FILE)
+    with open(path, "w") as f:
+      f.write("begin\tcreate-disk\t100.0\n"
+              "end\tcreate-disk\t130.5\n"
+              "begin\tcreate-instance\t131.0\n")
+
+    tracing.read_bash_spans(path, self.tracer, end_time=150.0)
+
+    self.assertEqual(
+        [(s.name, s.duration, s.status) for s in self.tracer.sorted_spans()],
+        [("create-disk", 30.5, tracing.OK),
+         ("create-instance", 19.0, tracing.ERROR)])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,145 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from custom_image_utils import vm_telemetry
+from tests import fake_backends
+
+_GIB = 1024 ** 3
+_HEADER = ("time,cpu_busy_jiffies,cpu_iowait_jiffies,cpu_total_jiffies,"
+           "mem_total_kb,mem_available_kb,swap_total_kb,swap_free_kb,"
+           "disk_reads,disk_writes,disk_read_bytes,disk_write_bytes,"
+           "disk_busy_ms,net_rx_bytes,net_tx_bytes,disk_used_bytes")
+
+
+def _sample(time, cpu_busy=0, cpu_total=0, iowait=0, disk_busy_ms=0,
+            net_rx=0, disk_reads=0, disk_used=10 * _GIB, swap_free=1024):
+  return ",".join(str(v) for v in (
+      time, cpu_busy, iowait, cpu_total, 8 * 1024 * 1024, 6 * 1024 * 1024,
+      1024, swap_free, disk_reads, 0, disk_reads * 4096, 0, disk_busy_ms,
+      net_rx, 0, disk_used))
+
+
+def _telemetry(*samples):
+  return "\n".join((_HEADER, "# boot=1 cpus=4 interval-sec=5") + samples)
+
+
+class TestSummary(unittest.TestCase):
+
+  def _summary(self, *samples):
+    return vm_telemetry.Summary(*vm_telemetry.parse(
+        io.StringIO(_telemetry(*samples))))
+
+  def test_cpu_bound(self):
+    """Verifies a build with busy vCPUs most of the time is CPU-bound."""
+    summary = self._summary(
+        _sample(0), _sample(10, cpu_busy=3600, cpu_total=4000),
+        _sample(20, cpu_busy=7200, cpu_total=8000),
+        _sample(25, cpu_busy=7300, cpu_total=10000))
+
+    self.assertEqual(summary.cpus, "4")
+    self.assertEqual(summary.duration, 25)
+    self.assertAlmostEqual(summary.bound_shares[vm_telemetry.CPU], 0.8)
+    self.assertEqual(summary.bound, vm_telemetry.CPU)
+    self.assertIn("The build was CPU-bound", summary.format_report())
+
+  def test_io_and_network_bound(self):
+    """Verifies busy disks and transfers bind the build to IO or network."""
+    io_bound = self._summary(
+        _sample(0), _sample(10, cpu_total=4000, disk_busy_ms=9000,
+                            disk_reads=5000))
+    network_bound = self._summary(
+        _sample(0), _sample(10, cpu_busy=400, cpu_total=4000,
+                            net_rx=100 * 1024 * 1024))
+    idle = self._summary(_sample(0), _sample(10, cpu_total=4000))
+
+    self.assertEqual(io_bound.bound, vm_telemetry.IO)
+    self.assertEqual(io_bound.iops, 500)
+    self.assertEqual(network_bound.bound, vm_telemetry.NETWORK)
+    self.assertEqual(network_bound.rx_bytes_per_sec, 10 * 1024 * 1024)
+    self.assertIsNone(idle.bound)
+    self.assertIn("not bound", idle.format_report())
+
+  def test_restart(self):
+    """Verifies intervals over a restart of the VM are skipped."""
+    summary = self._summary(
+        _sample(0), _sample(10, cpu_busy=4000, cpu_total=4000),
+        "1,2,3", "# boot=2 cpus=4 interval-sec=5",
+        # Taken right after the boot, before the counters grew past the
+        # ones of the first boot.
+        _sample(100, cpu_busy=5000, cpu_total=5000),
+        _sample(110, cpu_busy=5000, cpu_total=9000, disk_used=12 * _GIB,
+                swap_free=0))
+
+    self.assertEqual(summary.boots, 2)
+    self.assertEqual(summary.duration, 20)
+    self.assertEqual(summary.bound_shares[vm_telemetry.CPU], 0.5)
+    self.assertEqual(summary.disk_used_bytes_peak, 12 * _GIB)
+    self.assertEqual(summary.mem_used_bytes_peak, 2 * _GIB)
+    self.assertIn("4 vCPUs, 2 boots", summary.format_report())
+    self.assertIn("The VM swapped", summary.format_report())
+
+
+class TestReport(unittest.TestCase):
+
+  def setUp(self):
+    self.log_dir = tempfile.mkdtemp()
+    self.args = argparse.Namespace(dry_run=False, log_dir=self.log_dir,
+                                   gcs_log_dir="gs://bucket/run/logs")
+
+  def tearDown(self):
+    shutil.rmtree(self.log_dir)
+
+  def test_report(self):
+    """Verifies the telemetry is downloaded to the log dir and summarized."""
+    backend = fake_backends.FakeLogBackend({
+        "gs://bucket/run/logs/vm-telemetry.csv": _telemetry(
+            _sample(0), _sample(10, cpu_busy=4000, cpu_total=4000))})
+    output = io.StringIO()
+
+    vm_telemetry.report(self.args, output, backend)
+
+    self.assertIn("VM telemetry over 10s of customization on 4 vCPUs",
+                  output.getvalue())
+    self.assertTrue(os.path.exists(
+        os.path.join(self.log_dir, vm_telemetry.TELEMETRY_FILE)))
+
+  def test_missing_telemetry(self):
+    """Verifies a build without telemetry prints nothing."""
+    output = io.StringIO()
+
+    vm_telemetry.report(self.args, output, fake_backends.FakeLogBackend({}))
+
+    self.assertEqual(output.getvalue(), "")
+
+  def test_telemetry_missing_columns(self):
+    """Verifies telemetry which cannot be summarized prints nothing."""
+    backend = fake_backends.FakeLogBackend({
+        "gs://bucket/run/logs/vm-telemetry.csv": "time,cpu_busy_jiffies\n"
+                                                 "0,0\n10,100\n"})
+    output = io.StringIO()
+
+    vm_telemetry.report(self.args, output, backend)
+
+    self.assertEqual(output.getvalue(), "")
+
+
+if __name__ == "__main__":
+  unittest.main()
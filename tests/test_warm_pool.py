@@ -0,0 +1,89 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent import futures
+import threading
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import warm_pool
+
+_BASE_IMAGE = "projects/cloud-dataproc/global/images/dataproc-2-2-deb12"
+
+
+class FakeSnapshotBackend(cloud_backend.CloudBackend):
+  """Keeps snapshots in memory and records disk calls."""
+
+  def __init__(self):
+    self.snapshots = {}
+    self.calls = []
+    self.lock = threading.Lock()
+
+  def describe_snapshot(self, project_id, snapshot_name):
+    if snapshot_name not in self.snapshots:
+      raise cloud_backend.NotFoundError(snapshot_name)
+    return self.snapshots[snapshot_name]
+
+  def create_disk(self, project_id, zone, disk):
+    with self.lock:
+      self.calls.append(("create_disk", disk["name"]))
+
+  def create_snapshot(self, project_id, zone, disk_name, snapshot):
+    with self.lock:
+      self.calls.append(("create_snapshot", disk_name))
+      self.snapshots[snapshot["name"]] = dict(snapshot, status="READY")
+
+  def delete_disk(self, project_id, zone, disk_name):
+    with self.lock:
+      self.calls.append(("delete_disk", disk_name))
+
+
+class TestWarmPool(unittest.TestCase):
+
+  def test_snapshot_is_created_once(self):
+    """Verifies concurrent builds on one base image share one snapshot."""
+    backend = FakeSnapshotBackend()
+    times = iter([100.0, 142.0])
+
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+      snapshots = list(executor.map(
+          lambda _: warm_pool.ensure_snapshot(
+              backend, "p", "z", _BASE_IMAGE, clock=lambda: next(times)),
+          range(4)))
+
+    name = warm_pool.snapshot_name(_BASE_IMAGE)
+    self.assertEqual(backend.calls, [
+        ("create_disk", name + "-disk"),
+        ("create_snapshot", name + "-disk"),
+        ("delete_disk", name + "-disk"),
+    ])
+    self.assertEqual({s.name for s in snapshots}, {name})
+    self.assertTrue(all(s.image_disk_sec == 42 for s in snapshots))
+    self.assertLessEqual(len(name + "-disk"), 63)
+
+  def test_format_savings(self):
+    """Verifies the time saved is reported."""
+    snapshot = warm_pool.BaseDiskSnapshot("snap", 40.0)
+
+    self.assertIn("saved 30.0s", warm_pool.format_savings(snapshot, 10.0))
+
+  def test_families_are_not_supported(self):
+    """Verifies image families are not snapshotted."""
+    self.assertFalse(warm_pool.supports(
+        "projects/p/global/images/family/dataproc-2-2-deb12"))
+    self.assertTrue(warm_pool.supports(_BASE_IMAGE))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,144 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import threading
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import tracing
+from custom_image_utils import workflow_engine
+
+
+class TestWorkflowEngine(unittest.TestCase):
+
+  def setUp(self):
+    self.calls = []
+    self.sleeps = []
+    self.cleanups = []
+
+  def _run(self, steps):
+    workflow = workflow_engine.Workflow(
+        steps, cleanup=lambda w: self.cleanups.append(w.succeeded),
+        output=io.StringIO(), sleep=self.sleeps.append)
+    try:
+      workflow.run()
+    finally:
+      self.statuses = [record.status for record in workflow.records]
+      self.attempts = [record.attempts for record in workflow.records]
+
+  def _step(self, name, failures=0, error=cloud_backend.CloudApiError,
+            **kwargs):
+    remaining = [failures]
+
+    def action(context):
+      self.calls.append((name, context.attempt))
+      if remaining[0]:
+        remaining[0] -= 1
+        raise error("{} failed".format(name))
+
+    return workflow_engine.Step(name, action, **kwargs)
+
+  def test_steps_run_in_order(self):
+    """Verifies all steps run once, in order, and cleanup runs."""
+    self._run([self._step("a"), self._step("b")])
+
+    self.assertEqual(self.calls, [("a", 1), ("b", 1)])
+    self.assertEqual(self.statuses, [workflow_engine.SUCCEEDED] * 2)
+    self.assertEqual(self.cleanups, [True])
+
+  def test_retry_policy(self):
+    """Verifies API errors are retried with backoff up to max_attempts."""
+    retry = workflow_engine.RetryPolicy(max_attempts=3, delay_sec=1,
+                                        backoff=2)
+
+    self._run([self._step("flaky", failures=2, retry=retry)])
+
+    self.assertEqual(self.attempts, [3])
+    self.assertEqual(self.sleeps, [1, 2])
+
+  def test_failure_stops_workflow_and_cleans_up(self):
+    """Verifies a failed step skips the next ones and cleanup still runs."""
+    steps = [
+        self._step("broken", failures=1, error=ValueError,
+                   retry=workflow_engine.API_RETRY),
+        self._step("next"),
+    ]
+
+    with self.assertRaises(workflow_engine.WorkflowError) as e:
+      self._run(steps)
+
+    self.assertEqual(e.exception.step_name, "broken")
+    # ValueError is not an API error, so it is not retried.
+    self.assertEqual(self.attempts, [1, 0])
+    self.assertEqual(self.statuses,
+                     [workflow_engine.FAILED, workflow_engine.SKIPPED])
+    self.assertEqual(self.cleanups, [False])
+
+  def test_permanent_api_error_is_not_retried(self):
+    """Verifies API errors which would fail again are not retried."""
+    steps = [
+        self._step("missing", failures=1, error=cloud_backend.NotFoundError,
+                   retry=workflow_engine.API_RETRY),
+    ]
+
+    with self.assertRaises(workflow_engine.WorkflowError):
+      self._run(steps)
+
+    self.assertEqual(self.attempts, [1])
+    self.assertEqual(self.sleeps, [])
+
+  def test_timeout(self):
+    """Verifies a hung step fails once its timeout expires."""
+    release = threading.Event()
+    steps = [
+        workflow_engine.Step("hung", lambda context: release.wait(),
+                             timeout_sec=0.1),
+    ]
+
+    with self.assertRaises(workflow_engine.WorkflowError) as e:
+      self._run(steps)
+    release.set()
+
+    self.assertIsInstance(e.exception.cause, workflow_engine.StepTimeoutError)
+    self.assertEqual(self.statuses, [workflow_engine.FAILED])
+
+  def test_format_report(self):
+    """Verifies the report lists every step with its state."""
+    workflow = workflow_engine.Workflow([self._step("a")],
+                                        output=io.StringIO())
+    workflow.run()
+
+    report = workflow_engine.format_report(workflow.records)
+
+    self.assertIn("a ", report)
+    self.assertIn("SUCCEEDED", report)
+
+  def test_steps_are_traced(self):
+    """Verifies each step and the cleanup are recorded as spans."""
+    tracer = tracing.Tracer()
+    workflow = workflow_engine.Workflow(
+        [self._step("a"), self._step("b", error=ValueError, failures=1)],
+        cleanup=lambda w: None, output=io.StringIO(), tracer=tracer)
+
+    with self.assertRaises(workflow_engine.WorkflowError):
+      workflow.run()
+
+    self.assertEqual(
+        [(span.name, span.status) for span in tracer.sorted_spans()],
+        [("a", tracing.OK), ("b", tracing.ERROR), ("cleanup", tracing.OK)])
+
+
+if __name__ == '__main__':
+  unittest.main()
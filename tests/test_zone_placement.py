@@ -0,0 +1,137 @@
+# Copyright 2026 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#            http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from custom_image_utils import cloud_backend
+from custom_image_utils import zone_placement
+
+_KEY = ("a2-highgpu-1g", "nvidia-tesla-a100")
+
+
+def _exhausted(zone):
+  return cloud_backend.CloudApiError(
+      "Command failed with exit code 1: gcloud compute instances create\n"
+      " - The zone 'projects/p/zones/{}' does not have enough resources "
+      "available to fulfill the request.".format(zone))
+
+
+class TestZonePlacement(unittest.TestCase):
+
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.cache_dir)
+    self.now = 10000.0
+    self.history = zone_placement.ZoneHistory(self.cache_dir,
+                                              clock=lambda: self.now)
+
+  def test_rank(self):
+    """Verifies zones recently out of resources and slow zones come last."""
+    self.history.record(_KEY, "us-central1-a", zone_placement.EXHAUSTED, 5)
+    self.history.record(_KEY, "us-central1-b", zone_placement.CREATED, 40)
+    self.history.record(_KEY, "us-central1-c", zone_placement.CREATED, 20)
+    zones = ["us-central1-a", "us-central1-b", "us-central1-c",
+             "us-central1-f"]
+
+    self.assertEqual(self.history.rank(_KEY, zones), [
+        "us-central1-f", "us-central1-c", "us-central1-b", "us-central1-a"])
+    # Other machine types are ranked separately.
+    self.assertEqual(self.history.rank(("n1-standard-1", ""), zones), zones)
+
+  def test_ranked_placement_skips_exhausted_zones(self):
+    """Verifies the next zone is tried when a zone is out of resources."""
+    attempts = []
+
+    def create(zone):
+      attempts.append(zone)
+      if zone == "us-central1-a":
+        raise _exhausted(zone)
+      return "vm-" + zone
+
+    zone, result = zone_placement.place(
+        ["us-central1-a", "us-central1-b", "us-central1-c"], create,
+        key=_KEY, history=self.history, output=io.StringIO())
+
+    self.assertEqual((zone, result), ("us-central1-b", "vm-us-central1-b"))
+    self.assertEqual(attempts, ["us-central1-a", "us-central1-b"])
+    outcomes = [s["outcome"] for s in self.history.samples(_KEY,
+                                                           "us-central1-a")]
+    self.assertEqual(outcomes, [zone_placement.EXHAUSTED])
+
+  def test_other_errors_are_raised(self):
+    """Verifies errors other than missing resources stop the placement."""
+
+    def create(zone):
+      raise cloud_backend.CloudApiError("Invalid value for machine type")
+
+    with self.assertRaises(cloud_backend.CloudApiError):
+      zone_placement.place(["us-central1-a", "us-central1-b"], create,
+                           output=io.StringIO())
+
+  def test_no_zone_with_resources(self):
+
+    def create(zone):
+      raise _exhausted(zone)
+
+    with self.assertRaises(zone_placement.PlacementError):
+      zone_placement.place(["us-central1-a", "us-central1-b"], create,
+                           strategy=zone_placement.PARALLEL,
+                           output=io.StringIO())
+
+  def test_parallel_placement_releases_other_vms(self):
+    """Verifies the first VM created is kept and the others deleted."""
+    slow_zone_may_finish = threading.Event()
+    released = []
+    release_done = threading.Event()
+
+    def create(zone):
+      if zone == "us-central1-b":
+        slow_zone_may_finish.wait(5)
+      return "vm-" + zone
+
+    def release(zone, result):
+      released.append((zone, result))
+      release_done.set()
+
+    zone, _ = zone_placement.place(
+        ["us-central1-b", "us-central1-c"], create, release=release,
+        strategy=zone_placement.PARALLEL, output=io.StringIO())
+    slow_zone_may_finish.set()
+    release_done.wait(5)
+
+    self.assertEqual(zone, "us-central1-c")
+    self.assertEqual(released, [("us-central1-b", "vm-us-central1-b")])
+
+  def test_record_log(self):
+    """Verifies the placements printed by the workflow script are recorded."""
+    log_file = os.path.join(self.cache_dir, "workflow.log")
+    with open(log_file, "w") as f:
+      f.write("zone-placement: us-central1-a exhausted 3\n"
+              "Zone us-central1-a does not have the resources for the VM.\n"
+              "zone-placement: us-central1-b created 42\n")
+
+    zone = zone_placement.record_log(log_file, _KEY, self.history)
+
+    self.assertEqual(zone, "us-central1-b")
+    self.assertEqual(self.history.samples(_KEY, "us-central1-b")[0]
+                     ["latency_sec"], 42.0)
+
+
+if __name__ == "__main__":
+  unittest.main()